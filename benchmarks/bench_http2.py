@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTTP/2 多路复用 与 HTTP/1.1 连接池 的下载对比基准
+
+在本地启动一个同时支持 HTTP/1.1 与 h2c (明文 HTTP/2，prior knowledge) 的替身服务器，
+分别用 requests 默认连接池和 crawler_common.HTTP2Adapter 并发下载同样数量的"图片"，
+比较耗时、吞吐量以及服务器实际接受的 TCP 连接数。最后验证对仅支持 HTTP/1.1 的服务器自动回退。
+
+用法:
+  python benchmarks/bench_http2.py --requests 400 --size-kb 64 --concurrency 32
+
+依赖: requests, httpx[http2] (h2)
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import socketserver
+import http.server
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from crawler_common import HTTP2Adapter, http2_available
+
+H2_PREFACE = b"PRI * HTTP/2.0\r\n\r\nSM\r\n\r\n"
+
+
+# -------- 替身服务器 --------
+def run_server(port: int, body_size: int, h2_enabled: bool, ready) -> None:
+    body = os.urandom(body_size)
+    stats = {"h1_connections": 0, "h2_connections": 0, "requests": 0}
+    lock = threading.Lock()
+
+    class H1Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path == "/stats":
+                payload = json.dumps(stats).encode()
+                content_type = "application/json"
+            else:
+                with lock:
+                    stats["requests"] += 1
+                payload = body
+                content_type = "image/jpeg"
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    def serve_h2(sock: socket.socket) -> None:
+        import h2.config
+        import h2.connection
+        import h2.events
+
+        conn = h2.connection.H2Connection(config=h2.config.H2Configuration(client_side=False))
+        conn.initiate_connection()
+        sock.sendall(conn.data_to_send())
+        pending = {}  # stream_id -> 剩余待发送数据 (受流量控制窗口限制)
+
+        def flush(stream_id: int) -> None:
+            data = pending.get(stream_id)
+            while data:
+                window = min(conn.local_flow_control_window(stream_id), conn.max_outbound_frame_size)
+                if window <= 0:
+                    break
+                chunk, data = data[:window], data[window:]
+                conn.send_data(stream_id, chunk, end_stream=not data)
+            if data:
+                pending[stream_id] = data
+            else:
+                pending.pop(stream_id, None)
+
+        while True:
+            incoming = sock.recv(65536)
+            if not incoming:
+                return
+            for event in conn.receive_data(incoming):
+                if isinstance(event, h2.events.RequestReceived):
+                    with lock:
+                        stats["requests"] += 1
+                    conn.send_headers(event.stream_id, [
+                        (":status", "200"),
+                        ("content-type", "image/jpeg"),
+                        ("content-length", str(len(body))),
+                    ])
+                    pending[event.stream_id] = body
+                    flush(event.stream_id)
+                elif isinstance(event, h2.events.WindowUpdated):
+                    for stream_id in list(pending) if event.stream_id == 0 else [event.stream_id]:
+                        flush(stream_id)
+                elif isinstance(event, h2.events.ConnectionTerminated):
+                    sock.sendall(conn.data_to_send())
+                    return
+            sock.sendall(conn.data_to_send())
+
+    class Dispatcher(socketserver.BaseRequestHandler):
+        def handle(self):
+            preface = b""
+            try:
+                preface = self.request.recv(len(H2_PREFACE), socket.MSG_PEEK)
+            except OSError:
+                return
+            if h2_enabled and preface.startswith(H2_PREFACE[:len(preface)]) and preface:
+                with lock:
+                    stats["h2_connections"] += 1
+                serve_h2(self.request)
+            else:
+                with lock:
+                    stats["h1_connections"] += 1
+                H1Handler(self.request, self.client_address, self.server)
+
+    class Server(socketserver.ThreadingTCPServer):
+        allow_reuse_address = True
+        daemon_threads = True
+        request_queue_size = 256
+
+    server = Server(("127.0.0.1", port), Dispatcher)
+    ready.set()
+    server.serve_forever()
+
+
+def start_server(port: int, body_size: int, h2_enabled: bool = True) -> multiprocessing.Process:
+    ready = multiprocessing.Event()
+    proc = multiprocessing.Process(target=run_server, args=(port, body_size, h2_enabled, ready), daemon=True)
+    proc.start()
+    ready.wait(10)
+    return proc
+
+
+def server_stats(port: int) -> dict:
+    return requests.get(f"http://127.0.0.1:{port}/stats", timeout=10).json()
+
+
+# -------- 客户端 --------
+def fetch_all(session: requests.Session, base_url: str, total: int, concurrency: int) -> Tuple[float, int]:
+    def fetch(i: int) -> int:
+        r = session.get(f"{base_url}/img/{i}.jpg", timeout=30)
+        r.raise_for_status()
+        return len(r.content)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        received = sum(executor.map(fetch, range(total)))
+    return time.perf_counter() - start, received
+
+
+def bench(label: str, session: requests.Session, port: int, args) -> None:
+    before = server_stats(port)
+    cpu_start = time.process_time()
+    elapsed, received = fetch_all(session, f"http://127.0.0.1:{port}", args.requests, args.concurrency)
+    cpu = time.process_time() - cpu_start
+    if received != args.requests * args.size_kb * 1024:
+        raise RuntimeError(f"{label} 收到的字节数不符: {received}")  # 不用 assert，python -O 下同样检查
+    after = server_stats(port)
+    # /stats 请求本身走独立的 HTTP/1.1 短连接，需要扣除
+    h1 = after["h1_connections"] - before["h1_connections"] - 1
+    h2 = after["h2_connections"] - before["h2_connections"]
+    mb = args.requests * args.size_kb / 1024
+    print(f"{label:<22} 耗时 {elapsed:6.2f}s  吞吐 {mb / elapsed:7.1f} MB/s  客户端CPU {cpu:5.2f}s  "
+          f"新建连接 h1={h1} h2={h2}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP/2 与 HTTP/1.1 下载对比基准")
+    parser.add_argument("--requests", type=int, default=400, help="请求数量")
+    parser.add_argument("--size-kb", type=int, default=64, help="每个响应的大小(KB)")
+    parser.add_argument("--concurrency", type=int, default=32, help="并发线程数")
+    parser.add_argument("--port", type=int, default=18443, help="替身服务器端口")
+    args = parser.parse_args()
+
+    if not http2_available():
+        print("需要安装 httpx[http2]: pip install 'httpx[http2]'")
+        return 1
+
+    proc = start_server(args.port, args.size_kb * 1024)
+    fallback_proc = start_server(args.port + 1, args.size_kb * 1024, h2_enabled=False)
+    try:
+        print(f"请求数 {args.requests}，每个 {args.size_kb} KB，并发 {args.concurrency}")
+
+        h1_session = requests.Session()
+        h1_session.mount("http://", HTTPAdapter(pool_connections=args.concurrency, pool_maxsize=args.concurrency))
+        bench("HTTP/1.1 (requests)", h1_session, args.port, args)
+
+        h2_session = requests.Session()
+        h2_session.mount("http://", HTTP2Adapter(prior_knowledge=True))
+        bench("HTTP/2 (多路复用)", h2_session, args.port, args)
+
+        # 回退验证: 不强制 h2 时，对仅支持 HTTP/1.1 的服务器应正常工作
+        fallback_session = requests.Session()
+        fallback_session.mount("http://", HTTP2Adapter())
+        r = fallback_session.get(f"http://127.0.0.1:{args.port + 1}/img/0.jpg", timeout=10)
+        print(f"回退验证: 状态 {r.status_code}，协议 {r.http_version}，长度 {len(r.content)}")
+    finally:
+        proc.terminate()
+        fallback_proc.terminate()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+对象存储后端 (S3Storage) 的本地替身测试与基准
+
+在本地启动一个 MinIO 风格的 S3 替身 (PutObject / 分段上传 / ListObjectsV2 / HeadObject，不校验签名)
+和一个图片源服务器，验证并对比:
+  1. 图片流式下载后直接分段上传，全程不写本地磁盘，大对象按分段上传、小对象单次上传
+  2. 流式校验失败 (HTML 错误页 / 数据不完整) 时放弃分段上传，不留下残缺对象
+  3. 判重: 逐个 HeadObject 与按专辑前缀批量列举的请求数与耗时
+检查结果不符时抛出 RuntimeError 并以非 0 退出码结束 (不依赖 assert，python -O 下同样检查)。
+
+用法:
+  python benchmarks/bench_s3_storage.py --albums 20 --images 50
+
+依赖: requests, boto3
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+import http.server
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs
+from xml.sax.saxutils import escape
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+from crawler_common import S3Storage, s3_available
+
+
+# -------- S3 替身服务器 --------
+class FakeS3:
+    def __init__(self):
+        self.objects = {}   # (bucket, key) -> bytes
+        self.uploads = {}   # upload_id -> {part_number: bytes}
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+
+def make_s3_handler(state: FakeS3):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _target(self):
+            parsed = urlparse(self.path)
+            bucket, _, key = parsed.path.lstrip("/").partition("/")
+            query = {k: v[0] for k, v in parse_qs(parsed.query, keep_blank_values=True).items()}
+            return bucket, requests.utils.unquote(key), query
+
+        def _body(self) -> bytes:
+            length = int(self.headers.get("Content-Length", 0))
+            data = self.rfile.read(length)
+            # boto3 对分块签名的上传使用 aws-chunked 编码: <十六进制长度>;chunk-signature=...\r\n<数据>\r\n
+            if "aws-chunked" in self.headers.get("Content-Encoding", "") or \
+                    self.headers.get("x-amz-content-sha256", "").startswith("STREAMING-"):
+                data = decode_aws_chunked(data)
+            return data
+
+        def _reply(self, status: int, body: bytes = b"", headers=None):
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if self.command != "HEAD":
+                self.wfile.write(body)
+
+        def do_PUT(self):
+            bucket, key, query = self._target()
+            data = self._body()
+            with state.lock:
+                if "uploadId" in query:
+                    state.calls["UploadPart"] += 1
+                    state.uploads[query["uploadId"]][int(query["partNumber"])] = data
+                else:
+                    state.calls["PutObject"] += 1
+                    state.objects[(bucket, key)] = data
+            self._reply(200, headers={"ETag": f'"{hash(data) & 0xffffffff:08x}"'})
+
+        def do_POST(self):
+            bucket, key, query = self._target()
+            self._body()
+            with state.lock:
+                if "uploads" in query:
+                    state.calls["CreateMultipartUpload"] += 1
+                    upload_id = f"u{len(state.uploads) + 1}"
+                    state.uploads[upload_id] = {}
+                    body = (f"<InitiateMultipartUploadResult><Bucket>{bucket}</Bucket><Key>{escape(key)}</Key>"
+                            f"<UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>")
+                else:
+                    state.calls["CompleteMultipartUpload"] += 1
+                    parts = state.uploads.pop(query["uploadId"])
+                    state.objects[(bucket, key)] = b"".join(parts[n] for n in sorted(parts))
+                    body = (f"<CompleteMultipartUploadResult><Bucket>{bucket}</Bucket><Key>{escape(key)}</Key>"
+                            f"<ETag>\"x\"</ETag></CompleteMultipartUploadResult>")
+            self._reply(200, body.encode(), {"Content-Type": "application/xml"})
+
+        def do_DELETE(self):
+            _, _, query = self._target()
+            with state.lock:
+                state.calls["AbortMultipartUpload"] += 1
+                state.uploads.pop(query.get("uploadId"), None)
+            self._reply(204)
+
+        def do_HEAD(self):
+            bucket, key, _ = self._target()
+            with state.lock:
+                state.calls["HeadObject"] += 1
+                data = state.objects.get((bucket, key))
+            if data is None:
+                self._reply(404)
+            else:
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+
+        def do_GET(self):
+            bucket, _, query = self._target()
+            prefix = query.get("prefix", "")
+            max_keys = int(query.get("max-keys", 1000))
+            start_after = query.get("continuation-token", "")
+            with state.lock:
+                state.calls["ListObjectsV2"] += 1
+                keys = sorted(k for b, k in state.objects if b == bucket and k.startswith(prefix) and k > start_after)
+                page = keys[:max_keys]
+                sizes = {k: len(state.objects[(bucket, k)]) for k in page}
+            truncated = len(keys) > max_keys
+            contents = "".join(f"<Contents><Key>{escape(k)}</Key><Size>{sizes[k]}</Size></Contents>" for k in page)
+            token = f"<NextContinuationToken>{escape(page[-1])}</NextContinuationToken>" if truncated else ""
+            body = (f"<ListBucketResult><Name>{bucket}</Name><Prefix>{escape(prefix)}</Prefix>"
+                    f"<KeyCount>{len(page)}</KeyCount><MaxKeys>{max_keys}</MaxKeys>"
+                    f"<IsTruncated>{'true' if truncated else 'false'}</IsTruncated>{token}{contents}</ListBucketResult>")
+            self._reply(200, body.encode(), {"Content-Type": "application/xml"})
+
+    return Handler
+
+
+def decode_aws_chunked(data: bytes) -> bytes:
+    out = bytearray()
+    pos = 0
+    while pos < len(data):
+        line_end = data.index(b"\r\n", pos)
+        size = int(data[pos:line_end].split(b";")[0], 16)
+        if size == 0:
+            break
+        out += data[line_end + 2:line_end + 2 + size]
+        pos = line_end + 2 + size + 2
+    return bytes(out)
+
+
+# -------- 图片源服务器 --------
+def make_image_handler(images: dict):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            body = images.get(self.path)
+            if body is None:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html" if body.startswith(b"<") else "image/jpeg")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+def start(handler, port: int) -> http.server.ThreadingHTTPServer:
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def check(condition: bool, message: str) -> None:
+    """结果检查: 不用 assert (python -O 下会被去掉)，不符时直接抛出异常。"""
+    if not condition:
+        raise RuntimeError(message)
+
+
+def fake_jpeg(size: int) -> bytes:
+    return b"\xff\xd8\xff\xe0" + os.urandom(max(0, size - 6)) + b"\xff\xd9"
+
+
+def stream_one(session: requests.Session, storage: S3Storage, url: str, album: str, name: str) -> int:
+    """与爬虫相同的写法: 流式请求，边读边分段上传。"""
+    with session.get(url, stream=True, timeout=30) as r:
+        r.raise_for_status()
+        return storage.put_stream(album, name, r.iter_content(64 * 1024), "image/jpeg")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="S3 对象存储后端替身测试与基准")
+    parser.add_argument("--albums", type=int, default=20, help="专辑数")
+    parser.add_argument("--images", type=int, default=50, help="每个专辑的图片数")
+    parser.add_argument("--size-kb", type=int, default=32, help="普通图片大小(KB)")
+    parser.add_argument("--port", type=int, default=19000, help="S3 替身端口 (图片源使用 port+1)")
+    args = parser.parse_args()
+
+    if not s3_available():
+        print("需要安装 boto3: pip install boto3")
+        return 1
+
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "minioadmin")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "minioadmin")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+    state = FakeS3()
+    images = {f"/a{a}/{i:03d}.jpg": fake_jpeg(args.size_kb * 1024)
+              for a in range(args.albums) for i in range(args.images)}
+    images["/big.jpg"] = fake_jpeg(12 * 1024 * 1024)  # 超过分段大小，触发分段上传
+    s3_server = start(make_s3_handler(state), args.port)
+    img_server = start(make_image_handler(images), args.port + 1)
+    img_base = f"http://127.0.0.1:{args.port + 1}"
+
+    storage = S3Storage("crawler", "tuao", endpoint_url=f"http://127.0.0.1:{args.port}")
+    session = requests.Session()
+    cwd_before = set(os.listdir("."))
+
+    # 1. 流式上传
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        sizes = list(executor.map(
+            lambda path: stream_one(session, storage, img_base + path, path.split("/")[1], path.split("/")[2]),
+            [p for p in images if p != "/big.jpg"]))
+    elapsed = time.perf_counter() - start_time
+    big = stream_one(session, storage, img_base + "/big.jpg", "big", "big.jpg")
+    check(state.objects.get(("crawler", "tuao/big/big.jpg")) == images["/big.jpg"], "分段上传内容不一致")
+    check(state.calls["UploadPart"] > 1, f"大图应分段上传，实际 UploadPart={state.calls['UploadPart']}")
+    check(set(os.listdir(".")) == cwd_before, "流式上传不应在本地留下文件")
+    print(f"流式上传 {len(sizes)} 张 ({sum(sizes) / 1024 / 1024:.1f} MB) 耗时 {elapsed:.2f}s；"
+          f"大图 {big / 1024 / 1024:.0f} MB 分 {state.calls['UploadPart']} 段上传")
+
+    # 2. 校验失败时放弃分段上传
+    def broken_chunks():
+        yield os.urandom(storage.part_size)
+        raise ValueError("数据不完整")
+    try:
+        storage.put_stream("broken", "x.jpg", broken_chunks())
+    except ValueError:
+        pass
+    else:
+        raise RuntimeError("数据源抛出的异常没有传给调用方")
+    check(("crawler", "tuao/broken/x.jpg") not in state.objects and not state.uploads, "残缺的分段上传未被放弃")
+    print(f"校验失败放弃分段上传: AbortMultipartUpload={state.calls['AbortMultipartUpload']}，未留下残缺对象")
+
+    # 3. 判重: 逐个 HEAD vs 按专辑批量列举
+    state.calls.clear()
+    start_time = time.perf_counter()
+    storage_head = S3Storage("crawler", "tuao", endpoint_url=f"http://127.0.0.1:{args.port}")
+    found = sum(storage_head.stat(f"a{a}", f"{i:03d}.jpg") is not None
+                for a in range(args.albums) for i in range(args.images))
+    head_time, head_calls = time.perf_counter() - start_time, state.calls["HeadObject"]
+
+    state.calls.clear()
+    start_time = time.perf_counter()
+    for a in range(args.albums):
+        storage.prefetch(f"a{a}")
+    found_listed = sum(storage.stat(f"a{a}", f"{i:03d}.jpg") is not None
+                       for a in range(args.albums) for i in range(args.images))
+    list_time, list_calls = time.perf_counter() - start_time, state.calls["ListObjectsV2"]
+    check(found == found_listed == args.albums * args.images,
+          f"判重结果不符: 逐个HEAD {found}，批量列举 {found_listed}，应为 {args.albums * args.images}")
+    print(f"判重 逐个HEAD: {head_calls} 次请求 {head_time:.2f}s | 批量列举: {list_calls} 次请求 {list_time:.2f}s")
+
+    s3_server.shutdown()
+    img_server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+各入口脚本的启动耗时基准 (python -X importtime)
+
+对每个入口脚本运行 `python -X importtime <脚本> --help`，解析 stderr 中的导入耗时记录，统计:
+  - 启动总耗时 (进程从启动到退出的墙钟时间，取多次运行的最小值)
+  - 导入总耗时 (所有顶层导入的累计耗时之和)
+  - 耗时最多的顶层导入，以及是否加载了 requests / bs4 / PIL / rich 等重量级依赖
+
+运行前先把仓库根目录的模块编译为字节码，测的是日常运行 (有 __pycache__) 时的启动开销。
+--output 把结果写成 JSON，便于在 Termux 等设备上记录并与改动前后对比。
+
+用法:
+  python benchmarks/bench_startup.py --runs 5
+  python benchmarks/bench_startup.py 凸凹吧_tuao_cc.py 美图色色.py --output startup.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import compileall
+import py_compile
+import subprocess
+from statistics import median
+from typing import Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("requests", "urllib3", "bs4", "PIL", "rich", "httpx", "boto3")
+TOP_IMPORTS = 5
+
+
+def find_entry_points() -> List[str]:
+    """仓库根目录下带 __main__ 入口的脚本。"""
+    scripts = []
+    for name in sorted(os.listdir(ROOT)):
+        if not name.endswith(".py"):
+            continue
+        with open(os.path.join(ROOT, name), "r", encoding="utf-8", errors="ignore") as f:
+            if "__main__" in f.read():
+                scripts.append(name)
+    return scripts
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """解析 -X importtime 输出，返回顶层导入的 [(模块名, 自身耗时us, 累计耗时us)]。"""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        except ValueError:
+            continue
+        # 模块名前的缩进表示嵌套层级，只统计顶层 (缩进一格) 的导入，避免重复计算
+        if name.startswith(" ") and not name.startswith("  "):
+            imports.append((name.strip(), int(self_us), int(cumulative_us)))
+    return imports
+
+
+def measure(script: str, runs: int) -> Optional[Dict[str, object]]:
+    """多次运行 `脚本 --help`，返回启动耗时统计；脚本无法编译或运行失败时返回 None。"""
+    path = os.path.join(ROOT, script)
+    try:
+        py_compile.compile(path, doraise=True)
+    except py_compile.PyCompileError as e:
+        print(f"  跳过 {script}: 无法编译 ({e.msg.strip().splitlines()[-1]})")
+        return None
+
+    walls, totals = [], []
+    imports: List[Tuple[str, int, int]] = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-X", "importtime", path, "--help"], cwd=ROOT,
+                                capture_output=True, text=True, encoding="utf-8", errors="replace",
+                                stdin=subprocess.DEVNULL, timeout=60)
+        walls.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            print(f"  跳过 {script}: --help 退出码 {result.returncode}")
+            return None
+        imports = parse_importtime(result.stderr)
+        # site 等解释器自身的启动导入与脚本无关
+        totals.append(sum(cum for name, _, cum in imports if name not in ("site", "encodings")))
+
+    heaviest = sorted(((cum, name) for name, _, cum in imports if name not in ("site", "encodings")), reverse=True)
+    loaded = sorted({name.split(".")[0] for name, _, _ in imports} & set(HEAVY_MODULES))
+    return {
+        "wall_ms": round(min(walls) * 1000, 1),
+        "import_ms": round(median(totals) / 1000, 1),
+        "top_imports": [[name, round(cum / 1000, 1)] for cum, name in heaviest[:TOP_IMPORTS]],
+        "heavy_modules": loaded,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="各入口脚本 --help 的启动与导入耗时基准")
+    parser.add_argument("scripts", nargs="*", help="要测试的脚本 (默认: 仓库根目录下所有入口脚本)")
+    parser.add_argument("--runs", type=int, default=5, help="每个脚本运行次数")
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    scripts = args.scripts or find_entry_points()
+    # 共享模块 (crawler_common 等) 的字节码也要是最新的，否则每次运行都会重新编译
+    compileall.compile_dir(ROOT, maxlevels=0, quiet=2)
+    results: Dict[str, Dict[str, object]] = {}
+    print(f"Python {sys.version.split()[0]}，每个脚本运行 {args.runs} 次 ({sys.platform})")
+    for script in scripts:
+        stats = measure(os.path.basename(script), args.runs)
+        if stats is None:
+            continue
+        results[script] = stats
+        heavy = ",".join(stats["heavy_modules"]) or "无"
+        top = ", ".join(f"{name} {ms}ms" for name, ms in stats["top_imports"][:3])
+        print(f"{script:<28} 启动 {stats['wall_ms']:>7.1f} ms | 导入 {stats['import_ms']:>7.1f} ms "
+              f"| 重量级依赖: {heavy:<16} | {top}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "platform": sys.platform, "runs": args.runs,
+                       "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQLite 工作队列 (WorkQueue) 的替身测试与基准: 租约收回、最大尝试次数、多进程领取吞吐
+
+用很短的租约模拟 worker 中断，验证:
+  1. worker 掉线后租约过期，其他 worker 领取时收回该任务 (尝试次数 +1)
+  2. 每次领取都让 worker 崩溃/卡死的专辑，领取 max_attempts 次后记为失败，不再无限收回；
+     队列随后 finished()，drain_work_queue 正常返回而不是一直轮询
+  3. complete(ok=False) 重新排队，超过 max_attempts 次后记为失败
+然后多个 worker 进程同时领取/完成同一个队列文件中的任务，统计吞吐量，并检查每个任务恰好完成一次。
+
+用法:
+  python benchmarks/bench_work_queue.py --items 2000 --workers 4 --batch 8
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crawler_common import WorkQueue, drain_work_queue
+
+LEASE = 0.2  # 测试用的短租约 (秒)
+
+
+def check(condition: bool, message: object) -> None:
+    """结果检查: 不用 assert (python -O 下会被去掉)，不符时直接抛出异常。"""
+    if not condition:
+        raise RuntimeError(message)
+
+
+def check_lease_recovery(db_path: str) -> None:
+    coordinator = WorkQueue(db_path, "coordinator", lease_seconds=LEASE, max_attempts=3)
+    coordinator.add([("https://example.com/a/1", "专辑1", None), ("https://example.com/a/poison", "超大专辑", None)])
+    coordinator.mark_discovery_done()
+
+    # 1. worker-a 领取后掉线 (不续期也不完成)，租约过期后由 worker-b 收回
+    worker_a = WorkQueue(db_path, "worker-a", lease_seconds=LEASE, max_attempts=3)
+    first = worker_a.claim(1)[0]
+    time.sleep(LEASE * 1.5)
+    worker_b = WorkQueue(db_path, "worker-b", lease_seconds=LEASE, max_attempts=3)
+    reclaimed = worker_b.claim(1)[0]
+    check(reclaimed.url == first.url and reclaimed.attempts == 2, reclaimed)
+    worker_b.complete(reclaimed.url)
+    worker_a.complete(first.url)  # 迟到的结果不覆盖收回后的状态
+    check(coordinator.counts().get("done") == 1, coordinator.counts())
+
+    # 2. 每次领取都让 worker 卡死的专辑: 领取 3 次后记为失败
+    attempts = []
+    for attempt in range(5):
+        crashed = WorkQueue(db_path, f"crashed-{attempt}", lease_seconds=LEASE, max_attempts=3)
+        items = crashed.claim(1)
+        attempts += [item.attempts for item in items]
+        crashed.close()
+        time.sleep(LEASE * 1.5)
+    check(attempts == [1, 2, 3], attempts)
+    survivor = WorkQueue(db_path, "survivor", lease_seconds=LEASE, max_attempts=3)
+    check(survivor.claim(1) == [] and survivor.counts() == {"done": 1, "failed": 1}, survivor.counts())
+    start_time = time.time()
+    drain_work_queue(survivor, submit=lambda item: None, max_held=4, poll=LEASE)
+    check(time.time() - start_time < 5, "drain_work_queue 没有结束")
+    print("租约收回: 掉线 worker 的任务被收回 (第 2 次尝试)；反复卡死的专辑领取 3 次后记为失败，队列正常结束")
+
+    # 3. 明确报告失败的任务重新排队，超过最大尝试次数后记为失败
+    coordinator.add([("https://example.com/a/broken", "坏专辑", None)])
+    for _ in range(3):
+        item = survivor.claim(1)[0]
+        survivor.complete(item.url, ok=False)
+    check(survivor.counts() == {"done": 1, "failed": 2} and survivor.finished(), survivor.counts())
+    print("失败重试: complete(ok=False) 重新排队，第 3 次失败后记为失败")
+    for queue in (coordinator, worker_a, worker_b, survivor):
+        queue.close()
+
+
+def worker_main(db_path: str, worker_id: str, batch: int) -> int:
+    queue = WorkQueue(db_path, worker_id)
+    done = 0
+    while True:
+        items = queue.claim(batch)
+        if not items:
+            if queue.finished():
+                break
+            time.sleep(0.01)
+            continue
+        for item in items:
+            queue.complete(item.url)
+            done += 1
+    queue.close()
+    return done
+
+
+def bench_throughput(db_path: str, items: int, workers: int, batch: int) -> None:
+    coordinator = WorkQueue(db_path, "coordinator")
+    coordinator.add((f"https://example.com/album/{i}", f"专辑{i}", {"page": i // 20}) for i in range(items))
+    coordinator.mark_discovery_done()
+    start_time = time.perf_counter()
+    with multiprocessing.Pool(workers) as pool:
+        per_worker = pool.starmap(worker_main, [(db_path, f"w{i}", batch) for i in range(workers)])
+    elapsed = time.perf_counter() - start_time
+    counts = coordinator.counts()
+    check(sum(per_worker) == items and counts == {"done": items}, (per_worker, counts))
+    print(f"多进程领取: {workers} 个 worker，每次领取 {batch} 个，{items} 个任务耗时 {elapsed:.2f}s "
+          f"({items / elapsed:.0f} 个/秒)，每个任务恰好完成一次，各 worker 完成 {per_worker}")
+    coordinator.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WorkQueue 租约收回/最大尝试次数替身测试与多进程领取基准")
+    parser.add_argument("--items", type=int, default=2000, help="吞吐测试的任务数")
+    parser.add_argument("--workers", type=int, default=4, help="worker 进程数")
+    parser.add_argument("--batch", type=int, default=8, help="每次领取的任务数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        check_lease_recovery(os.path.join(work_dir, "lease.db"))
+        bench_throughput(os.path.join(work_dir, "throughput.db"), args.items, args.workers, args.batch)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+魅影图库 (xxtu.org) 相册发现方式的本地替身基准: WordPress REST API / RSS 订阅 / HTML 列表页
+
+在本地启动一个 WordPress 风格的替身站点 (带主题外壳的 ?paged=N 列表页、/wp-json/wp/v2/posts、/feed/)，
+用爬虫自身的 _listing_url / _parse_listing 按三种方式各翻完一遍列表 (不含爬虫的翻页延迟)，
+对比翻完全部列表所需的请求数、传输字节数和解析耗时。
+
+三种方式发现的相册是否一致、--discovery auto 的探测与回退由 test_wp_discovery.py 检查 (不计时)，
+替身站点和翻页函数与这里共用。
+
+用法:
+  python benchmarks/bench_wp_discovery.py --albums 500 --theme-kb 60
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import http.server
+import importlib.util
+from collections import Counter
+from contextlib import redirect_stdout
+from urllib.parse import urlparse, parse_qs
+from xml.sax.saxutils import escape
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+HTML_PER_PAGE = 10      # 主题列表页每页文章数
+FEED_PER_PAGE = 10      # WordPress 默认 posts_per_rss
+REST_MAX_PER_PAGE = 100
+
+
+# -------- WordPress 替身站点 --------
+class FakeWordPress:
+    def __init__(self, albums: int, theme_kb: int):
+        # 标题带 & 和引号，检查各方式的实体还原
+        self.posts = [{"id": i, "title": f"Album {i} &amp; “写真” #{i}"} for i in range(albums, 0, -1)]
+        self.theme = "<!-- theme -->" + "x" * (theme_kb * 1024)
+        self.rest = True
+        self.feed = True
+        self.calls = Counter()
+        self.bytes = Counter()
+        self.lock = threading.Lock()
+
+
+def make_handler(site: FakeWordPress, base: str):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, status: int, body: bytes, content_type: str = "text/html; charset=UTF-8", headers=None):
+            with site.lock:
+                site.bytes[self.kind] += len(body)
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+            self.kind = {"/wp-json/wp/v2/posts": "rest", "/feed/": "feed", "/": "html"}.get(parsed.path, "other")
+            with site.lock:
+                site.calls[self.kind] += 1
+            if self.kind == "rest" and site.rest:
+                return self._rest(query)
+            if self.kind == "feed" and site.feed:
+                return self._feed(query)
+            if self.kind == "html":
+                return self._html(query)
+            self._reply(404, b"<html><body>Not Found</body></html>")
+
+        def _link(self, post) -> str:
+            return f"{base}/{post['id']}.html"
+
+        def _rest(self, query):
+            per_page = min(int(query.get("per_page", 10)), REST_MAX_PER_PAGE)
+            page = int(query.get("page", 1))
+            total_pages = max(1, -(-len(site.posts) // per_page))
+            if page > total_pages:
+                body = json.dumps({"code": "rest_post_invalid_page_number", "data": {"status": 400}})
+                return self._reply(400, body.encode(), "application/json")
+            posts = []
+            for post in site.posts[(page - 1) * per_page:page * per_page]:
+                full = {"id": post["id"], "link": self._link(post), "title": {"rendered": post["title"]},
+                        "content": {"rendered": "<p>" + "正文" * 200 + "</p>"}, "excerpt": {"rendered": "<p>摘要</p>"}}
+                fields = query.get("_fields")
+                posts.append({k: full[k] for k in fields.split(",")} if fields else full)
+            self._reply(200, json.dumps(posts).encode(), "application/json",
+                        {"X-WP-Total": str(len(site.posts)), "X-WP-TotalPages": str(total_pages)})
+
+        def _feed(self, query):
+            page = int(query.get("paged", 1))
+            posts = site.posts[(page - 1) * FEED_PER_PAGE:page * FEED_PER_PAGE]
+            if not posts:
+                return self._reply(404, b"<html><body>Not Found</body></html>")
+            # RSS 中的标题是 XML 文本，WordPress 输出的实体在这里再转义一层
+            items = "".join(f"<item><title>{escape(post['title'].replace('&amp;', '&'))}</title>"
+                            f"<link>{self._link(post)}</link><description>摘要</description></item>"
+                            for post in posts)
+            body = f'<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel><title>xxtu</title>{items}</channel></rss>'
+            self._reply(200, body.encode(), "application/rss+xml; charset=UTF-8")
+
+        def _html(self, query):
+            page = int(query.get("paged", 1))
+            posts = site.posts[(page - 1) * HTML_PER_PAGE:page * HTML_PER_PAGE]
+            if not posts:
+                return self._reply(404, b"<html><body>Not Found</body></html>")
+            articles = "".join(f'<article><a href="{self._link(post)}"><img src="/thumb/{post["id"]}.jpg"></a>'
+                               f'<h2 class="entry-title">{post["title"]}</h2></article>' for post in posts)
+            self._reply(200, f"<html><head>{site.theme}</head><body>{articles}</body></html>".encode())
+
+    return Handler
+
+
+def start(handler, port: int) -> http.server.ThreadingHTTPServer:
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def load_crawler_module():
+    spec = importlib.util.spec_from_file_location("xxtu", os.path.join(ROOT, "魅影图库    xxtu.org.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def walk_listing(crawler, backend: str):
+    """与 get_all_albums 相同的翻页和结束条件，但不等待翻页延迟；返回 ([(链接, 标题)], 解析耗时)。"""
+    entries, parse_time, page = [], 0.0, 1
+    while True:
+        response = crawler.session.get(crawler._listing_url(backend, page), timeout=30)
+        if response.status_code == 404 or (backend == "rest" and response.status_code == 400):
+            break
+        response.raise_for_status()
+        start_time = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            page_entries, last_page = crawler._parse_listing(backend, response, page)
+        parse_time += time.perf_counter() - start_time
+        entries += page_entries
+        if not page_entries or last_page:
+            break
+        page += 1
+    return entries, parse_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="xxtu.org 相册发现方式 (REST / RSS / HTML) 替身测试与基准")
+    parser.add_argument("--albums", type=int, default=500, help="替身站点的相册数")
+    parser.add_argument("--theme-kb", type=int, default=60, help="每个 HTML 列表页的主题外壳大小(KB)")
+    parser.add_argument("--port", type=int, default=19200, help="替身站点端口")
+    args = parser.parse_args()
+
+    site = FakeWordPress(args.albums, args.theme_kb)
+    base = f"http://127.0.0.1:{args.port}"
+    server = start(make_handler(site, base), args.port)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)  # 爬虫模块导入时在当前目录创建日志文件
+        xxtu = load_crawler_module()
+        xxtu.BASE_URL = base + "/"
+
+        # 三种方式各翻完一遍
+        results = {}
+        for backend in ("html", "feed", "rest"):
+            crawler = xxtu.GalleryCrawler(os.path.join(work_dir, backend), prompt=False, discovery=backend)
+            site.calls.clear()
+            site.bytes.clear()
+            start_time = time.perf_counter()
+            entries, parse_time = walk_listing(crawler, backend)
+            results[backend] = (entries, time.perf_counter() - start_time, parse_time,
+                                sum(site.calls.values()), sum(site.bytes.values()))
+
+        print(f"{args.albums} 个相册 (HTML 列表页主题外壳 {args.theme_kb} KB/页)")
+        for backend, (entries, wall, parse_time, calls, nbytes) in results.items():
+            print(f"  {xxtu.DISCOVERY_NAMES[backend]:<20} 发现 {len(entries):>5} 个 | 请求 {calls:>4} 次 | 传输 {nbytes / 1024:>8.1f} KB "
+                  f"| 解析 {parse_time * 1000:>7.1f} ms | 耗时 {wall:.2f}s")
+        html_calls, rest_calls = results["html"][3], results["rest"][3]
+        print(f"REST 相比 HTML: 请求数 {html_calls} -> {rest_calls}，"
+              f"按每页 4-8 秒翻页延迟约节省 {(html_calls - rest_calls) * 6 / 60:.1f} 分钟")
+        os.chdir(ROOT)
+
+    server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
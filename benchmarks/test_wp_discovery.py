@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+魅影图库 (xxtu.org) 相册发现方式的正确性测试: 不计时，只检查结果
+
+复用 bench_wp_discovery.py 的 WordPress 替身站点，检查:
+  1. REST API / RSS 订阅 / HTML 列表页三种方式翻完列表后发现的相册 (链接 + 标题) 完全一致，
+     标题中的 HTML 实体正确还原，最后一页不满一页时也能正确结束
+  2. --discovery auto 的探测: REST 可用时选 REST，只有订阅时选订阅，都不可用时回退 HTML
+
+检查用 unittest 的 assert* 方法 (python -O 下同样生效)。
+
+用法:
+  python benchmarks/test_wp_discovery.py
+"""
+
+import io
+import os
+import sys
+import socket
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_wp_discovery import FakeWordPress, make_handler, start, load_crawler_module, walk_listing
+
+ALBUMS = 145    # 不是每页条数的整数倍，REST 翻两页，订阅和 HTML 最后一页不满
+THEME_KB = 1
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class WordPressDiscoveryTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        port = free_port()
+        cls.base = f"http://127.0.0.1:{port}"
+        cls.site = FakeWordPress(ALBUMS, THEME_KB)
+        cls.server = start(make_handler(cls.site, cls.base), port)
+        cls.work_dir = tempfile.TemporaryDirectory()
+        cls.cwd = os.getcwd()
+        os.chdir(cls.work_dir.name)  # 爬虫模块导入时在当前目录创建日志文件
+        cls.xxtu = load_crawler_module()
+        cls.xxtu.BASE_URL = cls.base + "/"
+
+    @classmethod
+    def tearDownClass(cls):
+        os.chdir(cls.cwd)
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.work_dir.cleanup()
+
+    def make_crawler(self, name: str, **kwargs):
+        return self.xxtu.GalleryCrawler(os.path.join(self.work_dir.name, name), prompt=False, **kwargs)
+
+    def test_backends_discover_same_albums(self):
+        expected = [(f"{self.base}/{post['id']}.html", post["title"].replace("&amp;", "&")) for post in self.site.posts]
+        for backend in ("html", "feed", "rest"):
+            with self.subTest(backend=backend):
+                entries, _ = walk_listing(self.make_crawler(backend, discovery=backend), backend)
+                self.assertEqual(entries, expected)
+
+    def test_auto_probe_falls_back(self):
+        cases = (((True, True), "rest"), ((False, True), "feed"), ((False, False), "html"))
+        try:
+            for (rest, feed), backend in cases:
+                with self.subTest(rest=rest, feed=feed):
+                    self.site.rest, self.site.feed = rest, feed
+                    crawler = self.make_crawler(f"auto-{rest}-{feed}")
+                    with redirect_stdout(io.StringIO()):
+                        self.assertEqual(crawler._choose_discovery(), backend)
+        finally:
+            self.site.rest = self.site.feed = True
+
+
+if __name__ == "__main__":
+    unittest.main()
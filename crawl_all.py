@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多站点同时爬取: 在一个进程中同时运行 凸凹吧 / 魅影图库 / ku1372 / 美图色色 四个爬虫
+
+各站点是不同的主机，限速和并发预算互不相干；逐个运行时总耗时是各站点之和，
+同时运行后总耗时接近最慢的那个站点。
+
+特点:
+  - 每个站点在自己的线程中运行原爬虫的 main()，保留各自的请求间隔、按主机限速和并发设置
+    (可用 --site-args 单独调整，如 "tuao=-c 3 --host-rate 1")
+  - 共享预算: 所有站点的下载数据共用一个带宽上限 (--bandwidth-mb)；合计写入量达到 --disk-gb
+    或磁盘剩余空间低于保留值后，各站点不再开始新的下载
+  - 合并进度: 每隔 --interval 秒在终端输出各站点的状态、下载次数、数据量和实时速度；
+    各爬虫自己的日志和输出写入 <保存目录>/crawl_all.log
+  - 不等待键盘输入 (各爬虫以 --no-prompt 运行)
+
+输出:
+  <保存目录>/<站点>/   各站点的保存目录
+
+用法:
+  python crawl_all.py <保存目录> [--sites tuao,xxtu,ku1372,meitu] [--bandwidth-mb 8] [--disk-gb 50]
+  python crawl_all.py E:/pachong/结果 --site-args "tuao=-c 3 --host-rate 1" --site-args "ku1372=--max-workers 4"
+"""
+
+import os
+import sys
+import time
+import shlex
+import argparse
+import logging
+import threading
+import importlib.util
+from contextlib import redirect_stdout
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, TextIO
+
+from crawler_common import TransferBudget, install_transfer_budget, flush_async_logging
+
+# -------- 站点配置 --------
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# 站点 -> (爬虫脚本, 基本参数)；{dir} 替换为该站点的保存目录
+SITES = {
+    "tuao": ("凸凹吧_tuao_cc.py", ["-d", "{dir}", "--no-prompt"]),
+    "xxtu": ("魅影图库    xxtu.org.py", ["--save-path", "{dir}", "--no-prompt"]),
+    "ku1372": ("爬取ku1372的所有图集.py", ["--save-path", "{dir}", "--no-prompt"]),
+    "meitu": ("美图色色.py", ["--save-dir", "{dir}"]),
+}
+HTTP2_SITES = ("tuao", "ku1372", "meitu")  # 支持 --http2 的站点
+DEFAULT_INTERVAL = 10.0             # 合并进度的输出间隔 (秒)
+LOG_NAME = "crawl_all.log"
+
+
+class SiteRun:
+    """一个站点的运行状态。"""
+
+    def __init__(self, key: str, module, argv: List[str]):
+        self.key = key
+        self.module = module
+        self.name = getattr(module, "SITE_NAME", key)
+        self.argv = argv
+        self.state = "等待"
+        self.start: Optional[float] = None
+        self.end: Optional[float] = None
+
+    @property
+    def elapsed(self) -> float:
+        if self.start is None:
+            return 0.0
+        return (self.end or time.monotonic()) - self.start
+
+    def run(self) -> None:
+        threading.current_thread().name = self.key
+        self.state = "运行中"
+        self.start = time.monotonic()
+        logging.info("[%s] 开始: %s", self.name, " ".join(self.argv))
+        try:
+            self.module.main(self.argv)
+            self.state = "完成"
+        except SystemExit as e:
+            # argparse 参数错误等
+            self.state = "完成" if not e.code else f"退出 ({e.code})"
+        except Exception:
+            logging.exception("[%s] 运行异常", self.name)
+            self.state = "异常"
+        finally:
+            self.end = time.monotonic()
+            logging.info("[%s] %s，耗时 %.1f 分钟", self.name, self.state, self.elapsed / 60)
+
+
+def load_site(key: str, script: str):
+    """按文件路径导入爬虫脚本 (文件名含中文和空格，不能直接 import)。"""
+    spec = importlib.util.spec_from_file_location(f"crawl_site_{key}", os.path.join(ROOT, script))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def parse_site_args(values: List[str]) -> Dict[str, List[str]]:
+    extra: Dict[str, List[str]] = {}
+    for value in values:
+        key, sep, args = value.partition("=")
+        if not sep or key not in SITES:
+            raise argparse.ArgumentTypeError(f"--site-args 格式应为 站点=参数，站点为 {','.join(SITES)}: {value}")
+        extra.setdefault(key, []).extend(shlex.split(args))
+    return extra
+
+
+# -------- 合并进度 --------
+def format_progress(runs: List[SiteRun], budget: TransferBudget, last: Dict[str, int], interval: float) -> str:
+    """各站点一行: 状态、下载次数、数据量、最近一个间隔内的速度、耗时。"""
+    snapshot = budget.snapshot()
+    running = sum(run.state == "运行中" for run in runs)
+    limit = f"，带宽上限 {budget.bandwidth / 1024 / 1024:.1f} MB/s" if budget.bandwidth > 0 else ""
+    lines = [f"[{time.strftime('%H:%M:%S')}] 运行中 {running}/{len(runs)} | {budget.summary()}{limit}"]
+    for run in runs:
+        files, nbytes = snapshot.get(run.name, (0, 0))
+        speed = (nbytes - last.get(run.name, 0)) / interval
+        last[run.name] = nbytes
+        lines.append(f"  {run.name:<10} {run.state:<6} {files:>7} 次下载 {nbytes / 1024 / 1024:>9.1f} MB "
+                     f"{speed / 1024 / 1024:>6.2f} MB/s  {run.elapsed / 60:>6.1f} 分钟")
+    return "\n".join(lines)
+
+
+def report_progress(runs: List[SiteRun], budget: TransferBudget, interval: float, stop: threading.Event,
+                    out: TextIO) -> None:
+    last: Dict[str, int] = {}
+    while not stop.wait(interval):
+        print(format_progress(runs, budget, last, interval), file=out, flush=True)
+
+
+# -------- 主流程 --------
+def main() -> int:
+    parser = argparse.ArgumentParser(description="在一个进程中同时运行多个站点的爬虫，共享带宽与磁盘预算")
+    parser.add_argument("root", help="保存根目录，各站点保存到其下的 <站点> 子目录")
+    parser.add_argument("--sites", default=",".join(SITES), help=f"要运行的站点，逗号分隔 (可选: {','.join(SITES)})")
+    parser.add_argument("--bandwidth-mb", type=float, default=0, help="所有站点合计的下载带宽上限(MB/s)，0 表示不限制")
+    parser.add_argument("--disk-gb", type=float, default=0, help="本次运行所有站点合计最多写入的数据量(GB)，0 表示不限制")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="合并进度的输出间隔(秒)")
+    parser.add_argument("--http2", action="store_true", help="对支持的站点启用 HTTP/2 多路复用传输 (需安装 httpx[http2])")
+    parser.add_argument("--site-args", action="append", default=[], metavar="站点=参数",
+                        help="传给某个站点爬虫的额外参数，可重复，如 \"tuao=-c 3 --host-rate 1\"")
+    args = parser.parse_args()
+
+    keys = [key.strip() for key in args.sites.split(",") if key.strip()]
+    unknown = [key for key in keys if key not in SITES]
+    if unknown or not keys:
+        parser.error(f"未知站点: {','.join(unknown)} (可选: {','.join(SITES)})")
+    try:
+        extra = parse_site_args(args.site_args)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+
+    root = os.path.abspath(args.root)
+    os.makedirs(root, exist_ok=True)
+    # 在导入各爬虫之前配置日志: 它们模块级的 basicConfig 不再生效，所有站点的日志写入同一个文件
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s",
+                        handlers=[logging.FileHandler(os.path.join(root, LOG_NAME), encoding="utf-8")])
+    terminal = sys.stdout
+
+    budget = TransferBudget(args.bandwidth_mb * 1024 * 1024, int(args.disk_gb * 1024 ** 3), disk_path=root)
+    install_transfer_budget(budget)
+
+    runs = []
+    for key in keys:
+        script, base_args = SITES[key]
+        argv = [arg.replace("{dir}", os.path.join(root, key)) for arg in base_args]
+        if args.http2 and key in HTTP2_SITES:
+            argv.append("--http2")
+        runs.append(SiteRun(key, load_site(key, script), argv + extra.get(key, [])))
+
+    print(f"同时运行 {len(runs)} 个站点: {', '.join(run.name for run in runs)}", file=terminal)
+    print(f"保存目录: {root}，各爬虫的输出见 {os.path.join(root, LOG_NAME)}", file=terminal)
+    start = time.monotonic()
+    stop = threading.Event()
+    reporter = threading.Thread(target=report_progress, args=(runs, budget, args.interval, stop, terminal),
+                                name="Progress", daemon=True)
+    # 各爬虫的 print / rich 输出同样写入日志文件，终端只显示合并进度
+    with open(os.path.join(root, LOG_NAME), "a", encoding="utf-8") as output, redirect_stdout(output):
+        reporter.start()
+        with ThreadPoolExecutor(max_workers=len(runs)) as executor:
+            for run in runs:
+                executor.submit(run.run)
+        stop.set()
+        reporter.join()
+        # 爬虫的 console_print 输出由后台线程写入日志文件，关闭文件前等它写完，否则排队的输出会被丢弃
+        flush_async_logging()
+    install_transfer_budget(None)
+
+    print(format_progress(runs, budget, {}, max(time.monotonic() - start, 1e-6)), file=terminal)
+    blocked = budget.exhausted()
+    if blocked:
+        print(f"磁盘预算: {blocked}，部分文件未下载", file=terminal)
+    print(f"全部站点结束，总耗时 {(time.monotonic() - start) / 60:.1f} 分钟 "
+          f"(最慢站点 {max(run.elapsed for run in runs) / 60:.1f} 分钟，各站点之和 {sum(run.elapsed for run in runs) / 60:.1f} 分钟)",
+          file=terminal)
+    return 0 if all(run.state == "完成" for run in runs) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,3236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+各站点爬虫共用的基础组件
+
+功能:
+  - SeenUrlIndex: 已见URL索引，运行期内存 set 去重，跨运行持久化到磁盘
+  - RateLimiter / host_limiter: 按主机的令牌桶限速，多个线程共享同一站点的请求预算
+  - MirrorSet: 同一站点的多个镜像域名，后台探测延迟和成功率，请求发往最快的健康镜像；
+    记录的URL统一改写为主域名，换域名后已完成索引依然有效
+  - SharedImagePool: 全局图片下载池，所有专辑提交到同一组线程，按专辑轮转公平调度
+  - HTTP2Adapter / mount_http2: 可选的 HTTP/2 传输 (需 httpx[http2])，每个主机少量连接多路复用大量图片请求
+    (适配器在 crawler_http2.py 中，启用时才加载)
+  - lazy_import: 重量级依赖 (requests / bs4 / PIL / rich) 第一次使用时才导入，--help 等不联网的模式启动更快
+  - MemoryBudget: 全局在途内存预算，下载前按 Content-Length (或估计值) 预留字节，预算耗尽时阻塞
+  - wait_for_downstream: 发现阶段的反压信号，下载队列排满或内存预算接近上限时暂停解析新页面
+  - CrawlFrontier: 全站发现队列，多个分类/标签的列表页同时向前翻页，专辑按 URL 跨标签去重后轮流交给下载端，
+    下载池在分类/标签和分页边界上不再排空
+  - ListingPrefetcher: 单个分类的列表页预取，处理第 N 页专辑时后台请求并解析第 N+1 页，翻页间隔从上一页请求开始计时
+  - FrontierCheckpoint: 发现队列断点，每翻完一页追加记录各分类/标签的下一页、待下载的专辑和正在写入的文件，
+    中断后从断点继续翻页，写了一半的专辑从中断处补全
+  - AlbumArchive / ArchiveStore: 打包输出模式，每个专辑一个不压缩的 tar 分片 + 索引，代替成千上万个小文件
+  - Storage (LocalStorage / S3Storage) / open_storage: 存储后端抽象，可直接流式分段上传到 S3 兼容对象存储 (需 boto3)
+  - DirSnapshot: 专辑目录的文件列表快照，os.scandir 列出一次后判重只查内存，写入/删除时同步更新，不再逐个 stat；
+    按 transcode.py 的报告找到被转为 WebP 改名的图片
+  - parse_image_dimensions / screen_image_response: 只读图片开头几 KB 解析宽高 (JPEG SOF / PNG IHDR / WebP VP8/VP8L/VP8X)，
+    体积或分辨率不达标时在传输正文前中止下载
+  - DownloadPlanner: 下载前的 HEAD 预检，在限速内批量获取大小和类型，剔除过小/类型不符的对象，
+    给出总字节数、按实测速度估算的剩余时间和下载顺序，并为内存预算和磁盘空间检查提供预期大小
+  - TransferBudget / metered_chunks: 多个站点在同一进程中同时运行时 (crawl_all.py) 共享的带宽与磁盘预算，
+    并按站点统计下载次数和字节数
+  - download_to_file: 响应体直接 readinto 一块复用的大缓冲区后整块写盘，预分配文件，摘要与文件头检查取自同一缓冲区
+  - WorkQueue / drain_work_queue / SharedRateLimiter: 共享卷上的 SQLite 工作队列，协调端写入发现的专辑，
+    多台机器上的 worker 以可续期的租约领取，过期租约自动收回；按主机限速在所有 worker 之间共享
+  - shard_of / ProcessRateTable: 单机多进程分片 (--shards)，专辑按 URL 摘要稳定分配到各进程，
+    按主机限速状态放在共享内存中，所有分片进程共用同一速率预算
+  - StageProfiler / span / profiled: --profile 时记录各流水线阶段的计时区间，导出 Chrome trace-event JSON，
+    可选按阶段保存 cProfile 统计；未启用时几乎没有开销
+  - AsyncLogWriter / install_async_logging / console_print / console_input / flush_async_logging: 日志记录和终端输出放入队列，由后台线程格式化并写文件/终端，
+    下载线程不再等待磁盘和终端；ProgressSampler 限制进度行的输出频率；log_event / JsonLogFormatter 输出结构化记录
+  - TimeAccount / timed / timed_get: 墙钟时间核算，把各工作线程的时间归入主动延迟、重试等待、建立连接、首字节、
+    传输、解析、校验、写盘等类别，运行结束时输出时间分布和最大的可避免开销
+
+特点:
+  - 小规模图库: 全部键常驻内存 set，新增键追加写入日志文件
+  - 超大规模图库 (百万级URL): 日志超过阈值后合并进磁盘上的有序键文件，
+    通过 mmap + 二分查找判重，内存占用与去重开销不随图库增长
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import csv
+import importlib.util
+import json
+import shutil
+import time
+import struct
+import tarfile
+import mmap
+import bisect
+import hashlib
+import atexit
+import logging
+import functools
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter, deque
+from contextlib import contextmanager, nullcontext
+from queue import SimpleQueue
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+
+# -------- 默认配置 --------
+SEEN_KEY_SIZE = 16                  # 每个URL摘要的字节数 (blake2b)
+SEEN_MEMORY_KEYS = 1_000_000        # 内存中最多保留的新增键数量，超过后合并到有序键文件
+HTTP2_KEEPALIVE_CONNECTIONS = 32    # HTTP/2 适配器保持的空闲连接数 (h2 下每个主机通常只需 1 个连接)
+DEFAULT_DOWNLOAD_ESTIMATE = 2 * 1024 * 1024  # 响应没有 Content-Length 时，按此大小预留内存
+QUEUE_HIGH_WATER = 256              # 下载池排队任务超过此数时，发现阶段暂停 (反压)
+ARCHIVE_SUFFIX = ".tar"             # 打包模式下专辑分片的扩展名，索引文件为 <分片>.idx
+S3_PART_SIZE = 8 * 1024 * 1024      # 分段上传每段大小 (S3 要求除最后一段外不小于 5MB)
+S3_MAX_POOL_CONNECTIONS = 64        # 对象存储客户端连接池大小，与下载线程数同量级
+PROBE_MAX_BYTES = 64 * 1024         # 探测图片尺寸时最多读取的字节数 (JPEG 的 EXIF 缩略图可能把 SOF 推后)
+PREFLIGHT_RATE = 10.0               # 预检 HEAD 请求速率上限 (次/秒，按主机共享)
+PREFLIGHT_WORKERS = 8               # 预检并发 HEAD 请求数
+DISK_SPACE_RESERVE = 512 * 1024 * 1024  # 磁盘空间检查时额外保留的字节数
+WORK_LEASE_SECONDS = 600.0          # 分布式 worker 领取专辑的租约时长 (秒)，后台每 1/3 时长续期一次
+WORK_POLL_SECONDS = 10.0            # 队列暂时为空时 worker 重新领取的间隔 (秒)
+WORK_MAX_ATTEMPTS = 3               # 一个专辑最多被领取几次，仍失败则标记为失败
+PROCESS_RATE_SLOTS = 64             # 多进程共享限速表最多容纳的主机数
+PROFILE_MAX_EVENTS = 2_000_000      # --profile 最多保留的计时区间数，超过后只累计各阶段统计
+DOWNLOAD_BUFFER_SIZE = 1024 * 1024  # 大缓冲区下载每次写盘的块大小 (字节)，读满一块才写一次
+PROGRESS_INTERVAL = 1.0             # 同一线程的下载进度最多每隔多少秒输出一行
+PROGRESS_MAX_PER_SECOND = 4         # 所有线程合计每秒最多输出几行下载进度
+FRONTIER_WORKERS = 2                # 全站发现队列中同时向前翻页的分类/标签数
+FRONTIER_MAX_PENDING = 200          # 发现队列中待下载的专辑达到此数时，所有分类/标签暂停翻页 (反压)
+LISTING_LOOKAHEAD = 1               # 列表页预取最多领先调用方几页
+CHECKPOINT_NAME = ".frontier_checkpoint.json"  # 发现队列断点文件 (保存目录下)，旁边的 .journal 为追加日志
+CHECKPOINT_COMPACT_BYTES = 1024 * 1024  # 断点日志超过此大小 (且大于快照) 时合并为新快照，总写入量与专辑数成线性
+MIRROR_PROBE_INTERVAL = 60.0        # 后台探测各镜像的间隔 (秒)
+MIRROR_PROBE_TIMEOUT = 10.0         # 单次镜像探测的超时 (秒)
+MIRROR_MIN_SUCCESS = 0.5            # 成功率 (滑动平均) 低于此值的镜像视为不健康
+MIRROR_EWMA_ALPHA = 0.3             # 镜像延迟和成功率滑动平均中最新一次结果的权重
+TRANSCODE_REPORT_NAME = ".transcode_report.csv"  # transcode.py 的报告 (保存目录下)，new_path 列记录改名后的路径
+
+
+# -------- 延迟导入 --------
+_LAZY_IMPORT_LOCK = threading.RLock()
+
+
+class LazyModule:
+    """模块占位对象: 第一次访问属性时才真正导入 (线程安全)，之后直接转发到真实模块。
+
+    导入前对其设置的属性先记下，等这个占位对象第一次被访问、真正导入时才写入模块；
+    占位对象一直没被访问就一直不导入，记下的设置也不会生效。需要随别的模块一起生效的设置
+    (如 PIL.ImageFile.LOAD_TRUNCATED_IMAGES 要在 PIL.Image 第一次使用时打开) 用 on_load 回调。
+    """
+
+    def __init__(self, name: str, on_load: Optional[Callable[[Any], None]] = None):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_module", None)
+        object.__setattr__(self, "_pending", {})
+        object.__setattr__(self, "_on_load", on_load)
+
+    def _load(self) -> Any:
+        module = self._module
+        if module is None:
+            with _LAZY_IMPORT_LOCK:
+                module = self._module
+                if module is None:
+                    module = importlib.import_module(self._name)
+                    for attr, value in self._pending.items():
+                        setattr(module, attr, value)
+                    if self._on_load is not None:
+                        self._on_load(module)
+                    object.__setattr__(self, "_module", module)
+        return module
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr: str, value: Any) -> None:
+        with _LAZY_IMPORT_LOCK:
+            if self._module is None:
+                self._pending[attr] = value
+                return
+        setattr(self._module, attr, value)
+
+    def __repr__(self) -> str:
+        state = "已导入" if self._module is not None else "未导入"
+        return f"<LazyModule {self._name} ({state})>"
+
+
+def lazy_import(name: str, on_load: Optional[Callable[[Any], None]] = None) -> Any:
+    """返回模块的延迟导入占位对象；模块已导入时直接返回模块本身。
+
+    只检查顶层包是否已安装 (未安装时立即抛出 ImportError，可用于 *_AVAILABLE 检查)，
+    不执行任何包代码；真正的导入推迟到第一次使用。on_load(module) 在真正导入后调用一次
+    (模块已导入时立即调用)。
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        if on_load is not None:
+            on_load(module)
+        return module
+    package = name.partition(".")[0]
+    if package not in sys.modules and importlib.util.find_spec(package) is None:
+        raise ImportError(f"No module named '{package}'", name=package)
+    return LazyModule(name, on_load)
+
+
+def enable_truncated_images(image_module: Any) -> None:
+    """PIL.Image 的 on_load 回调: 允许打开被截断的图片 (ImageFile.LOAD_TRUNCATED_IMAGES)。"""
+    from PIL import ImageFile
+    ImageFile.LOAD_TRUNCATED_IMAGES = True
+
+
+requests = lazy_import("requests")
+
+
+def __getattr__(name: str) -> Any:
+    # 兼容旧的导入方式: from crawler_common import HTTP2Adapter
+    if name == "HTTP2Adapter":
+        from crawler_http2 import HTTP2Adapter
+        return HTTP2Adapter
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# -------- 已见URL索引 --------
+def url_key(url: str) -> bytes:
+    """将URL映射为定长摘要，作为索引键。"""
+    return hashlib.blake2b(url.encode("utf-8"), digest_size=SEEN_KEY_SIZE).digest()
+
+
+class _SortedKeyView:
+    """对有序键文件的只读视图 (mmap + 二分查找)，不把键读入内存。"""
+
+    def __init__(self, path: str):
+        self._file = None
+        self._map: Optional[mmap.mmap] = None
+        self.count = 0
+        if os.path.exists(path) and os.path.getsize(path) >= SEEN_KEY_SIZE:
+            self._file = open(path, "rb")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.count = len(self._map) // SEEN_KEY_SIZE
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, i: int) -> bytes:
+        offset = i * SEEN_KEY_SIZE
+        return self._map[offset:offset + SEEN_KEY_SIZE]
+
+    def __contains__(self, key: bytes) -> bool:
+        if not self.count:
+            return False
+        i = bisect.bisect_left(self, key)
+        return i < self.count and self[i] == key
+
+    def __iter__(self) -> Iterator[bytes]:
+        for i in range(self.count):
+            yield self[i]
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.count = 0
+
+
+class SeenUrlIndex:
+    """已见URL索引，线程安全。
+
+    path 为空时只在内存中去重；指定 path 后:
+      - <path>          有序键文件 (定长摘要升序排列)
+      - <path>.journal  追加日志 (本次及上次运行中尚未合并的键)
+    启动时加载日志到内存 set，有序键文件只做 mmap 映射。
+    """
+
+    def __init__(self, path: Optional[str] = None, memory_keys: int = SEEN_MEMORY_KEYS):
+        self.path = path
+        self.memory_keys = memory_keys
+        self._lock = threading.Lock()
+        self._recent: Set[bytes] = set()
+        self._journal = None
+        self._sorted: Optional[_SortedKeyView] = None
+
+        if path:
+            parent = os.path.dirname(os.path.abspath(path))
+            os.makedirs(parent, exist_ok=True)
+            self._sorted = _SortedKeyView(path)
+            self._recent = self._load_journal(path + ".journal")
+            self._journal = open(path + ".journal", "ab")
+            if len(self._recent) >= self.memory_keys:
+                self._compact()
+            logging.info("已加载URL索引 %s: 有序键 %d 个, 日志键 %d 个",
+                         path, len(self._sorted), len(self._recent))
+
+    @staticmethod
+    def _load_journal(journal_path: str) -> Set[bytes]:
+        keys: Set[bytes] = set()
+        if not os.path.exists(journal_path):
+            return keys
+        with open(journal_path, "rb") as f:
+            data = f.read()
+        # 末尾可能有上次异常退出写了一半的键，直接丢弃
+        usable = len(data) - len(data) % SEEN_KEY_SIZE
+        for offset in range(0, usable, SEEN_KEY_SIZE):
+            keys.add(data[offset:offset + SEEN_KEY_SIZE])
+        return keys
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._recent) + (len(self._sorted) if self._sorted else 0)
+
+    def __contains__(self, url: str) -> bool:
+        key = url_key(url)
+        with self._lock:
+            return self._has_key(key)
+
+    def _has_key(self, key: bytes) -> bool:
+        if key in self._recent:
+            return True
+        return self._sorted is not None and key in self._sorted
+
+    def add(self, url: str) -> bool:
+        """记录URL。首次出现返回 True，已存在返回 False (可直接用于去重判断)。"""
+        with self._lock:
+            return self._add_key(url_key(url))
+
+    def _add_key(self, key: bytes) -> bool:
+        """记录一个键 (调用方持有锁)。"""
+        if self._has_key(key):
+            return False
+        self._recent.add(key)
+        if self._journal is not None:
+            self._journal.write(key)
+            self._journal.flush()
+            if len(self._recent) >= self.memory_keys:
+                self._compact()
+        return True
+
+    def update(self, urls: Iterable[str]) -> int:
+        """批量记录URL，返回新增数量。"""
+        return sum(1 for url in urls if self.add(url))
+
+    def absorb(self, other_path: str) -> int:
+        """把另一个索引 (如 --shards 分片进程各自写入的索引) 的键合并进来，然后删除它的文件。返回新增数量。"""
+        keys = self._load_journal(other_path + ".journal")
+        view = _SortedKeyView(other_path)
+        keys.update(view)
+        view.close()
+        with self._lock:
+            added = sum(1 for key in sorted(keys) if self._add_key(key))
+        for path in (other_path, other_path + ".journal"):
+            if os.path.exists(path):
+                os.remove(path)
+        return added
+
+    def _compact(self) -> None:
+        """将内存中的新增键与有序键文件归并，写出新的有序键文件并清空日志 (调用方持有锁)。"""
+        if not self.path or not self._recent:
+            return
+        tmp_path = self.path + ".tmp"
+        merged = 0
+        with open(tmp_path, "wb") as out:
+            for key in _merge_sorted(iter(self._sorted), sorted(self._recent)):
+                out.write(key)
+                merged += 1
+            out.flush()
+            os.fsync(out.fileno())
+        self._sorted.close()
+        os.replace(tmp_path, self.path)
+        self._journal.close()
+        self._journal = open(self.path + ".journal", "wb")
+        self._recent = set()
+        self._sorted = _SortedKeyView(self.path)
+        logging.info("URL索引已合并: %s (共 %d 个键)", self.path, merged)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            if self._sorted is not None:
+                self._sorted.close()
+
+
+def _merge_sorted(a: Iterator[bytes], b: List[bytes]) -> Iterator[bytes]:
+    """归并两个升序键序列，去掉重复键。"""
+    b_iter = iter(b)
+    x = next(a, None)
+    y = next(b_iter, None)
+    last = None
+    while x is not None or y is not None:
+        if y is None or (x is not None and x <= y):
+            cur, x = x, next(a, None)
+        else:
+            cur, y = y, next(b_iter, None)
+        if cur != last:
+            yield cur
+            last = cur
+
+
+# -------- 按主机限速 --------
+class RateLimiter:
+    """令牌桶限速器，线程安全。rate 为每秒发放的令牌数，burst 为桶容量。"""
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """取走令牌，预算不足时阻塞等待。返回实际等待的秒数。"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= tokens
+            # 令牌可以透支: 先到的线程先排队，等待时间按欠账计算，保证 FIFO 且不忙等
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+_HOST_LIMITERS: Dict[str, RateLimiter] = {}
+_HOST_LIMITERS_LOCK = threading.Lock()
+
+
+def host_limiter(url: str, rate: float, burst: float = 1.0) -> RateLimiter:
+    """获取URL所属主机的共享限速器 (同一主机只创建一次，后续调用忽略 rate/burst)。
+
+    调用过 share_host_limits() 时返回保存在工作队列文件 (多台机器) 或共享内存 (多个分片进程) 中的限速器。
+    """
+    host = urlparse(url).netloc.lower()
+    with _HOST_LIMITERS_LOCK:
+        limiter = _HOST_LIMITERS.get(host)
+        if limiter is None:
+            if _SHARED_HOST_LIMITS is not None:
+                # 分布式/多进程运行: 所有 worker 或分片进程共用同一份限速状态
+                limiter = _SHARED_HOST_LIMITS.limiter(host, rate, burst)
+            else:
+                limiter = RateLimiter(rate, burst)
+            _HOST_LIMITERS[host] = limiter
+        return limiter
+
+
+# -------- 镜像站点切换 --------
+def _format_latency(latency: float) -> str:
+    return f"{latency * 1000:.0f}ms" if latency != float("inf") else "-"
+
+
+class _MirrorStats:
+    __slots__ = ("latency", "success", "last_ok", "requests", "failures")
+
+    def __init__(self):
+        self.latency = float("inf")   # 延迟滑动平均 (秒)，尚无成功记录时为 inf
+        self.success = 1.0            # 成功率滑动平均
+        self.last_ok = True           # 最近一次请求/探测是否成功
+        self.requests = 0
+        self.failures = 0
+
+
+class MirrorSet:
+    """同一站点的多个镜像域名: 探测各镜像的延迟和成功率，请求改写到最快的健康镜像。
+
+    - canonical 为固定的记录域名，与镜像列表分开配置 (不必是仍可访问的镜像): 程序内和磁盘上记录的URL
+      (已完成索引、失败列表等) 统一用 canonical() 改写为该域名，发请求前才由 route() 改写到当前选中的镜像，
+      镜像的增删和顺序调整都不影响已记录的URL
+    - probe(URL) 对镜像根地址 + probe_path 做一次轻量请求，返回是否成功；创建时并发探测一轮，
+      之后后台线程每 interval 秒探测一次 (只有一个镜像或未传 probe 时不探测)
+    - 实际请求的结果通过 record(镜像, 成功, 耗时) 计入: 延迟和成功率按滑动平均更新，请求失败的镜像立即不再选用，
+      直到再次探测或请求成功
+    - 健康的镜像 (最近一次成功且成功率不低于 min_success) 中选延迟最低的；都不健康时选成功率最高的
+    - 不属于任何镜像的URL (如独立的图片 CDN) 原样返回
+    """
+
+    def __init__(self, mirrors: Iterable[str], canonical: str, probe: Optional[Callable[[str], bool]] = None, probe_path: str = "/",
+                 interval: float = MIRROR_PROBE_INTERVAL, min_success: float = MIRROR_MIN_SUCCESS):
+        self.mirrors: List[str] = []
+        for mirror in mirrors:
+            mirror = mirror.rstrip("/")
+            if mirror and mirror not in self.mirrors:
+                self.mirrors.append(mirror)
+        if not self.mirrors:
+            raise ValueError("至少需要一个镜像地址")
+        self.canonical_base = canonical.rstrip("/")
+        self.probe = probe
+        self.probe_path = probe_path
+        self.interval = interval
+        self.min_success = min_success
+        self._hosts = {urlparse(self.canonical_base).netloc.lower(): self.canonical_base}  # 记录下来的URL也能改写到镜像
+        self._hosts.update((urlparse(mirror).netloc.lower(), mirror) for mirror in self.mirrors)
+        self._stats = {mirror: _MirrorStats() for mirror in self.mirrors}
+        self._lock = threading.Lock()
+        self._best = self.mirrors[0]
+        self._stop = threading.Event()
+        self._announce = False  # 启动时的第一轮探测不逐次输出切换记录
+        if probe is not None and len(self.mirrors) > 1:
+            self.probe_all()  # 第一个请求就发往最快的镜像
+            logging.info("[镜像] 选用 %s (共 %d 个镜像，%d 个可用)", self._best, len(self.mirrors),
+                         sum(1 for mirror in self.mirrors if self.healthy(mirror)))
+            threading.Thread(target=self._run, name="MirrorProbe", daemon=True).start()
+        self._announce = True
+
+    def _split(self, url: str) -> Tuple[Optional[str], str]:
+        """(URL 所属镜像, 域名之后的部分)；不属于任何镜像时镜像为 None。"""
+        parsed = urlparse(url)
+        mirror = self._hosts.get(parsed.netloc.lower())
+        if mirror is None:
+            return None, url
+        return mirror, url.split(parsed.netloc, 1)[1]
+
+    def canonical(self, url: str) -> str:
+        """任一镜像的URL改写为记录域名形式 (用于记录和判重)。"""
+        mirror, rest = self._split(url)
+        return url if mirror is None else self.canonical_base + rest
+
+    def route(self, url: str) -> Tuple[Optional[str], str]:
+        """改写到当前最佳镜像，返回 (镜像, 请求URL)；不属于任何镜像的URL返回 (None, 原URL)。"""
+        mirror, rest = self._split(url)
+        if mirror is None:
+            return None, url
+        best = self.best()
+        return best, best + rest
+
+    def best(self) -> str:
+        with self._lock:
+            return self._best
+
+    def record(self, mirror: Optional[str], ok: bool, latency: Optional[float] = None) -> None:
+        """计入一次请求或探测的结果。"""
+        stats = self._stats.get(mirror) if mirror is not None else None
+        if stats is None:
+            return
+        with self._lock:
+            stats.requests += 1
+            stats.last_ok = ok
+            stats.success += MIRROR_EWMA_ALPHA * ((1.0 if ok else 0.0) - stats.success)
+            if ok and latency is not None:
+                stats.latency = latency if stats.latency == float("inf") else \
+                    stats.latency + MIRROR_EWMA_ALPHA * (latency - stats.latency)
+            if not ok:
+                stats.failures += 1
+            previous, self._best = self._best, self._choose()
+            best, best_stats = self._best, self._stats[self._best]
+        if best != previous and self._announce:
+            logging.info("[镜像] 切换到 %s (延迟 %s，成功率 %.0f%%)", best, _format_latency(best_stats.latency),
+                         best_stats.success * 100)
+
+    def healthy(self, mirror: str) -> bool:
+        """镜像最近一次请求/探测成功，且成功率不低于 min_success。"""
+        stats = self._stats.get(mirror)
+        return stats is not None and stats.last_ok and stats.success >= self.min_success
+
+    def _choose(self) -> str:
+        healthy = [m for m in self.mirrors if self.healthy(m)]
+        if healthy:
+            return min(healthy, key=lambda m: self._stats[m].latency)
+        return max(self.mirrors, key=lambda m: self._stats[m].success)
+
+    def _probe_one(self, mirror: str) -> None:
+        start = time.monotonic()
+        try:
+            ok = bool(self.probe(mirror + self.probe_path))
+        except Exception as e:
+            logging.debug("[镜像] 探测 %s 失败: %s", mirror, e)
+            ok = False
+        self.record(mirror, ok, time.monotonic() - start)
+
+    def probe_all(self) -> None:
+        """并发探测所有镜像一次。"""
+        with ThreadPoolExecutor(max_workers=len(self.mirrors), thread_name_prefix="MirrorProbe") as executor:
+            list(executor.map(self._probe_one, self.mirrors))
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.probe_all()
+
+    def close(self) -> None:
+        """停止后台探测。"""
+        self._stop.set()
+
+    def summary(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for mirror in self.mirrors:
+                stats = self._stats[mirror]
+                mark = "*" if mirror == self._best else " "
+                lines.append(f"{mark} {mirror}  延迟 {_format_latency(stats.latency)}  成功率 {stats.success:.0%}  "
+                             f"请求 {stats.requests} 次，失败 {stats.failures} 次")
+        return lines
+
+
+# -------- 全局图片下载池 --------
+class AlbumBatch:
+    """一个专辑在共享下载池中的任务批次。
+
+    counts 统计每个任务的返回值 (如 "ok"/"skipped"/"fail" 或 True/False)，
+    任务抛出异常时记为 error_result。close() 之后且所有任务完成时调用 on_complete(batch)。
+    """
+
+    def __init__(self, pool: "SharedImagePool", name: str,
+                 on_complete: Optional[Callable[["AlbumBatch"], None]], error_result: Any):
+        self.pool = pool
+        self.name = name
+        self.on_complete = on_complete
+        self.error_result = error_result
+        self.counts: Counter = Counter()
+        self.submitted = 0
+        self._tasks: Deque[Tuple[Callable, tuple, dict]] = deque()
+        self._running = 0
+        self._closed = False
+        self._finishing = False
+        self._done = threading.Event()
+
+    def submit(self, fn: Callable, *args, **kwargs) -> int:
+        """提交一个下载任务，返回该任务在本专辑中的序号 (从 1 开始)。"""
+        return self.pool._submit(self, fn, args, kwargs)
+
+    def add_result(self, result: Any, n: int = 1) -> None:
+        """直接记录结果 (如专辑页请求失败)，不经过下载池。"""
+        with self.pool._cond:
+            self.counts[result] += n
+
+    def close(self) -> None:
+        """声明不再提交新任务。任务已全部完成时立即触发完成回调。"""
+        self.pool._close_batch(self)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+
+class SharedImagePool:
+    """全局图片下载池。
+
+    所有专辑共用 max_workers 个下载线程。每个专辑有自己的任务队列，
+    工作线程按专辑轮转取任务: 多个专辑同时有任务时机会均等，
+    只剩一个大专辑时所有空闲线程都去帮它，不再受单专辑并发上限限制。
+    max_open_albums 限制同时处于未完成状态的专辑数，超过时 open_album 阻塞，
+    避免发现阶段跑得太远。
+    """
+
+    def __init__(self, max_workers: int, thread_name_prefix: str = "ImageDownloader",
+                 max_open_albums: int = 0):
+        self.max_workers = max_workers
+        self.max_open_albums = max_open_albums
+        self._cond = threading.Condition()
+        self._ready: Deque[AlbumBatch] = deque()
+        self._open: Set[AlbumBatch] = set()
+        self._queued = 0
+        self._shutdown = False
+        self._threads = []
+        for i in range(max_workers):
+            t = threading.Thread(target=self._worker, name=f"{thread_name_prefix}_{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def open_album(self, name: str, on_complete: Optional[Callable[[AlbumBatch], None]] = None,
+                   error_result: Any = "fail") -> AlbumBatch:
+        with self._cond:
+            while self.max_open_albums and len(self._open) >= self.max_open_albums and not self._shutdown:
+                self._cond.wait()
+            batch = AlbumBatch(self, name, on_complete, error_result)
+            self._open.add(batch)
+            return batch
+
+    @property
+    def open_albums(self) -> int:
+        with self._cond:
+            return len(self._open)
+
+    @property
+    def queued_tasks(self) -> int:
+        """等待执行的任务数 (不含正在执行的)。"""
+        with self._cond:
+            return self._queued
+
+    def wait_for_room(self, max_queued: int, timeout: Optional[float] = None) -> float:
+        """反压信号: 排队任务数超过 max_queued 时阻塞调用方 (发现阶段)，直到下载线程消化到阈值以下。
+
+        返回实际等待的秒数。
+        """
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        with self._cond:
+            while self._queued > max_queued and not self._shutdown:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+        return time.monotonic() - start
+
+    def _submit(self, batch: AlbumBatch, fn: Callable, args: tuple, kwargs: dict) -> int:
+        with self._cond:
+            if batch._closed:
+                raise RuntimeError(f"专辑任务批次已关闭: {batch.name}")
+            batch.submitted += 1
+            self._queued += 1
+            if not batch._tasks:
+                self._ready.append(batch)
+            batch._tasks.append((fn, args, kwargs))
+            self._cond.notify()
+            return batch.submitted
+
+    def _close_batch(self, batch: AlbumBatch) -> None:
+        with self._cond:
+            batch._closed = True
+            finished = self._maybe_finish(batch)
+        if finished:
+            self._run_callback(batch)
+
+    def _maybe_finish(self, batch: AlbumBatch) -> bool:
+        """批次已关闭且无待办/进行中任务时标记为结束中 (调用方持有锁)。"""
+        if batch._closed and not batch._tasks and not batch._running and not batch._finishing:
+            batch._finishing = True
+            return True
+        return False
+
+    def _run_callback(self, batch: AlbumBatch) -> None:
+        try:
+            if batch.on_complete is not None:
+                batch.on_complete(batch)
+        except Exception:
+            logging.exception("专辑完成回调异常: %s", batch.name)
+        finally:
+            batch._done.set()
+            with self._cond:
+                self._open.discard(batch)
+                self._cond.notify_all()
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                while not self._ready and not self._shutdown:
+                    self._cond.wait()
+                if not self._ready:
+                    return
+                # 轮转: 取队首专辑的一个任务，若还有剩余则把专辑放回队尾
+                batch = self._ready.popleft()
+                fn, args, kwargs = batch._tasks.popleft()
+                if batch._tasks:
+                    self._ready.append(batch)
+                batch._running += 1
+                self._queued -= 1
+                self._cond.notify_all()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception:
+                logging.exception("图片下载任务异常 [%s]", batch.name)
+                result = batch.error_result
+            with self._cond:
+                batch._running -= 1
+                batch.counts[result] += 1
+                finished = self._maybe_finish(batch)
+            if finished:
+                self._run_callback(batch)
+
+    def join(self) -> None:
+        """等待所有已打开的专辑完成 (包括完成回调)。"""
+        with self._cond:
+            while self._open:
+                self._cond.wait()
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+        if wait:
+            for t in self._threads:
+                t.join()
+
+
+# -------- 可选的 HTTP/2 传输 --------
+def http2_available() -> bool:
+    """检查 httpx 及其 HTTP/2 支持 (h2) 是否已安装。"""
+    try:
+        import httpx  # noqa: F401
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def mount_http2(session: requests.Session, max_keepalive_connections: int = HTTP2_KEEPALIVE_CONNECTIONS,
+                prior_knowledge: bool = False) -> bool:
+    """为 session 挂载 HTTP/2 适配器。httpx/h2 未安装时记录警告并保持 HTTP/1.1，返回是否启用成功。"""
+    if not http2_available():
+        logging.warning("未安装 httpx[http2]，继续使用 HTTP/1.1 (请运行: pip install 'httpx[http2]')")
+        return False
+    from crawler_http2 import HTTP2Adapter
+    adapter = HTTP2Adapter(max_keepalive_connections=max_keepalive_connections, prior_knowledge=prior_knowledge)
+    if not prior_knowledge:
+        session.mount("https://", adapter)
+    else:
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+    logging.info("已启用 HTTP/2 传输 (同一主机的请求多路复用，不支持 h2 的服务器自动回退 HTTP/1.1)")
+    return True
+
+
+# -------- 在途内存预算 --------
+class MemoryReservation:
+    """一次下载占用的内存预留，作为上下文管理器使用，退出时归还。"""
+
+    def __init__(self, budget: "MemoryBudget"):
+        self.budget = budget
+        self.nbytes = 0
+
+    def resize(self, nbytes: int) -> None:
+        """把预留调整为 nbytes。增加时若预算不足则阻塞，减少时立即归还。"""
+        self.budget._resize(self, max(0, int(nbytes)))
+
+    def reserve_for(self, response: Any) -> int:
+        """按响应头的 Content-Length 预留 (没有时使用预算的默认估计值)，返回预留字节数。"""
+        expected = self.budget.expected_size(response)
+        self.resize(expected)
+        return expected
+
+    def release(self) -> None:
+        self.resize(0)
+
+    def __enter__(self) -> "MemoryReservation":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+class MemoryBudget:
+    """全局在途内存预算 (字节)，线程安全。
+
+    每个下载在读取响应体之前预留其预期大小，已预留总量超过上限时阻塞，直到其他下载写盘归还。
+    单个对象超过整个预算时，只要没有其他在途预留也会放行，避免永久阻塞。
+    limit_bytes <= 0 表示不限制。
+    """
+
+    def __init__(self, limit_bytes: int, default_estimate: int = DEFAULT_DOWNLOAD_ESTIMATE):
+        self.limit = limit_bytes
+        self.default_estimate = default_estimate
+        self.in_use = 0
+        self.peak = 0
+        self._cond = threading.Condition()
+
+    def expected_size(self, response: Any) -> int:
+        try:
+            length = int(response.headers.get("Content-Length", ""))
+            if length > 0:
+                return length
+        except (TypeError, ValueError, AttributeError):
+            pass
+        return self.default_estimate
+
+    def reserve(self, nbytes: int = 0) -> MemoryReservation:
+        reservation = MemoryReservation(self)
+        if nbytes:
+            reservation.resize(nbytes)
+        return reservation
+
+    def _resize(self, reservation: MemoryReservation, nbytes: int) -> None:
+        with self._cond:
+            delta = nbytes - reservation.nbytes
+            if delta > 0 and self.limit > 0:
+                # 其他下载也占用预算时才需要等待；只有自己时直接放行
+                while self.in_use + delta > self.limit and self.in_use - reservation.nbytes > 0:
+                    self._cond.wait()
+            self.in_use += delta
+            reservation.nbytes = nbytes
+            self.peak = max(self.peak, self.in_use)
+            if delta < 0:
+                self._cond.notify_all()
+
+    @property
+    def pressure(self) -> float:
+        """已预留占上限的比例 (0~1+)，不限制时恒为 0。"""
+        if self.limit <= 0:
+            return 0.0
+        with self._cond:
+            return self.in_use / self.limit
+
+    def wait_below(self, fraction: float = 0.9, timeout: Optional[float] = None) -> float:
+        """反压信号: 已预留超过上限的 fraction 时阻塞调用方 (发现阶段)。返回实际等待的秒数。"""
+        start = time.monotonic()
+        if self.limit <= 0:
+            return 0.0
+        deadline = None if timeout is None else start + timeout
+        with self._cond:
+            while self.in_use > self.limit * fraction:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+        return time.monotonic() - start
+
+
+def wait_for_downstream(pool: Optional[SharedImagePool], budget: Optional[MemoryBudget] = None,
+                        max_queued: int = QUEUE_HIGH_WATER, memory_fraction: float = 0.9) -> float:
+    """发现阶段在请求下一个列表页/专辑页之前调用: 下游下载队列或内存预算吃紧时阻塞。返回等待的秒数。"""
+    waited = 0.0
+    if pool is not None:
+        waited += pool.wait_for_room(max_queued)
+    if budget is not None:
+        waited += budget.wait_below(memory_fraction)
+    return waited
+
+
+# -------- 全站发现队列 (跨分类/标签) --------
+class FrontierItem:
+    """发现队列交出的一个专辑。"""
+    __slots__ = ("url", "title", "source", "payload")
+
+    def __init__(self, url: str, title: str, source: str, payload: Any = None):
+        self.url = url
+        self.title = title
+        self.source = source    # 第一个发现该专辑的分类/标签
+        self.payload = payload
+
+
+class CrawlFrontier:
+    """全站发现队列: 多个分类/标签的列表页同时向前翻页，发现的专辑按来源轮流交给下载端。
+
+    - sources 为 [(来源名, 第一页URL)]；fetch_page(来源名, 页URL) 返回 ([(专辑URL, 标题, 附加数据)], 下一页URL)，
+      返回 None 表示该来源到此结束。站点限速和失败重试由 fetch_page 负责
+    - 同时翻页的来源数为 workers，一个来源翻完后开始下一个；来源内按顺序翻页 (下一页链接来自本页)，
+      每两页之间等待 page_delay() 秒
+    - 专辑按 URL 去重: 出现在多个标签下的专辑只交出一次，归属第一个发现它的来源；skip(url) 为真的专辑
+      (如历史运行中已完成的) 不交出
+    - 待交出的专辑达到 max_pending 时所有来源暂停翻页，下载端跟上后继续
+    - on_albums(来源名, [FrontierItem]) 在每页去重后于翻页线程中调用 (如更新状态表、写入分布式工作队列)
+    - 传入 checkpoint 时每页处理完都写入断点，重启后各来源从记录的下一页继续，上次未完成的专辑最先交出；
+      下载端完成专辑后调用 checkpoint.done(专辑URL)
+    - 下载端迭代 frontier (或调用 get())，各来源的专辑轮流交出；所有来源翻完且专辑全部交出后迭代结束。
+      提前停止迭代时 (break、Ctrl+C、异常) 应在 finally 中 close()；翻页线程是守护线程，漏掉 close()
+      也不会阻止解释器退出
+    """
+
+    def __init__(self, sources: Iterable[Tuple[str, str]],
+                 fetch_page: Callable[[str, str], Optional[Tuple[Iterable[Tuple[str, str, Any]], Optional[str]]]],
+                 workers: int = FRONTIER_WORKERS, max_pending: int = FRONTIER_MAX_PENDING,
+                 page_delay: Optional[Callable[[], float]] = None, skip: Optional[Callable[[str], bool]] = None,
+                 on_albums: Optional[Callable[[str, List[FrontierItem]], None]] = None,
+                 checkpoint: Optional["FrontierCheckpoint"] = None):
+        self.fetch_page = fetch_page
+        self.max_pending = max_pending
+        self.page_delay = page_delay
+        self.skip = skip
+        self.on_albums = on_albums
+        self.checkpoint = checkpoint
+        self.stats: Counter = Counter()   # pages / albums / duplicates / skipped
+        self._seen = SeenUrlIndex()
+        self._cond = threading.Condition()
+        self._pending: Dict[str, Deque[FrontierItem]] = {}
+        self._ready: Deque[str] = deque()
+        self._count = 0
+        self._closed = False
+        walks = []
+        for source, url in sources:
+            page = 0
+            if checkpoint is not None:
+                # 从断点继续: 已翻完的来源不再翻页，其余从记录的下一页开始
+                position = checkpoint.position(source)
+                if position is not None:
+                    url, page = position
+            if url:
+                walks.append((source, url, page))
+        if checkpoint is not None:
+            # 上次已发现但未完成的专辑先交出
+            for item in checkpoint.pending():
+                self._seen.add(item.url)
+                self._queue(item.source, [item])
+        self._remaining = len(walks)
+        self._walks: Deque[Tuple[str, str, int]] = deque(walks)
+        # 守护线程 (ThreadPoolExecutor 的线程在解释器退出时会被等待，阻塞在 max_pending 上的翻页线程会让进程无法退出)
+        for i in range(min(max(1, workers), len(walks))):
+            threading.Thread(target=self._run_walks, name=f"Frontier_{i}", daemon=True).start()
+
+    def _run_walks(self) -> None:
+        """翻页线程: 依次领取来源翻页，直到没有未开始的来源或已 close()。"""
+        while True:
+            with self._cond:
+                if not self._walks or self._closed:
+                    return
+                walk = self._walks.popleft()
+            self._walk(*walk)
+
+    def _walk(self, source: str, url: Optional[str], page: int = 0) -> None:
+        first_page = page
+        try:
+            while url and not self._closed:
+                if page > first_page and self.page_delay is not None:
+                    with span("sleep"):
+                        time.sleep(self.page_delay())
+                with self._cond:
+                    while self._count >= self.max_pending and not self._closed:
+                        self._cond.wait()
+                if self._closed:
+                    return
+                page += 1
+                try:
+                    result = self.fetch_page(source, url)
+                except Exception as e:
+                    logging.error("[发现队列] %s 第 %d 页处理异常 %s: %s", source, page, url, e)
+                    result = None
+                if result is None:
+                    return
+                albums, url = result
+                self._put(source, albums, page, url)
+        finally:
+            with self._cond:
+                self._remaining -= 1
+                self._cond.notify_all()
+
+    def _put(self, source: str, albums: Iterable[Tuple[str, str, Any]], page: int, next_url: Optional[str]) -> None:
+        items = []
+        duplicates = skipped = 0
+        for url, title, payload in albums:
+            if not self._seen.add(url):
+                duplicates += 1
+            elif self.skip is not None and self.skip(url):
+                skipped += 1
+            else:
+                items.append(FrontierItem(url, title, source, payload))
+        if items and self.on_albums is not None:
+            self.on_albums(source, items)
+        if self.checkpoint is not None:
+            # 先记入断点再交给下载端，下载端完成专辑时断点中一定已有该专辑
+            self.checkpoint.page_done(source, next_url, page, items)
+        with self._cond:
+            self.stats.update(pages=1, albums=len(items), duplicates=duplicates, skipped=skipped)
+        self._queue(source, items)
+
+    def _queue(self, source: str, items: List[FrontierItem]) -> None:
+        if not items:
+            return
+        with self._cond:
+            queue = self._pending.setdefault(source, deque())
+            if not queue:
+                self._ready.append(source)
+            queue.extend(items)
+            self._count += len(items)
+            self._cond.notify_all()
+
+    def get(self) -> Optional[FrontierItem]:
+        """取下一个专辑 (各来源轮流)，暂时没有时阻塞；全部交出或已 close() 时返回 None。"""
+        with self._cond:
+            while not self._ready:
+                if self._remaining == 0 or self._closed:
+                    return None
+                self._cond.wait()
+            source = self._ready.popleft()
+            queue = self._pending[source]
+            item = queue.popleft()
+            if queue:
+                self._ready.append(source)
+            self._count -= 1
+            self._cond.notify_all()
+            return item
+
+    def __iter__(self) -> Iterator[FrontierItem]:
+        while True:
+            item = self.get()
+            if item is None:
+                return
+            yield item
+
+    @property
+    def pending(self) -> int:
+        """已发现但尚未交出的专辑数。"""
+        with self._cond:
+            return self._count
+
+    def close(self) -> None:
+        """停止翻页并丢弃未交出的专辑 (如磁盘空间不足)；正在请求的页面完成后线程退出。"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def summary(self) -> str:
+        with self._cond:
+            stats = dict(self.stats)
+        return (f"列表页 {stats.get('pages', 0)} 页，新专辑 {stats.get('albums', 0)} 个，"
+                f"跨分类/标签重复 {stats.get('duplicates', 0)} 个，已完成跳过 {stats.get('skipped', 0)} 个")
+
+
+class ListingPrefetcher:
+    """列表页预取: 调用方处理第 N 页专辑的同时，后台线程请求并解析第 N+1 页，分页边界上不再等待列表页。
+
+    - fetch_page(页码, 页URL) 返回 (本页专辑列表, 下一页URL)；下一页URL 为空或已经翻过时结束
+    - 最多领先 lookahead 页: 调用方处理完第 N 页、取第 N+1 页时才开始请求第 N+1+lookahead 页；
+      lookahead=0 时与顺序翻页相同
+    - 相邻两次列表页请求的开始时间至少间隔 page_delay() 秒 (处理专辑的时间计入间隔)，传入 limiter 时
+      请求前还要从站点限速器取令牌，翻页频率不超过原来的顺序翻页
+    - 迭代得到 (页码, 页URL, 本页专辑列表)
+    """
+
+    def __init__(self, start_url: str, fetch_page: Callable[[int, str], Tuple[List[Any], Optional[str]]],
+                 page_delay: Optional[Callable[[], float]] = None, limiter: Optional[RateLimiter] = None,
+                 lookahead: int = LISTING_LOOKAHEAD):
+        self.fetch_page = fetch_page
+        self.page_delay = page_delay
+        self.limiter = limiter
+        self._slots = threading.Semaphore(max(0, lookahead) + 1)
+        self._pages: SimpleQueue = SimpleQueue()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(start_url,), name="ListingPrefetch", daemon=True)
+        self._thread.start()
+
+    def _run(self, url: Optional[str]) -> None:
+        seen: Set[str] = set()
+        page = 0
+        last_start: Optional[float] = None
+        try:
+            while url and url not in seen:
+                self._slots.acquire()
+                if self._closed.is_set():
+                    return
+                if last_start is not None and self.page_delay is not None:
+                    remaining = self.page_delay() - (time.monotonic() - last_start)
+                    if remaining > 0:
+                        with span("sleep"):
+                            if self._closed.wait(remaining):
+                                return
+                if self.limiter is not None:
+                    with span("rate_wait"):
+                        self.limiter.acquire()
+                seen.add(url)
+                page += 1
+                last_start = time.monotonic()
+                try:
+                    albums, next_url = self.fetch_page(page, url)
+                except Exception as e:
+                    logging.error("[列表页预取] 第 %d 页处理异常 %s: %s", page, url, e)
+                    albums, next_url = [], None
+                self._pages.put((page, url, albums))
+                url = next_url
+        finally:
+            self._pages.put(None)
+
+    def __iter__(self) -> Iterator[Tuple[int, str, List[Any]]]:
+        first = True
+        while True:
+            if not first:
+                self._slots.release()  # 上一页已处理完，允许再向前请求一页
+            first = False
+            item = self._pages.get()
+            if item is None:
+                return
+            yield item
+
+    def close(self) -> None:
+        """停止预取 (调用方提前结束翻页时)。"""
+        self._closed.set()
+        self._slots.release()
+
+
+class FrontierCheckpoint:
+    """发现队列断点: 快照文件 + 追加日志，运行中断后从断点继续。
+
+    - 记录每个分类/标签的下一页 URL 和已翻页数 (下一页为 null 表示该来源已翻完)，重启后从下一页继续，
+      不再从第一页重新翻起
+    - 记录已发现但尚未完成的专辑 (含正在下载的)，重启后最先交给下载端；专辑页解析出的图片列表也一并记录，
+      续传时不必再请求专辑页，已完整的图片由各爬虫原有的存在性检查跳过
+    - writing(路径) 期间该文件记为正在写入: 直接写入最终路径的下载被中断时，重启后先删除写了一半的文件
+    - 整次运行正常结束且所有来源都已翻完时 finish() 删除翻页位置，下次运行从第一页开始发现新专辑；
+      下载失败的专辑仍留在断点中，下次运行最先重试，全部完成后才删除断点文件
+
+    文件:
+      - <path>          JSON 快照 (临时文件写完 fsync 后 os.replace，断电也不会留下半个快照)
+      - <path>.journal  追加日志，每次变化写一行 JSON (只写本次变化的内容，不重写整个状态)；
+                        日志超过 CHECKPOINT_COMPACT_BYTES 且大于快照时合并为新快照并清空日志
+    启动时读快照后按顺序重放日志，末尾写了一半的行丢弃。
+    """
+
+    def __init__(self, path: str, resume: bool = True):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self._lock = threading.Lock()
+        self._sources: Dict[str, List[Any]] = {}   # 来源 -> [下一页URL, 已翻页数]
+        self._albums: Dict[str, List[Any]] = {}    # 专辑URL -> [标题, 来源, 附加数据, 图片列表]
+        self._writing: Set[str] = set()
+        if resume:
+            self._load()
+        self.resumed = bool(self._sources or self._albums)
+        for partial in sorted(self._writing):
+            if os.path.exists(partial):
+                os.remove(partial)
+                logging.info("[断点] 删除上次中断时写了一半的文件: %s", partial)
+        self._writing.clear()
+        self._journal = None
+        self._snapshot_bytes = 0
+        self._compact()  # 启动时合并一次，日志从空开始
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            self._sources = state.get("sources", {})
+            self._albums = state.get("albums", {})
+            self._writing = set(state.get("writing", []))
+        except (OSError, ValueError):
+            pass
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break  # 中断时写了一半的行
+                    self._apply(record)
+        except OSError:
+            pass
+
+    def _apply(self, record: Dict[str, Any]) -> None:
+        """在内存状态上执行一条日志记录 (加载重放与运行时共用，按顺序重放结果相同)。"""
+        op = record["op"]
+        if op == "page":
+            self._sources[record["source"]] = [record["next"], record["page"]]
+            for url, title, source, payload in record["albums"]:
+                self._albums.setdefault(url, [title, source, payload, None])
+        elif op == "images":
+            entry = self._albums.get(record["url"])
+            if entry is not None:
+                entry[3] = record["images"]
+        elif op == "done":
+            self._albums.pop(record["url"], None)
+        elif op == "writing":
+            self._writing.add(record["path"])
+        elif op == "written":
+            self._writing.discard(record["path"])
+
+    def _record(self, record: Dict[str, Any], sync: bool = False) -> None:
+        """执行一条记录并追加到日志 (调用方持有锁)。sync 时等待落盘 (断电后仍能找到写了一半的文件)。"""
+        self._apply(record)
+        if self._journal is None:
+            self._compact()  # finish() 删除断点文件后又有新记录时重新创建
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        self._journal.write(line)
+        self._journal.flush()
+        if sync:
+            os.fsync(self._journal.fileno())
+        self._journal_bytes += len(line.encode("utf-8"))
+        if self._journal_bytes > max(CHECKPOINT_COMPACT_BYTES, self._snapshot_bytes):
+            self._compact()
+
+    def _compact(self) -> None:
+        """把当前状态写成新快照并清空日志 (调用方持有锁)。快照先 fsync 再替换，之后才清空日志。"""
+        state = {"sources": self._sources, "albums": self._albums, "writing": sorted(self._writing)}
+        data = json.dumps(state, ensure_ascii=False).encode("utf-8")
+        tmp_path = self.path + ".part"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        if self._journal is not None:
+            self._journal.close()
+        self._journal = open(self.journal_path, "w", encoding="utf-8")
+        self._journal_bytes = 0
+        self._snapshot_bytes = len(data)
+
+    def position(self, source: str) -> Optional[Tuple[Optional[str], int]]:
+        """来源的断点 (下一页URL, 已翻页数)；没有记录时返回 None，下一页URL 为 None 表示已翻完。"""
+        with self._lock:
+            entry = self._sources.get(source)
+        return (entry[0], entry[1]) if entry is not None else None
+
+    def page_done(self, source: str, next_url: Optional[str], page: int, items: Iterable[FrontierItem] = ()) -> None:
+        """来源翻完第 page 页: 记下一页 URL 和本页新发现的专辑，立即写入日志。"""
+        albums = [[item.url, item.title, item.source, item.payload] for item in items]
+        with self._lock:
+            self._record({"op": "page", "source": source, "next": next_url, "page": page, "albums": albums})
+
+    def pending(self) -> List[FrontierItem]:
+        """已发现但尚未完成的专辑，按发现顺序。"""
+        with self._lock:
+            return [FrontierItem(url, title, source, payload)
+                    for url, (title, source, payload, _) in self._albums.items()]
+
+    def images(self, url: str) -> Optional[List[Any]]:
+        """专辑已记录的图片列表；没有记录时返回 None。"""
+        with self._lock:
+            entry = self._albums.get(url)
+            return entry[3] if entry is not None else None
+
+    def set_images(self, url: str, images: List[Any]) -> None:
+        """记录专辑页解析出的图片列表 (专辑开始下载时)。"""
+        with self._lock:
+            if url in self._albums:
+                self._record({"op": "images", "url": url, "images": list(images)})
+
+    def done(self, url: str) -> None:
+        """专辑已完整下载，移出断点。"""
+        with self._lock:
+            if url in self._albums:
+                self._record({"op": "done", "url": url})
+
+    @contextmanager
+    def writing(self, path: str) -> Iterator[None]:
+        """期间 path 记为正在写入，中断后重启时删除。"""
+        with self._lock:
+            self._record({"op": "writing", "path": path}, sync=True)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._record({"op": "written", "path": path})
+
+    def finish(self) -> bool:
+        """运行正常结束时调用，所有断点都已用完 (删除断点文件) 时返回 True，否则合并保存并返回 False。
+
+        还有来源未翻完时整个断点保留；所有来源都已翻完时只删除翻页位置 (下次运行从第一页发现新专辑)，
+        未完成的专辑 (下载失败的) 和它们的图片列表继续保留，下次运行最先重试。
+        """
+        with self._lock:
+            if any(next_url for next_url, _ in self._sources.values()):
+                self._compact()
+                return False
+            self._sources.clear()
+            if self._albums:
+                self._compact()
+                return False
+            self._journal.close()
+            self._journal = None
+            for path in (self.path, self.journal_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            return True
+
+    def summary(self) -> str:
+        with self._lock:
+            walking = sum(1 for next_url, _ in self._sources.values() if next_url)
+            return f"{walking} 个分类/标签未翻完，{len(self._albums)} 个专辑未完成"
+
+
+# -------- 打包输出 (专辑 tar 分片) --------
+class AlbumArchive:
+    """一个专辑的不压缩 tar 分片，图片以追加方式写入，旁边的 .idx 文件按行记录每个成员的偏移和大小。
+
+    - 判重与随机读取只查内存中的索引，不再对每张图片做 exists()/stat()
+    - 每个成员先写数据再写索引行；中断后重新打开时截断到最后一个已索引成员的末尾，丢弃不完整的数据
+    - 分片是标准 tar 格式，可直接用 tar/7-Zip 或 extract_archives.py 解包
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.index_path = path + ".idx"
+        self._lock = threading.Lock()
+        self._members: Dict[str, Tuple[int, int]] = {}  # 成员名 -> (数据偏移, 大小)
+        self._end = 0
+        self._load_index()
+        self._file = open(path, "r+b" if os.path.exists(path) else "w+b")
+        self._file.truncate(self._end)
+        self._file.seek(self._end)
+        self._index = open(self.index_path, "a", encoding="utf-8")
+
+    def _load_index(self) -> None:
+        if not os.path.exists(self.index_path):
+            if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+                self._members = _scan_tar_members(self.path)  # 索引丢失时从分片重建，避免截断已有数据
+        else:
+            self._members = read_archive_index(self.path)
+        self._end = max((offset + _tar_padded(size) for offset, size in self._members.values()), default=0)
+        # 重写索引，去掉中断时写了一半的行
+        with open(self.index_path, "w", encoding="utf-8") as f:
+            for name, (offset, size) in self._members.items():
+                f.write(json.dumps({"name": name, "offset": offset, "size": size}, ensure_ascii=False) + "\n")
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._members
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+    def names(self) -> List[str]:
+        with self._lock:
+            return list(self._members)
+
+    def add(self, name: str, data: bytes, mtime: Optional[float] = None) -> bool:
+        """追加一个成员，名称已存在时返回 False。"""
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(mtime if mtime is not None else time.time())
+        info.mode = 0o644
+        header = info.tobuf(format=tarfile.PAX_FORMAT, encoding="utf-8")
+        padding = _tar_padded(len(data)) - len(data)
+        with self._lock:
+            if name in self._members:
+                return False
+            data_offset = self._end + len(header)
+            self._file.seek(self._end)
+            self._file.write(header)
+            self._file.write(data)
+            self._file.write(b"\0" * padding)
+            self._file.flush()
+            self._index.write(json.dumps({"name": name, "offset": data_offset, "size": len(data)}, ensure_ascii=False) + "\n")
+            self._index.flush()
+            self._members[name] = (data_offset, len(data))
+            self._end = data_offset + len(data) + padding
+        return True
+
+    def read(self, name: str) -> bytes:
+        """按索引随机读取一个成员，不扫描分片。"""
+        offset, size = self._members[name]
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return f.read(size)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file.closed:
+                return
+            # tar 结束标记 (两个空块)；下次追加前会被截断
+            self._file.seek(self._end)
+            self._file.write(b"\0" * (tarfile.BLOCKSIZE * 2))
+            self._file.close()
+            self._index.close()
+
+
+def _tar_padded(size: int) -> int:
+    return (size + tarfile.BLOCKSIZE - 1) // tarfile.BLOCKSIZE * tarfile.BLOCKSIZE
+
+
+def _scan_tar_members(path: str) -> Dict[str, Tuple[int, int]]:
+    """顺序扫描 tar 成员头 (没有索引时使用)，遇到不完整的尾部成员时停止。"""
+    members: Dict[str, Tuple[int, int]] = {}
+    actual = os.path.getsize(path)
+    try:
+        with tarfile.open(path, mode="r:") as tar:
+            for m in tar:
+                if m.isfile() and m.offset_data + m.size <= actual:
+                    members[m.name] = (m.offset_data, m.size)
+    except tarfile.ReadError:
+        pass
+    return members
+
+
+def read_archive_index(path: str) -> Dict[str, Tuple[int, int]]:
+    """只读加载分片索引，返回 成员名 -> (数据偏移, 大小)，只保留数据已完整写入分片的成员。"""
+    members: Dict[str, Tuple[int, int]] = {}
+    actual = os.path.getsize(path) if os.path.exists(path) else 0
+    with open(path + ".idx", "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                name, offset, size = entry["name"], entry["offset"], entry["size"]
+            except (ValueError, KeyError, TypeError):
+                break  # 中断时写了一半的索引行，之后的内容不可信
+            if offset + size > actual:
+                break  # 索引已写入但数据未落盘
+            members[name] = (offset, size)
+    return members
+
+
+class ArchiveStore:
+    """打包模式下的输出目录: save_root/<专辑名>.tar，按需打开并复用各专辑的分片。
+
+    爬虫原本计算的图片路径 save_root/<专辑>/<文件名> 通过 locate() 映射为 (分片, 成员名)，
+    这样失败重试等按路径记录的逻辑无需改动。
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.Lock()
+        self._archives: Dict[str, AlbumArchive] = {}
+        os.makedirs(root, exist_ok=True)
+
+    def album(self, name: str) -> AlbumArchive:
+        with self._lock:
+            archive = self._archives.get(name)
+            if archive is None:
+                archive = AlbumArchive(os.path.join(self.root, name + ARCHIVE_SUFFIX))
+                self._archives[name] = archive
+            return archive
+
+    def locate(self, path: str) -> Tuple[AlbumArchive, str]:
+        album_dir, filename = os.path.split(path)
+        return self.album(os.path.basename(album_dir)), filename
+
+    def close_album(self, name: str) -> None:
+        """专辑下载完成后关闭其分片，避免长时间运行时句柄累积。"""
+        with self._lock:
+            archive = self._archives.pop(name, None)
+        if archive is not None:
+            archive.close()
+
+    def close(self) -> None:
+        with self._lock:
+            archives, self._archives = list(self._archives.values()), {}
+        for archive in archives:
+            archive.close()
+
+
+def archive_members(path: str) -> Dict[str, Tuple[int, int]]:
+    """分片的成员表: 优先读索引，没有索引 (如外部工具生成的 tar) 时扫描成员头。"""
+    if os.path.exists(path + ".idx"):
+        return read_archive_index(path)
+    return _scan_tar_members(path)
+
+
+def extract_archive(path: str, dest_dir: str) -> int:
+    """把一个专辑分片解包为 dest_dir 下的散文件，已存在的同名文件跳过。返回写出的文件数。"""
+    os.makedirs(dest_dir, exist_ok=True)
+    written = 0
+    existing = set(os.listdir(dest_dir))
+    with open(path, "rb") as src:
+        members = archive_members(path)
+        for name, (offset, size) in members.items():
+            filename = os.path.basename(name)
+            if filename in existing:
+                continue
+            src.seek(offset)
+            target = os.path.join(dest_dir, filename)
+            with open(target + ".tmp", "wb") as f:
+                f.write(src.read(size))
+            os.replace(target + ".tmp", target)
+            written += 1
+    return written
+
+
+# -------- 存储后端 --------
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+)
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """按文件头魔数识别图片类型，无法识别 (如 HTML 错误页) 时返回 None。"""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, content_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    return None
+
+
+class Storage(ABC):
+    """存储后端接口: 爬虫只通过 (专辑, 文件名) 访问对象。
+
+    prefetch(专辑) 一次性列举专辑下已有对象及大小并缓存，之后 stat() 直接查缓存；
+    put_stream() 边读边写，写入完成前对象不可见。buffer_size 为写入时内存中最多缓存的字节数。
+    """
+
+    buffer_size = 64 * 1024
+
+    def __init__(self, root: str):
+        self.root = root
+        self._listing: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def describe(self, album: str, name: str) -> str:
+        """对象的可读位置 (日志用)。"""
+
+    @abstractmethod
+    def prefetch(self, album: str) -> int:
+        """列举专辑下已有对象及大小并缓存，返回对象数。"""
+
+    def stat(self, album: str, name: str) -> Optional[int]:
+        """返回对象大小，不存在时返回 None。"""
+        with self._lock:
+            listing = self._listing.get(album)
+        if listing is not None:
+            return listing.get(name)
+        return self._stat_uncached(album, name)
+
+    @abstractmethod
+    def _stat_uncached(self, album: str, name: str) -> Optional[int]:
+        """专辑未预取时直接查询单个对象的大小，不存在时返回 None。"""
+
+    @abstractmethod
+    def put_stream(self, album: str, name: str, chunks: Iterable[bytes], content_type: str = "application/octet-stream") -> int:
+        """边读 chunks 边写入对象，返回写入的字节数；chunks 抛出异常时放弃写入，不留下残缺对象。"""
+
+    def put_bytes(self, album: str, name: str, data: bytes, content_type: str = "application/octet-stream") -> int:
+        return self.put_stream(album, name, [data], content_type)
+
+    def _remember(self, album: str, name: str, size: int) -> None:
+        with self._lock:
+            if album in self._listing:
+                self._listing[album][name] = size
+
+    def forget(self, album: str) -> None:
+        """专辑处理完后丢弃其列举缓存。"""
+        with self._lock:
+            self._listing.pop(album, None)
+
+    def close(self) -> None:
+        pass
+
+
+class LocalStorage(Storage):
+    """本地目录存储: <root>/<专辑>/<文件名>，写入先落到 .part 临时文件再原子替换。"""
+
+    def describe(self, album: str, name: str) -> str:
+        return os.path.join(self.root, album, name)
+
+    def prefetch(self, album: str) -> int:
+        """一次性列出专辑目录，之后的 stat() 直接查缓存。返回已有对象数。"""
+        sizes: Dict[str, int] = {}
+        try:
+            with os.scandir(os.path.join(self.root, album)) as it:
+                for entry in it:
+                    if entry.is_file() and not entry.name.endswith(".part"):
+                        sizes[entry.name] = entry.stat().st_size
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self._listing[album] = sizes
+        return len(sizes)
+
+    def _stat_uncached(self, album: str, name: str) -> Optional[int]:
+        try:
+            return os.path.getsize(self.describe(album, name))
+        except OSError:
+            return None
+
+    def put_stream(self, album: str, name: str, chunks: Iterable[bytes], content_type: str = "application/octet-stream") -> int:
+        path = self.describe(album, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".part"
+        size = 0
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    size += len(chunk)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._remember(album, name, size)
+        return size
+
+
+def s3_available() -> bool:
+    """检查 boto3 是否已安装。"""
+    try:
+        import boto3  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class S3Storage(Storage):
+    """S3 兼容对象存储 (AWS S3 / MinIO 等)，键为 <prefix>/<专辑>/<文件名>。
+
+    - 下载流直接分段上传 (multipart)，不落本地磁盘，内存中最多缓存一个分段
+    - 判重按专辑前缀批量列举 (ListObjectsV2，每次最多 1000 个对象)，不再逐个 HEAD
+    - 客户端连接池大小可配置，所有下载线程共享一个客户端
+    凭据按 boto3 的默认方式读取 (环境变量 AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY、~/.aws 等)。
+    """
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None,
+                 max_pool_connections: int = S3_MAX_POOL_CONNECTIONS, part_size: int = S3_PART_SIZE):
+        import boto3
+        from botocore.config import Config
+
+        super().__init__(root=prefix.strip("/"))
+        self.bucket = bucket
+        self.part_size = max(part_size, 5 * 1024 * 1024)
+        self.buffer_size = self.part_size
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            config=Config(
+                max_pool_connections=max_pool_connections,
+                retries={"max_attempts": 5, "mode": "standard"},
+                # 自建服务 (MinIO 等) 通常不支持虚拟主机式的 bucket 域名
+                s3={"addressing_style": "path"} if endpoint_url else None,
+            ),
+        )
+
+    def key(self, album: str, name: str) -> str:
+        return "/".join(part for part in (self.root, album, name) if part)
+
+    def describe(self, album: str, name: str) -> str:
+        return f"s3://{self.bucket}/{self.key(album, name)}"
+
+    def prefetch(self, album: str) -> int:
+        prefix = self.key(album, "") + "/"
+        sizes: Dict[str, int] = {}
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                sizes[obj["Key"][len(prefix):]] = obj["Size"]
+        with self._lock:
+            self._listing[album] = sizes
+        return len(sizes)
+
+    def _stat_uncached(self, album: str, name: str) -> Optional[int]:
+        from botocore.exceptions import ClientError
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self.key(album, name))["ContentLength"]
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def put_stream(self, album: str, name: str, chunks: Iterable[bytes], content_type: str = "application/octet-stream") -> int:
+        """边读边上传。数据不足一个分段时用单次 PutObject；chunks 迭代中抛出异常时放弃分段上传，不留下残缺对象。"""
+        key = self.key(album, name)
+        buffer = bytearray()
+        parts: List[Dict[str, Any]] = []
+        upload_id: Optional[str] = None
+        size = 0
+        try:
+            for chunk in chunks:
+                buffer += chunk
+                size += len(chunk)
+                if len(buffer) >= self.part_size:
+                    if upload_id is None:
+                        upload_id = self.client.create_multipart_upload(
+                            Bucket=self.bucket, Key=key, ContentType=content_type)["UploadId"]
+                    self._upload_part(key, upload_id, parts, bytes(buffer))
+                    buffer.clear()
+            if upload_id is None:
+                self.client.put_object(Bucket=self.bucket, Key=key, Body=bytes(buffer), ContentType=content_type)
+            else:
+                if buffer:
+                    self._upload_part(key, upload_id, parts, bytes(buffer))
+                self.client.complete_multipart_upload(
+                    Bucket=self.bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts})
+        except BaseException:
+            if upload_id is not None:
+                try:
+                    self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+                except Exception as e:
+                    logging.warning("放弃分段上传失败: %s (%s)", key, e)
+            raise
+        self._remember(album, name, size)
+        return size
+
+    def _upload_part(self, key: str, upload_id: str, parts: List[Dict[str, Any]], data: bytes) -> None:
+        number = len(parts) + 1
+        etag = self.client.upload_part(
+            Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=number, Body=data)["ETag"]
+        parts.append({"PartNumber": number, "ETag": etag})
+
+
+def open_storage(spec: str, endpoint_url: Optional[str] = None) -> Storage:
+    """按地址创建存储后端: s3://bucket/prefix 为对象存储，其余视为本地目录。"""
+    parsed = urlparse(spec)
+    if parsed.scheme == "s3":
+        if not s3_available():
+            raise RuntimeError("使用 s3:// 存储需要安装 boto3 (请运行: pip install boto3)")
+        return S3Storage(parsed.netloc, parsed.path, endpoint_url=endpoint_url)
+    return LocalStorage(spec)
+
+
+# -------- 目录快照 (判重) --------
+def load_transcode_renames(root: str) -> Dict[Tuple[str, str], str]:
+    """读取 transcode.py 的报告: (专辑目录名, 原文件名) -> 改名后的文件名。
+
+    报告中记录的是绝对路径，这里只取专辑目录名和文件名，保存目录整体移动后依然有效。没有报告时返回空表。
+    """
+    renames: Dict[Tuple[str, str], str] = {}
+    try:
+        with open(os.path.join(root, TRANSCODE_REPORT_NAME), "r", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                old_path, new_path = row.get("path"), row.get("new_path")
+                if row.get("action") != "transcoded" or not old_path or not new_path or new_path == old_path:
+                    continue
+                album_dir, old_name = os.path.split(old_path)
+                renames[(os.path.basename(album_dir), old_name)] = os.path.basename(new_path)
+    except OSError:
+        pass
+    return renames
+
+
+class DirSnapshot:
+    """专辑目录的文件列表快照，判断图片是否已下载时不再逐个 stat。线程安全。
+
+    - 第一次查询某个目录时用 os.scandir 列出一次 (只读目录项，不 stat 每个文件)，之后 exists() 只查内存
+    - size() 需要大小时才对该文件 stat 一次并缓存 (Windows 上目录项自带大小，不产生系统调用)
+    - 写入或删除文件后调用 add() / discard() 同步快照；专辑处理完后 forget() 释放
+    - 临时文件 (.part / .tmp) 不计入快照: 各爬虫都是先写临时文件、校验通过后原子重命名，
+      快照中的文件都是完整写入过的
+    - follow_renames(保存目录) 后，被 transcode.py --format webp 改名的图片 (如 001.jpg -> 001.webp)
+      按原文件名查询时也算已存在，locate() 返回改名后的实际路径
+    """
+
+    def __init__(self, ignore_suffixes: Tuple[str, ...] = (".part", ".tmp")):
+        self.ignore_suffixes = ignore_suffixes
+        self._dirs: Dict[str, Dict[str, Any]] = {}  # 目录 -> {文件名: 大小 或 os.DirEntry}
+        self._renames: Dict[Tuple[str, str], str] = {}  # (专辑目录名, 原文件名) -> 改名后的文件名
+        self._lock = threading.Lock()
+
+    def follow_renames(self, root: str) -> int:
+        """读取 root 下 transcode.py 的报告，之后按原文件名查询时跟随改名。返回改名记录数。"""
+        self._renames = load_transcode_renames(root)
+        return len(self._renames)
+
+    def _listing(self, directory: str) -> Dict[str, Any]:
+        with self._lock:
+            listing = self._dirs.get(directory)
+        if listing is not None:
+            return listing
+        listing = {}
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if not entry.name.endswith(self.ignore_suffixes) and entry.is_file():
+                        listing[entry.name] = entry
+        except (FileNotFoundError, NotADirectoryError):
+            pass
+        with self._lock:
+            return self._dirs.setdefault(directory, listing)
+
+    def locate(self, path: str) -> Optional[str]:
+        """文件的实际路径: 存在时返回 path，已被重新编码改名时返回新路径，都不存在时返回 None。"""
+        directory, name = os.path.split(path)
+        listing = self._listing(directory)
+        if name in listing:
+            return path
+        renamed = self._renames.get((os.path.basename(directory), name))
+        if renamed is not None and renamed in listing:
+            return os.path.join(directory, renamed)
+        return None
+
+    def exists(self, path: str) -> bool:
+        return self.locate(path) is not None
+
+    def size(self, path: str) -> Optional[int]:
+        """文件大小 (已改名时为改名后的文件)，不存在时返回 None。"""
+        path = self.locate(path) or path
+        directory, name = os.path.split(path)
+        listing = self._listing(directory)
+        value = listing.get(name)
+        if value is None or isinstance(value, int):
+            return value
+        try:
+            size = value.stat().st_size
+        except OSError:
+            size = None
+        with self._lock:
+            if size is None:
+                listing.pop(name, None)
+            elif listing.get(name) is value:
+                listing[name] = size
+        return size
+
+    def add(self, path: str, size: int) -> None:
+        """记录新写入的文件；该目录还没有快照时忽略 (第一次查询时会列出)。"""
+        directory, name = os.path.split(path)
+        with self._lock:
+            listing = self._dirs.get(directory)
+            if listing is not None:
+                listing[name] = size
+
+    def discard(self, path: str) -> None:
+        directory, name = os.path.split(path)
+        with self._lock:
+            listing = self._dirs.get(directory)
+            if listing is not None:
+                listing.pop(name, None)
+
+    def forget(self, directory: str) -> None:
+        """专辑处理完后丢弃其快照。"""
+        with self._lock:
+            self._dirs.pop(directory, None)
+
+
+# -------- 图片尺寸探测 --------
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def parse_image_dimensions(head: bytes) -> Optional[Tuple[int, int]]:
+    """从图片开头的字节解析 (宽, 高)。数据不足或格式不支持时返回 None。
+
+    支持 JPEG (SOFn 段)、PNG (IHDR)、WebP (VP8 / VP8L / VP8X)、GIF、BMP，不解码像素。
+    """
+    if head.startswith(b"\xff\xd8"):
+        return _jpeg_dimensions(head)
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        if len(head) >= 24 and head[12:16] == b"IHDR":
+            return struct.unpack(">II", head[16:24])
+        return None
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return _webp_dimensions(head)
+    if head[:6] in (b"GIF87a", b"GIF89a") and len(head) >= 10:
+        return struct.unpack("<HH", head[6:10])
+    if head[:2] == b"BM" and len(head) >= 26:
+        width, height = struct.unpack("<ii", head[18:26])
+        return abs(width), abs(height)
+    return None
+
+
+def _jpeg_dimensions(head: bytes) -> Optional[Tuple[int, int]]:
+    i = 2
+    while i + 4 <= len(head):
+        if head[i] != 0xFF:
+            return None  # 段结构损坏
+        marker = head[i + 1]
+        if marker == 0xFF:  # 填充字节
+            i += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:  # 无长度的独立标记
+            i += 2
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            if i + 9 > len(head):
+                return None
+            height, width = struct.unpack(">HH", head[i + 5:i + 9])
+            return width, height
+        if marker == 0xDA:  # 到达扫描数据仍未遇到 SOF
+            return None
+        i += 2 + struct.unpack(">H", head[i + 2:i + 4])[0]
+    return None
+
+
+def _webp_dimensions(head: bytes) -> Optional[Tuple[int, int]]:
+    chunk = head[12:16]
+    if chunk == b"VP8 " and len(head) >= 30 and head[23:26] == b"\x9d\x01\x2a":
+        width, height = struct.unpack("<HH", head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L" and len(head) >= 25 and head[20] == 0x2F:
+        bits = struct.unpack("<I", head[21:25])[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X" and len(head) >= 30:
+        width = int.from_bytes(head[24:27], "little") + 1
+        height = int.from_bytes(head[27:30], "little") + 1
+        return width, height
+    return None
+
+
+def parse_resolution(text: str) -> Tuple[int, int]:
+    """解析命令行的分辨率参数，如 "800x600" 或 "800"(长短边都不小于 800)。"""
+    parts = text.lower().replace("*", "x").split("x")
+    if len(parts) == 1:
+        return int(parts[0]), int(parts[0])
+    return int(parts[0]), int(parts[1])
+
+
+def meets_resolution(dimensions: Tuple[int, int], minimum: Optional[Tuple[int, int]]) -> bool:
+    """按长边/短边分别比较，横图竖图使用同一个阈值。"""
+    if not minimum:
+        return True
+    return (min(dimensions) >= min(minimum)) and (max(dimensions) >= max(minimum))
+
+
+def probe_image_stream(response: Any, max_bytes: int = PROBE_MAX_BYTES,
+                       chunk_size: int = 8192) -> Tuple[Optional[Tuple[int, int]], Iterator[bytes]]:
+    """从流式响应 (stream=True) 只读取开头部分解析图片尺寸。
+
+    返回 (尺寸或 None, 数据块迭代器)。调用方决定继续下载时遍历该迭代器，已读取的开头会先产出，
+    不需要再发一次请求；决定放弃时调用 discard_response()，正文剩余部分不会传输。
+    """
+    chunks = response.iter_content(chunk_size)
+    head = bytearray()
+    dimensions = None
+    for chunk in chunks:
+        head += chunk
+        dimensions = parse_image_dimensions(bytes(head))
+        if dimensions is not None or len(head) >= max_bytes:
+            break
+
+    def all_chunks() -> Iterator[bytes]:
+        if head:
+            yield bytes(head)
+        yield from chunks
+
+    return dimensions, all_chunks()
+
+
+def discard_response(response: Any, drain_limit: int = PROBE_MAX_BYTES) -> None:
+    """放弃一个流式响应: 剩余正文很少时读完以便复用连接，否则直接关闭连接不再传输。"""
+    try:
+        remaining = int(response.headers.get("Content-Length", "")) - response.raw.tell()
+    except (TypeError, ValueError, AttributeError):
+        remaining = -1
+    try:
+        if 0 <= remaining <= drain_limit:
+            for _ in response.iter_content(8192):
+                pass
+    except Exception:
+        pass
+    response.close()
+
+
+def screen_image_response(response: Any, min_bytes: int = 0,
+                          min_resolution: Optional[Tuple[int, int]] = None) -> Tuple[Optional[str], Iterator[bytes]]:
+    """在传输正文前筛掉过小的图片: 先看 Content-Length，再只读开头几 KB 解析分辨率。
+
+    返回 (拒绝原因, 数据块迭代器)。拒绝时响应已被中止，原因为 None 时遍历迭代器即可得到完整数据。
+    无法识别格式的图片不在这里拒绝，交给下载后的完整校验。
+    """
+    try:
+        length = int(response.headers.get("Content-Length", ""))
+    except (TypeError, ValueError):
+        length = -1
+    if min_bytes and 0 <= length < min_bytes:
+        discard_response(response)
+        return f"文件过小 ({length / 1024:.1f} KB < {min_bytes / 1024:.0f} KB)", iter(())
+    if not min_resolution:
+        return None, response.iter_content(8192)
+    dimensions, chunks = probe_image_stream(response)
+    if dimensions is not None and not meets_resolution(dimensions, min_resolution):
+        discard_response(response)
+        return f"分辨率过低 ({dimensions[0]}x{dimensions[1]} < {min_resolution[0]}x{min_resolution[1]})", iter(())
+    return None, chunks
+
+
+# -------- 下载预检 (HEAD) 与计划 --------
+def head_object(session: requests.Session, url: str, timeout: float = 15,
+                headers: Optional[Dict[str, str]] = None) -> Tuple[Optional[int], str, int]:
+    """发出 HEAD 请求 (跟随重定向)，返回 (Content-Length, Content-Type, 状态码)。
+
+    没有 Content-Length 或服务器不支持 HEAD 时长度为 None；网络错误时状态码为 0。
+    """
+    try:
+        r = session.head(url, timeout=timeout, headers=headers, allow_redirects=True)
+    except requests.RequestException:
+        return None, "", 0
+    try:
+        length: Optional[int] = int(r.headers.get("Content-Length", ""))
+    except (TypeError, ValueError):
+        length = None
+    content_type = r.headers.get("Content-Type", "").split(";")[0].strip().lower()
+    r.close()
+    return length, content_type, r.status_code
+
+
+class DownloadPlanner:
+    """下载前的预检与计划，线程安全。
+
+    plan() 对一批 URL 在主机限速内并发发出 HEAD，在传输任何正文之前剔除过小、类型不符或已不存在的对象，
+    记录其余对象的预期大小。累计的计划字节数与已完成字节数用于估算剩余时间 (按实测吞吐)、
+    下载前按预期大小预留内存，以及检查磁盘剩余空间。
+    HEAD 失败或没有 Content-Length 的对象照常下载，只是不计入计划字节数。
+    """
+
+    def __init__(self, session: requests.Session, min_bytes: int = 0,
+                 accept_types: Optional[Tuple[str, ...]] = None, rate: float = PREFLIGHT_RATE,
+                 workers: int = PREFLIGHT_WORKERS, timeout: float = 15,
+                 headers: Optional[Dict[str, str]] = None):
+        self.session = session
+        self.min_bytes = min_bytes
+        self.accept_types = accept_types  # None 表示只拒绝 text/* (HTML 错误页)
+        self.rate = rate
+        self.workers = workers
+        self.timeout = timeout
+        self.headers = headers
+        self.planned = 0
+        self.planned_bytes = 0
+        self.unknown = 0
+        self.rejected = 0
+        self.done_bytes = 0
+        self._pending: Dict[str, int] = {}
+        self._start: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _check(self, url: str) -> Tuple[str, Optional[int], Optional[str]]:
+        host_limiter(url, self.rate, burst=self.workers).acquire()
+        length, content_type, status = head_object(self.session, url, self.timeout, self.headers)
+        if status in (404, 410):
+            return url, None, f"对象不存在 (HTTP {status})"
+        if 200 <= status < 300:
+            if content_type:
+                if self.accept_types is None:
+                    if content_type.startswith("text/"):
+                        return url, None, f"类型不符 ({content_type})"
+                elif not content_type.startswith(self.accept_types):
+                    return url, None, f"类型不符 ({content_type})"
+            if length is not None and length < self.min_bytes:
+                return url, None, f"文件过小 ({length / 1024:.1f} KB < {self.min_bytes / 1024:.0f} KB)"
+            return url, length, None
+        return url, None, None  # 不支持 HEAD 或临时错误: 不下结论，交给正式下载处理
+
+    def plan(self, urls: Iterable[str]) -> Tuple[List[str], List[Tuple[str, str]]]:
+        """预检一批 URL，返回 (待下载列表, [(URL, 剔除原因)])。
+
+        待下载列表按预期大小从大到小排列，大小未知的排在最后: 多线程下载时大文件先开始，
+        避免最后只剩一个大文件拖尾。
+        """
+        urls = list(urls)
+        if not urls:
+            return [], []
+        with self._lock:
+            if self._start is None:
+                self._start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(urls)), thread_name_prefix="Preflight") as executor:
+            results = list(executor.map(self._check, urls))
+
+        accepted: List[Tuple[str, Optional[int]]] = []
+        rejected: List[Tuple[str, str]] = []
+        for url, length, reason in results:
+            if reason is not None:
+                rejected.append((url, reason))
+            else:
+                accepted.append((url, length))
+        with self._lock:
+            self.rejected += len(rejected)
+            for url, length in accepted:
+                self.planned += 1
+                if length is None:
+                    self.unknown += 1
+                else:
+                    self.planned_bytes += length
+                    self._pending[url] = length
+        order = [url for url, length in sorted(accepted, key=lambda item: -1 if item[1] is None else item[1], reverse=True)]
+        return order, rejected
+
+    def expected_size(self, url: str) -> int:
+        """预检得到的预期大小，未知时为 0。"""
+        with self._lock:
+            return self._pending.get(url, 0)
+
+    def record(self, url: str, nbytes: int = 0) -> None:
+        """一个计划内的对象处理完毕 (无论成败)，nbytes 为实际传输的字节数。"""
+        with self._lock:
+            self._pending.pop(url, None)
+            self.done_bytes += nbytes
+
+    @property
+    def remaining_bytes(self) -> int:
+        with self._lock:
+            return sum(self._pending.values())
+
+    def throughput(self) -> float:
+        """从第一次预检开始的平均吞吐 (字节/秒)。"""
+        with self._lock:
+            if self._start is None or self.done_bytes <= 0:
+                return 0.0
+            return self.done_bytes / max(time.monotonic() - self._start, 1e-6)
+
+    def eta(self) -> Optional[float]:
+        """按实测吞吐估算剩余秒数，尚无吞吐数据时为 None。"""
+        speed = self.throughput()
+        return self.remaining_bytes / speed if speed > 0 else None
+
+    def disk_shortfall(self, path: str, reserve: int = DISK_SPACE_RESERVE) -> int:
+        """剩余计划字节数加保留空间超出 path 所在磁盘可用空间的字节数，足够时为 0。"""
+        try:
+            free = shutil.disk_usage(path).free
+        except OSError:
+            return 0
+        return max(0, self.remaining_bytes + reserve - free)
+
+    def summary(self) -> str:
+        eta = self.eta()
+        eta_text = f"{eta / 60:.1f} 分钟" if eta is not None else "未知"
+        return (f"计划 {self.planned} 个对象 {self.planned_bytes / 1024 / 1024:.1f} MB (大小未知 {self.unknown} 个)，"
+                f"预检剔除 {self.rejected} 个，剩余 {self.remaining_bytes / 1024 / 1024:.1f} MB，"
+                f"速度 {self.throughput() / 1024 / 1024:.2f} MB/s，预计剩余 {eta_text}")
+
+
+# -------- 多站点共享的带宽与磁盘预算 --------
+class TransferBudget:
+    """多个站点在同一进程中同时运行时共享的带宽与磁盘预算，线程安全。
+
+    - 带宽: 所有站点的下载数据块从同一个按字节计的令牌桶取令牌，合计速率不超过 bandwidth (字节/秒)
+    - 磁盘: 本次运行合计写入不超过 disk_limit 字节，且 disk_path 所在磁盘保留 reserve 字节可用空间；
+      用完后 exhausted() 给出原因，各站点不再开始新的下载 (进行中的文件照常完成)
+    - 统计: 按站点记录完整接收的下载次数 (含之后校验失败、重试的) 与字节数，供合并的进度视图显示
+    bandwidth / disk_limit <= 0 表示不限制。
+    """
+
+    DISK_CHECK_INTERVAL = 1.0  # 查询磁盘剩余空间的最短间隔 (秒)
+
+    def __init__(self, bandwidth: float = 0, disk_limit: int = 0, disk_path: Optional[str] = None,
+                 reserve: int = DISK_SPACE_RESERVE):
+        self.bandwidth = bandwidth
+        self.disk_limit = disk_limit
+        self.disk_path = disk_path
+        self.reserve = reserve
+        self.used = 0
+        self.start = time.monotonic()
+        self._limiter = RateLimiter(bandwidth, burst=bandwidth)
+        self._sites: Dict[str, List[int]] = {}  # 站点 -> [下载次数, 字节数]
+        self._exhausted: Optional[str] = None
+        self._disk_checked = 0.0
+        self._lock = threading.Lock()
+
+    def consume(self, site: str, nbytes: int) -> None:
+        """记录 site 收到的 nbytes 字节，超出带宽预算时阻塞。"""
+        self._limiter.acquire(nbytes)
+        with self._lock:
+            self._sites.setdefault(site, [0, 0])[1] += nbytes
+            self.used += nbytes
+
+    def finish(self, site: str) -> None:
+        """site 完整接收了一个文件。"""
+        with self._lock:
+            self._sites.setdefault(site, [0, 0])[0] += 1
+
+    def exhausted(self) -> Optional[str]:
+        """磁盘预算已用完时返回原因，否则为 None。一旦用完不再恢复。"""
+        with self._lock:
+            if self._exhausted is None and self.disk_limit > 0 and self.used >= self.disk_limit:
+                self._exhausted = f"已写入 {self.used / 1024 / 1024:.0f} MB，达到磁盘预算 {self.disk_limit / 1024 / 1024:.0f} MB"
+            check_disk = (self._exhausted is None and self.disk_path is not None
+                          and time.monotonic() - self._disk_checked >= self.DISK_CHECK_INTERVAL)
+            if check_disk:
+                self._disk_checked = time.monotonic()
+        if check_disk:
+            try:
+                free = shutil.disk_usage(self.disk_path).free
+            except OSError:
+                free = None
+            if free is not None and free < self.reserve:
+                with self._lock:
+                    self._exhausted = f"磁盘剩余 {free / 1024 / 1024:.0f} MB，低于保留空间"
+        with self._lock:
+            return self._exhausted
+
+    def snapshot(self) -> Dict[str, Tuple[int, int]]:
+        """各站点的 (下载次数, 字节数)。"""
+        with self._lock:
+            return {site: (files, nbytes) for site, (files, nbytes) in self._sites.items()}
+
+    def summary(self) -> str:
+        elapsed = max(time.monotonic() - self.start, 1e-6)
+        limit = f" / 磁盘预算 {self.disk_limit / 1024 / 1024:.0f} MB" if self.disk_limit > 0 else ""
+        return (f"合计 {sum(files for files, _ in self.snapshot().values())} 次下载 "
+                f"{self.used / 1024 / 1024:.1f} MB{limit}，平均 {self.used / elapsed / 1024 / 1024:.2f} MB/s")
+
+
+_TRANSFER_BUDGET: Optional[TransferBudget] = None
+
+
+def install_transfer_budget(budget: Optional[TransferBudget]) -> None:
+    """设置进程内所有站点共享的传输预算 (由 crawl_all.py 调用)；单独运行某个爬虫时不设置，计量函数不做任何事。"""
+    global _TRANSFER_BUDGET
+    _TRANSFER_BUDGET = budget
+
+
+def transfer_blocked() -> Optional[str]:
+    """开始下载一个文件之前调用: 共享磁盘预算已用完时返回原因，否则为 None。"""
+    budget = _TRANSFER_BUDGET
+    return budget.exhausted() if budget is not None else None
+
+
+def metered_chunks(site: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """逐块转发下载数据，按共享传输预算计量和限速；数据全部读完时记为 site 完成一个文件。"""
+    budget = _TRANSFER_BUDGET
+    if budget is None:
+        yield from chunks
+        return
+    for chunk in chunks:
+        if chunk:
+            budget.consume(site, len(chunk))
+        yield chunk
+    budget.finish(site)
+
+
+# -------- 大缓冲区下载写盘 --------
+class DownloadResult:
+    """download_to_file 的结果: 写入的字节数、响应体开头若干字节 (魔数/HTML 错误页检查用)、摘要 (传入 hasher 时)。"""
+
+    __slots__ = ("size", "head", "digest")
+
+    def __init__(self, size: int, head: bytes, digest: Optional[str]):
+        self.size = size
+        self.head = head
+        self.digest = digest
+
+
+# 直接读取依赖 urllib3 HTTPResponse 的两个私有属性: _fp (底层的 http.client.HTTPResponse) 和
+# _fp_bytes_read (已读出的响应体字节数)，在 urllib3 1.26 和 2.x 上核对过。其他大版本、属性缺失或类型不符时
+# 不走直接读取，回退到 iter_content (功能不变，只是每块多一次 bytes 分配)
+_DIRECT_READ_URLLIB3_MAJORS = ("1", "2")
+
+
+def _direct_readinto(response: Any) -> Optional[Callable[[memoryview], int]]:
+    """可以绕过 urllib3 直接读入缓冲区时返回读取函数，否则返回 None (调用方回退到 iter_content)。
+
+    未压缩的 HTTP/1.1 响应由 http.client 从套接字缓冲直接 readinto 调用方的 memoryview，
+    不再为每一块数据创建 bytes 对象；压缩响应、HTTP/2 适配器、已读过部分响应体或 urllib3 版本未核对时走 iter_content。
+    直接读取绕过了 urllib3 的异常包装，超时和连接中断按 iter_content 的方式转换为 requests 的异常，
+    调用方照常只需捕获 RequestException。响应体长度由 download_to_file 按 Content-Length 检查；
+    内容本身只保留开头 head_size (默认 512) 字节供调用方检查 HTML 错误页和魔数，其余部分不做校验。
+    """
+    urllib3_version = getattr(sys.modules.get("urllib3"), "__version__", "")
+    if urllib3_version.partition(".")[0] not in _DIRECT_READ_URLLIB3_MAJORS:
+        return None
+    import socket
+    import http.client  # 能直接读取时 urllib3 早已导入这两个模块
+
+    raw = getattr(response, "raw", None)
+    fp = getattr(raw, "_fp", None)
+    if not isinstance(fp, http.client.HTTPResponse) or getattr(raw, "_fp_bytes_read", None) != 0:
+        return None
+    if response.headers.get("Content-Encoding", "identity").lower() not in ("", "identity"):
+        return None
+
+    def readinto(view: memoryview) -> int:
+        try:
+            return fp.readinto(view)
+        except socket.timeout as e:
+            raise requests.exceptions.ConnectionError(f"读取响应体超时: {e}") from e
+        except (http.client.HTTPException, OSError) as e:
+            raise requests.exceptions.ChunkedEncodingError(f"读取响应体中断: {e!r}") from e
+    return readinto
+
+
+_DOWNLOAD_BUFFERS = threading.local()
+
+
+def _download_buffer(size: int) -> bytearray:
+    """每个线程复用一块下载缓冲区，不为每个文件重新分配。"""
+    buffer = getattr(_DOWNLOAD_BUFFERS, "buffer", None)
+    if buffer is None or len(buffer) != size:
+        buffer = _DOWNLOAD_BUFFERS.buffer = bytearray(size)
+    return buffer
+
+
+def _preallocate(f: Any, size: int) -> None:
+    """按 Content-Length 预先分配文件空间，减少边写边扩展造成的碎片和元数据更新；文件系统不支持时忽略。"""
+    try:
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(f.fileno(), 0, size)
+        else:
+            f.truncate(size)  # Windows (NTFS) 上设置文件大小即分配空间
+    except OSError:
+        pass
+
+
+def download_to_file(response: Any, path: str, site: Optional[str] = None, hasher: Any = None,
+                     head_size: int = 512, buffer_size: int = DOWNLOAD_BUFFER_SIZE,
+                     on_progress: Optional[Callable[[int], None]] = None) -> DownloadResult:
+    """把流式响应体写入 path: 读入一块复用的预分配缓冲区，攒满 buffer_size 后整块写盘。
+
+    - 有 Content-Length 时预分配文件，写完后截断到实际大小；实际大小不足时抛出 ChunkedEncodingError
+    - hasher (hashlib 对象) 与开头 head_size 字节直接取自同一缓冲区，无需写完后再读回文件；
+      这里不检查内容，调用方的 HTML 错误页/魔数检查只看得到返回的开头 head_size (默认 512) 字节
+    - site 不为空时按共享传输预算 (crawl_all.py) 计量和限速；on_progress(已下载字节数) 每写一块调用一次
+    """
+    expected = int(response.headers.get("Content-Length") or 0)
+    readinto = _direct_readinto(response)
+    budget = _TRANSFER_BUDGET if site else None
+    view = memoryview(_download_buffer(buffer_size))
+    head = b""
+    size = 0
+    with open(path, "wb") as f:
+        if expected > 0:
+            _preallocate(f, expected)
+
+        def flush(block: memoryview) -> None:
+            nonlocal head, size
+            if len(head) < head_size:
+                head += bytes(block[:head_size - len(head)])
+            if hasher is not None:
+                hasher.update(block)
+            if budget is not None:
+                budget.consume(site, len(block))
+            with timed("write"):
+                f.write(block)
+            size += len(block)
+            if on_progress is not None:
+                on_progress(size)
+
+        try:
+            if readinto is not None:
+                filled = 0
+                while True:
+                    n = readinto(view[filled:])
+                    if not n:
+                        break
+                    filled += n
+                    if filled == buffer_size:
+                        flush(view)
+                        filled = 0
+                if filled:
+                    flush(view[:filled])
+                response.raw.release_conn()  # 响应体已读完，连接放回连接池
+            else:
+                for chunk in response.iter_content(buffer_size):
+                    if chunk:
+                        flush(memoryview(chunk))
+        finally:
+            if expected > 0 and size != expected:
+                f.truncate(size)  # 中断或不完整时不留下按预分配大小补零的文件
+    view.release()
+    if 0 < expected and size < expected:
+        raise requests.exceptions.ChunkedEncodingError(f"响应体不完整: {size}/{expected} 字节 ({path})")
+    if budget is not None:
+        budget.finish(site)  # 只统计完整接收的文件
+    return DownloadResult(size, head, hasher.hexdigest() if hasher is not None else None)
+
+
+# -------- 分布式工作队列 (SQLite 租约) --------
+class WorkItem:
+    """从工作队列领取的一个任务 (一个专辑)。payload 为协调端写入的附加信息 (JSON 对象)。"""
+
+    def __init__(self, url: str, title: str, payload: Dict[str, Any], attempts: int):
+        self.url = url
+        self.title = title
+        self.payload = payload
+        self.attempts = attempts
+
+
+class WorkQueue:
+    """放在共享卷上的 SQLite 工作队列，多台机器上的 worker 以租约方式领取专辑，线程安全。
+
+    - 协调端 (add) 把发现的专辑写入队列，已在队列中的 URL 忽略；全部写完后 mark_discovery_done()
+    - worker 领取 (claim) 时获得 lease_seconds 秒的租约，keep_alive() 在后台定期续期；
+      完成后 complete() 标记结果，失败的专辑重新排队，超过 max_attempts 次后记为失败
+    - worker 中断或掉线后租约过期，其他 worker 领取时自动收回；已领取 max_attempts 次仍过期的记为失败
+    - 按主机的限速状态 (host_rate 表) 也保存在同一文件中，见 SharedRateLimiter
+    共享卷需要支持文件锁 (SQLite 在不支持锁的网络文件系统上可能损坏)；各机器的时钟应基本同步。
+    """
+
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS work (
+            url TEXT PRIMARY KEY, title TEXT NOT NULL, payload TEXT NOT NULL DEFAULT '{}',
+            state TEXT NOT NULL DEFAULT 'pending', worker TEXT, lease_until REAL NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0, updated REAL NOT NULL DEFAULT 0)""",
+        "CREATE INDEX IF NOT EXISTS work_state ON work (state, lease_until)",
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS host_rate (host TEXT PRIMARY KEY, tat REAL NOT NULL)",
+    )
+
+    def __init__(self, path: str, worker_id: Optional[str] = None, lease_seconds: float = WORK_LEASE_SECONDS,
+                 max_attempts: int = WORK_MAX_ATTEMPTS):
+        import sqlite3
+        import socket
+
+        self.path = path
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.held: Set[str] = set()  # 本 worker 持有租约、尚未完成的 URL
+        self._lock = threading.Lock()
+        self._completed = threading.Event()  # 本 worker 有任务完成时置位，唤醒等待中的领取循环
+        # 自动提交模式，写操作显式 BEGIN IMMEDIATE，避免多个进程同时升级锁时死锁
+        self._conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        with self._lock:
+            for statement in self.SCHEMA:
+                self._conn.execute(statement)
+
+    def _write(self, fn: Callable[[Any], Any]) -> Any:
+        """在一个写事务中执行 fn(conn)。"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    # ---- 协调端 ----
+    def add(self, items: Iterable[Tuple[str, str, Optional[Dict[str, Any]]]]) -> int:
+        """写入 [(URL, 标题, 附加信息)]，返回新加入的数量。"""
+        rows = [(url, title, json.dumps(payload or {}, ensure_ascii=False), time.time()) for url, title, payload in items]
+        if not rows:
+            return 0
+
+        def insert(conn: Any) -> int:
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO work (url, title, payload, updated) VALUES (?, ?, ?, ?)", rows)
+            return conn.total_changes - before
+        return self._write(insert)
+
+    def mark_discovery_done(self, done: bool = True) -> None:
+        self._write(lambda conn: conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('discovery_done', ?)",
+                                              ("1" if done else "0",)))
+
+    # ---- worker ----
+    def claim(self, n: int = 1) -> List[WorkItem]:
+        """领取最多 n 个任务: 待领取的，或租约已过期的 (收回掉线 worker 的任务)。
+        租约过期且已领取 max_attempts 次的任务记为失败，不再收回 (反复让 worker 崩溃或卡死的专辑)。"""
+        if n <= 0:
+            return []
+
+        def take(conn: Any) -> List[WorkItem]:
+            now = time.time()
+            items: List[WorkItem] = []
+            while len(items) < n:
+                rows = conn.execute(
+                    "SELECT url, title, payload, attempts, state, worker FROM work "
+                    "WHERE state = 'pending' OR (state = 'leased' AND lease_until < ?) ORDER BY rowid LIMIT ?",
+                    (now, n - len(items))).fetchall()
+                if not rows:
+                    break
+                for url, title, payload, attempts, state, worker in rows:
+                    if state == "leased" and attempts >= self.max_attempts:
+                        conn.execute("UPDATE work SET state = 'failed', worker = NULL, lease_until = 0, updated = ? "
+                                     "WHERE url = ?", (now, url))
+                        logging.error("租约过期且已领取 %d 次，记为失败: %s (原 worker %s)", attempts, url, worker)
+                        continue
+                    conn.execute("UPDATE work SET state = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1, "
+                                 "updated = ? WHERE url = ?", (self.worker_id, now + self.lease_seconds, now, url))
+                    if state == "leased":
+                        logging.warning("收回过期租约: %s (原 worker %s)", url, worker)
+                    items.append(WorkItem(url, title, json.loads(payload or "{}"), attempts + 1))
+            return items
+        items = self._write(take)
+        with self._lock:
+            self.held.update(item.url for item in items)
+        return items
+
+    def renew(self) -> int:
+        """为本 worker 持有的所有租约续期，返回续期的数量。"""
+        now = time.time()
+        return self._write(lambda conn: conn.execute(
+            "UPDATE work SET lease_until = ?, updated = ? WHERE worker = ? AND state = 'leased'",
+            (now + self.lease_seconds, now, self.worker_id)).rowcount)
+
+    def complete(self, url: str, ok: bool = True) -> None:
+        """报告任务结果。失败且未超过最大尝试次数时重新排队；租约已被其他 worker 收回时不覆盖其状态。"""
+        def finish(conn: Any) -> int:
+            row = conn.execute("SELECT attempts FROM work WHERE url = ? AND worker = ? AND state = 'leased'",
+                               (url, self.worker_id)).fetchone()
+            if row is None:
+                return 0
+            state = "done" if ok else ("failed" if row[0] >= self.max_attempts else "pending")
+            return conn.execute("UPDATE work SET state = ?, worker = NULL, lease_until = 0, updated = ? WHERE url = ?",
+                                (state, time.time(), url)).rowcount
+        if not self._write(finish):
+            logging.warning("租约已过期并被其他 worker 收回，结果未记录: %s", url)
+        with self._lock:
+            self.held.discard(url)
+        self._completed.set()
+
+    def wait_for_completion(self, timeout: float) -> bool:
+        """等待本 worker 的任意任务完成 (或超时)，返回是否有任务完成。"""
+        completed = self._completed.wait(timeout)
+        self._completed.clear()
+        return completed
+
+    def finished(self) -> bool:
+        """协调端已完成发现，且队列中没有待领取或租用中的任务。"""
+        with self._lock:
+            done = self._conn.execute("SELECT value FROM meta WHERE key = 'discovery_done'").fetchone()
+            open_count = self._conn.execute("SELECT COUNT(*) FROM work WHERE state IN ('pending', 'leased')").fetchone()[0]
+        return bool(done and done[0] == "1") and open_count == 0
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT state, COUNT(*) FROM work GROUP BY state").fetchall())
+
+    def limiter(self, host: str, rate: float, burst: float = 1.0) -> "SharedRateLimiter":
+        """返回状态保存在本队列文件中的主机限速器。"""
+        return SharedRateLimiter(self, host, rate, burst)
+
+    def keep_alive(self, interval: Optional[float] = None) -> "LeaseKeeper":
+        """返回在后台定期续期租约的上下文管理器。"""
+        return LeaseKeeper(self, interval or self.lease_seconds / 3)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class LeaseKeeper:
+    """后台线程，每隔 interval 秒为 worker 持有的租约续期，作为上下文管理器使用。"""
+
+    def __init__(self, queue: WorkQueue, interval: float):
+        self.queue = queue
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="LeaseKeeper", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.queue.renew()
+            except Exception:
+                logging.exception("租约续期失败")
+
+    def __enter__(self) -> "LeaseKeeper":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def drain_work_queue(queue: WorkQueue, submit: Callable[[WorkItem], None], max_held: int,
+                     poll: float = WORK_POLL_SECONDS) -> None:
+    """worker 主循环: 持有的租约少于 max_held 时领取新任务并交给 submit (submit 不应阻塞，
+    任务结束后由调用方 queue.complete())；暂时领取不到时等待，直到协调端已完成发现且队列中
+    没有待领取或租用中的任务。运行期间租约在后台定期续期。"""
+    with queue.keep_alive():
+        while True:
+            room = max_held - len(queue.held)
+            items = queue.claim(room) if room > 0 else []
+            for item in items:
+                submit(item)
+            if items:
+                continue
+            if not queue.held and queue.finished():
+                return
+            # 自己的任务完成时立即重新领取，否则每隔 poll 秒查看其他 worker 是否放出了任务
+            queue.wait_for_completion(poll)
+
+
+class SharedRateLimiter:
+    """按主机的限速器，状态保存在工作队列的 SQLite 文件中，所有机器上的 worker 共享同一速率预算。
+
+    使用 GCRA (通用信元速率算法): 只保存每个主机的理论到达时间 (tat)，每次请求一个写事务。
+    接口与 RateLimiter 相同。
+    """
+
+    def __init__(self, queue: WorkQueue, host: str, rate: float, burst: float = 1.0):
+        self.queue = queue
+        self.host = host
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        if self.rate <= 0:
+            return 0.0
+
+        def reserve(conn: Any) -> float:
+            row = conn.execute("SELECT tat FROM host_rate WHERE host = ?", (self.host,)).fetchone()
+            tat, wait = _gcra_reserve(row[0] if row else 0.0, tokens, self.rate, self.burst)
+            conn.execute("INSERT OR REPLACE INTO host_rate (host, tat) VALUES (?, ?)", (self.host, tat))
+            return wait
+        wait = self.queue._write(reserve)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+def _gcra_reserve(tat: float, tokens: float, rate: float, burst: float) -> Tuple[float, float]:
+    """GCRA: 按理论到达时间 tat 预约 tokens 个令牌，返回 (新的 tat, 需要等待的秒数)。"""
+    now = time.time()
+    interval = 1.0 / rate
+    tat = max(tat, now)
+    return tat + tokens * interval, max(0.0, tat - now - (burst - 1) * interval)
+
+
+# -------- 单机多进程分片 --------
+def shard_of(url: str, shards: int) -> int:
+    """按 URL 摘要把专辑稳定地分配到 0..shards-1 号分片 (与进程、运行次数无关)。"""
+    return int.from_bytes(url_key(url)[:8], "big") % shards
+
+
+class ProcessRateTable:
+    """多进程共享的按主机限速状态: 每个主机一个 GCRA 理论到达时间，放在共享内存中。
+
+    在主进程创建，只能在创建子进程时传递 (如进程池的 initializer/initargs)；
+    子进程中用 share_host_limits(table) 后，host_limiter() 返回的限速器在所有进程之间共享速率预算。
+    """
+
+    def __init__(self, slots: int = PROCESS_RATE_SLOTS):
+        import multiprocessing
+
+        # 主机名摘要 (0 表示空槽) 与理论到达时间；整张表由 _hosts 自带的锁保护
+        self._hosts = multiprocessing.Array("q", slots)
+        self._tat = multiprocessing.RawArray("d", slots)
+
+    def slot(self, host: str) -> int:
+        key = int.from_bytes(url_key(host)[:7], "big") + 1
+        with self._hosts.get_lock():
+            hosts = self._hosts.get_obj()
+            for i, value in enumerate(hosts):
+                if value == key:
+                    return i
+                if value == 0:
+                    hosts[i] = key
+                    return i
+        raise RuntimeError(f"多进程限速表已满 ({len(hosts)} 个主机)，无法加入 {host}")
+
+    def limiter(self, host: str, rate: float, burst: float = 1.0) -> "ProcessRateLimiter":
+        return ProcessRateLimiter(self, self.slot(host), rate, burst)
+
+
+class ProcessRateLimiter:
+    """ProcessRateTable 中一个主机的限速器，接口与 RateLimiter 相同。"""
+
+    def __init__(self, table: ProcessRateTable, slot: int, rate: float, burst: float = 1.0):
+        self.table = table
+        self.slot = slot
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        if self.rate <= 0:
+            return 0.0
+        with self.table._hosts.get_lock():
+            self.table._tat[self.slot], wait = _gcra_reserve(self.table._tat[self.slot], tokens, self.rate, self.burst)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+_SHARED_HOST_LIMITS: Optional[Union[WorkQueue, ProcessRateTable]] = None
+
+
+def share_host_limits(shared: Optional[Union[WorkQueue, ProcessRateTable]]) -> None:
+    """之后由 host_limiter() 新建的限速器改为保存在工作队列文件 (多台机器上的 worker)
+    或共享内存 (同一台机器上的分片进程) 中，共享同一速率预算。
+
+    已缓存的进程内限速器同时被丢弃: fork 启动的子进程会继承父进程的缓存，不清空时
+    子进程拿到的仍是各自独立的 RateLimiter。调用前已取得的限速器对象不受影响。
+    """
+    global _SHARED_HOST_LIMITS
+    with _HOST_LIMITERS_LOCK:
+        _SHARED_HOST_LIMITS = shared
+        _HOST_LIMITERS.clear()
+
+
+# -------- 阶段计时 (--profile) --------
+class _Span:
+    """一个计时区间，作为上下文管理器使用。"""
+
+    __slots__ = ("profiler", "stage", "args", "start", "cprofile")
+
+    def __init__(self, profiler: "StageProfiler", stage: str, args: Optional[Dict[str, Any]]):
+        self.profiler = profiler
+        self.stage = stage
+        self.args = args
+        self.cprofile = None
+
+    def __enter__(self) -> "_Span":
+        if self.stage in self.profiler.cprofile_stages:
+            self.cprofile = self.profiler._start_cprofile(self.stage)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        duration = time.perf_counter_ns() - self.start
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            self.profiler._local.cprofile = None
+        self.profiler._record(self.stage, self.start, duration, self.args)
+
+
+class StageProfiler:
+    """流水线各阶段 (请求、解析、校验、写盘、等待等) 的计时区间，导出为 Chrome trace-event JSON
+    (用 chrome://tracing 或 https://ui.perfetto.dev 打开)，线程安全。
+
+    - 每个区间只记录阶段名、线程、开始时间和时长；记录超过 max_events 后只保留各阶段的累计统计
+    - cprofile_stages 中的阶段额外用 cProfile 采集函数级耗时，按阶段合并保存为 <trace>.<阶段>.pstats
+      (同一线程内嵌套的区间只有最外层采集)，用 python -m pstats 或 snakeviz 查看
+    """
+
+    def __init__(self, cprofile_stages: Iterable[str] = (), max_events: int = PROFILE_MAX_EVENTS):
+        self.cprofile_stages = frozenset(cprofile_stages)
+        self.max_events = max_events
+        self.dropped = 0
+        self._events: List[Tuple[str, int, int, int, Optional[Dict[str, Any]]]] = []
+        self._stats: Dict[str, List[int]] = {}  # 阶段 -> [次数, 总时长ns, 最长ns]
+        self._threads: Dict[int, str] = {}
+        self._cprofiles: Dict[str, List[Any]] = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._merged: List[Dict[str, Any]] = []  # 其他进程 (--shards) 的 trace 事件
+
+    def span(self, stage: str, **args: Any) -> _Span:
+        return _Span(self, stage, args or None)
+
+    def _record(self, stage: str, start: int, duration: int, args: Optional[Dict[str, Any]]) -> None:
+        tid = threading.get_ident()
+        with self._lock:
+            if tid not in self._threads:
+                self._threads[tid] = threading.current_thread().name
+            stats = self._stats.get(stage)
+            if stats is None:
+                stats = self._stats[stage] = [0, 0, 0]
+            stats[0] += 1
+            stats[1] += duration
+            stats[2] = max(stats[2], duration)
+            if len(self._events) < self.max_events:
+                self._events.append((stage, tid, start, duration, args))
+            else:
+                self.dropped += 1
+
+    def _start_cprofile(self, stage: str) -> Any:
+        """在当前线程开始该阶段的 cProfile 采集；线程内已有采集中的区间时返回 None。"""
+        if getattr(self._local, "cprofile", None) is not None:
+            return None
+        import cProfile
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ 同一时间只允许一个 cProfile (sys.monitoring)，其他线程正在采集时跳过
+            return None
+        self._local.cprofile = profile
+        with self._lock:
+            self._cprofiles.setdefault(stage, []).append(profile)
+        return profile
+
+    # ---- 汇总与导出 ----
+    def trace_events(self) -> List[Dict[str, Any]]:
+        """Chrome trace-event 格式的事件列表 (时间戳为微秒)。"""
+        pid = os.getpid()
+        with self._lock:
+            events: List[Dict[str, Any]] = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                                            for tid, name in self._threads.items()]
+            for stage, tid, start, duration, args in self._events:
+                event = {"name": stage, "cat": "crawl", "ph": "X", "pid": pid, "tid": tid,
+                         "ts": start / 1000, "dur": duration / 1000}
+                if args:
+                    event["args"] = args
+                events.append(event)
+            events.extend(self._merged)
+        return events
+
+    def snapshot(self) -> Dict[str, Any]:
+        """可在进程间传递的计时结果 (--shards 的分片进程返回给主进程，用 merge() 合并)。"""
+        with self._lock:
+            stats = {stage: list(values) for stage, values in self._stats.items()}
+            dropped = self.dropped
+        return {"events": self.trace_events(), "stats": stats, "dropped": dropped}
+
+    def merge(self, snapshot: Dict[str, Any]) -> None:
+        with self._lock:
+            self._merged.extend(snapshot["events"])
+            self.dropped += snapshot["dropped"]
+            for stage, (count, total, longest) in snapshot["stats"].items():
+                stats = self._stats.setdefault(stage, [0, 0, 0])
+                stats[0] += count
+                stats[1] += total
+                stats[2] = max(stats[2], longest)
+
+    def summary(self) -> List[str]:
+        """各阶段的次数、累计耗时 (所有线程之和)、平均和最长耗时，按累计耗时从多到少排列。"""
+        with self._lock:
+            rows = sorted(self._stats.items(), key=lambda item: -item[1][1])
+        # 表头的中文字符按两列宽对齐
+        lines = [f"{'阶段':<14}{'次数':>6}{'累计(s)':>10}{'平均(ms)':>10}{'最长(ms)':>10}"]
+        for stage, (count, total, longest) in rows:
+            lines.append(f"{stage:<16}{count:>8}{total / 1e9:>12.2f}{total / count / 1e6:>12.2f}{longest / 1e6:>12.1f}")
+        return lines
+
+    def export(self, path: str) -> None:
+        """写出 Chrome trace JSON。"""
+        tmp_path = path + ".part"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": self.trace_events(), "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def dump_cprofile(self, prefix: str) -> List[str]:
+        """把各阶段的 cProfile 统计合并保存为 <prefix>.<阶段>.pstats，返回写出的文件路径。"""
+        with self._lock:
+            cprofiles = {stage: list(profiles) for stage, profiles in self._cprofiles.items()}
+        if not cprofiles:
+            return []
+        import pstats
+
+        written = []
+        for stage, profiles in sorted(cprofiles.items()):
+            stats = None
+            for profile in profiles:
+                try:
+                    stats = pstats.Stats(profile) if stats is None else stats.add(profile)
+                except TypeError:
+                    continue  # 区间内没有采集到任何调用
+            if stats is not None:
+                stats.dump_stats(f"{prefix}.{stage}.pstats")
+                written.append(f"{prefix}.{stage}.pstats")
+        return written
+
+
+_PROFILER: Optional[StageProfiler] = None
+_NULL_SPAN = nullcontext()
+
+
+def install_profiler(profiler: Optional[StageProfiler]) -> None:
+    """设置 span() 使用的全局计时器 (None 表示关闭计时)。"""
+    global _PROFILER
+    _PROFILER = profiler
+
+
+def span(stage: str, **args: Any) -> Any:
+    """记录一个阶段的计时区间: with span("validate"): ...。未启用 --profile 时返回空上下文，几乎没有开销。"""
+    profiler = _PROFILER
+    if profiler is None:
+        return _NULL_SPAN
+    return profiler.span(stage, **args)
+
+
+def profiled(stage: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """装饰器: 函数的每次调用记为一个 stage 区间。"""
+    def decorate(fn: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            profiler = _PROFILER
+            if profiler is None:
+                return fn(*args, **kwargs)
+            with profiler.span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# -------- 墙钟时间核算 --------
+# 类别 -> (名称, 可避免时的改进建议)；建议为 None 的类别 (服务器响应与数据传输) 视为不可避免
+ACCOUNT_CATEGORIES: Dict[str, Tuple[str, Optional[str]]] = {
+    "sleep": ("主动延迟", "把每次请求前后的固定随机延迟换成按主机限速 (令牌桶)，或缩小延迟范围"),
+    "backoff": ("重试等待", "查看失败原因 (429/5xx/超时)，降低请求速率比失败后再退避更省时间"),
+    "connect": ("建立连接", "复用会话与连接池 (keep-alive)，或启用 --http2 用少量连接多路复用"),
+    "ttfb": ("等待首字节", None),
+    "transfer": ("传输", None),
+    "parse": ("解析", "改用 lxml 解析器，或只解析需要的页面片段"),
+    "validate": ("校验", "在内存中校验或只检查文件头，避免写盘后再读回整张图片"),
+    "write": ("写盘", "打包输出 (--pack) 减少小文件的创建与重命名，或换更快的存储"),
+}
+
+
+class _AccountSpan:
+    """一段计入某类别的时间，作为上下文管理器使用；嵌套时内层时间不重复计入外层。"""
+
+    __slots__ = ("account", "category")
+
+    def __init__(self, account: "TimeAccount", category: str):
+        self.account = account
+        self.category = category
+
+    def __enter__(self) -> "_AccountSpan":
+        self.account._enter(self.category)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.account._exit()
+
+
+class TimeAccount:
+    """把每个工作线程的墙钟时间按类别 (主动延迟、重试等待、建立连接、首字节、传输、解析、校验、写盘) 核算，线程安全。
+
+    - 各类别互斥计时: 区间嵌套时外层暂停计时，例如传输循环中的写盘只计入 write
+    - 线程的时间窗口为它第一个区间开始到最后一个区间结束，窗口内未计入任何类别的部分
+      (等待任务、内存预算、锁和日志等) 记为 "其他"
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter_ns()
+        self._totals: Counter = Counter()
+        self._threads: Dict[int, List[int]] = {}  # 线程 -> [首个区间开始, 最后区间结束, 已计入ns]
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def charge(self, category: str) -> _AccountSpan:
+        if category not in ACCOUNT_CATEGORIES:
+            raise ValueError(f"未知的时间类别: {category}")
+        return _AccountSpan(self, category)
+
+    def _enter(self, category: str) -> None:
+        now = time.perf_counter_ns()
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        if stack:
+            outer = stack[-1]
+            outer[2] += now - outer[1]  # 外层暂停计时
+        elif getattr(self._local, "window", None) is None:
+            self._local.window = now
+        stack.append([category, now, 0])
+
+    def _exit(self) -> None:
+        now = time.perf_counter_ns()
+        stack = self._local.stack
+        category, resumed, elapsed = stack.pop()
+        elapsed += now - resumed
+        if stack:
+            stack[-1][1] = now  # 外层恢复计时
+        tid = threading.get_ident()
+        with self._lock:
+            self._totals[category] += elapsed
+            window = self._threads.get(tid)
+            if window is None:
+                window = self._threads[tid] = [self._local.window, now, 0]
+            window[1] = now
+            window[2] += elapsed
+
+    def totals(self) -> Dict[str, float]:
+        """各类别的累计秒数 (所有线程之和)，另含 "other": 线程时间窗口内未归类的秒数。"""
+        with self._lock:
+            totals = {category: ns / 1e9 for category, ns in self._totals.items()}
+            other = sum(max(0, end - first - accounted) for first, end, accounted in self._threads.values())
+        totals["other"] = other / 1e9
+        return totals
+
+    def biggest_avoidable(self) -> Optional[Tuple[str, float]]:
+        """可避免类别中累计时间最多的一个: (类别, 秒)；没有任何可避免的耗时时返回 None。"""
+        totals = self.totals()
+        candidates = [(seconds, category) for category, seconds in totals.items()
+                      if category in ACCOUNT_CATEGORIES and ACCOUNT_CATEGORIES[category][1] and seconds > 0]
+        if not candidates:
+            return None
+        seconds, category = max(candidates)
+        return category, seconds
+
+    def report(self) -> List[str]:
+        """时间分布报告: 各类别的累计时间与占线程时间的比例，以及最大的可避免开销和改进建议。"""
+        totals = self.totals()
+        with self._lock:
+            threads = len(self._threads)
+        thread_time = sum(totals.values())
+        wall = (time.perf_counter_ns() - self.start) / 1e9
+        lines = [f"墙钟时间核算: 运行 {wall:.1f}s，{threads} 个线程合计 {thread_time:.1f}s"]
+        if thread_time <= 0:
+            return lines
+        rows = [(totals.get(category, 0.0), f"{name} ({category})") for category, (name, _) in ACCOUNT_CATEGORIES.items()]
+        rows.append((totals["other"], "其他 (排队/等待/未归类)"))
+        for seconds, label in sorted(rows, reverse=True):
+            share = seconds / thread_time
+            padding = " " * max(0, 24 - len(label) - sum(ord(c) > 0x2E80 for c in label))  # 中文字符按两列宽对齐
+            lines.append(f"  {label}{padding}{seconds:>10.1f}s {share:>6.1%}  {'█' * round(share * 40)}")
+        biggest = self.biggest_avoidable()
+        if biggest is not None:
+            category, seconds = biggest
+            name, advice = ACCOUNT_CATEGORIES[category]
+            lines.append(f"最大的可避免开销: {name} {seconds:.1f}s ({seconds / thread_time:.1%})，建议: {advice}")
+        return lines
+
+
+_TIME_ACCOUNT: Optional[TimeAccount] = None
+_HTTP_ACCOUNTED = False
+
+
+def install_time_account(account: Optional[TimeAccount]) -> None:
+    """设置 timed() 使用的全局时间核算 (None 表示关闭)。"""
+    global _TIME_ACCOUNT
+    _TIME_ACCOUNT = account
+
+
+def timed(category: str) -> Any:
+    """把一段时间计入某个类别: with timed("sleep"): time.sleep(delay)。未启用核算时返回空上下文。"""
+    account = _TIME_ACCOUNT
+    if account is None:
+        return _NULL_SPAN
+    return account.charge(category)
+
+
+def account_http() -> None:
+    """让 urllib3 的建立连接 (含 TLS 握手) 计入 connect，Retry 的退避等待计入 backoff。可重复调用。
+
+    需要在启用核算时调用一次；补丁对所有会话生效，未启用核算时 timed() 为空上下文，几乎没有开销。
+    """
+    global _HTTP_ACCOUNTED
+    with _LAZY_IMPORT_LOCK:
+        if _HTTP_ACCOUNTED:
+            return
+        import urllib3.connection
+        import urllib3.util.retry
+
+        for cls in (urllib3.connection.HTTPConnection, urllib3.connection.HTTPSConnection):
+            original = cls.__dict__.get("connect")
+            if original is None:
+                continue
+
+            def connect(self, _original=original):
+                with timed("connect"):
+                    return _original(self)
+            cls.connect = connect
+
+        original_sleep = urllib3.util.retry.Retry.sleep
+
+        def sleep(self, response=None):
+            with timed("backoff"):
+                return original_sleep(self, response)
+        urllib3.util.retry.Retry.sleep = sleep
+        _HTTP_ACCOUNTED = True
+
+
+def timed_get(session: Any, url: str, **kwargs: Any) -> Any:
+    """session.get 的核算版本: 等待响应头计入 ttfb (新建连接部分计入 connect)，读取响应体计入 transfer。
+
+    stream=True 时只核算到响应头，响应体由调用方读取时自行计入 transfer。
+    """
+    stream = kwargs.pop("stream", False)
+    with timed("ttfb"):
+        response = session.get(url, stream=True, **kwargs)
+    if not stream:
+        with timed("transfer"):
+            response.content
+    return response
+
+
+# -------- 异步日志 --------
+class _QueueLogHandler(logging.Handler):
+    """只把日志记录放进队列，不加锁、不格式化；格式化和写入由 AsyncLogWriter 的后台线程完成。"""
+
+    def __init__(self, writer: "AsyncLogWriter"):
+        super().__init__()
+        self.writer = writer
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        if not self.filter(record):
+            return False
+        self.writer._queue.put(record)
+        return True
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.writer._queue.put(record)
+
+
+class AsyncLogWriter:
+    """后台写日志线程: 下载线程调用 logger.info() / console_print() 时只把记录放进队列 (SimpleQueue，无锁竞争)，
+    消息格式化、写日志文件和终端都在后台线程中完成，慢速存储 (手机 /sdcard) 和终端不会拖慢下载线程。
+
+    - 日志消息的 %-参数在后台线程中格式化，参数应为不可变对象 (各爬虫使用 f-string，不受影响)
+    - 终端输出保留 print 的 end 参数 (如 end='\r' 的进度行)，与日志记录按调用顺序写出
+    - stop() 写完队列中剩余的记录后返回，进程退出时自动调用
+    """
+
+    def __init__(self, handlers: Iterable[logging.Handler]):
+        self.handlers = list(handlers)
+        self._queue: SimpleQueue = SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="LogWriter", daemon=True)
+        self._stopped = False
+        self._thread.start()
+
+    def write(self, stream: Any, text: str) -> None:
+        self._queue.put((stream, text))
+
+    def _run(self) -> None:
+        dirty: Set[Any] = set()
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if isinstance(item, threading.Event):
+                item.set()  # flush(): 之前的记录都已写出
+            elif isinstance(item, logging.LogRecord):
+                for handler in self.handlers:
+                    if item.levelno >= handler.level:
+                        handler.handle(item)
+            else:
+                stream, text = item
+                try:
+                    stream.write(text)
+                    dirty.add(stream)
+                except (OSError, ValueError):
+                    pass  # 终端已关闭
+            if dirty and self._queue.empty():
+                # 队列暂时清空时才刷新终端，连续输出时合并成较少的写操作
+                for stream in dirty:
+                    try:
+                        stream.flush()
+                    except (OSError, ValueError):
+                        pass
+                dirty.clear()
+
+    def flush(self, timeout: Optional[float] = 5.0) -> None:
+        """等待已放入队列的记录全部写出 (等待键盘输入前调用，让提示前的输出先显示)。"""
+        if self._stopped:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def stop(self) -> None:
+        if self._stopped:
+            return
+        self._stopped = True
+        self._queue.put(None)
+        self._thread.join()
+        for handler in self.handlers:
+            handler.flush()
+
+
+_LOG_WRITER: Optional[AsyncLogWriter] = None
+
+
+def install_async_logging(json_path: Optional[str] = None) -> AsyncLogWriter:
+    """把根日志器现有的处理器 (各爬虫 basicConfig 配置的文件/终端) 移到后台线程，可重复调用。
+
+    json_path 不为空时额外把每条记录以 JSON 行写入该文件 (见 JsonLogFormatter)。
+    """
+    global _LOG_WRITER
+    with _LAZY_IMPORT_LOCK:
+        root = logging.getLogger()
+        if _LOG_WRITER is None:
+            handlers = [h for h in root.handlers if not isinstance(h, _QueueLogHandler)]
+            _LOG_WRITER = AsyncLogWriter(handlers)
+            for handler in handlers:
+                root.removeHandler(handler)
+            root.addHandler(_QueueLogHandler(_LOG_WRITER))
+            atexit.register(_LOG_WRITER.stop)
+        if json_path:
+            handler = logging.FileHandler(json_path, encoding="utf-8")
+            handler.setFormatter(JsonLogFormatter())
+            _LOG_WRITER.handlers.append(handler)
+        return _LOG_WRITER
+
+
+def console_print(*values: Any, sep: str = " ", end: str = "\n", file: Any = None, flush: bool = False) -> None:
+    """与 print 参数相同；启用异步日志后由后台线程写终端，否则直接 print。"""
+    writer = _LOG_WRITER
+    if writer is None:
+        print(*values, sep=sep, end=end, file=file, flush=flush)
+        return
+    # 调用时就确定输出对象，crawl_all.py 的 redirect_stdout 结束后仍写入原来的位置
+    writer.write(file if file is not None else sys.stdout, sep.join(map(str, values)) + end)
+
+
+def flush_async_logging(timeout: Optional[float] = 5.0) -> None:
+    """等待后台线程写完已排队的日志和终端输出；未启用异步日志时什么也不做。
+
+    输出对象即将关闭前调用 (如 crawl_all.py 结束 redirect_stdout 前)，排队的输出不会写到已关闭的文件上被丢弃。
+    """
+    writer = _LOG_WRITER
+    if writer is not None:
+        writer.flush(timeout)
+
+
+def console_input(prompt: str = "") -> str:
+    """与 input 相同；先等后台线程写完之前的输出，提示不会被排在后面的日志冲掉。"""
+    writer = _LOG_WRITER
+    if writer is not None:
+        writer.flush()
+    return input(prompt)
+
+
+class ProgressSampler:
+    """下载进度的输出采样: 同一线程每隔 interval 秒最多一行，所有线程合计每秒最多 max_per_second 行，
+    未到时间的进度直接丢弃 (只是显示用的估算值)。"""
+
+    def __init__(self, interval: float = PROGRESS_INTERVAL, max_per_second: float = PROGRESS_MAX_PER_SECOND):
+        self.interval = interval
+        self.spacing = 1.0 / max_per_second if max_per_second > 0 else 0.0
+        self._next_global = 0.0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """开始一次新的下载 (一张图片)，本线程至少 interval 秒后才输出第一行进度。"""
+        self._local.next_at = time.monotonic() + self.interval
+
+    def due(self) -> bool:
+        """本线程现在是否应该输出一行进度。"""
+        now = time.monotonic()
+        if now < getattr(self._local, "next_at", 0.0):
+            return False
+        self._local.next_at = now + self.interval
+        with self._lock:
+            if now < self._next_global:
+                return False
+            self._next_global = now + self.spacing
+        return True
+
+
+class JsonLogFormatter(logging.Formatter):
+    """结构化日志: 每条记录一行 JSON，含时间、级别、线程、消息，以及 log_event() 附带的事件名和字段。"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        event = getattr(record, "event", None)
+        if event:
+            entry["event"] = event
+            entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def log_event(logger: logging.Logger, event: str, message: str, level: int = logging.INFO, **fields: Any) -> None:
+    """记录一个带结构化字段的事件: 普通日志照常显示 message，JSON 日志额外包含 event 和各字段。"""
+    if logger.isEnabledFor(level):
+        logger.log(level, message, extra={"event": event, "fields": fields})
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+可选的 HTTP/2 传输: 基于 httpx 的 requests 适配器
+
+由 crawler_common.mount_http2 在启用 --http2 时加载，未启用时不导入 requests 适配器相关模块和 httpx。
+"""
+
+from types import SimpleNamespace
+from typing import Iterator, Optional
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from crawler_common import HTTP2_KEEPALIVE_CONNECTIONS
+
+
+class _HeaderMessage:
+    """为 requests 的 Cookie 提取提供 http.client.HTTPMessage 风格的 get_all 接口。"""
+
+    def __init__(self, headers):
+        self._headers = headers
+
+    def get_all(self, name: str, failobj=None):
+        values = self._headers.get_list(name)
+        return values or failobj
+
+
+class _HttpxRaw:
+    """把 httpx 的流式响应包装成 requests.Response.raw 所需的最小接口。"""
+
+    def __init__(self, response):
+        self._response = response
+        self._iter = None
+        self._buffer = b""
+        self._original_response = SimpleNamespace(msg=_HeaderMessage(response.headers))
+        self.closed = False
+
+    def stream(self, chunk_size: int = 8192, decode_content: bool = True) -> Iterator[bytes]:
+        while True:
+            data = self.read(chunk_size)
+            if not data:
+                break
+            yield data
+
+    def read(self, amt: Optional[int] = None, decode_content: bool = True) -> bytes:
+        if self._iter is None:
+            self._iter = self._response.iter_bytes()
+        if amt is None:
+            data = self._buffer + b"".join(self._iter)
+            self._buffer = b""
+            return data
+        while len(self._buffer) < amt:
+            chunk = next(self._iter, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        data, self._buffer = self._buffer[:amt], self._buffer[amt:]
+        return data
+
+    def release_conn(self) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if not self.closed:
+            self._response.close()
+            self.closed = True
+
+
+class HTTP2Adapter(BaseAdapter):
+    """基于 httpx 的 requests 传输适配器。
+
+    TLS 连接通过 ALPN 协商 HTTP/2，服务器不支持时自动回退到 HTTP/1.1；
+    同一主机的大量并发请求在少量连接上多路复用，减少握手次数和套接字数量。
+    prior_knowledge=True 时对明文 http:// 直接使用 h2c (仅用于本地测试服务器)。
+    """
+
+    def __init__(self, max_keepalive_connections: int = HTTP2_KEEPALIVE_CONNECTIONS, prior_knowledge: bool = False):
+        super().__init__()
+        import httpx
+        self._httpx = httpx
+        # 不限制总连接数: h2 下同一主机的请求自动复用已有连接；回退到 HTTP/1.1 时行为与 requests 连接池一致
+        self._client = httpx.Client(
+            http1=not prior_knowledge,
+            http2=True,
+            follow_redirects=False,  # 重定向交给 requests.Session 处理
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=max_keepalive_connections),
+        )
+
+    def _timeout(self, timeout):
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            return self._httpx.Timeout(read, connect=connect)
+        return self._httpx.Timeout(timeout)
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        httpx = self._httpx
+        try:
+            httpx_request = self._client.build_request(
+                request.method,
+                request.url,
+                headers=list(request.headers.items()),
+                content=request.body,
+                timeout=self._timeout(timeout),
+            )
+            httpx_response = self._client.send(httpx_request, stream=True)
+        except httpx.ConnectTimeout as e:
+            raise requests.exceptions.ConnectTimeout(e, request=request)
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.ReadTimeout(e, request=request)
+        except httpx.ConnectError as e:
+            raise requests.exceptions.ConnectionError(e, request=request)
+        except httpx.HTTPError as e:
+            raise requests.exceptions.RequestException(e, request=request)
+
+        response = requests.Response()
+        response.status_code = httpx_response.status_code
+        response.headers = CaseInsensitiveDict(
+            (key, ", ".join(httpx_response.headers.get_list(key))) for key in httpx_response.headers.keys()
+        )
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = _HttpxRaw(httpx_response)
+        response.reason = httpx_response.reason_phrase
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        # 记录实际协商到的协议 ("HTTP/2" 或 "HTTP/1.1")，便于统计回退情况
+        response.http_version = httpx_response.http_version
+        if not stream:
+            try:
+                response.content
+            except httpx.HTTPError as e:
+                raise requests.exceptions.ChunkedEncodingError(e, request=request)
+        return response
+
+    def close(self) -> None:
+        self._client.close()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+打包模式 (--pack) 专辑分片解包工具
+
+把保存目录下的 <专辑名>.tar 分片还原为 <输出目录>/<专辑名>/<图片> 的散文件结构，
+已存在的同名图片自动跳过，可重复运行。
+
+用法:
+  python extract_archives.py <保存目录或.tar分片> [更多...] [-o 输出目录]
+  python extract_archives.py E:/pachong/结果/凹凸吧 -o E:/pachong/解包
+  python extract_archives.py 专辑A.tar --list
+"""
+
+import os
+import sys
+import argparse
+import logging
+
+from crawler_common import ARCHIVE_SUFFIX, archive_members, extract_archive
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+def find_archives(path: str) -> list:
+    """参数可以是单个分片或保存目录 (只查找目录第一层的分片)。"""
+    if os.path.isfile(path):
+        return [path]
+    return sorted(
+        os.path.join(path, name) for name in os.listdir(path)
+        if name.endswith(ARCHIVE_SUFFIX)
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="把 --pack 模式生成的专辑分片解包为散文件")
+    parser.add_argument("paths", nargs="+", help="保存目录或 .tar 分片")
+    parser.add_argument("-o", "--output", help="输出根目录 (默认与分片同目录)")
+    parser.add_argument("--list", action="store_true", help="只列出分片内容，不解包")
+    args = parser.parse_args()
+
+    archives = [a for p in args.paths for a in find_archives(p)]
+    if not archives:
+        logging.warning("未找到任何 %s 分片", ARCHIVE_SUFFIX)
+        return 1
+
+    total = 0
+    for index, archive in enumerate(archives, 1):
+        album = os.path.basename(archive)[:-len(ARCHIVE_SUFFIX)]
+        if args.list:
+            members = archive_members(archive)
+            print(f"{album}: {len(members)} 张")
+            for name, (_, size) in members.items():
+                print(f"  {name}  {size} 字节")
+            continue
+        dest_dir = os.path.join(args.output or os.path.dirname(archive), album)
+        written = extract_archive(archive, dest_dir)
+        total += written
+        logging.info("[%d/%d] %s -> %s (新写出 %d 张)", index, len(archives), archive, dest_dir, written)
+
+    if not args.list:
+        logging.info("解包完成，共写出 %d 张图片", total)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+下载后处理: 缩略图与专辑预览图生成
+
+为保存目录下的每个专辑生成固定尺寸的缩略图，以及一张专辑封面拼图 (contact sheet)，
+浏览图库时无需打开动辄数 MB 的原图。
+
+特点:
+  - 不完整解码大图: JPEG 使用 Pillow draft() 在解码阶段按 1/2、1/4、1/8 缩小；
+    其他格式 (webp/png) 使用 thumbnail(reducing_gap=...) 先整数倍 reduce 再精细缩放
+  - 进程池: 解码和缩放在独立进程中进行，不与爬虫的下载线程争抢 GIL
+  - 增量: 清单 (.thumbs/manifest.json) 记录每张原图的大小和修改时间，未变化的图片直接跳过
+    (无法解码的原图也会记录，文件变化前不再重试)
+  - 同时支持散文件目录和 --pack 模式生成的 <专辑>.tar 分片
+
+输出:
+  <保存目录>/.thumbs/<专辑>/<图片名>.jpg   缩略图
+  <保存目录>/.thumbs/<专辑>/_contact.jpg   专辑封面拼图
+
+用法:
+  python thumbnails.py <保存目录> [--size 320] [--workers 4]
+"""
+
+import os
+import sys
+import json
+import argparse
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from crawler_common import ARCHIVE_SUFFIX, archive_members
+
+# -------- 默认配置 --------
+THUMB_DIR = ".thumbs"
+MANIFEST_NAME = "manifest.json"
+CONTACT_NAME = "_contact.jpg"
+DEFAULT_THUMB_SIZE = 320            # 缩略图最长边 (像素)
+CONTACT_COLUMNS = 4                 # 封面拼图每行张数
+CONTACT_MAX_IMAGES = 16             # 封面拼图最多取前 N 张
+THUMB_QUALITY = 80
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp")
+FAILED_MARK = -1                    # 清单中标记无法解码的原图
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# 任务: (专辑名, 图片名, 源路径, tar 分片内偏移, 大小, 缩略图路径)；散文件时偏移为 -1
+ThumbTask = Tuple[str, str, str, int, int, str]
+
+
+# -------- 进程池中执行的函数 --------
+def make_thumbnail(task: ThumbTask, size: int) -> Tuple[str, str, Optional[str]]:
+    """生成一张缩略图，返回 (专辑, 图片名, 错误信息)。在子进程中运行。"""
+    import io
+    from PIL import Image, ImageFile
+    ImageFile.LOAD_TRUNCATED_IMAGES = True
+    Image.MAX_IMAGE_PIXELS = None
+
+    album, name, src, offset, length, dest = task
+    try:
+        if offset >= 0:
+            with open(src, "rb") as f:
+                f.seek(offset)
+                source = io.BytesIO(f.read(length))
+        else:
+            source = src
+        with Image.open(source) as img:
+            # JPEG: 解码时直接按 DCT 缩放，大图只解码到不小于目标尺寸的最小档位
+            img.draft("RGB", (size, size))
+            img.thumbnail((size, size), Image.LANCZOS, reducing_gap=2.0)
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            tmp_path = dest + ".part"
+            img.save(tmp_path, "JPEG", quality=THUMB_QUALITY, optimize=True)
+            os.replace(tmp_path, dest)
+        return album, name, None
+    except Exception as e:
+        return album, name, str(e)
+
+
+def make_contact_sheet(thumb_paths: List[str], dest: str, size: int) -> Optional[str]:
+    """把若干缩略图拼成一张专辑封面，返回错误信息 (成功时为 None)。在子进程中运行。"""
+    from PIL import Image
+
+    try:
+        count = min(len(thumb_paths), CONTACT_MAX_IMAGES)
+        columns = min(CONTACT_COLUMNS, count)
+        rows = (count + columns - 1) // columns
+        sheet = Image.new("RGB", (columns * size, rows * size), (24, 24, 24))
+        for i, path in enumerate(thumb_paths[:count]):
+            with Image.open(path) as thumb:
+                x = (i % columns) * size + (size - thumb.width) // 2
+                y = (i // columns) * size + (size - thumb.height) // 2
+                sheet.paste(thumb, (x, y))
+        tmp_path = dest + ".part"
+        sheet.save(tmp_path, "JPEG", quality=THUMB_QUALITY, optimize=True)
+        os.replace(tmp_path, dest)
+        return None
+    except Exception as e:
+        return str(e)
+
+
+def _run_thumbnail(args: Tuple[ThumbTask, int]) -> Tuple[str, str, Optional[str]]:
+    return make_thumbnail(*args)
+
+
+def _run_contact(args: Tuple[List[str], str, int]) -> Optional[str]:
+    return make_contact_sheet(*args)
+
+
+# -------- 清单与任务收集 --------
+def load_manifest(path: str) -> Dict[str, List[int]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(path: str, manifest: Dict[str, List[int]]) -> None:
+    tmp_path = path + ".part"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def thumb_name(name: str) -> str:
+    return os.path.splitext(name)[0] + ".jpg"
+
+
+def scan_sources(root: str) -> Dict[str, List[Tuple[str, str, int, int, int]]]:
+    """列出所有专辑的原图: 专辑 -> [(图片名, 源路径, 偏移, 大小, 修改时间)]。"""
+    albums: Dict[str, List[Tuple[str, str, int, int, int]]] = {}
+    with os.scandir(root) as it:
+        for entry in it:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir():
+                images = []
+                with os.scandir(entry.path) as album_it:
+                    for img in album_it:
+                        if img.is_file() and img.name.lower().endswith(IMAGE_EXTENSIONS):
+                            st = img.stat()
+                            images.append((img.name, img.path, -1, st.st_size, st.st_mtime_ns))
+                albums[entry.name] = images
+            elif entry.is_file() and entry.name.endswith(ARCHIVE_SUFFIX):
+                # 分片只追加不修改，成员名 + 大小即可判断是否变化
+                mtime = entry.stat().st_mtime_ns
+                albums[entry.name[:-len(ARCHIVE_SUFFIX)]] = [
+                    (name, entry.path, offset, size, mtime)
+                    for name, (offset, size) in archive_members(entry.path).items()
+                    if name.lower().endswith(IMAGE_EXTENSIONS)
+                ]
+    return albums
+
+
+# -------- 主流程 --------
+def build_thumbnails(root: str, size: int = DEFAULT_THUMB_SIZE, workers: Optional[int] = None) -> Dict[str, int]:
+    """为 root 下所有专辑增量生成缩略图和封面拼图，返回统计。"""
+    thumb_root = os.path.join(root, THUMB_DIR)
+    os.makedirs(thumb_root, exist_ok=True)
+    manifest_path = os.path.join(thumb_root, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+    if manifest.get("__size__") != [size]:
+        manifest = {"__size__": [size]}  # 尺寸变化时全部重建
+
+    albums = scan_sources(root)
+    tasks: List[ThumbTask] = []
+    fingerprints: Dict[Tuple[str, str], List[int]] = {}
+    dirty_albums = set()
+    for album, images in albums.items():
+        album_thumb_dir = os.path.join(thumb_root, album)
+        for name, src, offset, length, mtime in images:
+            key = f"{album}/{name}"
+            fingerprint = [length, mtime if offset < 0 else 0]
+            dest = os.path.join(album_thumb_dir, thumb_name(name))
+            recorded = manifest.get(key)
+            if recorded == fingerprint + [FAILED_MARK] or (recorded == fingerprint and os.path.exists(dest)):
+                continue
+            tasks.append((album, name, src, offset, length, dest))
+            fingerprints[(album, name)] = fingerprint
+            dirty_albums.add(album)
+        if images and not os.path.exists(os.path.join(album_thumb_dir, CONTACT_NAME)):
+            dirty_albums.add(album)
+
+    stats = {"albums": len(albums), "generated": 0, "skipped": sum(map(len, albums.values())) - len(tasks),
+             "failed": 0, "contacts": 0}
+    logging.info("缩略图: %d 个专辑，%d 张需要生成，%d 张未变化跳过", len(albums), len(tasks), stats["skipped"])
+    if not tasks and not dirty_albums:
+        return stats
+
+    from concurrent.futures import ProcessPoolExecutor  # 只在真正需要生成时才加载多进程模块
+    workers = workers or max(1, (os.cpu_count() or 2) // 2)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, min(32, len(tasks) // (workers * 4) or 1))
+        for index, (album, name, error) in enumerate(
+                executor.map(_run_thumbnail, [(task, size) for task in tasks], chunksize=chunksize), 1):
+            if error is None:
+                manifest[f"{album}/{name}"] = fingerprints[(album, name)]
+                stats["generated"] += 1
+            else:
+                manifest[f"{album}/{name}"] = fingerprints[(album, name)] + [FAILED_MARK]
+                stats["failed"] += 1
+                logging.warning("缩略图生成失败: %s/%s (%s)", album, name, error)
+            if index % 500 == 0:
+                save_manifest(manifest_path, manifest)  # 中断后下次从这里继续
+                logging.info("缩略图进度: %d/%d", index, len(tasks))
+
+        contact_jobs = []
+        for album in sorted(dirty_albums):
+            thumbs = [os.path.join(thumb_root, album, thumb_name(name)) for name, *_ in sorted(albums[album])]
+            thumbs = [path for path in thumbs if os.path.exists(path)]
+            if thumbs:
+                contact_jobs.append((thumbs, os.path.join(thumb_root, album, CONTACT_NAME), size))
+        for (_, dest, _), error in zip(contact_jobs, executor.map(_run_contact, contact_jobs)):
+            if error is None:
+                stats["contacts"] += 1
+            else:
+                logging.warning("封面拼图生成失败: %s (%s)", dest, error)
+
+    save_manifest(manifest_path, manifest)
+    logging.info("缩略图完成: 生成 %d 张，跳过 %d 张，失败 %d 张，封面拼图 %d 个",
+                 stats["generated"], stats["skipped"], stats["failed"], stats["contacts"])
+    return stats
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="为已下载的专辑生成缩略图和封面拼图")
+    parser.add_argument("root", help="爬虫的保存目录")
+    parser.add_argument("--size", type=int, default=DEFAULT_THUMB_SIZE, help="缩略图最长边(像素)")
+    parser.add_argument("--workers", type=int, help="进程数，默认 CPU 核数的一半")
+    args = parser.parse_args()
+
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        logging.error("需要安装 Pillow (请运行: pip install Pillow)")
+        return 1
+    build_thumbnails(os.path.abspath(args.root), args.size, args.workers)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+下载后处理: 图片重新编码以节省图库空间
+
+把保存目录下的图片按原格式重新编码 (JPEG 用高压缩率参数，WebP 用最慢最省的编码方式，
+PNG 无损优化)，或用 --format webp 转成 WebP；只有结果更小时才替换原图，每张图片的原始大小和
+新大小都记录在报告 (<保存目录>/.transcode_report.csv) 中。
+
+特点:
+  - 进程池: 解码/编码在独立进程中进行，不与下载线程争抢 GIL
+  - 先校验再编码: 原图必须能完整解码，损坏的图片只记录不处理
+  - 结果不小于原图时保留原图；动图、以及内容与扩展名不符的图片保持原样
+  - 扩展名始终与内容一致: 默认只在原格式内重新编码，文件名不变；--format webp 时 JPEG/PNG
+    转为 WebP 并改名为 .webp (同名 .webp 已存在时不转换)，报告的 new_path 列记录 旧路径 -> 新路径，
+    各爬虫判断"已存在"时按报告找到改名后的文件，不会重新下载
+  - 重新编码时保留原图的 ICC 色彩配置和 EXIF (CMYK 转 RGB 时 ICC 配置不再适用，丢弃)
+  - 增量/可断点续传: 报告按行追加，记录每个文件处理后的大小和修改时间，
+    重新运行时跳过未变化的文件，适合处理数百 GB 的已有图库
+  - 只处理散文件目录；--pack 模式的 tar 分片只追加不修改，不参与重新编码
+
+用法:
+  python transcode.py <保存目录> [--format keep|webp] [--quality 80] [--workers 4]
+"""
+
+import os
+import sys
+import csv
+import time
+import argparse
+import logging
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Dict, Iterator, Optional, Tuple
+
+from crawler_common import TRANSCODE_REPORT_NAME as REPORT_NAME
+
+# -------- 默认配置 --------
+REPORT_FIELDS = ["path", "original_bytes", "new_bytes", "action", "mtime_ns", "error", "new_path"]
+TARGET_FORMATS = ("keep", "webp")   # keep: 原格式内重新编码；webp: JPEG/PNG 转为 WebP 并改扩展名
+DEFAULT_TARGET = "keep"
+DEFAULT_QUALITY = 80
+# 扩展名 -> 编码格式：只在原格式内重新编码，扩展名始终与内容一致
+FORMAT_BY_EXTENSION = {".jpg": "JPEG", ".jpeg": "JPEG", ".png": "PNG", ".webp": "WEBP"}
+IMAGE_EXTENSIONS = tuple(FORMAT_BY_EXTENSION)
+PENDING_PER_WORKER = 8              # 每个进程排队的任务数上限，避免百万级文件一次性全部提交
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+# -------- 进程池中执行的函数 --------
+def transcode_file(path: str, quality: int, target: str = DEFAULT_TARGET) -> Dict[str, object]:
+    """重新编码一张图片，结果更小时原子替换原文件 (转 WebP 时写入 .webp 后删除原文件)。在子进程中运行，返回报告行。"""
+    import io
+    from PIL import Image
+
+    Image.MAX_IMAGE_PIXELS = None
+    original_bytes = os.path.getsize(path)
+    row: Dict[str, object] = {"path": path, "original_bytes": original_bytes, "new_bytes": original_bytes,
+                              "action": "kept", "error": "", "new_path": path}
+    new_path = path
+    try:
+        with Image.open(path) as img:
+            if getattr(img, "is_animated", False):
+                row["action"] = "skipped_animated"
+                return _finish(row, path)
+            source_format = FORMAT_BY_EXTENSION[os.path.splitext(path)[1].lower()]
+            if img.format != source_format:
+                # 内容与扩展名不符 (如站点把 JPEG 存成 .png)，不做猜测，保持原样
+                row["action"] = "skipped_mismatch"
+                return _finish(row, path)
+            target_format = source_format
+            if target == "webp" and source_format != "WEBP":
+                target_format = "WEBP"
+                new_path = os.path.splitext(path)[0] + ".webp"
+                if os.path.exists(new_path):
+                    row["action"] = "skipped_conflict"  # 同名 .webp 已存在 (另一张图或上次中断留下的)，不覆盖
+                    return _finish(row, path)
+            img.load()  # 完整解码，截断或损坏的图片在这里失败
+            # 色彩配置和拍摄信息随图片保留；CMYK 转 RGB 后原 ICC 配置不再适用
+            metadata = {key: img.info[key] for key in ("icc_profile", "exif") if img.info.get(key)}
+            if img.mode == "CMYK":
+                metadata.pop("icc_profile", None)
+            has_alpha = img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info)
+            buffer = io.BytesIO()
+            if target_format == "WEBP":
+                if img.mode not in ("RGB", "RGBA", "L"):
+                    img = img.convert("RGBA" if has_alpha else "RGB")
+                img.save(buffer, "WEBP", quality=quality, method=6, **metadata)
+            elif target_format == "PNG":
+                img.save(buffer, "PNG", optimize=True, **metadata)  # 无损，只重新压缩
+            else:
+                if img.mode not in ("RGB", "L"):
+                    img = img.convert("RGB")
+                img.save(buffer, "JPEG", quality=quality, optimize=True, progressive=True, subsampling="4:2:0",
+                         **metadata)
+    except Exception as e:
+        row["action"] = "error"
+        row["error"] = str(e)
+        return _finish(row, path)
+
+    data = buffer.getvalue()
+    if len(data) >= original_bytes:
+        return _finish(row, path)  # 重新编码后没有变小，保留原图
+
+    tmp_path = new_path + ".transcode.part"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, new_path)
+    if new_path != path:
+        os.remove(path)  # 新文件已完整写入后才删除原图
+    row["new_bytes"] = len(data)
+    row["action"] = "transcoded"
+    row["new_path"] = new_path
+    return _finish(row, new_path)
+
+
+def _finish(row: Dict[str, object], path: str) -> Dict[str, object]:
+    row["mtime_ns"] = os.stat(path).st_mtime_ns
+    return row
+
+
+# -------- 报告 (同时作为断点续传记录) --------
+def load_report(path: str) -> Dict[str, Tuple[int, int]]:
+    """读取已有报告: 处理后的文件路径 -> (处理后的大小, 处理后的修改时间)。中断时写了一半的行被忽略。"""
+    done: Dict[str, Tuple[int, int]] = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            try:
+                done[row.get("new_path") or row["path"]] = (int(row["new_bytes"]), int(row["mtime_ns"]))
+            except (TypeError, ValueError, KeyError):
+                continue
+    return done
+
+
+def upgrade_report(path: str) -> None:
+    """旧版报告没有 new_path 列时补上表头 (旧行的新路径就是原路径)，之后追加的行与表头对齐。"""
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        reader = csv.DictReader(f)
+        if reader.fieldnames is None or "new_path" in reader.fieldnames:
+            return
+        rows = [row for row in reader if row.get("path")]
+    tmp_path = path + ".part"
+    with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for row in rows:
+            row["new_path"] = row["path"]
+            writer.writerow(row)
+    os.replace(tmp_path, path)
+
+
+def iter_candidates(root: str, done: Dict[str, Tuple[int, int]]) -> Iterator[str]:
+    """逐个产出需要处理的图片 (报告中没有，或处理后又发生了变化)。"""
+    with os.scandir(root) as it:
+        album_dirs = [entry.path for entry in it if entry.is_dir() and not entry.name.startswith(".")]
+    for album_dir in sorted(album_dirs):
+        with os.scandir(album_dir) as it:
+            for entry in it:
+                if not entry.is_file() or not entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                st = entry.stat()
+                if done.get(entry.path) == (st.st_size, st.st_mtime_ns):
+                    continue
+                yield entry.path
+
+
+# -------- 主流程 --------
+def transcode_library(root: str, quality: int = DEFAULT_QUALITY, workers: Optional[int] = None,
+                      target: str = DEFAULT_TARGET) -> Dict[str, int]:
+    """增量重新编码 root 下所有专辑目录中的图片，返回统计。target 为 "webp" 时 JPEG/PNG 转为 WebP 并改名。"""
+    from concurrent.futures import ProcessPoolExecutor  # 只在真正运行时才加载多进程模块
+    report_path = os.path.join(root, REPORT_NAME)
+    upgrade_report(report_path)
+    done = load_report(report_path)
+    new_report = not os.path.exists(report_path)
+    stats = {"processed": 0, "transcoded": 0, "kept": 0, "skipped": 0, "error": 0,
+             "original_bytes": 0, "new_bytes": 0}
+    workers = workers or max(1, (os.cpu_count() or 2) // 2)
+    start_time = time.time()
+    logging.info("重新编码 (%s): 质量 %d，进程数 %d，报告中已有 %d 个文件",
+                 "转为 WebP" if target == "webp" else "保持原格式", quality, workers, len(done))
+
+    with open(report_path, "a", encoding="utf-8", newline="") as report_file, \
+            ProcessPoolExecutor(max_workers=workers) as executor:
+        writer = csv.DictWriter(report_file, fieldnames=REPORT_FIELDS)
+        if new_report:
+            writer.writeheader()
+        pending = set()
+        progress = {"logged": 0}
+
+        def collect(finished) -> None:
+            for future in finished:
+                row = future.result()
+                writer.writerow(row)
+                stats["processed"] += 1
+                action = str(row["action"])
+                stats[action if action in stats else "skipped"] += 1
+                stats["original_bytes"] += int(row["original_bytes"])
+                stats["new_bytes"] += int(row["new_bytes"])
+                if action == "error":
+                    logging.warning("无法解码，保持原样: %s (%s)", row["path"], row["error"])
+            report_file.flush()  # 每批结果立即落盘，中断后从这里继续
+            if stats["processed"] // 1000 > progress["logged"]:
+                progress["logged"] = stats["processed"] // 1000
+                saved = stats["original_bytes"] - stats["new_bytes"]
+                logging.info("重新编码进度: 已处理 %d 张，节省 %.1f MB", stats["processed"], saved / 1024 / 1024)
+
+        # 边扫描边提交，排队任务数有上限，百万级图库也不会一次性占满内存
+        for path in iter_candidates(root, done):
+            pending.add(executor.submit(transcode_file, path, quality, target))
+            if len(pending) >= workers * PENDING_PER_WORKER:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+        if pending:
+            finished, _ = wait(pending)
+            collect(finished)
+
+    saved = stats["original_bytes"] - stats["new_bytes"]
+    ratio = saved / stats["original_bytes"] * 100 if stats["original_bytes"] else 0.0
+    logging.info("重新编码完成 (%.1f 分钟): 处理 %d 张，替换 %d 张，保留原图 %d 张，跳过 %d 张，损坏 %d 张",
+                 (time.time() - start_time) / 60, stats["processed"], stats["transcoded"], stats["kept"],
+                 stats["skipped"], stats["error"])
+    logging.info("本次节省 %.1f MB (%.1f%%)，明细见 %s", saved / 1024 / 1024, ratio, report_path)
+    return stats
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="把已下载的图片重新编码以节省空间")
+    parser.add_argument("root", help="爬虫的保存目录")
+    parser.add_argument("--format", choices=TARGET_FORMATS, default=DEFAULT_TARGET,
+                        help="keep: 按原格式重新编码，文件名不变；webp: JPEG/PNG 转为 WebP 并改名为 .webp")
+    parser.add_argument("--quality", type=int, default=DEFAULT_QUALITY, help="JPEG/WebP 编码质量 (1-100)")
+    parser.add_argument("--workers", type=int, help="进程数，默认 CPU 核数的一半")
+    args = parser.parse_args()
+
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        logging.error("需要安装 Pillow (请运行: pip install Pillow)")
+        return 1
+    transcode_library(os.path.abspath(args.root), args.quality, args.workers, args.format)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,636 +1,1185 @@
-#!/usr/bin/env python3
-# -*- coding: utf-8 -*-
-"""
-凸凹吧 (https://www.tuao.cc/) 相册爬虫
-
-功能:
-  - 爬取网站的图集
-  - 图像内容验证：自动检测并重新下载损坏的图片 (需 Pillow 库)
-
-
-特点:
-  - 两级并发: 并发处理多个图集，同时在每个图集内部并发下载图片
-  - 图像验证:
-    - 通过 --verify 启用，可识别并修复已存在的损坏文件
-    - 验证新下载的内容，防止 HTML 错误页被保存
-  - 防护增强:
-    - 增加连接池 (HTTPAdapter)
-    - 增加列表页爬取延迟 (page-sleep)
-    - 新增专辑详情页请求延迟 (album-sleep) 以防止 429
-  - 原子化写入/断点续传: 自动跳过已存在的图片文件
-  - 健壮的解析: 使用更稳定的CSS选择器，并有清晰的日志记录
-  - 统一日志: 实现了 [专辑 X/N] 和 (图片 Y/Z) 进度打印
-  - 随机加入4~8s延迟，模拟用户真实操作
-  - 重试机制：如遇链接或者下载失败时，重试5次，每次重试前随机延时4~8秒，5次失败后暂停脚本等待，待用户检查网络后按任意键继续链接或下载，以此循环
-"""
-
-import os
-import re
-import time
-import random
-import argparse
-import logging
-import io
-from urllib.parse import urljoin, urlparse
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import List, Tuple, Dict, Optional, Set, Any
-
-import requests
-from requests.adapters import HTTPAdapter
-from requests.exceptions import RequestException
-from bs4 import BeautifulSoup
-
-# -------- 检查 Pillow 库 --------
-try:
-    from PIL import Image, ImageFile
-    from PIL.Image import UnidentifiedImageError
-    ImageFile.LOAD_TRUNCATED_IMAGES = True
-    Image.MAX_IMAGE_PIXELS = None
-    PILLOW_AVAILABLE = True
-except ImportError:
-    PILLOW_AVAILABLE = False
-
-# -------- 默认配置 (针对反爬优化) --------
-BASE_URL = "https://www.tuao.cc/"
-# 分类列表
-CATEGORIES = [
-    ("最新", "/Articles"),
-    ("无圣光", "/Articles/Categories/1"),
-    ("凸凹图", "/Articles/Categories/2"),
-    ("靓人体", "/Articles/Categories/3"),
-    ("写真集", "/Articles/Categories/4")
-]
-DEFAULT_SAVE_DIR = r"E:\pachong\结果\凹凸吧"
-DEFAULT_RETRIES = 5
-DEFAULT_TIMEOUT = 20
-DEFAULT_CONCURRENCY_ALBUM = 5      # 并发处理专辑数量
-DEFAULT_CONCURRENCY_IMAGE = 8      # 专辑内部并发下载图片数量
-DEFAULT_PAGE_SLEEP_MIN = 4.0       # 列表页爬取延迟最小值
-DEFAULT_PAGE_SLEEP_MAX = 8.0       # 列表页爬取延迟最大值
-DEFAULT_ALBUM_SLEEP_MIN = 4.0      # 专辑详情页请求延迟最小值
-DEFAULT_ALBUM_SLEEP_MAX = 8.0      # 专辑详情页请求延迟最大值
-DEFAULT_POOL_SIZE = 64             # 连接池大小
-
-# -------- 日志设置 --------
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
-
-if not PILLOW_AVAILABLE:
-    logging.warning("Pillow 库未安装。将跳过严格的图像完整性校验 (请运行: pip install Pillow)")
-
-# -------- 辅助函数 --------
-def make_session() -> requests.Session:
-    """创建并配置requests.Session，增加连接池大小。"""
-    s = requests.Session()
-    s.headers.update({
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36",
-    })
-    
-    # 配置连接池适配器
-    adapter = HTTPAdapter(
-        pool_connections=DEFAULT_POOL_SIZE,  # 连接池的最大数量
-        pool_maxsize=DEFAULT_POOL_SIZE       # 保持活动的连接数
-    )
-    # 为 http 和 https 协议都挂载这个适配器
-    s.mount('http://', adapter)
-    s.mount('https://', adapter)
-    
-    return s
-
-def get_random_delay(min_delay: float, max_delay: float) -> float:
-    """获取指定范围内的随机延迟"""
-    return random.uniform(min_delay, max_delay)
-
-def request_with_retry(session: requests.Session, url: str, retries: int, timeout: int, is_binary: bool = False) -> Optional[Any]:
-    """带重试机制的请求函数"""
-    r: Optional[requests.Response] = None
-    for attempt in range(1, retries + 1):
-        try:
-            if is_binary:
-                r = session.get(url, timeout=timeout, stream=True)
-            else:
-                r = session.get(url, timeout=timeout)
-            r.raise_for_status() # 检查 4xx/5xx 错误
-            return r.content if is_binary else r.text
-            
-        except RequestException as e:
-            wait_time = get_random_delay(4.0, 8.0)
-            status_msg = f"{r.status_code}" if r is not None else "无响应"
-
-            if attempt < retries:
-                logging.warning("请求失败: %s (尝试 %d/%d) 错误: %s。状态: %s，等待 %.1fs 并重试。", 
-                                url, attempt, retries, e, status_msg, wait_time)
-                time.sleep(wait_time)
-            else:
-                logging.error("请求失败: %s (所有尝试均失败)。错误: %s", url, e)
-                # 5次失败后暂停脚本等待
-                input("按任意键继续...")
-    return None
-
-def sanitize_filename(name: str, maxlen: int = 150) -> str:
-    """清洗并截断文件名/文件夹名。"""
-    if not name: return "untitled"
-    s = re.sub(r'[\\/:*?"<>|]+', "_", name).strip()
-    return s[:maxlen] or "untitled"
-
-# -------- 图像验证辅助函数 --------
-def is_image_valid_bytes(data: bytes, verify: bool) -> bool:
-    """检查内存中的 bytes 是否为有效图像。"""
-    if not verify or not PILLOW_AVAILABLE:
-        return True
-    
-    try:
-        with Image.open(io.BytesIO(data)) as img:
-            img.verify() # 检查文件是否截断或损坏
-        return True
-    except (UnidentifiedImageError, ValueError, OSError, TypeError) as e:
-        logging.debug("Pillow 校验失败 (内容确认损坏或为HTML): %s", e)
-        return False
-    except Exception as e:
-        logging.error("验证时发生系统级异常: %s", e)
-        return False
-
-def is_image_valid_file(filepath: str, verify: bool) -> bool:
-    """检查磁盘上的文件是否为有效图像。"""
-    if not verify or not PILLOW_AVAILABLE:
-        return True
-    
-    try:
-        with Image.open(filepath) as img:
-            img.verify() # 检查文件是否截断或损坏
-        return True
-    except (UnidentifiedImageError, ValueError, OSError, TypeError, FileNotFoundError) as e:
-        logging.debug("Pillow 校验失败 (文件确认损坏或IO问题): %s. 错误: %s", filepath, e)
-        return False
-    except Exception as e:
-        logging.error("校验文件 %s 时发生未知异常: %s", filepath, e)
-        return False
-
-def save_bytes_atomic(path: str, data: bytes) -> bool:
-    """原子化写入文件，避免文件损坏。"""
-    tmp_path = path + ".part"
-    try:
-        with open(tmp_path, "wb") as f: 
-            f.write(data)
-        os.replace(tmp_path, path)
-        return True
-    except IOError as e:
-        logging.error("文件写入失败 %s : %s", path, e)
-        if os.path.exists(tmp_path):
-            try: 
-                os.remove(tmp_path)
-            except OSError: 
-                pass
-        return False
-
-# -------- 解析函数 --------
-def parse_next_page(soup: BeautifulSoup) -> Optional[str]:
-    """从当前页面解析出下一页链接"""
-    pagination = soup.find("ul", class_="pagination")
-    if not pagination:
-        return None
-    
-    # 查找下一页链接的几种方法
-    next_page = None
-    
-    # 方法1: 查找包含右箭头符号的a标签
-    next_page = pagination.find("a", string="»")
-    if next_page and "href" in next_page.attrs:
-        return next_page["href"]
-    
-    # 方法2: 查找包含'下一页'文本的a标签
-    next_page = pagination.find("a", string=lambda text: text and "下一页" in text)
-    if next_page and "href" in next_page.attrs:
-        return next_page["href"]
-    
-    # 方法3: 查找pagination中的最后一个a标签
-    all_a = pagination.find_all("a")
-    if all_a:
-        last_a = all_a[-1]
-        if "href" in last_a.attrs:
-            href = last_a["href"]
-            # 确保不是当前页链接
-            if "Page=" in href:
-                return href
-    
-    return None
-
-def parse_albums_on_listing_page(html: str, base_url: str) -> List[Tuple[str, str]]:
-    """从列表页HTML中解析出(标题, URL)元组列表。"""
-    soup = BeautifulSoup(html, "html.parser")
-    albums = []
-    
-    logging.info("开始解析列表页专辑")
-    
-    # 简化的专辑提取逻辑：直接查找所有符合条件的a标签对
-    # 查找所有class为index-imgcontent-img的a标签（图片链接）
-    img_links = soup.find_all("a", class_="index-imgcontent-img")
-    logging.info(f"找到 {len(img_links)} 个class为index-imgcontent-img的a标签")
-    
-    # 查找所有class为index-imgcontent-title的a标签（标题链接）
-    title_links = soup.find_all("a", class_="index-imgcontent-title")
-    logging.info(f"找到 {len(title_links)} 个class为index-imgcontent-title的a标签")
-    
-    # 遍历图片链接，尝试为每个图片链接找到对应的标题
-    for i, img_link in enumerate(img_links):
-        # 获取图片链接的href
-        img_href = img_link.get("href")
-        if not img_href:
-            continue
-        
-        # 构建完整的专辑URL
-        album_url = urljoin(base_url, img_href)
-        
-        # 查找对应的标题
-        album_title = ""
-        
-        # 方法1: 如果标题链接数量匹配，直接对应
-        if i < len(title_links):
-            album_title = title_links[i].get_text(strip=True)
-        
-        # 方法2: 如果方法1失败，查找图片链接的父元素中的标题
-        if not album_title:
-            # 查找图片链接的父div
-            parent_div = img_link.find_parent("div")
-            if parent_div:
-                # 在父div中查找标题a标签
-                title_elem = parent_div.find("a", class_="index-imgcontent-title")
-                if title_elem:
-                    album_title = title_elem.get_text(strip=True)
-        
-        # 方法3: 简化的标题提取 - 使用alt属性或文件名作为标题
-        if not album_title:
-            # 查找图片标签
-            img_tag = img_link.find("img")
-            if img_tag:
-                # 使用alt属性作为标题
-                album_title = img_tag.get("alt", "")
-                if not album_title:
-                    # 使用图片文件名作为标题
-                    img_src = img_tag.get("src", "")
-                    if img_src:
-                        album_title = os.path.basename(img_src).split('.')[0]
-        
-        # 如果还是没有标题，使用默认标题
-        if not album_title:
-            album_title = f"专辑_{i+1}"
-        
-        # 清洗标题
-        album_title = sanitize_filename(album_title)
-        
-        # 添加到专辑列表
-        albums.append((album_title, album_url))
-        logging.info(f"提取到专辑: {album_title} -> {album_url}")
-    
-    logging.info(f"列表页解析完成，共提取到 {len(albums)} 个专辑")
-    return albums
-
-def parse_images_on_album_page(html: str, base_url: str) -> Set[str]:
-    """从相册页HTML中解析出所有高清图片的绝对URL集合。"""
-    soup = BeautifulSoup(html, "html.parser")
-    image_urls = set()
-    
-    # 查找所有图片，优先选择高清大图
-    for img in soup.find_all("img"):
-        src = img.get("src", "")
-        
-        # 检查是否为有效的图片URL
-        if src.startswith("/Files/images/") and (src.endswith(".webp") or src.endswith(".jpg") or src.endswith(".png")):
-            # 高清图片格式: /Files/images/20260113/6390391274363781897617252.webp
-            # 缩略图格式: /Files/images/202601/1c6ef29491e444428639530fb1ae1b85.webp
-            # 只选择带完整日期（8位数字）的高清图
-            import re
-            # 检查路径中是否包含8位数字的日期
-            if re.search(r'/\d{8}/', src):
-                image_urls.add(urljoin(base_url, src))
-    
-    return image_urls
-
-# -------- 下载核心逻辑 --------
-def download_single_image(session: requests.Session, url: str, album_dir: str, verify: bool, retries: int, timeout: int, current_index: int, total_images: int) -> str:
-    """下载单张图片，并根据内容验证有效性。"""
-    filename = os.path.basename(urlparse(url).path)
-    dest_path = os.path.join(album_dir, filename)
-    
-    progress_prefix = f"({current_index}/{total_images})"
-
-    # 1. 检查已存在的文件
-    if os.path.exists(dest_path):
-        if is_image_valid_file(dest_path, verify):
-            logging.info("%s 跳过 (已存在且有效): %s", progress_prefix, dest_path)
-            return "skipped"
-        else:
-            # 文件存在，但验证失败 (损坏、太小或是HTML)
-            logging.warning("%s 重新下载 (文件无效或损坏): %s", progress_prefix, dest_path)
-            try:
-                os.remove(dest_path) # 删除损坏的旧文件
-            except OSError as e:
-                logging.error("%s 无法删除旧的损坏文件: %s", progress_prefix, e)
-
-    # 2. 执行下载 (文件不存在 或 文件损坏)
-    data = request_with_retry(session, url, retries=retries, timeout=timeout, is_binary=True)
-    
-    if not data:
-        logging.warning("%s 下载失败 (未获取到数据): %s", progress_prefix, url)
-        return "fail"
-    
-    # 3. 验证新下载的数据 (在保存前)
-    if not is_image_valid_bytes(data, verify):
-        logging.warning("%s 下载的内容验证失败(损坏或HTML)，抛弃: %s", progress_prefix, url)
-        return "fail"
-
-    # 4. 保存 (数据已验证)
-    if save_bytes_atomic(dest_path, data):
-        logging.info("%s 下载成功: %s", progress_prefix, dest_path)
-        return "ok"
-    else:
-        logging.warning("%s 下载后保存文件失败: %s", progress_prefix, dest_path)
-        return "fail"
-
-def parse_album_total_pages(html: str) -> int:
-    """从专辑页HTML中解析出总页数。"""
-    soup = BeautifulSoup(html, "html.parser")
-    pagination = soup.find("ul", class_="pagination")
-    
-    if not pagination:
-        return 1
-    
-    page_numbers = {1}
-    for li in pagination.find_all("li"):
-        a_tag = li.find("a")
-        if a_tag:
-            text = a_tag.get_text(strip=True)
-            if text.isdigit():
-                page_numbers.add(int(text))
-    
-    return max(page_numbers) if page_numbers else 1
-
-def process_album(session: requests.Session, title: str, url: str, save_root: str, verify: bool, retries: int, timeout: int, album_index: int, total_albums: int) -> Dict[str, int]:
-    """处理单个相册：进入专辑页 -> 获取专辑内总页数 -> 遍历专辑内所有分页 -> 提取图片链接 -> 并发下载图片。"""
-    # 相册并发任务之间的延迟
-    time.sleep(get_random_delay(DEFAULT_ALBUM_SLEEP_MIN, DEFAULT_ALBUM_SLEEP_MAX))
-    
-    # 打印专辑总进度
-    log_prefix = f"[专辑 {album_index}/{total_albums}] {title}"
-    logging.info("%s -> 正在请求专辑页: %s", log_prefix, url)
-
-    # 获取专辑首页
-    album_html = request_with_retry(session, url, retries=retries, timeout=timeout)
-    if not album_html:
-        logging.error("%s 无法获取专辑页。", log_prefix)
-        return {"ok": 0, "skipped": 0, "fail": 1}
-    
-    # 解析专辑总页数
-    total_pages = parse_album_total_pages(album_html)
-    logging.info("%s -> 专辑共有 %d 页", log_prefix, total_pages)
-    
-    # 遍历专辑内所有分页，提取所有图片URL
-    all_image_urls = set()
-    
-    for page_num in range(1, total_pages + 1):
-        # 构建分页URL
-        if page_num == 1:
-            page_url = url
-        else:
-            page_url = f"{url}?page={page_num}"
-        
-        logging.info("%s -> 正在请求专辑分页 %d/%d: %s", log_prefix, page_num, total_pages, page_url)
-        
-        # 请求分页
-        page_html = request_with_retry(session, page_url, retries=retries, timeout=timeout)
-        if not page_html:
-            logging.warning("%s -> 无法获取专辑分页 %d/%d", log_prefix, page_num, total_pages)
-            continue
-        
-        # 提取当前分页的图片URL
-        page_image_urls = parse_images_on_album_page(page_html, BASE_URL)
-        all_image_urls.update(page_image_urls)
-        
-        logging.info("%s -> 分页 %d/%d 提取到 %d 张图片", log_prefix, page_num, total_pages, len(page_image_urls))
-        
-        # 分页之间添加小延迟
-        time.sleep(get_random_delay(1.0, 2.0))
-    
-    if not all_image_urls:
-        logging.warning("%s 未解析到任何图片。", log_prefix)
-        return {"ok": 0, "skipped": 0, "fail": 0}
-
-    # 打印总图片数
-    total_images = len(all_image_urls)
-    logging.info("%s -> 发现 %d 张图片，开始下载...", log_prefix, total_images)
-
-    # 并发下载所有图片
-    album_dir = os.path.join(save_root, title)
-    os.makedirs(album_dir, exist_ok=True)
-    
-    results = {"ok": 0, "skipped": 0, "fail": 0}
-    
-    # 准备一个带序号的图片URL列表，便于传递进度
-    indexed_image_urls = list(enumerate(all_image_urls, start=1))
-
-    with ThreadPoolExecutor(max_workers=DEFAULT_CONCURRENCY_IMAGE, thread_name_prefix='ImageDownloader') as executor:
-        future_map = {
-            executor.submit(
-                download_single_image, 
-                session, 
-                img_url, 
-                album_dir, 
-                verify, 
-                retries, 
-                timeout, 
-                index, 
-                total_images
-            ): img_url 
-            for index, img_url in indexed_image_urls
-        }
-        
-        # 遍历完成的任务
-        for future in as_completed(future_map):
-            try:
-                status = future.result()
-                results[status] += 1
-            except Exception as e:
-                img_url = future_map[future]
-                logging.exception("图片下载任务异常 [%s]", img_url)
-                results["fail"] += 1
-
-    # 打印结果
-    logging.info("%s -> 处理完成。结果: 成功: %d, 跳过: %d, 失败: %d", 
-                 log_prefix, results['ok'], results['skipped'], results['fail'])
-    return results
-
-# -------- 主函数 --------
-def main():
-    parser = argparse.ArgumentParser(description="凸凹吧相册爬虫", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-    parser.add_argument("-d", "--dir", help="图片保存的根目录")
-    parser.add_argument("--verify", action="store_true", default=True, help="启用严格的图像验证")
-    parser.add_argument("-r", "--retries", type=int, default=DEFAULT_RETRIES, help="请求失败最大重试次数")
-    parser.add_argument("-t", "--timeout", type=int, default=DEFAULT_TIMEOUT, help="请求超时时间(秒)")
-    parser.add_argument("-c", "--album-concurrency", type=int, default=DEFAULT_CONCURRENCY_ALBUM, help="并发处理的专辑数量")
-    
-    args = parser.parse_args()
-    
-    # 用户输入保存地址功能
-    if args.dir:
-        save_dir = args.dir
-    else:
-        save_dir = input("请输入保存地址 (留空则使用默认地址): ").strip()
-        if not save_dir:
-            save_dir = DEFAULT_SAVE_DIR
-    
-    save_dir = os.path.abspath(save_dir)
-    
-    # 创建保存目录
-    os.makedirs(save_dir, exist_ok=True)
-    
-    # 配置参数
-    verify = args.verify
-    retries = args.retries
-    timeout = args.timeout
-    album_concurrency = args.album_concurrency
-    
-    logging.info("开始爬取凸凹吧 (https://www.tuao.cc/)")
-    logging.info(f"图片将保存到: {save_dir}")
-    
-    # 创建会话
-    session = make_session()
-    
-    summary = {"ok": 0, "skipped": 0, "fail": 0, "albums_processed": 0}
-    all_albums_to_process = []
-    seen_album_urls: Set[str] = set()
-    
-    # 1. 分析类型个数
-    total_categories = len(CATEGORIES)
-    logging.info(f"\n=== 分析类型信息 ===")
-    logging.info(f"发现 {total_categories} 个类型：")
-    for i, (category_name, _) in enumerate(CATEGORIES, 1):
-        logging.info(f"  {i}. {category_name}")
-    logging.info("==================")
-    
-    # 2. 遍历所有类型，收集所有相册链接
-    logging.info("\n=== 开始收集所有类型的相册链接 ===")
-    
-    # 新增：记录上一页的专辑链接，用于去重
-    previous_page_album_urls = set()
-    
-    for category_index, (category_name, category_path) in enumerate(CATEGORIES, 1):
-        logging.info("\n" + "="*60)
-        logging.info(f"[{category_index}/{total_categories}] 正在处理类型: {category_name}")
-        logging.info("="*60)
-        
-        # 构建分类首页URL
-        category_url = urljoin(BASE_URL, category_path)
-        current_url = category_url
-        page_count = 1
-        
-        # 遍历当前分类的所有分页
-        while True:
-            logging.info(f"[分类: {category_name}] 列表页 {page_count}: 正在请求 {current_url}")
-            
-            list_html = request_with_retry(session, current_url, retries=retries, timeout=timeout)
-            if not list_html:
-                logging.warning("获取列表页失败: %s", current_url)
-                time.sleep(get_random_delay(DEFAULT_PAGE_SLEEP_MIN, DEFAULT_PAGE_SLEEP_MAX))
-                continue
-            
-            # 解析当前页的相册
-            soup = BeautifulSoup(list_html, "html.parser")
-            current_page_albums = parse_albums_on_listing_page(list_html, BASE_URL)
-            
-            # 新增：提取当前页面的所有专辑URL
-            current_page_album_urls = {url for _, url in current_page_albums}
-            
-            # 新增：检查当前页面与上一页的专辑是否完全相同
-            if previous_page_album_urls and previous_page_album_urls == current_page_album_urls:
-                logging.warning(f"[{category_name}] 列表页 {page_count} 与上一页的专辑完全相同，存在重复爬取情况")
-                
-                if category_index == total_categories:
-                    # 新增：如果是最后一个类别，完成爬取
-                    logging.info("[{category_index}/{total_categories}] 当前是最后一个类别，且页面重复，结束爬取")
-                    break
-                else:
-                    # 新增：不是最后一个类别，进入下一个类别
-                    logging.info("[{category_index}/{total_categories}] 不是最后一个类别，进入下一个类别")
-                    break
-            
-            # 添加到待处理列表
-            newly_added = 0
-            for title, url in current_page_albums:
-                if url not in seen_album_urls:
-                    seen_album_urls.add(url)
-                    all_albums_to_process.append((title, url))
-                    newly_added += 1
-            
-            logging.info(f"[分类: {category_name}] 列表页 {page_count} 完成。发现 {newly_added} 个新专辑。")
-            
-            # 新增：更新上一页专辑URL集合
-            previous_page_album_urls = current_page_album_urls
-            
-            # 检查下一页
-            next_page_url = parse_next_page(soup)
-            if next_page_url:
-                current_url = urljoin(BASE_URL, next_page_url)
-                page_count += 1
-                logging.info(f"[{category_name}] 发现下一页，将继续爬取第 {page_count} 页")
-                # 随机延迟4~8秒
-                time.sleep(get_random_delay(DEFAULT_PAGE_SLEEP_MIN, DEFAULT_PAGE_SLEEP_MAX))
-            else:
-                logging.info(f"[{category_index}/{total_categories}] 类型 {category_name} 已完成所有分页爬取")
-                # 新增：进入新类别前清空上一页记录
-                previous_page_album_urls = set()
-                break
-    
-    # 收集完成
-    logging.info("\n" + "="*60)
-    logging.info("=== 所有类型的相册链接收集完成 ===")
-    
-    # 处理所有收集到的相册
-    total_albums = len(all_albums_to_process)
-    if total_albums == 0:
-        logging.warning("未找到任何专辑，程序结束。")
-        return
-        
-    logging.info("\n" + "="*70)
-    logging.info(f"共收集到 {total_albums} 个待处理专辑，开始并发下载...")
-    logging.info("="*70)
-    
-    with ThreadPoolExecutor(max_workers=album_concurrency, thread_name_prefix='AlbumProcessor') as executor:
-        future_map: Dict[Any, Tuple[str, str, int]] = {}
-        
-        for index, (title, url) in enumerate(all_albums_to_process, start=1):
-            future = executor.submit(
-                process_album, 
-                session, title, url, save_dir, verify, 
-                retries, timeout, index, total_albums
-            )
-            future_map[future] = (title, url, index)
-        
-        logging.info("已提交 %d 个相册任务，等待完成...", total_albums)
-        
-        for future in as_completed(future_map):
-            album_title, album_url, index = future_map[future]
-            
-            try:
-                result = future.result() 
-                summary["ok"] += result["ok"]
-                summary["skipped"] += result["skipped"]
-                summary["fail"] += result["fail"]
-                summary["albums_processed"] += 1
-                
-            except Exception as e:
-                logging.error("[%d/%d] 专辑处理任务异常 [%s] %s: %s", index, total_albums, album_title, album_url, e)
-                summary["albums_processed"] += 1
-    
-    # 打印最终结果
-    logging.info("\n" + "="*70)
-    logging.info("程序执行完毕。爬取任务总结：")
-    logging.info(f"  处理的专辑总数: {summary['albums_processed']} / {total_albums}")
-    logging.info("-" * 25)
-    logging.info(f"  [成功下载]: {summary['ok']} 张")
-    logging.info(f"  [跳过 (已存在)]: {summary['skipped']} 张")
-    logging.info(f"  [失败总数]: {summary['fail']} 张")
-    logging.info("="*70)
-    logging.info(f"所有图片已保存到: {save_dir}")
-
-if __name__ == "__main__":
-    main()
-
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+凸凹吧 (https://www.tuao.cc/) 相册爬虫
+
+功能:
+  - 爬取网站的图集
+  - 图像内容验证：自动检测并重新下载损坏的图片 (需 Pillow 库)
+
+
+特点:
+  - 两级并发: 并发处理多个图集，所有图集的图片提交到同一个全局下载池，按图集轮转公平调度
+  - 分页并发: 专辑分页在站点限速 (--host-rate) 内并发请求，每解析完一页立即开始下载该页图片
+  - 全站发现: 多个分类同时翻列表页 (--listing-concurrency)，新专辑按分类轮流边发现边下载，
+    下载池在分类和列表页边界上不会排空；出现在多个分类下的专辑 (如 "最新") 只下载一次
+  - 内存预算: 图片下载前按 Content-Length 预留内存 (--memory-mb)，下载队列排满时暂停发现新专辑/分页
+  - 打包输出: --pack 时每个专辑写入一个不压缩的 tar 分片 (<专辑>.tar + 索引)，用 extract_archives.py 还原为散文件
+  - 对象存储: --storage s3://bucket/前缀 时图片边下载边分段上传 (需 boto3)，不落本地磁盘；按专辑批量列举判重
+  - 缩略图: --thumbnails 时下载结束后在进程池中增量生成缩略图和专辑封面拼图 (见 thumbnails.py)
+  - 重新编码: --transcode 时下载结束后把图片按原格式重新编码 (--transcode webp 时转为 WebP 并改名)，更小才替换原图 (见 transcode.py)
+  - 下载预检: --preflight 时每页图片先在限速内批量 HEAD，剔除过小 (--min-kb) 或非图片的对象，
+    按大小从大到小下载，按预期大小预留内存，磁盘空间不足时停止提交，并估算剩余时间
+  - 图像验证:
+    - 通过 --verify 启用，可识别并修复已存在的损坏文件
+    - 验证新下载的内容，防止 HTML 错误页被保存
+  - 防护增强:
+    - 增加连接池 (HTTPAdapter)
+    - 增加列表页爬取延迟 (page-sleep)
+    - 新增专辑详情页请求延迟 (album-sleep) 以防止 429
+  - 原子化写入/断点续传: 自动跳过已存在的图片文件；每个专辑目录只 scandir 一次，判重查内存中的目录快照
+  - 健壮的解析: 使用更稳定的CSS选择器，并有清晰的日志记录
+  - 统一日志: 实现了 [专辑 X/N] 和 (图片 Y/Z) 进度打印
+  - 随机加入4~8s延迟，模拟用户真实操作
+  - 启动快: requests / bs4 / PIL 第一次使用时才导入，--help 等模式不加载
+  - 可与其他站点同时运行: crawl_all.py 在同一进程中调用 main()，--no-prompt 时不等待键盘输入
+  - 多进程分片: --shards N 时专辑按 URL 摘要分到 N 个进程下载，Pillow 校验、页面解析等 CPU 工作用满多核；
+    站点限速放在共享内存中由所有进程共用，各进程的已完成专辑合并回同一个索引
+  - 阶段计时: --profile trace.json 时记录列表页请求/解析、专辑分页、图片请求与传输、校验、写盘、限速等待和延迟
+    等各阶段的耗时，导出 Chrome trace (chrome://tracing 或 Perfetto 打开) 并输出各阶段汇总；
+    --profile-cprofile 阶段名 额外保存这些阶段的 cProfile 统计 (.pstats)
+  - 重试机制：如遇链接或者下载失败时，重试5次，每次重试前随机延时4~8秒，5次失败后暂停脚本等待，待用户检查网络后按任意键继续链接或下载，以此循环
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import time
+import random
+import argparse
+import logging
+import io
+import threading
+import mimetypes
+from contextlib import nullcontext
+from functools import partial
+from urllib.parse import urljoin, urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Tuple, Dict, Optional, Set, Any, Callable, Iterable
+
+from crawler_common import (
+    SeenUrlIndex, RateLimiter, host_limiter, SharedImagePool, AlbumBatch, mount_http2,
+    MemoryBudget, MemoryReservation, wait_for_downstream, ArchiveStore, AlbumArchive,
+    Storage, open_storage, sniff_image_type, DownloadPlanner, lazy_import, enable_truncated_images, metered_chunks, transfer_blocked,
+    WorkQueue, WorkItem, drain_work_queue, share_host_limits, shard_of, ProcessRateTable, ProcessRateLimiter,
+    StageProfiler, install_profiler, span, profiled, DirSnapshot, CrawlFrontier, FrontierItem, FRONTIER_WORKERS,
+)
+
+# -------- 重量级依赖 (第一次使用时才导入) --------
+requests = lazy_import("requests")
+bs4 = lazy_import("bs4")
+
+# -------- 检查 Pillow 库 --------
+try:
+    Image = lazy_import("PIL.Image", on_load=enable_truncated_images)
+    Image.MAX_IMAGE_PIXELS = None
+    PILLOW_AVAILABLE = True
+except ImportError:
+    PILLOW_AVAILABLE = False
+
+# -------- 默认配置 (针对反爬优化) --------
+BASE_URL = "https://www.tuao.cc/"
+SITE_NAME = "tuao.cc"              # 多站点同时运行 (crawl_all.py) 时的统计名称
+# 分类列表
+CATEGORIES = [
+    ("最新", "/Articles"),
+    ("无圣光", "/Articles/Categories/1"),
+    ("凸凹图", "/Articles/Categories/2"),
+    ("靓人体", "/Articles/Categories/3"),
+    ("写真集", "/Articles/Categories/4")
+]
+DEFAULT_SAVE_DIR = r"E:\pachong\结果\凹凸吧"
+DEFAULT_RETRIES = 5
+DEFAULT_TIMEOUT = 20
+DEFAULT_CONCURRENCY_ALBUM = 5      # 并发处理专辑数量
+DEFAULT_CONCURRENCY_IMAGE = 8      # 每个并发专辑分摊的图片下载线程数 (全局下载池 = 专辑并发 × 此值)
+DEFAULT_PAGE_SLEEP_MIN = 4.0       # 列表页爬取延迟最小值
+DEFAULT_PAGE_SLEEP_MAX = 8.0       # 列表页爬取延迟最大值
+DEFAULT_ALBUM_SLEEP_MIN = 4.0      # 专辑详情页请求延迟最小值
+DEFAULT_ALBUM_SLEEP_MAX = 8.0      # 专辑详情页请求延迟最大值
+DEFAULT_POOL_SIZE = 64             # 连接池大小
+DEFAULT_CONCURRENCY_SUBPAGE = 4    # 专辑内并发请求分页数量
+DEFAULT_HOST_RATE = 2.0            # 站点页面请求速率上限 (次/秒)，所有专辑共享
+DEFAULT_MEMORY_MB = 256            # 在途图片数据的内存上限 (MB)，Termux 等小内存设备可调低
+STREAM_CHUNK_SIZE = 64 * 1024      # 流式写入存储后端时每次读取的字节数
+PREFLIGHT_ACCEPT_TYPES = ("image/", "application/octet-stream")  # 预检时接受的 Content-Type
+PAUSE_ON_FAILURE = True            # 请求全部重试失败后暂停等待按键；--no-prompt 时关闭
+COMPLETED_INDEX_NAME = ".completed_albums.idx"  # 已完整下载的专辑索引 (保存目录下)
+SHARD_INDEX_SUFFIX = ".shard"      # --shards 时各分片进程的专辑索引: <索引>.shard<N>，结束后合并回主索引
+# --profile 记录的阶段 (--profile-cprofile 可选其中若干个)
+PROFILE_STAGES = ("listing_fetch", "listing_parse", "album_page", "album_subpage", "album_parse", "rate_wait",
+                  "backpressure", "image_request", "memory_wait", "image_transfer", "validate", "save", "sleep")
+
+# -------- 日志设置 --------
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+if not PILLOW_AVAILABLE:
+    logging.warning("Pillow 库未安装。将跳过严格的图像完整性校验 (请运行: pip install Pillow)")
+
+# 专辑目录快照: 每个专辑目录 scandir 一次，之后判断图片是否已存在只查内存，不再逐张 stat
+dir_snapshot = DirSnapshot()
+
+# -------- 辅助函数 --------
+def make_session(http2: bool = False) -> requests.Session:
+    """创建并配置requests.Session，增加连接池大小。http2=True 时改用 HTTP/2 多路复用传输。"""
+    s = requests.Session()
+    s.headers.update({
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36",
+    })
+    
+    # 配置连接池适配器
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=DEFAULT_POOL_SIZE,  # 连接池的最大数量
+        pool_maxsize=DEFAULT_POOL_SIZE       # 保持活动的连接数
+    )
+    # 为 http 和 https 协议都挂载这个适配器
+    s.mount('http://', adapter)
+    s.mount('https://', adapter)
+    
+    # HTTP/2: 图片请求在少量连接上多路复用，不支持 h2 的服务器自动回退 HTTP/1.1
+    if http2:
+        mount_http2(s)
+    
+    return s
+
+def get_random_delay(min_delay: float, max_delay: float) -> float:
+    """获取指定范围内的随机延迟"""
+    return random.uniform(min_delay, max_delay)
+
+def request_with_retry(session: requests.Session, url: str, retries: int, timeout: int, is_binary: bool = False, reservation: Optional[MemoryReservation] = None, stage: str = "page_fetch") -> Optional[Any]:
+    """带重试机制的请求函数。传入 reservation 时，读取二进制响应体之前先按 Content-Length 预留内存。
+    stage 为 --profile 时的阶段名；二进制请求的计时分为 stage (连接到响应头)、memory_wait 和 image_transfer (响应体)。"""
+    r: Optional[requests.Response] = None
+    for attempt in range(1, retries + 1):
+        try:
+            with span(stage, url=url):
+                if is_binary:
+                    r = session.get(url, timeout=timeout, stream=True)
+                else:
+                    r = session.get(url, timeout=timeout)
+            with r:  # 流式响应出错时也要关闭，连接才能回到连接池
+                r.raise_for_status() # 检查 4xx/5xx 错误
+                if is_binary and reservation is not None:
+                    with span("memory_wait"):
+                        reservation.reserve_for(r)  # 预算耗尽时在此阻塞，响应体尚未读入内存
+                if is_binary:
+                    # 逐块读取响应体: 多站点同时运行时按共享带宽预算限速
+                    with span("image_transfer"):
+                        return b"".join(metered_chunks(SITE_NAME, r.iter_content(STREAM_CHUNK_SIZE)))
+                return r.text
+            
+        except requests.RequestException as e:
+            wait_time = get_random_delay(4.0, 8.0)
+            status_msg = f"{r.status_code}" if r is not None else "无响应"
+
+            if attempt < retries:
+                logging.warning("请求失败: %s (尝试 %d/%d) 错误: %s。状态: %s，等待 %.1fs 并重试。", 
+                                url, attempt, retries, e, status_msg, wait_time)
+                with span("sleep"):
+                    time.sleep(wait_time)
+            else:
+                logging.error("请求失败: %s (所有尝试均失败)。错误: %s", url, e)
+                # 5次失败后暂停脚本等待 (--no-prompt 时直接放弃该请求)
+                if PAUSE_ON_FAILURE:
+                    input("按任意键继续...")
+    return None
+
+def sanitize_filename(name: str, maxlen: int = 150) -> str:
+    """清洗并截断文件名/文件夹名。"""
+    if not name: return "untitled"
+    s = re.sub(r'[\\/:*?"<>|]+', "_", name).strip()
+    return s[:maxlen] or "untitled"
+
+# -------- 图像验证辅助函数 --------
+@profiled("validate")
+def is_image_valid_bytes(data: bytes, verify: bool) -> bool:
+    """检查内存中的 bytes 是否为有效图像。"""
+    if not verify or not PILLOW_AVAILABLE:
+        return True
+    
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img.verify() # 检查文件是否截断或损坏
+        return True
+    except (Image.UnidentifiedImageError, ValueError, OSError, TypeError) as e:
+        logging.debug("Pillow 校验失败 (内容确认损坏或为HTML): %s", e)
+        return False
+    except Exception as e:
+        logging.error("验证时发生系统级异常: %s", e)
+        return False
+
+@profiled("validate")
+def is_image_valid_file(filepath: str, verify: bool) -> bool:
+    """检查磁盘上的文件是否为有效图像。"""
+    if not verify or not PILLOW_AVAILABLE:
+        return True
+    
+    try:
+        with Image.open(filepath) as img:
+            img.verify() # 检查文件是否截断或损坏
+        return True
+    except (Image.UnidentifiedImageError, ValueError, OSError, TypeError, FileNotFoundError) as e:
+        logging.debug("Pillow 校验失败 (文件确认损坏或IO问题): %s. 错误: %s", filepath, e)
+        return False
+    except Exception as e:
+        logging.error("校验文件 %s 时发生未知异常: %s", filepath, e)
+        return False
+
+@profiled("save")
+def save_bytes_atomic(path: str, data: bytes) -> bool:
+    """原子化写入文件，避免文件损坏。"""
+    tmp_path = path + ".part"
+    try:
+        with open(tmp_path, "wb") as f: 
+            f.write(data)
+        os.replace(tmp_path, path)
+        return True
+    except IOError as e:
+        logging.error("文件写入失败 %s : %s", path, e)
+        if os.path.exists(tmp_path):
+            try: 
+                os.remove(tmp_path)
+            except OSError: 
+                pass
+        return False
+
+# -------- 解析函数 --------
+def parse_next_page(soup: bs4.BeautifulSoup) -> Optional[str]:
+    """从当前页面解析出下一页链接"""
+    pagination = soup.find("ul", class_="pagination")
+    if not pagination:
+        return None
+    
+    # 查找下一页链接的几种方法
+    next_page = None
+    
+    # 方法1: 查找包含右箭头符号的a标签
+    next_page = pagination.find("a", string="»")
+    if next_page and "href" in next_page.attrs:
+        return next_page["href"]
+    
+    # 方法2: 查找包含'下一页'文本的a标签
+    next_page = pagination.find("a", string=lambda text: text and "下一页" in text)
+    if next_page and "href" in next_page.attrs:
+        return next_page["href"]
+    
+    # 方法3: 查找pagination中的最后一个a标签
+    all_a = pagination.find_all("a")
+    if all_a:
+        last_a = all_a[-1]
+        if "href" in last_a.attrs:
+            href = last_a["href"]
+            # 确保不是当前页链接
+            if "Page=" in href:
+                return href
+    
+    return None
+
+@profiled("listing_parse")
+def parse_albums_on_listing_page(html: str, base_url: str) -> List[Tuple[str, str]]:
+    """从列表页HTML中解析出(标题, URL)元组列表。"""
+    soup = bs4.BeautifulSoup(html, "html.parser")
+    try:
+        return parse_albums_from_soup(soup, base_url)
+    finally:
+        soup.decompose()
+
+def parse_albums_from_soup(soup: bs4.BeautifulSoup, base_url: str) -> List[Tuple[str, str]]:
+    """从已解析的列表页中提取(标题, URL)元组列表，调用方可复用同一棵树解析下一页链接。"""
+    albums = []
+    
+    logging.info("开始解析列表页专辑")
+    
+    # 简化的专辑提取逻辑：直接查找所有符合条件的a标签对
+    # 查找所有class为index-imgcontent-img的a标签（图片链接）
+    img_links = soup.find_all("a", class_="index-imgcontent-img")
+    logging.info(f"找到 {len(img_links)} 个class为index-imgcontent-img的a标签")
+    
+    # 查找所有class为index-imgcontent-title的a标签（标题链接）
+    title_links = soup.find_all("a", class_="index-imgcontent-title")
+    logging.info(f"找到 {len(title_links)} 个class为index-imgcontent-title的a标签")
+    
+    # 遍历图片链接，尝试为每个图片链接找到对应的标题
+    for i, img_link in enumerate(img_links):
+        # 获取图片链接的href
+        img_href = img_link.get("href")
+        if not img_href:
+            continue
+        
+        # 构建完整的专辑URL
+        album_url = urljoin(base_url, img_href)
+        
+        # 查找对应的标题
+        album_title = ""
+        
+        # 方法1: 如果标题链接数量匹配，直接对应
+        if i < len(title_links):
+            album_title = title_links[i].get_text(strip=True)
+        
+        # 方法2: 如果方法1失败，查找图片链接的父元素中的标题
+        if not album_title:
+            # 查找图片链接的父div
+            parent_div = img_link.find_parent("div")
+            if parent_div:
+                # 在父div中查找标题a标签
+                title_elem = parent_div.find("a", class_="index-imgcontent-title")
+                if title_elem:
+                    album_title = title_elem.get_text(strip=True)
+        
+        # 方法3: 简化的标题提取 - 使用alt属性或文件名作为标题
+        if not album_title:
+            # 查找图片标签
+            img_tag = img_link.find("img")
+            if img_tag:
+                # 使用alt属性作为标题
+                album_title = img_tag.get("alt", "")
+                if not album_title:
+                    # 使用图片文件名作为标题
+                    img_src = img_tag.get("src", "")
+                    if img_src:
+                        album_title = os.path.basename(img_src).split('.')[0]
+        
+        # 如果还是没有标题，使用默认标题
+        if not album_title:
+            album_title = f"专辑_{i+1}"
+        
+        # 清洗标题
+        album_title = sanitize_filename(album_title)
+        
+        # 添加到专辑列表
+        albums.append((album_title, album_url))
+        logging.info(f"提取到专辑: {album_title} -> {album_url}")
+    
+    logging.info(f"列表页解析完成，共提取到 {len(albums)} 个专辑")
+    return albums
+
+@profiled("album_parse")
+def parse_images_on_album_page(html: str, base_url: str) -> Set[str]:
+    """从相册页HTML中解析出所有高清图片的绝对URL集合。"""
+    soup = bs4.BeautifulSoup(html, "html.parser")
+    image_urls = set()
+    
+    # 查找所有图片，优先选择高清大图
+    for img in soup.find_all("img"):
+        src = img.get("src", "")
+        
+        # 检查是否为有效的图片URL
+        if src.startswith("/Files/images/") and (src.endswith(".webp") or src.endswith(".jpg") or src.endswith(".png")):
+            # 高清图片格式: /Files/images/20260113/6390391274363781897617252.webp
+            # 缩略图格式: /Files/images/202601/1c6ef29491e444428639530fb1ae1b85.webp
+            # 只选择带完整日期（8位数字）的高清图
+            import re
+            # 检查路径中是否包含8位数字的日期
+            if re.search(r'/\d{8}/', src):
+                image_urls.add(urljoin(base_url, src))
+    
+    soup.decompose()  # 及时释放解析树，避免与在途图片数据叠加占用内存
+    return image_urls
+
+# -------- 下载核心逻辑 --------
+def download_single_image(session: requests.Session, url: str, album_dir: str, verify: bool, retries: int, timeout: int, current_index: int, total_images: int, memory_budget: Optional[MemoryBudget] = None, archives: Optional[ArchiveStore] = None, storage: Optional[Storage] = None, expected_size: int = 0) -> Tuple[str, int]:
+    """下载单张图片，并根据内容验证有效性，返回 (结果, 实际写入的字节数)；结果为 "ok"/"skipped"/"fail"，跳过和失败时字节数为 0。
+    传入 memory_budget 时，图片数据从读取到写盘期间占用预算 (已知 expected_size 时在发出请求前就按此预留)；
+    传入 archives 时 (打包模式) 图片追加到专辑分片而不是单独的文件；传入 storage 时流式写入存储后端。"""
+    filename = os.path.basename(urlparse(url).path)
+    dest_path = os.path.join(album_dir, filename)
+    
+    progress_prefix = f"({current_index}/{total_images})"
+
+    if storage is not None:
+        return download_to_storage(session, url, storage, os.path.basename(album_dir), filename, verify, retries, timeout, progress_prefix, memory_budget)
+
+    # 1. 检查已存在的文件
+    archive: Optional[AlbumArchive] = None
+    if archives is not None:
+        # 打包模式: 判重只查内存中的分片索引，不对每张图片访问文件系统 (写入前已验证)
+        archive, member = archives.locate(dest_path)
+        if member in archive:
+            logging.info("%s 跳过 (已在分片中): %s/%s", progress_prefix, os.path.basename(archive.path), member)
+            return "skipped", 0
+    elif dir_snapshot.exists(dest_path):
+        existing = dir_snapshot.locate(dest_path)  # 被 transcode.py 转为 WebP 改名时为新路径
+        if is_image_valid_file(existing, verify):
+            logging.info("%s 跳过 (已存在且有效): %s", progress_prefix, existing)
+            return "skipped", 0
+        else:
+            # 文件存在，但验证失败 (损坏、太小或是HTML)
+            logging.warning("%s 重新下载 (文件无效或损坏): %s", progress_prefix, existing)
+            try:
+                os.remove(existing) # 删除损坏的旧文件
+                dir_snapshot.discard(existing)
+            except OSError as e:
+                logging.error("%s 无法删除旧的损坏文件: %s", progress_prefix, e)
+
+    blocked = transfer_blocked()
+    if blocked:
+        logging.warning("%s 停止下载 (%s): %s", progress_prefix, blocked, url)
+        return "fail", 0
+
+    # 2. 执行下载 (文件不存在 或 文件损坏)，写盘完成后归还内存预算
+    if memory_budget is None:
+        return _fetch_and_save_image(session, url, dest_path, verify, retries, timeout, progress_prefix, None, archive)
+    with memory_budget.reserve(expected_size) as reservation:
+        return _fetch_and_save_image(session, url, dest_path, verify, retries, timeout, progress_prefix, reservation, archive)
+
+def _fetch_and_save_image(session: requests.Session, url: str, dest_path: str, verify: bool, retries: int, timeout: int, progress_prefix: str, reservation: Optional[MemoryReservation], archive: Optional[AlbumArchive] = None) -> Tuple[str, int]:
+    """下载、验证并原子保存一张图片 (打包模式下追加到专辑分片)，返回 (结果, 写入的字节数)。"""
+    data = request_with_retry(session, url, retries=retries, timeout=timeout, is_binary=True, reservation=reservation, stage="image_request")
+    
+    if not data:
+        logging.warning("%s 下载失败 (未获取到数据): %s", progress_prefix, url)
+        return "fail", 0
+    
+    # 3. 验证新下载的数据 (在保存前)
+    if not is_image_valid_bytes(data, verify):
+        logging.warning("%s 下载的内容验证失败(损坏或HTML)，抛弃: %s", progress_prefix, url)
+        return "fail", 0
+
+    # 4. 保存 (数据已验证)
+    if archive is not None:
+        try:
+            with span("save"):
+                archive.add(os.path.basename(dest_path), data)
+        except OSError as e:
+            logging.warning("%s 写入专辑分片失败: %s (%s)", progress_prefix, archive.path, e)
+            return "fail", 0
+        logging.info("%s 下载成功: %s/%s", progress_prefix, os.path.basename(archive.path), os.path.basename(dest_path))
+        return "ok", len(data)
+    if save_bytes_atomic(dest_path, data):
+        dir_snapshot.add(dest_path, len(data))
+        logging.info("%s 下载成功: %s", progress_prefix, dest_path)
+        return "ok", len(data)
+    else:
+        logging.warning("%s 下载后保存文件失败: %s", progress_prefix, dest_path)
+        return "fail", 0
+
+def download_image(*args, **kwargs) -> str:
+    """下载池中的任务: 下载一张图片，只返回结果 ("ok"/"skipped"/"fail")，专辑按结果计数。"""
+    return download_single_image(*args, **kwargs)[0]
+
+def download_planned_image(planner: DownloadPlanner, session: requests.Session, url: str, *args, **kwargs) -> str:
+    """按预检结果下载一张图片: 预期大小用于提前预留内存，完成后按实际写入的字节数更新计划的剩余字节数和实测吞吐。"""
+    expected = planner.expected_size(url)
+    result, nbytes = download_single_image(session, url, *args, expected_size=expected, **kwargs)
+    planner.record(url, nbytes)
+    return result
+
+def is_already_saved(url: str, album_dir: str, archives: Optional[ArchiveStore] = None, storage: Optional[Storage] = None) -> bool:
+    """图片是否已经保存过 (只看是否存在，不做校验)，预检时跳过这些图片的 HEAD 请求。"""
+    filename = os.path.basename(urlparse(url).path)
+    if storage is not None:
+        return storage.stat(os.path.basename(album_dir), filename) is not None
+    if archives is not None:
+        archive, member = archives.locate(os.path.join(album_dir, filename))
+        return member in archive
+    return dir_snapshot.exists(os.path.join(album_dir, filename))
+
+def iter_validated_chunks(response: requests.Response, verify: bool) -> Any:
+    """逐块产出响应体，同时做流式校验: 首块必须是图片文件头 (排除 HTML 错误页)，总长度必须与 Content-Length 一致。
+
+    校验失败时抛出 ValueError，存储后端据此放弃写入 (对象存储放弃分段上传)，不会留下残缺对象。
+    """
+    expected = response.headers.get("Content-Length")
+    received = 0
+    for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+        if not chunk:
+            continue
+        if received == 0 and verify and sniff_image_type(chunk) is None:
+            raise ValueError("内容不是图片 (可能是HTML错误页)")
+        received += len(chunk)
+        yield chunk
+    if received == 0:
+        raise ValueError("响应为空")
+    if expected is not None and expected.isdigit() and received != int(expected):
+        raise ValueError(f"数据不完整 ({received}/{expected} 字节)")
+
+def download_to_storage(session: requests.Session, url: str, storage: Storage, album: str, filename: str, verify: bool, retries: int, timeout: int, progress_prefix: str, memory_budget: Optional[MemoryBudget] = None) -> Tuple[str, int]:
+    """流式下载一张图片并直接写入存储后端 (对象存储时为分段上传，不经过本地磁盘)，返回 (结果, 写入的字节数)。"""
+    target = storage.describe(album, filename)
+
+    # 只有通过流式校验的完整数据才会写入存储，因此对象存在且非空即视为有效 (按元数据判断，无需下载回来校验)
+    if storage.stat(album, filename):
+        logging.info("%s 跳过 (已存在): %s", progress_prefix, target)
+        return "skipped", 0
+    blocked = transfer_blocked()
+    if blocked:
+        logging.warning("%s 停止下载 (%s): %s", progress_prefix, blocked, url)
+        return "fail", 0
+
+    content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    for attempt in range(1, retries + 1):
+        try:
+            with span("image_request", url=url):
+                r = session.get(url, timeout=timeout, stream=True)
+            with r:
+                r.raise_for_status()
+                # 内存中最多缓存一个写入缓冲区 (对象存储为一个分段)，按此预留内存
+                reservation = memory_budget.reserve() if memory_budget is not None else nullcontext()
+                with reservation:
+                    if memory_budget is not None:
+                        reservation.resize(min(memory_budget.expected_size(r), storage.buffer_size + STREAM_CHUNK_SIZE))
+                    chunks = metered_chunks(SITE_NAME, iter_validated_chunks(r, verify))
+                    with span("image_transfer"):
+                        size = storage.put_stream(album, filename, chunks, content_type)
+            logging.info("%s 下载成功: %s (%d 字节)", progress_prefix, target, size)
+            return "ok", size
+        except ValueError as e:
+            logging.warning("%s 下载的内容验证失败，抛弃: %s (%s)", progress_prefix, url, e)
+            return "fail", 0
+        except Exception as e:
+            # 网络错误与存储后端错误都按重试处理
+            if attempt < retries:
+                wait_time = get_random_delay(4.0, 8.0)
+                logging.warning("%s 写入失败: %s (尝试 %d/%d) 错误: %s，等待 %.1fs 并重试。", progress_prefix, target, attempt, retries, e, wait_time)
+                with span("sleep"):
+                    time.sleep(wait_time)
+            else:
+                logging.error("%s 写入失败: %s (所有尝试均失败)。错误: %s", progress_prefix, target, e)
+    return "fail", 0
+
+@profiled("album_parse")
+def parse_album_total_pages(html: str) -> int:
+    """从专辑页HTML中解析出总页数。"""
+    soup = bs4.BeautifulSoup(html, "html.parser")
+    pagination = soup.find("ul", class_="pagination")
+    
+    if not pagination:
+        return 1
+    
+    page_numbers = {1}
+    for li in pagination.find_all("li"):
+        a_tag = li.find("a")
+        if a_tag:
+            text = a_tag.get_text(strip=True)
+            if text.isdigit():
+                page_numbers.add(int(text))
+    
+    soup.decompose()
+    return max(page_numbers) if page_numbers else 1
+
+def fetch_album_subpage(session: requests.Session, page_url: str, retries: int, timeout: int, limiter: RateLimiter) -> Optional[Set[str]]:
+    """在站点请求预算内获取一个专辑分页，并解析出其中的图片URL。"""
+    with span("rate_wait"):
+        limiter.acquire()
+    page_html = request_with_retry(session, page_url, retries=retries, timeout=timeout, stage="album_subpage")
+    if not page_html:
+        return None
+    return parse_images_on_album_page(page_html, BASE_URL)
+
+def process_album(session: requests.Session, title: str, url: str, save_root: str, verify: bool, retries: int, timeout: int, album_index: int, total_albums: int, image_pool: SharedImagePool, on_complete: Optional[Callable[[str, str, Dict[str, int]], None]] = None, host_rate: float = DEFAULT_HOST_RATE, memory_budget: Optional[MemoryBudget] = None, archives: Optional[ArchiveStore] = None, storage: Optional[Storage] = None, planner: Optional[DownloadPlanner] = None) -> AlbumBatch:
+    """处理单个相册：进入专辑页 -> 获取专辑内总页数 -> 并发请求专辑内所有分页 -> 每解析完一页立即把图片提交到全局下载池。
+
+    专辑线程只负责发现阶段，提交完所有图片后立即返回；图片全部完成后由下载池调用 on_complete(标题, URL, 结果) 汇总统计。
+    下载队列排满或内存预算接近上限时，发现阶段先等待下游消化 (反压)。
+    """
+    # 相册并发任务之间的延迟
+    with span("sleep"):
+        time.sleep(get_random_delay(DEFAULT_ALBUM_SLEEP_MIN, DEFAULT_ALBUM_SLEEP_MAX))
+    with span("backpressure"):
+        wait_for_downstream(image_pool, memory_budget)
+    
+    # 打印专辑总进度
+    log_prefix = f"[专辑 {album_index}/{total_albums}] {title}"
+
+    def finish(batch: AlbumBatch) -> None:
+        results = {key: batch.counts.get(key, 0) for key in ("ok", "skipped", "fail")}
+        logging.info("%s -> 处理完成。结果: 成功: %d, 跳过: %d, 失败: %d", 
+                     log_prefix, results['ok'], results['skipped'], results['fail'])
+        if archives is not None:
+            archives.close_album(title)
+        if storage is not None:
+            storage.forget(title)
+        dir_snapshot.forget(os.path.join(save_root, title))
+        if on_complete is not None:
+            on_complete(title, url, results)
+
+    batch = image_pool.open_album(log_prefix, on_complete=finish)
+    try:
+        discover_album_images(session, url, save_root, title, retries, timeout, log_prefix, batch, verify, host_rate, memory_budget, archives, storage, planner)
+    except Exception:
+        logging.exception("%s 专辑发现阶段异常", log_prefix)
+        batch.add_result("fail")
+    finally:
+        batch.close()
+    return batch
+
+def discover_album_images(session: requests.Session, url: str, save_root: str, title: str, retries: int, timeout: int, log_prefix: str, batch: AlbumBatch, verify: bool, host_rate: float, memory_budget: Optional[MemoryBudget] = None, archives: Optional[ArchiveStore] = None, storage: Optional[Storage] = None, planner: Optional[DownloadPlanner] = None) -> None:
+    """请求专辑首页及所有分页，每解析完一页立即把该页图片提交到专辑的下载批次。
+    传入 planner 时，提交前先对该页未保存过的图片做 HEAD 预检。"""
+    logging.info("%s -> 正在请求专辑页: %s", log_prefix, url)
+
+    # 所有专辑线程共享同一站点的页面请求预算
+    limiter = host_limiter(BASE_URL, host_rate, burst=DEFAULT_CONCURRENCY_SUBPAGE)
+
+    # 获取专辑首页
+    with span("rate_wait"):
+        limiter.acquire()
+    album_html = request_with_retry(session, url, retries=retries, timeout=timeout, stage="album_page")
+    if not album_html:
+        logging.error("%s 无法获取专辑页。", log_prefix)
+        batch.add_result("fail")
+        return
+    
+    # 解析专辑总页数
+    total_pages = parse_album_total_pages(album_html)
+    logging.info("%s -> 专辑共有 %d 页", log_prefix, total_pages)
+    
+    album_dir = os.path.join(save_root, title)
+    if storage is not None:
+        # 一次列举专辑下已有对象，代替逐张图片的存在性请求
+        existing = storage.prefetch(title)
+        logging.info("%s -> 存储中已有 %d 个对象", log_prefix, existing)
+    elif archives is None:
+        os.makedirs(album_dir, exist_ok=True)
+    
+    queued_urls: Set[str] = set()
+    download = download_image if planner is None else partial(download_planned_image, planner)
+
+    def queue_images(page_num: int, page_image_urls: Set[str]) -> None:
+        """分页解析完成后立即提交该页图片的下载，使图片传输与分页发现重叠进行。"""
+        new_urls = sorted(page_image_urls - queued_urls)
+        queued_urls.update(new_urls)
+        # 反压: 下载池积压过多时暂缓提交，分页线程随之阻塞在限速器之外
+        wait_for_downstream(batch.pool, memory_budget)
+        # 总数在所有分页解析完之前未知，按首页图片数估算
+        estimated_total = max(len(queued_urls), len(first_page_urls) * total_pages)
+        if planner is not None:
+            new_urls = preflight_images(new_urls)
+        for img_url in new_urls:
+            batch.submit(
+                download,
+                session,
+                img_url,
+                album_dir,
+                verify,
+                retries,
+                timeout,
+                batch.submitted + 1,
+                estimated_total,
+                memory_budget,
+                archives,
+                storage
+            )
+        logging.info("%s -> 分页 %d/%d 提取到 %d 张图片，已加入下载队列", log_prefix, page_num, total_pages, len(new_urls))
+
+    def preflight_images(new_urls: List[str]) -> List[str]:
+        """HEAD 预检: 剔除过小/非图片的对象，其余按大小从大到小排列；磁盘空间不足时不再提交。"""
+        saved = [u for u in new_urls if is_already_saved(u, album_dir, archives, storage)]
+        saved_set = set(saved)
+        planned, rejected = planner.plan(u for u in new_urls if u not in saved_set)
+        for img_url, reason in rejected:
+            logging.info("%s -> 预检剔除 (%s): %s", log_prefix, reason, img_url)
+        if rejected:
+            batch.add_result("skipped", len(rejected))
+        shortfall = planner.disk_shortfall(save_root) if storage is None else 0
+        if shortfall and planned:
+            logging.error("%s -> 磁盘空间不足 (还差 %.1f MB)，本页 %d 张图片不再下载", log_prefix, shortfall / 1024 / 1024, len(planned))
+            for img_url in planned:
+                planner.record(img_url)
+            batch.add_result("fail", len(planned))
+            planned = []
+        # 已保存的图片只需本地校验，先提交
+        return saved + planned
+
+    # 首页已经拿到，直接解析并开始下载
+    first_page_urls = parse_images_on_album_page(album_html, BASE_URL)
+    del album_html
+    queue_images(1, first_page_urls)
+
+    # 其余分页并发请求，受站点限速器约束
+    if total_pages > 1:
+        with ThreadPoolExecutor(max_workers=DEFAULT_CONCURRENCY_SUBPAGE, thread_name_prefix='SubpageFetcher') as page_executor:
+            page_futures = {
+                page_executor.submit(fetch_album_subpage, session, f"{url}?page={page_num}", retries, timeout, limiter): page_num
+                for page_num in range(2, total_pages + 1)
+            }
+            for future in as_completed(page_futures):
+                page_num = page_futures[future]
+                try:
+                    page_image_urls = future.result()
+                except Exception:
+                    logging.exception("%s -> 专辑分页 %d/%d 处理异常", log_prefix, page_num, total_pages)
+                    continue
+                if page_image_urls is None:
+                    logging.warning("%s -> 无法获取专辑分页 %d/%d", log_prefix, page_num, total_pages)
+                    continue
+                queue_images(page_num, page_image_urls)
+
+    if not queued_urls:
+        logging.warning("%s 未解析到任何图片。", log_prefix)
+        return
+
+    logging.info("%s -> 分页解析完成，共发现 %d 张图片，交由全局下载池完成", log_prefix, len(queued_urls))
+
+# -------- 专辑收集 --------
+def make_listing_frontier(session: requests.Session, retries: int, timeout: int, completed_albums: SeenUrlIndex, concurrency: int = FRONTIER_WORKERS, host_rate: float = DEFAULT_HOST_RATE, on_albums: Optional[Callable[[str, List[FrontierItem]], None]] = None) -> CrawlFrontier:
+    """创建全站发现队列: concurrency 个分类同时翻列表页，新专辑按分类轮流交给下载端，边发现边下载。
+    多个分类下重复出现的专辑只交出一次，历史运行中已完成的专辑跳过。
+    传入 on_albums 时每个列表页的新专辑立即交给它 (协调端写入工作队列，worker 无需等收集全部结束)。"""
+    total_categories = len(CATEGORIES)
+    logging.info(f"\n=== 分析类型信息 ===")
+    logging.info(f"发现 {total_categories} 个类型：")
+    for i, (category_name, _) in enumerate(CATEGORIES, 1):
+        logging.info(f"  {i}. {category_name}")
+    logging.info("==================")
+    logging.info("\n=== 开始收集所有类型的相册链接 (%d 个类型同时翻页) ===", min(concurrency, total_categories))
+    
+    # 列表页请求与专辑页共用站点限速
+    limiter = host_limiter(BASE_URL, host_rate, burst=DEFAULT_CONCURRENCY_SUBPAGE)
+    page_counts: Dict[str, int] = {}
+    # 记录每个分类上一页的专辑链接，用于检测重复翻页 (每个分类同一时刻只有一个线程在翻页)
+    previous_page_album_urls: Dict[str, Set[str]] = {}
+    
+    def fetch_listing_page(category_name: str, current_url: str) -> Optional[Tuple[List[Tuple[str, str, None]], Optional[str]]]:
+        page_count = page_counts.get(category_name, 0) + 1
+        page_counts[category_name] = page_count
+        logging.info(f"[分类: {category_name}] 列表页 {page_count}: 正在请求 {current_url}")
+        
+        while True:
+            with span("rate_wait"):
+                limiter.acquire()
+            list_html = request_with_retry(session, current_url, retries=retries, timeout=timeout, stage="listing_fetch")
+            if list_html:
+                break
+            logging.warning("获取列表页失败: %s", current_url)
+            with span("sleep"):
+                time.sleep(get_random_delay(DEFAULT_PAGE_SLEEP_MIN, DEFAULT_PAGE_SLEEP_MAX))
+        
+        # 解析当前页的相册 (同一棵解析树同时用于提取专辑和下一页链接)
+        with span("listing_parse"):
+            soup = bs4.BeautifulSoup(list_html, "html.parser")
+            del list_html
+            current_page_albums = parse_albums_from_soup(soup, BASE_URL)
+            next_page_url = parse_next_page(soup)
+            soup.decompose()
+        
+        # 检查当前页面与上一页的专辑是否完全相同，相同时结束该分类
+        current_page_album_urls = {url for _, url in current_page_albums}
+        if current_page_album_urls and previous_page_album_urls.get(category_name) == current_page_album_urls:
+            logging.warning(f"[{category_name}] 列表页 {page_count} 与上一页的专辑完全相同，存在重复爬取情况，结束该类型")
+            return None
+        previous_page_album_urls[category_name] = current_page_album_urls
+        
+        logging.info(f"[分类: {category_name}] 列表页 {page_count} 完成。本页 {len(current_page_albums)} 个专辑。")
+        if next_page_url:
+            logging.info(f"[{category_name}] 发现下一页，将继续爬取第 {page_count + 1} 页")
+            next_page_url = urljoin(BASE_URL, next_page_url)
+        else:
+            logging.info(f"[{category_name}] 类型 {category_name} 已完成所有分页爬取 (共 {page_count} 页)")
+        return [(url, title, None) for title, url in current_page_albums], next_page_url
+    
+    return CrawlFrontier(
+        [(category_name, urljoin(BASE_URL, category_path)) for category_name, category_path in CATEGORIES],
+        fetch_listing_page, workers=concurrency,
+        page_delay=lambda: get_random_delay(DEFAULT_PAGE_SLEEP_MIN, DEFAULT_PAGE_SLEEP_MAX),  # 同一分类翻页间隔 4~8 秒
+        skip=lambda url: url in completed_albums, on_albums=on_albums
+    )
+
+# -------- 下载阶段 --------
+def download_albums(args: argparse.Namespace, save_dir: str, session: requests.Session, storage: Optional[Storage], albums: Iterable[Tuple[str, str]], completed_albums: SeenUrlIndex, work_queue: Optional[WorkQueue] = None, frontier: Optional[CrawlFrontier] = None) -> Dict[str, Any]:
+    """并发下载 albums (worker 模式下改为从工作队列领取专辑)。
+    albums 可以是边发现边产出的迭代器 (来自 frontier)，此时日志中的专辑总数为 "已提交 + 已发现待提交" 的估计值。
+    返回统计: ok/skipped/fail/albums_processed/total_albums、在途内存峰值 memory_peak 和下载计划摘要 plans。"""
+    verify = args.verify
+    retries = args.retries
+    timeout = args.timeout
+    album_concurrency = args.album_concurrency
+    summary = {"ok": 0, "skipped": 0, "fail": 0, "albums_processed": 0}
+    total_albums = len(albums) if isinstance(albums, list) else 0
+    
+    summary_lock = threading.Lock()
+
+    def on_album_done(album_title: str, album_url: str, result: Dict[str, int]) -> None:
+        """专辑的所有图片完成后由下载池回调，汇总统计。"""
+        with summary_lock:
+            summary["ok"] += result["ok"]
+            summary["skipped"] += result["skipped"]
+            summary["fail"] += result["fail"]
+            summary["albums_processed"] += 1
+            if result["fail"] == 0 and (result["ok"] or result["skipped"]):
+                completed_albums.add(album_url)
+        if work_queue is not None:
+            work_queue.complete(album_url, ok=result["fail"] == 0)
+        if planner is not None:
+            logging.info("[下载计划] %s", planner.summary())
+
+    # 全局图片下载池: 总连接数与原先 "专辑并发 × 专辑内并发" 相同，空闲线程自动分给还有任务的专辑
+    image_pool = SharedImagePool(
+        max_workers=album_concurrency * DEFAULT_CONCURRENCY_IMAGE,
+        thread_name_prefix='ImageDownloader',
+        max_open_albums=album_concurrency * 2
+    )
+    memory_budget = MemoryBudget(args.memory_mb * 1024 * 1024)
+    archives = ArchiveStore(save_dir) if args.pack else None
+    planner = DownloadPlanner(session, args.min_kb * 1024, accept_types=PREFLIGHT_ACCEPT_TYPES) if args.preflight else None
+    
+    with ThreadPoolExecutor(max_workers=album_concurrency, thread_name_prefix='AlbumProcessor') as executor:
+        future_map: Dict[Any, Tuple[str, str, int]] = {}
+        
+        if work_queue is not None:
+            # worker: 持有的租约不超过同时打开的专辑数，专辑的图片全部完成后 (on_album_done) 报告结果
+            claimed = 0
+
+            def submit_work(item: WorkItem) -> None:
+                nonlocal claimed
+                claimed += 1
+                # 总数只用于日志，取 "已领取 + 队列中待领取" 的估计值
+                future = executor.submit(
+                    process_album,
+                    session, item.title, item.url, save_dir, verify,
+                    retries, timeout, claimed, claimed + work_queue.counts().get("pending", 0),
+                    image_pool=image_pool, on_complete=on_album_done, host_rate=args.host_rate,
+                    memory_budget=memory_budget, archives=archives, storage=storage, planner=planner
+                )
+
+                def on_error(f: Any) -> None:
+                    if f.exception() is not None:
+                        logging.error("专辑处理任务异常 [%s] %s: %s", item.title, item.url, f.exception())
+                        work_queue.complete(item.url, ok=False)
+                future.add_done_callback(on_error)
+
+            drain_work_queue(work_queue, submit_work, max_held=album_concurrency * 2)
+            total_albums = claimed
+        
+        # 专辑线程池中最多排队 2 倍并发数的专辑，其余留在发现队列中 (各分类轮流交出)
+        slots = threading.BoundedSemaphore(album_concurrency * 2)
+        index = 0
+        for index, (title, url) in enumerate(albums, start=1):
+            if frontier is not None:
+                total_albums = index + frontier.pending
+            slots.acquire()
+            future = executor.submit(
+                process_album, 
+                session, title, url, save_dir, verify, 
+                retries, timeout, index, total_albums,
+                image_pool=image_pool, on_complete=on_album_done, host_rate=args.host_rate,
+                memory_budget=memory_budget, archives=archives, storage=storage, planner=planner
+            )
+            future.add_done_callback(lambda f: slots.release())
+            future_map[future] = (title, url, index)
+        
+        if frontier is not None:
+            total_albums = index
+            logging.info("[发现队列] %s", frontier.summary())
+        logging.info("已提交 %d 个相册任务，等待完成...", total_albums)
+        
+        for future in as_completed(future_map):
+            album_title, album_url, index = future_map[future]
+            
+            try:
+                future.result() 
+            except Exception as e:
+                logging.error("[%d/%d] 专辑处理任务异常 [%s] %s: %s", index, total_albums, album_title, album_url, e)
+                with summary_lock:
+                    summary["albums_processed"] += 1
+    
+    # 专辑发现全部结束后，等待下载池中剩余的图片完成
+    image_pool.join()
+    image_pool.shutdown()
+    if archives is not None:
+        archives.close()
+    
+    summary["total_albums"] = total_albums
+    summary["memory_peak"] = memory_budget.peak
+    summary["plans"] = [planner.summary()] if planner is not None else []
+    return summary
+
+# -------- 多进程分片 --------
+def merge_shard_indexes(completed_albums: SeenUrlIndex) -> int:
+    """把分片进程写入的已完成专辑索引 (包括上次中断时遗留的) 合并进主索引，返回新增专辑数。"""
+    save_dir, index_name = os.path.split(completed_albums.path)
+    pattern = re.compile(re.escape(index_name + SHARD_INDEX_SUFFIX) + r"\d+")
+    shard_paths = {os.path.join(save_dir, name[:-len(".journal")] if name.endswith(".journal") else name)
+                   for name in os.listdir(save_dir) if pattern.fullmatch(name.replace(".journal", ""))}
+    return sum(completed_albums.absorb(path) for path in sorted(shard_paths))
+
+def run_shard(shard: int, args: argparse.Namespace, save_dir: str, albums: List[Tuple[str, str]]) -> Dict[str, Any]:
+    """分片进程入口: 用自己的会话、下载池和专辑索引下载分到本分片的专辑，返回统计。"""
+    global PAUSE_ON_FAILURE
+    PAUSE_ON_FAILURE = False  # 分片进程不等待键盘输入
+    # 页面请求限速必须来自主进程的共享表，否则 N 个分片会以 N 倍 --host-rate 请求站点
+    if not isinstance(host_limiter(BASE_URL, args.host_rate, burst=DEFAULT_CONCURRENCY_SUBPAGE), ProcessRateLimiter):
+        raise RuntimeError("分片进程没有接入共享限速表，站点限速不会在进程间共享")
+    session = make_session(http2=args.http2)
+    storage = open_storage(args.storage, endpoint_url=args.s3_endpoint) if args.storage else None
+    dir_snapshot.follow_renames(save_dir)
+    completed_albums = SeenUrlIndex(os.path.join(save_dir, f"{COMPLETED_INDEX_NAME}{SHARD_INDEX_SUFFIX}{shard}"))
+    profiler: Optional[StageProfiler] = None
+    if args.profile:
+        # 计时结果交给主进程合并到同一个 trace；cProfile 统计按分片分别保存
+        profiler = StageProfiler(parse_profile_stages(args.profile_cprofile))
+        install_profiler(profiler)
+    try:
+        result = download_albums(args, save_dir, session, storage, albums, completed_albums)
+    finally:
+        completed_albums.close()
+        if storage is not None:
+            storage.close()
+    if profiler is not None:
+        install_profiler(None)
+        profiler.dump_cprofile(f"{os.path.splitext(args.profile)[0]}.shard{shard}")
+        result["profile"] = profiler.snapshot()
+    return result
+
+def run_shards(args: argparse.Namespace, save_dir: str, albums: List[Tuple[str, str]], completed_albums: SeenUrlIndex, profiler: Optional[StageProfiler] = None, rate_table: Optional[ProcessRateTable] = None) -> Dict[str, Any]:
+    """按专辑 URL 摘要把专辑分到 args.shards 个进程下载，返回合并后的统计。
+    专辑并发和内存预算按分片数均分，总连接数和内存上限与单进程时相同；页面请求限速由所有进程
+    (以及传入 rate_table 时翻列表页的主进程) 共用。"""
+    from concurrent.futures import ProcessPoolExecutor  # 只在分片时才加载多进程模块
+    
+    shards = args.shards
+    buckets: List[List[Tuple[str, str]]] = [[] for _ in range(shards)]
+    for title, url in albums:
+        buckets[shard_of(url, shards)].append((title, url))
+    shard_args = argparse.Namespace(**vars(args))
+    shard_args.album_concurrency = max(1, -(-args.album_concurrency // shards))
+    shard_args.memory_mb = max(1, args.memory_mb // shards) if args.memory_mb > 0 else 0
+    logging.info("分成 %d 个进程下载，各分片专辑数: %s (每个进程并发专辑 %d 个，内存上限 %d MB)",
+                 shards, [len(bucket) for bucket in buckets], shard_args.album_concurrency, shard_args.memory_mb)
+    
+    totals: Dict[str, Any] = {"ok": 0, "skipped": 0, "fail": 0, "albums_processed": 0, "total_albums": 0, "memory_peak": 0, "plans": []}
+    # 站点限速状态放在共享内存中，各进程启动时接入
+    with ProcessPoolExecutor(max_workers=shards, initializer=share_host_limits, initargs=(rate_table or ProcessRateTable(),)) as executor:
+        futures = {executor.submit(run_shard, shard, shard_args, save_dir, bucket): shard
+                   for shard, bucket in enumerate(buckets) if bucket}
+        for future in as_completed(futures):
+            shard = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logging.error("分片 %d 异常退出: %s", shard, e)
+                totals["total_albums"] += len(buckets[shard])
+                continue
+            for key in ("ok", "skipped", "fail", "albums_processed", "total_albums", "memory_peak"):
+                totals[key] += result[key]  # 内存峰值为各进程峰值之和 (上限)
+            totals["plans"] += result["plans"]
+            if profiler is not None and "profile" in result:
+                profiler.merge(result["profile"])
+            logging.info("分片 %d 完成: 专辑 %d/%d，成功 %d 张，跳过 %d 张，失败 %d 张", shard, result["albums_processed"],
+                         result["total_albums"], result["ok"], result["skipped"], result["fail"])
+    
+    merged = merge_shard_indexes(completed_albums)
+    logging.info("各分片已完成的 %d 个专辑已合并到 %s", merged, completed_albums.path)
+    return totals
+
+# -------- 阶段计时 --------
+def parse_profile_stages(value: Optional[str]) -> List[str]:
+    """解析 --profile-cprofile 的阶段列表 (逗号分隔，all 表示全部)。"""
+    if not value:
+        return []
+    if value == "all":
+        return list(PROFILE_STAGES)
+    return [stage.strip() for stage in value.split(",") if stage.strip()]
+
+def finish_profiling(profiler: StageProfiler, trace_path: str) -> None:
+    """停止计时，导出 Chrome trace 和 cProfile 统计，并在日志中输出各阶段汇总。"""
+    install_profiler(None)
+    profiler.export(trace_path)
+    pstats_paths = profiler.dump_cprofile(os.path.splitext(trace_path)[0])
+    logging.info("阶段计时 (累计为所有线程之和):")
+    for line in profiler.summary():
+        logging.info("  %s", line)
+    if profiler.dropped:
+        logging.warning("计时区间超过上限，%d 个区间只计入汇总，未写入 trace", profiler.dropped)
+    logging.info("Chrome trace 已保存到 %s (用 chrome://tracing 或 https://ui.perfetto.dev 打开)", trace_path)
+    for path in pstats_paths:
+        logging.info("cProfile 统计已保存到 %s (python -m pstats 查看)", path)
+
+# -------- 主函数 --------
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="凸凹吧相册爬虫", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-d", "--dir", help="图片保存的根目录")
+    parser.add_argument("--verify", action="store_true", default=True, help="启用严格的图像验证")
+    parser.add_argument("-r", "--retries", type=int, default=DEFAULT_RETRIES, help="请求失败最大重试次数")
+    parser.add_argument("-t", "--timeout", type=int, default=DEFAULT_TIMEOUT, help="请求超时时间(秒)")
+    parser.add_argument("-c", "--album-concurrency", type=int, default=DEFAULT_CONCURRENCY_ALBUM, help="并发处理的专辑数量")
+    parser.add_argument("--http2", action="store_true", help="启用 HTTP/2 多路复用传输 (需安装 httpx[http2])")
+    parser.add_argument("--host-rate", type=float, default=DEFAULT_HOST_RATE, help="列表页/专辑页/分页请求速率上限(次/秒)，0 表示不限速")
+    parser.add_argument("--listing-concurrency", type=int, default=FRONTIER_WORKERS, help="同时翻列表页的分类数 (各分类的专辑混合下载，重复出现的专辑只下载一次)")
+    parser.add_argument("--memory-mb", type=int, default=DEFAULT_MEMORY_MB, help="在途图片数据的内存上限(MB)，0 表示不限制")
+    output_group = parser.add_mutually_exclusive_group()
+    output_group.add_argument("--pack", action="store_true", help="打包输出: 每个专辑保存为一个不压缩的 tar 分片，而不是大量小文件")
+    output_group.add_argument("--storage", help="存储后端，如 s3://bucket/前缀 (需安装 boto3)；此时 -d 目录只保存运行状态")
+    parser.add_argument("--s3-endpoint", help="S3 兼容服务地址 (如 MinIO: http://127.0.0.1:9000)")
+    parser.add_argument("--thumbnails", action="store_true", help="下载完成后生成缩略图和专辑封面拼图 (本地保存时有效)")
+    parser.add_argument("--transcode", nargs="?", const="keep", choices=("keep", "webp"), metavar="FORMAT",
+                        help="下载完成后重新编码图片以节省空间 (本地散文件保存时有效): 默认按原格式，webp 时 JPEG/PNG 转为 WebP 并改名")
+    parser.add_argument("--preflight", action="store_true", help="下载前先批量 HEAD 预检: 剔除过小/非图片的对象，估算总量和剩余时间，检查磁盘空间 (HEAD 与页面请求共用站点限速)")
+    parser.add_argument("--min-kb", type=int, default=0, help="预检时丢弃小于此大小的图片(KB)，需配合 --preflight")
+    queue_group = parser.add_mutually_exclusive_group()
+    queue_group.add_argument("--coordinator", metavar="QUEUE_DB", help="分布式协调端: 只收集各分类的专辑，写入共享卷上的 SQLite 工作队列后退出")
+    queue_group.add_argument("--worker", metavar="QUEUE_DB", help="分布式 worker: 不收集专辑，从工作队列领取专辑下载 (租约自动续期，掉线后由其他 worker 收回)")
+    parser.add_argument("--worker-id", help="worker 名称，默认 <主机名>-<进程号>")
+    parser.add_argument("--shards", type=int, default=1, help="按专辑 URL 分到 N 个进程下载，用满多核 (Pillow 校验/页面解析不受 GIL 限制)；站点限速在进程间共享")
+    parser.add_argument("--profile", metavar="TRACE_JSON", help="记录各阶段耗时 (请求/传输/解析/校验/写盘/等待)，导出 Chrome trace-event JSON")
+    parser.add_argument("--profile-cprofile", metavar="STAGES", help=f"配合 --profile，为这些阶段额外保存 cProfile 统计，逗号分隔或 all (可选: {','.join(PROFILE_STAGES)})")
+    parser.add_argument("--no-prompt", action="store_true", help="不等待键盘输入: 未指定 -d 时使用默认地址，请求全部失败后不暂停 (后台或 crawl_all.py 运行)")
+    
+    args = parser.parse_args(argv)
+    if args.shards > 1 and (args.coordinator or args.worker):
+        parser.error("--shards 不能与 --coordinator/--worker 同时使用 (多台机器请在每台机器上运行 worker)")
+    unknown_stages = set(parse_profile_stages(args.profile_cprofile)) - set(PROFILE_STAGES)
+    if unknown_stages:
+        parser.error(f"未知的阶段: {','.join(sorted(unknown_stages))} (可选: {','.join(PROFILE_STAGES)})")
+    if args.profile_cprofile and not args.profile:
+        parser.error("--profile-cprofile 需要同时指定 --profile")
+    
+    global PAUSE_ON_FAILURE
+    if args.no_prompt:
+        PAUSE_ON_FAILURE = False
+    
+    # 用户输入保存地址功能
+    if args.dir:
+        save_dir = args.dir
+    elif args.no_prompt:
+        save_dir = DEFAULT_SAVE_DIR
+    else:
+        save_dir = input("请输入保存地址 (留空则使用默认地址): ").strip()
+        if not save_dir:
+            save_dir = DEFAULT_SAVE_DIR
+    
+    save_dir = os.path.abspath(save_dir)
+    
+    # 创建保存目录
+    os.makedirs(save_dir, exist_ok=True)
+    dir_snapshot.follow_renames(save_dir)  # 被 transcode.py 转为 WebP 改名的图片也算已存在
+    
+    # 配置参数
+    retries = args.retries
+    timeout = args.timeout
+    
+    logging.info("开始爬取凸凹吧 (https://www.tuao.cc/)")
+    logging.info(f"图片将保存到: {save_dir}")
+    
+    # 阶段计时: 各阶段的耗时区间，结束时导出 Chrome trace
+    profiler: Optional[StageProfiler] = None
+    if args.profile:
+        profiler = StageProfiler(parse_profile_stages(args.profile_cprofile))
+        install_profiler(profiler)
+    
+    # 创建会话
+    session = make_session(http2=args.http2)
+    storage: Optional[Storage] = None
+    if args.storage:
+        try:
+            storage = open_storage(args.storage, endpoint_url=args.s3_endpoint)
+        except RuntimeError as e:
+            logging.error("%s", e)
+            return
+        logging.info("图片将写入存储后端: %s", args.storage)
+    
+    # 已完整下载的专辑，跨运行持久化，重启后直接跳过 (包括上次 --shards 运行中断时各分片已完成的专辑)
+    completed_albums = SeenUrlIndex(os.path.join(save_dir, COMPLETED_INDEX_NAME))
+    merge_shard_indexes(completed_albums)
+    
+    # 分布式运行: 协调端只收集专辑写入共享队列；worker 从队列领取专辑，页面请求限速在所有 worker 之间共享
+    work_queue: Optional[WorkQueue] = None
+    if args.coordinator or args.worker:
+        work_queue = WorkQueue(args.coordinator or args.worker, worker_id=args.worker_id)
+        logging.info("工作队列: %s (%s)，当前状态: %s", work_queue.path, "协调端" if args.coordinator else f"worker {work_queue.worker_id}", work_queue.counts())
+    
+    # 全站发现队列: 多个分类同时翻页，单进程下载时边发现边下载；协调端和 --shards 需要先收集完整列表
+    frontier: Optional[CrawlFrontier] = None
+    all_albums_to_process: Iterable[Tuple[str, str]] = []
+    rate_table: Optional[ProcessRateTable] = None
+    if args.worker:
+        share_host_limits(work_queue)
+    else:
+        if args.shards > 1:
+            # 翻列表页的主进程与各分片进程共用同一份站点限速 (在创建发现队列、取得限速器之前接入)
+            rate_table = ProcessRateTable()
+            share_host_limits(rate_table)
+        on_page_albums = None
+        if work_queue is not None:
+            work_queue.mark_discovery_done(False)
+
+            def on_page_albums(category_name: str, items: List[FrontierItem]) -> None:
+                work_queue.add((item.url, item.title, None) for item in items)
+        frontier = make_listing_frontier(session, retries, timeout, completed_albums, args.listing_concurrency, args.host_rate, on_page_albums)
+        if args.coordinator or args.shards > 1:
+            try:
+                all_albums_to_process = [(item.title, item.url) for item in frontier]
+            finally:
+                frontier.close()  # Ctrl+C 等中断时停止翻页
+            
+            # 收集完成
+            logging.info("\n" + "="*60)
+            logging.info("=== 所有类型的相册链接收集完成 ===")
+            logging.info("[发现队列] %s", frontier.summary())
+        else:
+            all_albums_to_process = ((item.title, item.url) for item in frontier)
+    
+    if args.coordinator:
+        work_queue.mark_discovery_done()
+        logging.info("已写入工作队列 %d 个专辑，队列状态: %s", len(all_albums_to_process), work_queue.counts())
+        work_queue.close()
+        completed_albums.close()
+        if profiler is not None:
+            finish_profiling(profiler, args.profile)
+        return
+    
+    # 处理所有收集到的相册
+    if isinstance(all_albums_to_process, list) and not all_albums_to_process and not args.worker:
+        logging.warning("未找到任何专辑，程序结束。")
+        return
+        
+    logging.info("\n" + "="*70)
+    if args.worker:
+        logging.info("从工作队列领取专辑，开始并发下载...")
+    elif isinstance(all_albums_to_process, list):
+        logging.info(f"共收集到 {len(all_albums_to_process)} 个待处理专辑，开始并发下载...")
+    else:
+        logging.info("各分类边翻页边下载，新发现的专辑按分类轮流提交...")
+    logging.info("="*70)
+    
+    if args.shards > 1:
+        summary = run_shards(args, save_dir, all_albums_to_process, completed_albums, profiler, rate_table)
+    else:
+        try:
+            summary = download_albums(args, save_dir, session, storage, all_albums_to_process, completed_albums, work_queue, frontier)
+        finally:
+            if frontier is not None:
+                frontier.close()  # 下载中断 (Ctrl+C 或异常) 时停止翻页
+        if summary["total_albums"] == 0 and not args.worker:
+            logging.warning("未找到任何待处理的专辑。")
+    completed_albums.close()
+    if work_queue is not None:
+        logging.info("工作队列状态: %s", work_queue.counts())
+        work_queue.close()
+    if storage is not None:
+        storage.close()
+    
+    # 打印最终结果
+    logging.info("\n" + "="*70)
+    logging.info("程序执行完毕。爬取任务总结：")
+    logging.info(f"  处理的专辑总数: {summary['albums_processed']} / {summary['total_albums']}")
+    logging.info("-" * 25)
+    logging.info(f"  [成功下载]: {summary['ok']} 张")
+    logging.info(f"  [跳过 (已存在)]: {summary['skipped']} 张")
+    logging.info(f"  [失败总数]: {summary['fail']} 张")
+    logging.info(f"  [在途内存峰值]: {summary['memory_peak'] / 1024 / 1024:.1f} MB")
+    for plan in summary["plans"]:
+        logging.info(f"  [下载计划]: {plan}")
+    logging.info("="*70)
+    logging.info(f"所有图片已保存到: {save_dir}")
+    if profiler is not None:
+        finish_profiling(profiler, args.profile)
+
+    # 下载后处理: 在独立进程中运行，不占用下载线程的 GIL；先重新编码，缩略图按新文件生成
+    if args.transcode:
+        if storage is not None or args.pack or not PILLOW_AVAILABLE:
+            logging.warning("重新编码需要本地散文件保存且安装 Pillow，已跳过")
+        else:
+            from transcode import transcode_library
+            transcode_library(save_dir, target=args.transcode)
+    if args.thumbnails:
+        if storage is not None or not PILLOW_AVAILABLE:
+            logging.warning("缩略图生成需要本地保存且安装 Pillow，已跳过")
+        else:
+            from thumbnails import build_thumbnails
+            build_thumbnails(save_dir)
+
+if __name__ == "__main__":
+    main()
+
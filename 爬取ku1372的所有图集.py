@@ -1,679 +1,842 @@
-#!/usr/bin/env python3
-# -*- coding: utf-8 -*-
-
-import requests
-from bs4 import BeautifulSoup
-import os
-import time
-import random
-import re
-import argparse
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from urllib.parse import urljoin
-import zipfile
-from PIL import Image
-import io
-from rich.console import Console
-from rich.table import Table
-from rich.live import Live
-from rich.text import Text
-
-# 初始化rich控制台
-console = Console()
-
-# 全局状态字典，用于存储下载状态
-download_status = {}
-# 全局计数器
-total_albums_count = 0
-processed_albums_count = 0
-
-# 全局配置
-HEADERS = {
-    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-}
-
-session = requests.Session()
-session.mount('http://', requests.adapters.HTTPAdapter(pool_connections=20, pool_maxsize=20))
-session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=20, pool_maxsize=20))
-
-def update_download_status(album_name, status, progress=0, tag_name="", speed=0):
-    """更新下载状态"""
-    global download_status
-    download_status[album_name] = {
-        'tag': tag_name,
-        'status': status,
-        'progress': progress,
-        'speed': speed
-    }
-
-def get_stats_text():
-    """获取统计信息文本"""
-    global total_albums_count, processed_albums_count
-    
-    # 避免除以零错误
-    if total_albums_count > 0:
-        progress_percent = processed_albums_count / total_albums_count * 100
-    else:
-        progress_percent = 0
-    
-    return f"[bold white on blue]总计: {total_albums_count} 个相册 | 已处理: {processed_albums_count} 个 | 进度: {progress_percent:.1f}%[/bold white on blue]"
-
-def create_status_table():
-    """创建状态表格"""
-    table = Table(title="相册下载状态", show_header=True, header_style="bold magenta")
-    table.add_column("标签", width=20, style="cyan")
-    table.add_column("相册名称", width=40, style="green")
-    table.add_column("进度", width=15, style="yellow")
-    table.add_column("速度", width=15, style="red")
-    table.add_column("状态", width=20, style="blue")
-    
-    # 按照状态排序：等待下载 -> 正在下载 -> 下载完成 -> 跳过
-    status_order = {"等待下载": 0, "正在下载": 1, "下载完成": 2, "跳过，本地已存在": 3}
-    sorted_albums = sorted(
-        download_status.items(),
-        key=lambda x: (status_order.get(x[1]['status'], 4), x[0])
-    )
-    
-    if sorted_albums:
-        for album_name, status_info in sorted_albums:
-            # 格式化进度
-            if status_info['status'] in ["正在下载", "下载完成", "跳过，本地已存在"]:
-                progress_str = f"{status_info['progress']:.1f}%"
-            else:
-                progress_str = "-"
-            
-            # 格式化速度，确保实时更新
-            if status_info['status'] == "正在下载":
-                speed = status_info.get('speed', 0)
-                if speed < 1024:
-                    speed_str = f"{speed:.1f} KB/s"
-                else:
-                    speed_str = f"{speed/1024:.1f} MB/s"
-            else:
-                speed_str = "-"
-            
-            # 根据状态设置不同的颜色
-            status_text = status_info['status']
-            if status_info['status'] == "下载完成":
-                status_text = Text(status_text, style="green bold")
-            elif status_info['status'] == "正在下载":
-                status_text = Text(status_text, style="yellow bold")
-            elif status_info['status'] == "等待下载":
-                status_text = Text(status_text, style="blue")
-            elif status_info['status'] == "跳过，本地已存在":
-                status_text = Text(status_text, style="cyan bold")
-            
-            table.add_row(
-                status_info['tag'],
-                album_name,
-                progress_str,
-                speed_str,
-                status_text
-            )
-    else:
-        # 添加一行提示信息，避免表格看起来是空的
-        table.add_row(
-            "等待中",
-            "暂无相册信息",
-            "-",
-            "-",
-            "等待下载",
-            style="italic dim"
-        )
-    
-    return table
-
-def get_soup(url):
-    """获取网页的BeautifulSoup对象"""
-    try:
-        response = session.get(url, headers=HEADERS, timeout=30)
-        response.encoding = 'gb2312'
-        return BeautifulSoup(response.text, 'html.parser')
-    except Exception as e:
-        console.print(f"[red]获取页面 {url} 失败: {e}[/red]")
-        return None
-
-def get_tags():
-    """获取所有标签链接和名称"""
-    tags = []
-    url = 'https://www.ku1372.cc/b/tag/'
-    soup = get_soup(url)
-    if not soup:
-        return tags
-    
-    # 找到所有包含标签的ul列表
-    ul_list = soup.find_all('ul')
-    for ul in ul_list:
-        li_list = ul.find_all('li')
-        for li in li_list:
-            a_tag = li.find('a')
-            span_tag = li.find('span')
-            if a_tag and span_tag:
-                tag_url = a_tag.get('href')
-                tag_name = a_tag.text.strip()
-                tag_count = span_tag.text.strip()
-                tags.append({
-                    'name': f"{tag_name} {tag_count}",
-                    'url': tag_url
-                })
-    return tags
-
-def get_albums(tag_url):
-    """获取标签下的所有相册链接"""
-    albums = []
-    page = 1
-    
-    while True:
-        # 构建页码URL
-        if page == 1:
-            url = tag_url
-        else:
-            # 提取tag_id，实际分页URL格式为list_{tag_id}_{page}.html
-            # 从tag_url中提取数字ID
-            import re
-            tag_id_match = re.search(r'/b/(\d+)/?', tag_url)
-            if tag_id_match:
-                tag_id = tag_id_match.group(1)
-                # 检查URL格式，构建正确的分页URL
-                if tag_url.endswith('/'):
-                    url = f"{tag_url}list_{tag_id}_{page}.html"
-                else:
-                    url = f"{tag_url}/list_{tag_id}_{page}.html"
-            else:
-                # 如果无法提取tag_id，使用之前的格式作为备选
-                if tag_url.endswith('/'):
-                    url = f"{tag_url}list_{page}.html"
-                else:
-                    url = f"{tag_url}/list_{page}.html"
-        
-        soup = get_soup(url)
-        if not soup:
-            break
-        
-        # 查找相册列表
-        list_div = soup.find('div', class_='m-list')
-        if not list_div:
-            break
-        
-        # 查找所有相册链接
-        li_list = list_div.find_all('li')
-        if not li_list:
-            break
-        
-        for li in li_list:
-            a_tag = li.find('a')
-            if a_tag:
-                album_url = a_tag.get('href')
-                album_name = a_tag.get('title', '').strip()
-                albums.append({
-                    'name': album_name,
-                    'url': album_url
-                })
-        
-        # 检查是否有下一页
-        page_div = soup.find('div', class_='page')
-        if not page_div:
-            print(f"未找到分页控件，结束爬取 (第{page}页)")
-            break
-        
-        # 尝试多种方式查找下一页
-        next_page = None
-        
-        # 1. 通过文本匹配查找下一页
-        text_matches = page_div.find_all('a')
-        for a in text_matches:
-            a_text = a.text.strip()
-            if a_text in ['下一页', 'ÏÂÒ»Ò³', 'Next', 'next'] or '下一页' in a_text:
-                next_page = a
-                break
-        
-        # 2. 如果文本匹配失败，查找包含href且href中包含list的链接
-        if not next_page:
-            href_matches = page_div.find_all('a', href=re.compile(r'list_'))
-            for a in href_matches:
-                # 排除当前页链接
-                if 'this-page' not in a.get('class', []):
-                    # 尝试解析页码，找到比当前页大1的页码
-                    page_match = re.search(r'_([0-9]+)\.html', a.get('href', ''))
-                    if page_match:
-                        link_page = int(page_match.group(1))
-                        if link_page == page + 1:
-                            next_page = a
-                            break
-        
-        if not next_page:
-            print(f"未找到下一页链接，结束爬取 (第{page}页)")
-            break
-        
-        page += 1
-        print(f"准备爬取下一页: 第{page}页")
-        # 增加页面爬取延迟
-        time.sleep(random.randint(4, 8))
-    
-    return albums
-
-def get_download_link(album_url):
-    """获取相册的下载链接"""
-    soup = get_soup(album_url)
-    if not soup:
-        return None
-    
-    # 查找下载链接
-    title_div = soup.find('div', class_='Title111')
-    if not title_div:
-        return None
-    
-    download_a = title_div.find('a', text=re.compile(r'点击打包下载本套图|µã»÷´ò°üÏÂÔØ±¾Ì×Í¼'))
-    if download_a:
-        return download_a.get('href')
-    
-    return None
-
-def extract_zip(zip_path, extract_dir, delete_after=False):
-    """解压单个压缩包"""
-    try:
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(extract_dir)
-        print(f"解压成功: {os.path.basename(zip_path)}")
-        
-        if delete_after:
-            os.remove(zip_path)
-            print(f"删除原压缩包: {os.path.basename(zip_path)}")
-        
-        return True
-    except Exception as e:
-        print(f"解压失败 {os.path.basename(zip_path)}: {e}")
-        return False
-
-def verify_image(image_path):
-    """验证图像是否损坏"""
-    try:
-        with Image.open(image_path) as img:
-            img.verify()
-        return True
-    except Exception as e:
-        print(f"图像损坏: {image_path} - {e}")
-        return False
-
-def main():
-    # 解析命令行参数
-    parser = argparse.ArgumentParser(description='爬取ku1372网站相册')
-    parser.add_argument('--verify', action='store_true', help='启用已存在文件验证')
-    parser.add_argument('--max-workers', type=int, default=2, help='最大下载线程数')
-    args = parser.parse_args()
-    
-    # 获取保存路径（使用原始字符串避免转义警告）
-    default_path = r"E:\pachong\结果\ku1372"
-    save_path = input(f"请输入保存路径（默认：{default_path}）: ").strip()
-    if not save_path:
-        save_path = default_path
-    
-    # 创建保存目录
-    os.makedirs(save_path, exist_ok=True)
-    
-    # 询问解压选项（在下载开始之前）
-    console.print("\n=== 解压选项设置 ===")
-    extract_choice = input("全站下载完成后是否解压压缩包？(y/n，默认y): ").strip().lower()
-    should_extract = extract_choice in ['y', '']
-    delete_after = False
-    
-    if should_extract:
-        delete_choice = input("解压完成后是否删除原压缩包？(y/n，默认y): ").strip().lower()
-        delete_after = delete_choice in ['y', '']
-    
-    # 获取所有标签
-    tags = get_tags()
-    if not tags:
-        console.print("[red]获取标签失败，程序退出[/red]")
-        return
-    
-    console.print(f"\n[bold cyan]共找到 {len(tags)} 个标签[/bold cyan]")
-    
-    # 开始下载，使用Live显示动态表格和统计信息
-    total_success = 0
-    
-    # 创建Live上下文，一开始就显示统计信息和表格
-    with Live(None, refresh_per_second=2, console=console) as live:
-        # 定义内容渲染函数
-        def render_content():
-            """渲染统计信息和表格"""
-            from rich.console import Group
-            
-            # 获取统计信息和表格
-            table = create_status_table()
-            
-            # 使用Group来组合多个Renderable对象
-            group = Group(
-                get_stats_text(),
-                "",
-                table
-            )
-            
-            return group
-        
-        # 初始化Live显示
-        live.update(render_content())
-        # 遍历所有标签
-        for tag_index, tag in enumerate(tags):
-            tag_name = tag['name']
-            console.print(f"\n[bold magenta]=== 开始处理标签 {tag_index+1}/{len(tags)}: {tag_name} ===[/bold magenta]")
-            
-            # 初始化标签目录
-            tag_dir = os.path.join(save_path, tag_name)
-            os.makedirs(tag_dir, exist_ok=True)
-            
-            # 分页爬取和下载
-            page = 1
-            has_more_pages = True
-            
-            while has_more_pages:
-                console.print(f"[yellow]正在爬取第 {page} 页相册...[/yellow]")
-                
-                # 构建页码URL
-                if page == 1:
-                    current_url = tag['url']
-                else:
-                    # 提取tag_id
-                    tag_id_match = re.search(r'/b/(\d+)/?', tag['url'])
-                    if tag_id_match:
-                        tag_id = tag_id_match.group(1)
-                        if tag['url'].endswith('/'):
-                            current_url = f"{tag['url']}list_{tag_id}_{page}.html"
-                        else:
-                            current_url = f"{tag['url']}/list_{tag_id}_{page}.html"
-                    else:
-                        console.print(f"[red]无法提取tag_id，跳过第 {page} 页[/red]")
-                        break
-                
-                # 爬取当前页相册
-                soup = get_soup(current_url)
-                if not soup:
-                    console.print(f"[red]爬取第 {page} 页失败[/red]")
-                    break
-                
-                # 查找相册列表
-                list_div = soup.find('div', class_='m-list')
-                if not list_div:
-                    console.print(f"[red]第 {page} 页未找到相册列表[/red]")
-                    break
-                
-                # 查找所有相册链接
-                li_list = list_div.find_all('li')
-                if not li_list:
-                    console.print(f"[red]第 {page} 页未找到相册[/red]")
-                    break
-                
-                console.print(f"[green]第 {page} 页找到 {len(li_list)} 个相册[/green]")
-                
-                # 提取当前页相册
-                current_page_albums = []
-                for li in li_list:
-                    a_tag = li.find('a')
-                    if a_tag:
-                        album_url = a_tag.get('href')
-                        album_name = a_tag.get('title', '').strip()
-                        if album_name:
-                            current_page_albums.append({
-                                'name': album_name,
-                                'url': album_url
-                            })
-                
-                # 将当前页相册添加到表格中
-                for album in current_page_albums:
-                    # 更新全局计数器
-                    global total_albums_count
-                    total_albums_count += 1
-                    
-                    # 初始化相册状态
-                    update_download_status(album['name'], "等待下载", 0, tag_name)
-                    
-                    # 更新显示内容
-                    live.update(render_content())
-                
-                # 定义线程安全的成功计数器
-                thread_success_count = 0
-                
-                # 定义一个内部函数来下载相册，这样可以访问render_content
-                def download_album_wrapper(album, tag_dir, verify=False, tag_name=""):
-                    nonlocal thread_success_count
-                    album_name = album['name']
-                    album_url = album['url']
-                    
-                    # 清理文件名
-                    safe_name = re.sub(r'[\\/:*?"<>|]', '_', album_name)
-                    save_path = os.path.join(tag_dir, f"{safe_name}.zip")
-                    
-                    # 如果文件已存在，根据verify参数决定是否验证
-                    if os.path.exists(save_path):
-                        if verify:
-                            update_download_status(album_name, "正在下载", 0, tag_name)
-                            live.update(render_content())
-                            console.print(f"[yellow]验证已存在文件: {safe_name}[/yellow]")
-                            # 简单验证文件大小，大于1KB认为有效
-                            if os.path.getsize(save_path) > 1024:
-                                update_download_status(album_name, "跳过，本地已存在", 100, tag_name)
-                                live.update(render_content())
-                                return True
-                            else:
-                                console.print(f"[orange]文件已存在但无效，重新下载: {safe_name}[/orange]")
-                                os.remove(save_path)
-                        else:
-                            update_download_status(album_name, "跳过，本地已存在", 100, tag_name)
-                            live.update(render_content())
-                            console.print(f"[green]跳过，本地已存在: {safe_name}[/green]")
-                            return True
-                    
-                    # 重试机制，最多重试5次
-                    retry_count = 0
-                    max_retries = 5
-                    
-                    while retry_count < max_retries:
-                        try:
-                            # 获取下载链接
-                            download_url = get_download_link(album_url)
-                            if not download_url:
-                                update_download_status(album_name, "下载完成", 0, tag_name)
-                                live.update(render_content())
-                                console.print(f"[red]获取下载链接失败: {album_name}[/red]")
-                                return False
-                            
-                            # 添加专辑详情页请求延迟
-                            delay = random.randint(2, 4)
-                            console.print(f"[blue]等待 {delay} 秒后下载: {album_name}[/blue]")
-                            time.sleep(delay)
-                            
-                            update_download_status(album_name, "正在下载", 0, tag_name)
-                            live.update(render_content())
-                            console.print(f"[green]正在下载: {album_name} (尝试 {retry_count+1}/{max_retries})[/green]")
-                            
-                            # 添加超时重试机制
-                            response = session.get(download_url, headers=HEADERS, stream=True, timeout=60)
-                            response.raise_for_status()  # 检查HTTP状态码
-                            
-                            total_size = int(response.headers.get('content-length', 0))
-                            console.print(f"[cyan]文件大小: {total_size / 1024 / 1024:.2f} MB[/cyan]")
-                            
-                            downloaded_size = 0
-                            start_time = time.time()
-                            last_update_time = start_time
-                            
-                            with open(save_path, 'wb') as f:
-                                for chunk in response.iter_content(chunk_size=8192):
-                                    if chunk:
-                                        f.write(chunk)
-                                        downloaded_size += len(chunk)
-                                        
-                                        # 计算下载速度和进度
-                                        current_time = time.time()
-                                        elapsed_time = current_time - start_time
-                                        
-                                        # 每秒更新一次状态和表格
-                                        if current_time - last_update_time >= 1.0 and total_size > 0:
-                                            progress = (downloaded_size / total_size) * 100
-                                            
-                                            # 计算下载速度（KB/s）
-                                            if elapsed_time > 0:
-                                                speed_kbps = (downloaded_size / elapsed_time) / 1024
-                                            else:
-                                                speed_kbps = 0
-                                            
-                                            update_download_status(album_name, "正在下载", progress, tag_name, speed_kbps)
-                                            # 更新表格
-                                            live.update(render_content())
-                                            last_update_time = current_time
-                            
-                            # 下载完成后更新最终状态
-                            final_time = time.time()
-                            total_elapsed = final_time - start_time
-                            if total_elapsed > 0:
-                                avg_speed_kbps = (downloaded_size / total_elapsed) / 1024
-                                console.print(f"[cyan]平均下载速度: {avg_speed_kbps:.2f} KB/s[/cyan]")
-                            
-                            # 验证下载内容是否为HTML错误页
-                            with open(save_path, 'rb') as f:
-                                content = f.read(512)  # 读取更多内容进行验证
-                                if b'<!DOCTYPE html>' in content or b'<html>' in content or b'<head>' in content:
-                                    update_download_status(album_name, "等待下载", 0, tag_name)
-                                    live.update(render_content())
-                                    console.print(f"[red]下载失败，返回HTML错误页: {album_name}[/red]")
-                                    os.remove(save_path)
-                                    retry_count += 1
-                                    # 重试前延迟
-                                    time.sleep(random.randint(4, 8))
-                                    continue
-                            
-                            # 验证文件大小
-                            final_size = os.path.getsize(save_path)
-                            console.print(f"[cyan]实际下载大小: {final_size / 1024 / 1024:.2f} MB[/cyan]")
-                            
-                            if final_size < 1024:
-                                update_download_status(album_name, "等待下载", 0, tag_name)
-                                live.update(render_content())
-                                console.print(f"[red]下载失败，文件太小 ({final_size} bytes): {album_name}[/red]")
-                                os.remove(save_path)
-                                retry_count += 1
-                                # 重试前延迟
-                                time.sleep(random.randint(4, 8))
-                                continue
-                            
-                            # 验证文件完整性（简单检查）
-                            if total_size > 0 and abs(final_size - total_size) > 1024:
-                                update_download_status(album_name, "等待下载", 0, tag_name)
-                                live.update(render_content())
-                                console.print(f"[red]下载失败，文件大小不匹配 (预期: {total_size}, 实际: {final_size}): {album_name}[/red]")
-                                os.remove(save_path)
-                                retry_count += 1
-                                # 重试前延迟
-                                time.sleep(random.randint(4, 8))
-                                continue
-                            
-                            update_download_status(album_name, "下载完成", 100, tag_name)
-                            live.update(render_content())
-                            console.print(f"[green]✓ 下载成功: {album_name}[/green]")
-                            thread_success_count += 1
-                            return True
-                        except requests.exceptions.RequestException as e:
-                            update_download_status(album_name, "等待下载", 0, tag_name)
-                            live.update(render_content())
-                            console.print(f"[red]网络请求失败 (尝试 {retry_count+1}/{max_retries}): {e}[/red]")
-                            retry_count += 1
-                            if os.path.exists(save_path):
-                                os.remove(save_path)
-                            # 重试前延迟
-                            time.sleep(random.randint(4, 8))
-                        except Exception as e:
-                            update_download_status(album_name, "等待下载", 0, tag_name)
-                            live.update(render_content())
-                            console.print(f"[red]下载专辑 {album_name} 失败 (尝试 {retry_count+1}/{max_retries}): {e}[/red]")
-                            retry_count += 1
-                            if os.path.exists(save_path):
-                                os.remove(save_path)
-                            # 重试前延迟
-                            time.sleep(random.randint(4, 8))
-                    
-                    # 5次重试失败后，继续执行
-                    update_download_status(album_name, "下载完成", 0, tag_name)
-                    live.update(render_content())
-                    console.print(f"[red]✗ 专辑 {album_name} 下载失败，已重试5次[/red]")
-                    return False
-                
-                # 使用线程池并发下载当前页相册
-                console.print(f"[green]使用 {args.max_workers} 个线程下载当前页相册[/green]")
-                with ThreadPoolExecutor(max_workers=args.max_workers) as executor:
-                    # 提交所有下载任务
-                    future_to_album = {
-                        executor.submit(download_album_wrapper, album, tag_dir, verify=args.verify, tag_name=tag_name): album
-                        for album in current_page_albums
-                    }
-                    
-                    # 处理完成的任务
-                    for future in as_completed(future_to_album):
-                        album = future_to_album[future]
-                        try:
-                            future.result()  # 获取结果，捕获异常
-                        except Exception as e:
-                            console.print(f"[red]处理相册 {album['name']} 时发生异常: {e}[/red]")
-                        
-                        # 更新已处理计数器
-                        global processed_albums_count
-                        processed_albums_count += 1
-                        
-                        # 更新显示内容
-                        live.update(render_content())
-                
-                # 更新总成功数
-                total_success += thread_success_count
-                
-                # 页面下载完成后延迟
-                time.sleep(random.randint(2, 5))
-                
-                # 检查是否有下一页
-                page_div = soup.find('div', class_='page')
-                if not page_div:
-                    console.print(f"[yellow]第 {page} 页未找到分页控件，结束该标签爬取[/yellow]")
-                    has_more_pages = False
-                    break
-                
-                # 查找下一页链接
-                next_page = None
-                text_matches = page_div.find_all('a')
-                for a in text_matches:
-                    a_text = a.text.strip()
-                    if a_text in ['下一页', 'ÏÂÒ»Ò³', 'Next', 'next'] or '下一页' in a_text:
-                        next_page = a
-                        break
-                
-                if not next_page:
-                    console.print(f"[yellow]第 {page} 页未找到下一页链接，结束该标签爬取[/yellow]")
-                    has_more_pages = False
-                    break
-                
-                # 进入下一页
-                page += 1
-                console.print(f"[cyan]准备爬取下一页: 第 {page} 页[/cyan]")
-                
-                # 页面爬取间隔
-                time.sleep(random.randint(4, 8))
-            
-            console.print(f"[bold magenta]=== 标签 {tag_index+1}/{len(tags)} 处理完成 ===[/bold magenta]")
-    
-    # 执行解压操作（如果用户选择了解压）
-    if should_extract:
-        console.print("\n[bold blue]=== 开始解压压缩包 ===[/bold blue]")
-        # 遍历所有标签目录
-        for tag in tags:
-            tag_dir = os.path.join(save_path, tag['name'])
-            if os.path.exists(tag_dir):
-                for file in os.listdir(tag_dir):
-                    if file.endswith('.zip'):
-                        zip_path = os.path.join(tag_dir, file)
-                        extract_zip(zip_path, tag_dir, delete_after)
-    
-    # 总结数据
-    console.print(f"\n[bold green]=== 下载完成 ===[/bold green]")
-    console.print(f"[cyan]总标签数: {len(tags)}[/cyan]")
-    console.print(f"[green]总成功下载数: {total_success}[/green]")
-    console.print(f"[yellow]总处理相册数: {processed_albums_count}[/yellow]")
-
-if __name__ == "__main__":
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import random
+import re
+import argparse
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+import zipfile
+import io
+from crawler_common import (mount_http2, DownloadPlanner, lazy_import, download_to_file, transfer_blocked, host_limiter,
+                            WorkQueue, drain_work_queue, share_host_limits, DirSnapshot, CrawlFrontier, FRONTIER_WORKERS,
+                            FrontierCheckpoint, CHECKPOINT_NAME, SeenUrlIndex)
+
+# 重量级依赖第一次使用时才导入（--help 时不加载 requests/bs4/PIL/rich）
+requests = lazy_import("requests")
+bs4 = lazy_import("bs4")
+Image = lazy_import("PIL.Image")
+rich_console = lazy_import("rich.console")
+rich_table = lazy_import("rich.table")
+rich_live = lazy_import("rich.live")
+rich_text = lazy_import("rich.text")
+
+# rich控制台和会话在 main() 中创建
+console = None
+session = None
+
+# 全局状态字典，用于存储下载状态
+download_status = {}
+# 全局计数器
+total_albums_count = 0
+processed_albums_count = 0
+# 下载计划（--preflight 时创建），用于统计栏显示剩余大小和预计时间
+download_planner = None
+# 站点请求速率上限（次/秒，0 表示不限制），--worker 时为所有 worker 合计
+host_rate = 0
+
+# 全局配置
+SITE_NAME = "ku1372"  # 多站点同时运行（crawl_all.py）时的统计名称
+DEFAULT_SAVE_PATH = r"E:\pachong\结果\ku1372"
+COMPLETED_INDEX_NAME = ".completed_albums.idx"  # 已完整下载的相册索引（保存目录下）
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+def create_session():
+    """创建带连接池的会话"""
+    s = requests.Session()
+    s.mount('http://', requests.adapters.HTTPAdapter(pool_connections=20, pool_maxsize=20))
+    s.mount('https://', requests.adapters.HTTPAdapter(pool_connections=20, pool_maxsize=20))
+    return s
+
+def update_download_status(album_name, status, progress=0, tag_name="", speed=0):
+    """更新下载状态"""
+    global download_status
+    download_status[album_name] = {
+        'tag': tag_name,
+        'status': status,
+        'progress': progress,
+        'speed': speed
+    }
+
+def get_stats_text():
+    """获取统计信息文本"""
+    global total_albums_count, processed_albums_count
+    
+    # 避免除以零错误
+    if total_albums_count > 0:
+        progress_percent = processed_albums_count / total_albums_count * 100
+    else:
+        progress_percent = 0
+    
+    text = f"总计: {total_albums_count} 个相册 | 已处理: {processed_albums_count} 个 | 进度: {progress_percent:.1f}%"
+    if download_planner is not None:
+        eta = download_planner.eta()
+        eta_str = f"{eta / 60:.1f} 分钟" if eta is not None else "未知"
+        text += f" | 计划剩余: {download_planner.remaining_bytes / 1024 / 1024:.1f} MB | 预计剩余: {eta_str}"
+    return f"[bold white on blue]{text}[/bold white on blue]"
+
+def create_status_table():
+    """创建状态表格"""
+    table = rich_table.Table(title="相册下载状态", show_header=True, header_style="bold magenta")
+    table.add_column("标签", width=20, style="cyan")
+    table.add_column("相册名称", width=40, style="green")
+    table.add_column("进度", width=15, style="yellow")
+    table.add_column("速度", width=15, style="red")
+    table.add_column("状态", width=20, style="blue")
+    
+    # 按照状态排序：等待下载 -> 正在下载 -> 下载完成 -> 跳过
+    status_order = {"等待下载": 0, "正在下载": 1, "下载完成": 2, "跳过，本地已存在": 3, "预检剔除": 4}
+    sorted_albums = sorted(
+        download_status.items(),
+        key=lambda x: (status_order.get(x[1]['status'], 4), x[0])
+    )
+    
+    if sorted_albums:
+        for album_name, status_info in sorted_albums:
+            # 格式化进度
+            if status_info['status'] in ["正在下载", "下载完成", "跳过，本地已存在"]:
+                progress_str = f"{status_info['progress']:.1f}%"
+            else:
+                progress_str = "-"
+            
+            # 格式化速度，确保实时更新
+            if status_info['status'] == "正在下载":
+                speed = status_info.get('speed', 0)
+                if speed < 1024:
+                    speed_str = f"{speed:.1f} KB/s"
+                else:
+                    speed_str = f"{speed/1024:.1f} MB/s"
+            else:
+                speed_str = "-"
+            
+            # 根据状态设置不同的颜色
+            status_text = status_info['status']
+            if status_info['status'] == "下载完成":
+                status_text = rich_text.Text(status_text, style="green bold")
+            elif status_info['status'] == "正在下载":
+                status_text = rich_text.Text(status_text, style="yellow bold")
+            elif status_info['status'] == "等待下载":
+                status_text = rich_text.Text(status_text, style="blue")
+            elif status_info['status'] == "跳过，本地已存在":
+                status_text = rich_text.Text(status_text, style="cyan bold")
+            elif status_info['status'] == "预检剔除":
+                status_text = rich_text.Text(status_text, style="red")
+            
+            table.add_row(
+                status_info['tag'],
+                album_name,
+                progress_str,
+                speed_str,
+                status_text
+            )
+    else:
+        # 添加一行提示信息，避免表格看起来是空的
+        table.add_row(
+            "等待中",
+            "暂无相册信息",
+            "-",
+            "-",
+            "等待下载",
+            style="italic dim"
+        )
+    
+    return table
+
+def get_soup(url):
+    """获取网页的BeautifulSoup对象"""
+    try:
+        host_limiter(url, host_rate).acquire()
+        response = session.get(url, headers=HEADERS, timeout=30)
+        response.encoding = 'gb2312'
+        return bs4.BeautifulSoup(response.text, 'html.parser')
+    except Exception as e:
+        console.print(f"[red]获取页面 {url} 失败: {e}[/red]")
+        return None
+
+def get_tags():
+    """获取所有标签链接和名称"""
+    tags = []
+    url = 'https://www.ku1372.cc/b/tag/'
+    soup = get_soup(url)
+    if not soup:
+        return tags
+    
+    # 找到所有包含标签的ul列表
+    ul_list = soup.find_all('ul')
+    for ul in ul_list:
+        li_list = ul.find_all('li')
+        for li in li_list:
+            a_tag = li.find('a')
+            span_tag = li.find('span')
+            if a_tag and span_tag:
+                tag_url = a_tag.get('href')
+                tag_name = a_tag.text.strip()
+                tag_count = span_tag.text.strip()
+                tags.append({
+                    'name': f"{tag_name} {tag_count}",
+                    'url': tag_url
+                })
+    return tags
+
+def get_albums(tag_url):
+    """获取标签下的所有相册链接"""
+    albums = []
+    page = 1
+    
+    while True:
+        # 构建页码URL
+        if page == 1:
+            url = tag_url
+        else:
+            # 提取tag_id，实际分页URL格式为list_{tag_id}_{page}.html
+            # 从tag_url中提取数字ID
+            import re
+            tag_id_match = re.search(r'/b/(\d+)/?', tag_url)
+            if tag_id_match:
+                tag_id = tag_id_match.group(1)
+                # 检查URL格式，构建正确的分页URL
+                if tag_url.endswith('/'):
+                    url = f"{tag_url}list_{tag_id}_{page}.html"
+                else:
+                    url = f"{tag_url}/list_{tag_id}_{page}.html"
+            else:
+                # 如果无法提取tag_id，使用之前的格式作为备选
+                if tag_url.endswith('/'):
+                    url = f"{tag_url}list_{page}.html"
+                else:
+                    url = f"{tag_url}/list_{page}.html"
+        
+        soup = get_soup(url)
+        if not soup:
+            break
+        
+        # 查找相册列表
+        list_div = soup.find('div', class_='m-list')
+        if not list_div:
+            break
+        
+        # 查找所有相册链接
+        li_list = list_div.find_all('li')
+        if not li_list:
+            break
+        
+        for li in li_list:
+            a_tag = li.find('a')
+            if a_tag:
+                album_url = a_tag.get('href')
+                album_name = a_tag.get('title', '').strip()
+                albums.append({
+                    'name': album_name,
+                    'url': album_url
+                })
+        
+        # 检查是否有下一页
+        page_div = soup.find('div', class_='page')
+        if not page_div:
+            print(f"未找到分页控件，结束爬取 (第{page}页)")
+            break
+        
+        # 尝试多种方式查找下一页
+        next_page = None
+        
+        # 1. 通过文本匹配查找下一页
+        text_matches = page_div.find_all('a')
+        for a in text_matches:
+            a_text = a.text.strip()
+            if a_text in ['下一页', 'ÏÂÒ»Ò³', 'Next', 'next'] or '下一页' in a_text:
+                next_page = a
+                break
+        
+        # 2. 如果文本匹配失败，查找包含href且href中包含list的链接
+        if not next_page:
+            href_matches = page_div.find_all('a', href=re.compile(r'list_'))
+            for a in href_matches:
+                # 排除当前页链接
+                if 'this-page' not in a.get('class', []):
+                    # 尝试解析页码，找到比当前页大1的页码
+                    page_match = re.search(r'_([0-9]+)\.html', a.get('href', ''))
+                    if page_match:
+                        link_page = int(page_match.group(1))
+                        if link_page == page + 1:
+                            next_page = a
+                            break
+        
+        if not next_page:
+            print(f"未找到下一页链接，结束爬取 (第{page}页)")
+            break
+        
+        page += 1
+        print(f"准备爬取下一页: 第{page}页")
+        # 增加页面爬取延迟
+        time.sleep(random.randint(4, 8))
+    
+    return albums
+
+def get_download_link(album_url):
+    """获取相册的下载链接"""
+    soup = get_soup(album_url)
+    if not soup:
+        return None
+    
+    # 查找下载链接
+    title_div = soup.find('div', class_='Title111')
+    if not title_div:
+        return None
+    
+    download_a = title_div.find('a', text=re.compile(r'点击打包下载本套图|µã»÷´ò°üÏÂÔØ±¾Ì×Í¼'))
+    if download_a:
+        return download_a.get('href')
+    
+    return None
+
+def preflight_albums(albums, tag_dir, tag_name, planner, snapshot):
+    """下载前预检当前页相册：获取下载链接并批量发送HEAD请求，剔除HTML错误页和过小的压缩包，
+    其余按压缩包大小从大到小排列（大文件先开始，避免最后只剩一个大文件拖尾）。
+    本地已存在的相册（查标签目录快照 snapshot，不逐个 stat）不预检，原样保留在列表最前面。"""
+    existing = []
+    resolved = {}
+    for album in albums:
+        safe_name = re.sub(r'[\\/:*?"<>|]', '_', album['name'])
+        if snapshot.exists(os.path.join(tag_dir, f"{safe_name}.zip")):
+            existing.append(album)
+            continue
+        download_url = get_download_link(album['url'])
+        if download_url:
+            album['download_url'] = download_url
+            resolved[download_url] = album
+        else:
+            # 获取链接失败的相册交给下载流程按原有逻辑重试
+            existing.append(album)
+    
+    planned, rejected = planner.plan(resolved)
+    for download_url, reason in rejected:
+        album = resolved[download_url]
+        update_download_status(album['name'], "预检剔除", 0, tag_name)
+        console.print(f"[red]预检剔除 ({reason}): {album['name']}[/red]")
+    return existing + [resolved[url] for url in planned], len(rejected)
+
+def extract_zip(zip_path, extract_dir, delete_after=False):
+    """解压单个压缩包"""
+    try:
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            zip_ref.extractall(extract_dir)
+        print(f"解压成功: {os.path.basename(zip_path)}")
+        
+        if delete_after:
+            os.remove(zip_path)
+            print(f"删除原压缩包: {os.path.basename(zip_path)}")
+        
+        return True
+    except Exception as e:
+        print(f"解压失败 {os.path.basename(zip_path)}: {e}")
+        return False
+
+def verify_image(image_path):
+    """验证图像是否损坏"""
+    try:
+        with Image.open(image_path) as img:
+            img.verify()
+        return True
+    except Exception as e:
+        print(f"图像损坏: {image_path} - {e}")
+        return False
+
+def main(argv=None):
+    # 解析命令行参数
+    parser = argparse.ArgumentParser(description='爬取ku1372网站相册')
+    parser.add_argument('--verify', action='store_true', help='启用已存在文件验证')
+    parser.add_argument('--max-workers', type=int, default=2, help='最大下载线程数')
+    parser.add_argument('--http2', action='store_true', help='启用 HTTP/2 多路复用传输（需安装 httpx[http2]）')
+    parser.add_argument('--preflight', action='store_true', help='下载前批量HEAD预检：剔除HTML错误页/过小的压缩包，估算总大小和剩余时间，检查磁盘空间')
+    parser.add_argument('--save-path', help=f'保存路径（指定后不再询问，默认：{DEFAULT_SAVE_PATH}）')
+    parser.add_argument('--no-extract', action='store_true', help='下载完成后不解压压缩包（不再询问）')
+    parser.add_argument('--no-prompt', action='store_true', help='不等待键盘输入，未指定的选项使用默认值：解压并删除原压缩包（后台或 crawl_all.py 运行）')
+    parser.add_argument('--listing-concurrency', type=int, default=FRONTIER_WORKERS, help='同时翻页的标签数（各标签的相册混合下载，重复的相册只下载一次）')
+    parser.add_argument('--no-resume', action='store_true', help='忽略上次中断时保存的翻页断点，所有标签从第一页重新开始')
+    parser.add_argument('--host-rate', type=float, default=0, help='站点请求速率上限（次/秒，0 表示不限制；--worker 时为所有 worker 合计）')
+    # 分布式爬取：协调端收集相册写入共享卷上的 SQLite 队列，多台机器上的 worker 领取下载
+    distributed = parser.add_mutually_exclusive_group()
+    distributed.add_argument('--coordinator', metavar='QUEUE_DB', help='只收集相册写入工作队列文件，不下载')
+    distributed.add_argument('--worker', metavar='QUEUE_DB', help='从工作队列文件领取相册下载，不爬取标签和列表页')
+    parser.add_argument('--worker-id', help='worker 标识（默认：主机名-进程号）')
+    args = parser.parse_args(argv)
+    
+    # 参数解析之后才创建控制台和会话，--help 不导入重量级依赖
+    global console, session, download_planner, host_rate
+    console = rich_console.Console()
+    session = create_session()
+    
+    # HTTP/2: 压缩包请求在少量连接上多路复用，服务器不支持时自动回退 HTTP/1.1
+    if args.http2:
+        mount_http2(session)
+    
+    # 下载预检：与下载结束后的文件大小检查使用相同的 1KB 下限
+    if args.preflight:
+        download_planner = DownloadPlanner(session, min_bytes=1024, headers=HEADERS)
+    disk_full = False
+    
+    # 获取保存路径（命令行已指定或不询问模式下不再输入）
+    save_path = args.save_path
+    if not save_path and not args.no_prompt:
+        save_path = input(f"请输入保存路径（默认：{DEFAULT_SAVE_PATH}）: ").strip()
+    if not save_path:
+        save_path = DEFAULT_SAVE_PATH
+    
+    # 创建保存目录
+    os.makedirs(save_path, exist_ok=True)
+    # 翻页断点：每页处理完记录各标签的下一页和未完成的相册，中断后从断点继续（worker 不翻页）；
+    # 上次中断时写了一半的压缩包在这里删除，不会被当作"本地已存在"跳过
+    checkpoint = None
+    if not args.worker:
+        checkpoint = FrontierCheckpoint(os.path.join(save_path, CHECKPOINT_NAME), resume=not args.no_resume)
+        if checkpoint.resumed:
+            console.print(f"[cyan]从上次中断处继续: {checkpoint.summary()}[/cyan]")
+    # 已完整下载的相册索引：上次运行在某个标签下载完成的相册，这次出现在其他标签时不再重复下载
+    completed_albums = None
+    if not args.worker:
+        completed_albums = SeenUrlIndex(os.path.join(save_path, COMPLETED_INDEX_NAME))
+    # 标签目录快照：每个目录只 scandir 一次，判断 zip 是否已存在时查内存，不再逐个 stat
+    dir_snapshot = DirSnapshot()
+    
+    # 工作队列：协调端写入相册，worker 领取相册并共享站点限速
+    work_queue = None
+    if args.coordinator or args.worker:
+        work_queue = WorkQueue(args.coordinator or args.worker, worker_id=args.worker_id)
+    if args.worker:
+        share_host_limits(work_queue)
+    host_rate = args.host_rate
+    
+    # 询问解压选项（在下载开始之前，协调端不下载也不解压）
+    should_extract = not args.no_extract and not args.coordinator
+    delete_after = False
+    if should_extract and args.no_prompt:
+        delete_after = True
+    elif should_extract:
+        console.print("\n=== 解压选项设置 ===")
+        extract_choice = input("全站下载完成后是否解压压缩包？(y/n，默认y): ").strip().lower()
+        should_extract = extract_choice in ['y', '']
+        
+        if should_extract:
+            delete_choice = input("解压完成后是否删除原压缩包？(y/n，默认y): ").strip().lower()
+            delete_after = delete_choice in ['y', '']
+    
+    # 获取所有标签（worker 从工作队列领取相册，不爬取标签）
+    tags = []
+    if not args.worker:
+        tags = get_tags()
+        if not tags:
+            console.print("[red]获取标签失败，程序退出[/red]")
+            return
+        
+        console.print(f"\n[bold cyan]共找到 {len(tags)} 个标签[/bold cyan]")
+    if args.coordinator:
+        work_queue.mark_discovery_done(False)
+    
+    # 开始下载，使用Live显示动态表格和统计信息
+    total_success = 0
+    worker_tags = set()  # worker 下载过的标签（用于解压）
+    
+    # 创建Live上下文，一开始就显示统计信息和表格
+    with rich_live.Live(None, refresh_per_second=2, console=console) as live:
+        # 定义内容渲染函数
+        def render_content():
+            """渲染统计信息和表格"""
+            from rich.console import Group
+            
+            # 获取统计信息和表格
+            table = create_status_table()
+            
+            # 使用Group来组合多个Renderable对象
+            group = Group(
+                get_stats_text(),
+                "",
+                table
+            )
+            
+            return group
+        
+        # 定义线程安全的成功计数器
+        thread_success_count = 0
+        
+        # 定义一个内部函数来下载相册，这样可以访问render_content
+        def download_album_wrapper(album, tag_dir, verify=False, tag_name=""):
+            nonlocal thread_success_count
+            album_name = album['name']
+            album_url = album['url']
+            
+            # 清理文件名
+            safe_name = re.sub(r'[\\/:*?"<>|]', '_', album_name)
+            save_path = os.path.join(tag_dir, f"{safe_name}.zip")
+            
+            # 如果文件已存在，根据verify参数决定是否验证
+            if dir_snapshot.exists(save_path):
+                if verify:
+                    update_download_status(album_name, "正在下载", 0, tag_name)
+                    live.update(render_content())
+                    console.print(f"[yellow]验证已存在文件: {safe_name}[/yellow]")
+                    # 简单验证文件大小，大于1KB认为有效
+                    if (dir_snapshot.size(save_path) or 0) > 1024:
+                        update_download_status(album_name, "跳过，本地已存在", 100, tag_name)
+                        live.update(render_content())
+                        return True
+                    else:
+                        console.print(f"[orange]文件已存在但无效，重新下载: {safe_name}[/orange]")
+                        os.remove(save_path)
+                        dir_snapshot.discard(save_path)
+                else:
+                    update_download_status(album_name, "跳过，本地已存在", 100, tag_name)
+                    live.update(render_content())
+                    console.print(f"[green]跳过，本地已存在: {safe_name}[/green]")
+                    return True
+            
+            blocked = transfer_blocked()
+            if blocked:
+                update_download_status(album_name, "停止下载", 0, tag_name)
+                live.update(render_content())
+                console.print(f"[red]停止下载（{blocked}）: {album_name}[/red]")
+                return False
+            
+            # 重试机制，最多重试5次
+            retry_count = 0
+            max_retries = 5
+            
+            while retry_count < max_retries:
+                try:
+                    # 获取下载链接（预检时已获取的链接只在第一次尝试时使用，重试时重新获取）
+                    download_url = album.get('download_url') if retry_count == 0 else None
+                    download_url = download_url or get_download_link(album_url)
+                    if not download_url:
+                        update_download_status(album_name, "下载完成", 0, tag_name)
+                        live.update(render_content())
+                        console.print(f"[red]获取下载链接失败: {album_name}[/red]")
+                        return False
+                    
+                    # 添加专辑详情页请求延迟
+                    delay = random.randint(2, 4)
+                    console.print(f"[blue]等待 {delay} 秒后下载: {album_name}[/blue]")
+                    time.sleep(delay)
+                    
+                    update_download_status(album_name, "正在下载", 0, tag_name)
+                    live.update(render_content())
+                    console.print(f"[green]正在下载: {album_name} (尝试 {retry_count+1}/{max_retries})[/green]")
+                    
+                    # 添加超时重试机制
+                    host_limiter(download_url, host_rate).acquire()
+                    response = session.get(download_url, headers=HEADERS, stream=True, timeout=60)
+                    response.raise_for_status()  # 检查HTTP状态码
+                    
+                    total_size = int(response.headers.get('content-length', 0))
+                    console.print(f"[cyan]文件大小: {total_size / 1024 / 1024:.2f} MB[/cyan]")
+                    
+                    start_time = time.time()
+                    last_update_time = start_time
+                    
+                    def report_progress(downloaded_size):
+                        """每写盘一块（1MB）回调一次，每秒更新一次状态和表格"""
+                        nonlocal last_update_time
+                        current_time = time.time()
+                        if current_time - last_update_time >= 1.0 and total_size > 0:
+                            progress = (downloaded_size / total_size) * 100
+                            speed_kbps = (downloaded_size / (current_time - start_time)) / 1024
+                            update_download_status(album_name, "正在下载", progress, tag_name, speed_kbps)
+                            live.update(render_content())
+                            last_update_time = current_time
+                    
+                    # 响应体读入复用的大缓冲区后整块写盘（多站点同时运行时按共享带宽预算限速），
+                    # 写入期间记入断点，中断后重启时删除不完整的压缩包
+                    with checkpoint.writing(save_path) if checkpoint is not None else nullcontext():
+                        result = download_to_file(response, save_path, site=SITE_NAME, on_progress=report_progress)
+                    downloaded_size = result.size
+                    
+                    # 下载完成后更新最终状态
+                    final_time = time.time()
+                    total_elapsed = final_time - start_time
+                    if total_elapsed > 0:
+                        avg_speed_kbps = (downloaded_size / total_elapsed) / 1024
+                        console.print(f"[cyan]平均下载速度: {avg_speed_kbps:.2f} KB/s[/cyan]")
+                    
+                    # 验证下载内容是否为HTML错误页（开头512字节在写盘时已保留，无需重新读文件）
+                    content = result.head
+                    if b'<!DOCTYPE html>' in content or b'<html>' in content or b'<head>' in content:
+                        update_download_status(album_name, "等待下载", 0, tag_name)
+                        live.update(render_content())
+                        console.print(f"[red]下载失败，返回HTML错误页: {album_name}[/red]")
+                        os.remove(save_path)
+                        retry_count += 1
+                        # 重试前延迟
+                        time.sleep(random.randint(4, 8))
+                        continue
+                    
+                    # 验证文件大小
+                    final_size = downloaded_size
+                    console.print(f"[cyan]实际下载大小: {final_size / 1024 / 1024:.2f} MB[/cyan]")
+                    
+                    if final_size < 1024:
+                        update_download_status(album_name, "等待下载", 0, tag_name)
+                        live.update(render_content())
+                        console.print(f"[red]下载失败，文件太小 ({final_size} bytes): {album_name}[/red]")
+                        os.remove(save_path)
+                        retry_count += 1
+                        # 重试前延迟
+                        time.sleep(random.randint(4, 8))
+                        continue
+                    
+                    # 验证文件完整性（简单检查）
+                    if total_size > 0 and abs(final_size - total_size) > 1024:
+                        update_download_status(album_name, "等待下载", 0, tag_name)
+                        live.update(render_content())
+                        console.print(f"[red]下载失败，文件大小不匹配 (预期: {total_size}, 实际: {final_size}): {album_name}[/red]")
+                        os.remove(save_path)
+                        retry_count += 1
+                        # 重试前延迟
+                        time.sleep(random.randint(4, 8))
+                        continue
+                    
+                    update_download_status(album_name, "下载完成", 100, tag_name)
+                    live.update(render_content())
+                    console.print(f"[green]✓ 下载成功: {album_name}[/green]")
+                    thread_success_count += 1
+                    dir_snapshot.add(save_path, final_size)
+                    if download_planner is not None:
+                        download_planner.record(album.get('download_url', download_url), final_size)
+                    return True
+                except requests.exceptions.RequestException as e:
+                    update_download_status(album_name, "等待下载", 0, tag_name)
+                    live.update(render_content())
+                    console.print(f"[red]网络请求失败 (尝试 {retry_count+1}/{max_retries}): {e}[/red]")
+                    retry_count += 1
+                    if os.path.exists(save_path):
+                        os.remove(save_path)
+                        dir_snapshot.discard(save_path)
+                    # 重试前延迟
+                    time.sleep(random.randint(4, 8))
+                except Exception as e:
+                    update_download_status(album_name, "等待下载", 0, tag_name)
+                    live.update(render_content())
+                    console.print(f"[red]下载专辑 {album_name} 失败 (尝试 {retry_count+1}/{max_retries}): {e}[/red]")
+                    retry_count += 1
+                    if os.path.exists(save_path):
+                        os.remove(save_path)
+                        dir_snapshot.discard(save_path)
+                    # 重试前延迟
+                    time.sleep(random.randint(4, 8))
+            
+            # 5次重试失败后，继续执行
+            if download_planner is not None and album.get('download_url'):
+                download_planner.record(album['download_url'])
+            update_download_status(album_name, "下载完成", 0, tag_name)
+            live.update(render_content())
+            console.print(f"[red]✗ 专辑 {album_name} 下载失败，已重试5次[/red]")
+            return False
+        
+        # 初始化Live显示
+        live.update(render_content())
+        
+        # worker：从工作队列领取相册下载，直到协调端收集完成且队列中没有未完成的相册
+        if args.worker:
+            def finish_work(item, future):
+                global processed_albums_count
+                try:
+                    ok = future.result()
+                except Exception as e:
+                    console.print(f"[red]处理相册 {item.title} 时发生异常: {e}[/red]")
+                    ok = False
+                # 失败的相册重新排队，由任意 worker 再次领取
+                work_queue.complete(item.url, ok=bool(ok))
+                processed_albums_count += 1
+                live.update(render_content())
+            
+            console.print(f"[green]worker {work_queue.worker_id} 从工作队列领取相册，使用 {args.max_workers} 个线程下载[/green]")
+            with ThreadPoolExecutor(max_workers=args.max_workers) as executor:
+                def submit_work(item):
+                    global total_albums_count
+                    tag_name = item.payload.get('tag', '')
+                    tag_dir = os.path.join(save_path, tag_name)
+                    os.makedirs(tag_dir, exist_ok=True)
+                    worker_tags.add(tag_name)
+                    total_albums_count += 1
+                    update_download_status(item.title, "等待下载", 0, tag_name)
+                    live.update(render_content())
+                    future = executor.submit(download_album_wrapper, {'name': item.title, 'url': item.url}, tag_dir,
+                                             verify=args.verify, tag_name=tag_name)
+                    future.add_done_callback(lambda f: finish_work(item, f))
+                
+                drain_work_queue(work_queue, submit_work, max_held=args.max_workers * 2)
+            total_success += thread_success_count
+        # 全站发现队列：多个标签同时向前翻页，各标签的相册轮流交给同一个下载线程池，
+        # 下载池在标签和分页边界上不再排空；出现在多个标签下的相册只下载一次（保存到第一个发现它的标签目录）
+        if tags:
+            # 标签 -> 当前页码（每个标签同一时刻只有一个线程在翻页），从断点继续时接着记录的页码
+            tag_pages = {}
+            for tag in tags:
+                position = checkpoint.position(tag['name'])
+                if position is not None:
+                    tag_pages[tag['name']] = position[1]
+            
+            def fetch_tag_page(tag_name, current_url):
+                """请求并解析标签的一个列表页，返回 (本页相册, 下一页URL)；失败时返回 None 结束该标签"""
+                nonlocal disk_full
+                if disk_full:
+                    return None
+                page = tag_pages.get(tag_name, 0) + 1
+                tag_pages[tag_name] = page
+                tag_dir = os.path.join(save_path, tag_name)
+                os.makedirs(tag_dir, exist_ok=True)
+                console.print(f"[yellow]{tag_name}: 正在爬取第 {page} 页相册...[/yellow]")
+                
+                soup = get_soup(current_url)
+                if not soup:
+                    console.print(f"[red]{tag_name}: 爬取第 {page} 页失败[/red]")
+                    return None
+                
+                # 查找相册列表
+                list_div = soup.find('div', class_='m-list')
+                li_list = list_div.find_all('li') if list_div else []
+                if not li_list:
+                    console.print(f"[red]{tag_name}: 第 {page} 页未找到相册[/red]")
+                    return None
+                
+                current_page_albums = []
+                for li in li_list:
+                    a_tag = li.find('a')
+                    if a_tag:
+                        album_name = a_tag.get('title', '').strip()
+                        if album_name:
+                            current_page_albums.append({'name': album_name, 'url': a_tag.get('href')})
+                console.print(f"[green]{tag_name}: 第 {page} 页找到 {len(current_page_albums)} 个相册[/green]")
+                # 以前的运行中已完整下载的相册不再预检（发现队列同样会跳过）
+                current_page_albums = [album for album in current_page_albums if album['url'] not in completed_albums]
+                
+                # 预检：剔除无效压缩包、按大小排序，并在下载前确认磁盘空间足够
+                if download_planner is not None and not args.coordinator:
+                    current_page_albums, _ = preflight_albums(current_page_albums, tag_dir, tag_name, download_planner, dir_snapshot)
+                    console.print(f"[cyan]下载计划: {download_planner.summary()}[/cyan]")
+                    shortfall = download_planner.disk_shortfall(save_path)
+                    if shortfall:
+                        console.print(f"[red]磁盘空间不足（还差 {shortfall / 1024 / 1024:.1f} MB），停止下载[/red]")
+                        disk_full = True
+                        return None
+                
+                # 检查是否有下一页，页码链接按 list_{tag_id}_{page}.html 构建
+                next_url = None
+                page_div = soup.find('div', class_='page')
+                if page_div and any(a.text.strip() in ['下一页', 'ÏÂÒ»Ò³', 'Next', 'next'] or '下一页' in a.text
+                                    for a in page_div.find_all('a')):
+                    tag_id_match = re.search(r'/b/(\d+)/?', tags_by_name[tag_name])
+                    if tag_id_match:
+                        tag_url = tags_by_name[tag_name].rstrip('/')
+                        next_url = f"{tag_url}/list_{tag_id_match.group(1)}_{page + 1}.html"
+                    else:
+                        console.print(f"[red]{tag_name}: 无法提取tag_id，结束该标签爬取[/red]")
+                else:
+                    console.print(f"[bold magenta]=== 标签 {tag_name} 翻页完成（共 {page} 页） ===[/bold magenta]")
+                return [(album['url'], album['name'], album.get('download_url')) for album in current_page_albums], next_url
+            
+            def on_page_albums(tag_name, items):
+                """每页去重后：相册加入状态表；协调端写入工作队列，由 worker 下载"""
+                global total_albums_count
+                total_albums_count += len(items)
+                status = "已写入队列" if args.coordinator else "等待下载"
+                for item in items:
+                    update_download_status(item.title, status, 0, tag_name)
+                if args.coordinator:
+                    added = work_queue.add((item.url, item.title, {'tag': tag_name}) for item in items)
+                    console.print(f"[cyan]写入工作队列 {added} 个相册（其余已在队列中）[/cyan]")
+                live.update(render_content())
+            
+            tags_by_name = {tag['name']: tag['url'] for tag in tags}
+            frontier = CrawlFrontier(
+                [(tag['name'], tag['url']) for tag in tags], fetch_tag_page,
+                workers=args.listing_concurrency, max_pending=args.max_workers * 20,
+                page_delay=lambda: random.randint(4, 8),  # 同一标签的页面爬取间隔
+                on_albums=on_page_albums, checkpoint=checkpoint,
+                skip=lambda url: url in completed_albums
+            )
+            console.print(f"[green]{args.listing_concurrency} 个标签同时翻页，使用 {args.max_workers} 个线程下载[/green]")
+            
+            if args.coordinator:
+                # 协调端只收集相册，相册在翻页线程中已写入工作队列；断点中恢复的相册补写一次（已在队列中的不重复写入）
+                try:
+                    for item in frontier:
+                        work_queue.add([(item.url, item.title, {'tag': item.source})])
+                        checkpoint.done(item.url)
+                finally:
+                    frontier.close()  # 中断 (Ctrl+C 或异常) 时停止翻页
+            else:
+                thread_success_count = 0
+                # 线程池中最多排队 2 倍线程数的相册，其余留在发现队列中，保持各标签轮流下载
+                slots = threading.BoundedSemaphore(args.max_workers * 2)
+                
+                def finish_album(album, future):
+                    global processed_albums_count
+                    slots.release()
+                    try:
+                        if future.result():  # 获取结果，捕获异常
+                            completed_albums.add(album['url'])
+                            checkpoint.done(album['url'])  # 失败的相册留在断点中，下次运行重试
+                    except Exception as e:
+                        console.print(f"[red]处理相册 {album['name']} 时发生异常: {e}[/red]")
+                    processed_albums_count += 1
+                    live.update(render_content())
+                
+                with ThreadPoolExecutor(max_workers=args.max_workers) as executor:
+                    try:
+                        for item in frontier:
+                            if disk_full:
+                                break
+                            # 多站点同时运行时共享的磁盘预算用完后不再开始新的下载
+                            blocked = transfer_blocked()
+                            if blocked:
+                                console.print(f"[red]停止下载：{blocked}[/red]")
+                                break
+                            slots.acquire()
+                            album = {'name': item.title, 'url': item.url}
+                            if item.payload:
+                                album['download_url'] = item.payload  # 预检时已获取的下载链接
+                            tag_dir = os.path.join(save_path, item.source)
+                            future = executor.submit(download_album_wrapper, album, tag_dir, verify=args.verify, tag_name=item.source)
+                            future.add_done_callback(lambda f, album=album: finish_album(album, f))
+                    finally:
+                        frontier.close()  # 提前停止 (磁盘已满、预算用完、Ctrl+C 或异常) 时停止翻页，不再等待翻页线程
+                
+                # 更新总成功数
+                total_success += thread_success_count
+            console.print(f"[cyan]发现队列: {frontier.summary()}[/cyan]")
+            # 磁盘空间不足或预算用完而提前停止时保留断点，下次从停下的地方继续
+            if disk_full or transfer_blocked() or not checkpoint.finish():
+                console.print(f"[yellow]翻页断点已保存（{checkpoint.summary()}），下次运行从断点继续[/yellow]")
+    if completed_albums is not None:
+        completed_albums.close()
+        
+    # 执行解压操作（如果用户选择了解压）
+    if should_extract:
+        console.print("\n[bold blue]=== 开始解压压缩包 ===[/bold blue]")
+        # 遍历所有标签目录（worker 为本机下载过的标签）
+        for tag_name in [tag['name'] for tag in tags] + sorted(worker_tags):
+            tag_dir = os.path.join(save_path, tag_name)
+            if os.path.exists(tag_dir):
+                for file in os.listdir(tag_dir):
+                    if file.endswith('.zip'):
+                        zip_path = os.path.join(tag_dir, file)
+                        extract_zip(zip_path, tag_dir, delete_after)
+    
+    if work_queue is not None:
+        if args.coordinator:
+            work_queue.mark_discovery_done()
+        console.print(f"[cyan]工作队列状态: {work_queue.counts()}[/cyan]")
+        work_queue.close()
+    
+    # 总结数据
+    console.print(f"\n[bold green]=== 下载完成 ===[/bold green]")
+    console.print(f"[cyan]总标签数: {len(tags) or len(worker_tags)}[/cyan]")
+    console.print(f"[green]总成功下载数: {total_success}[/green]")
+    console.print(f"[yellow]总处理相册数: {processed_albums_count}[/yellow]")
+
+if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,359 +1,531 @@
-# -*- coding: utf-8 -*-
-""" 美图色色爬虫 双平台通用版（手机Termux+Windows电脑）| 顺序下载 | 40KB过滤 """
-import os
-import re
-import time
-import random
-import sys
-import requests
-import argparse
-import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from bs4 import BeautifulSoup
-from PIL import Image
-from io import BytesIO
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-
-# -------- 日志设置（双平台兼容：终端+文件） --------
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("美图色色_crawler.log", encoding="utf-8"),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
-logger = logging.getLogger(__name__)
-
-# -------- 跨平台核心配置 --------
-IS_MOBILE = os.path.exists("/sdcard/Download")  # 自动识别手机/Windows
-# 跨平台默认保存路径
-DEFAULT_SAVE_DIR_MOBILE = "/sdcard/Download/美图色色"
-DEFAULT_SAVE_DIR_WIN = r"C:\爬取结果\美图色色"
-MIN_IMAGE_SIZE = 40 * 1024  # 40KB过滤
-
-class MeituSpider:
-    def __init__(self, save_path, verify=False, page_sleep=5, album_sleep=3):
-        self.save_path = save_path
-        self.verify = verify
-        self.page_sleep = page_sleep
-        self.album_sleep = album_sleep
-        self.session = self._init_session()
-        self.base_url = "https://xn--drdgbhrb-xx6n10qjm3s.tljkd-01.sbs"
-        self.user_agents = [
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.212 Safari/537.36",
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/89.0.4389.114 Safari/537.36"
-        ]
-        self.failed_images = []
-        self.failed_albums = []
-        self.processed_album_urls = set()  # 记录已处理专辑，避免重复
-
-    def _init_session(self):
-        session = requests.Session()
-        retry = Retry(
-            total=3,
-            backoff_factor=1,
-            status_forcelist=[429, 500, 502, 503, 504]
-        )
-        adapter = HTTPAdapter(max_retries=retry, pool_connections=100, pool_maxsize=100)
-        session.mount("http://", adapter)
-        session.mount("https://", adapter)
-        return session
-
-    def _get_random_user_agent(self):
-        return random.choice(self.user_agents)
-
-    def _get_response(self, url, retries=5):
-        headers = {
-            "User-Agent": self._get_random_user_agent(),
-            "Referer": self.base_url,
-            "Accept-Language": "zh-CN,zh;q=0.9"
-        }
-        
-        for i in range(retries):
-            start_time = time.time()
-            try:
-                response = self.session.get(url, headers=headers, timeout=30)
-                response.raise_for_status()
-                request_time = time.time() - start_time
-                logger.info(f"[请求] {url} 成功，耗时 {request_time:.2f}秒")
-                
-                delay = random.uniform(2, 4)
-                time.sleep(delay)
-                return response
-            except Exception as e:
-                request_time = time.time() - start_time
-                if i < retries - 1:
-                    delay = random.uniform(4, 8)
-                    logger.warning(f"[请求] {url} 失败，{i+1}/{retries} 重试，{delay:.2f}秒后重试: {e}")
-                    time.sleep(delay)
-                else:
-                    logger.error(f"[请求] {url} 失败，{retries} 次重试后仍失败: {e}")
-                    return None
-
-    def _parse_albums(self, url):
-        """解析单页相册列表，返回本页所有专辑"""
-        response = self._get_response(url)
-        if not response:
-            logger.error(f"[解析] 请求失败，无法解析页面: {url}")
-            return [], None
-        
-        try:
-            soup = BeautifulSoup(response.text, "html.parser")
-            albums = []
-            album_elements = soup.select(".videos-list-wrap .video-item-col")
-            logger.info(f"[解析] 本页找到 {len(album_elements)} 个相册元素")
-            
-            for i, album in enumerate(album_elements):
-                try:
-                    album_url = album.get("href")
-                    album_title = album.select_one(".video-desc-content").text.strip() if album.select_one(".video-desc-content") else f"未知专辑_{i+1}"
-                    # 跨平台过滤专辑名特殊字符
-                    album_title = re.sub(r'[\\/:*?"<>|+@#$%^&*(){}[]]', "_", album_title)
-                    if album_url and album_title not in ["/", ""]:
-                        full_url = f"{self.base_url}{album_url}" if not album_url.startswith("http") else album_url
-                        albums.append((album_title, full_url))
-                        logger.debug(f"[解析] 解析到相册: {album_title} - {full_url}")
-                except Exception as e:
-                    logger.error(f"[解析] 解析相册元素失败: {e}")
-            
-            # 解析下一页
-            next_page = None
-            next_page_element = soup.select_one(".mo-paging .paging-item--next")
-            if next_page_element and next_page_element.get("href"):
-                next_page = f"{self.base_url}{next_page_element.get('href')}" if not next_page_element.get("href").startswith("http") else next_page_element.get("href")
-            return albums, next_page
-        except Exception as e:
-            logger.error(f"[解析] 解析页面失败: {url}, 错误: {e}")
-            return [], None
-
-    def _parse_album_images(self, album_url):
-        logger.info(f"[解析] 开始解析相册图片: {album_url}")
-        response = self._get_response(album_url)
-        if not response:
-            return []
-        
-        soup = BeautifulSoup(response.text, "html.parser")
-        book_pages = soup.select_one("#book-pages")
-        if not book_pages:
-            logger.error(f"[解析] 未找到相册图片容器: {album_url}")
-            return []
-        
-        screenshots = book_pages.get("data-screenshots", "")
-        if not screenshots:
-            logger.error(f"[解析] 未找到相册图片URL: {album_url}")
-            return []
-        
-        images = []
-        for img_url in screenshots.split("#$"):
-            img_url = img_url.strip().lstrip('$')
-            if img_url and img_url.startswith("http"):
-                images.append(img_url)
-        logger.info(f"[解析] 从相册提取到 {len(images)} 张图片")
-        return images
-
-    def _validate_image(self, image_path):
-        try:
-            with Image.open(image_path) as img:
-                img.verify()
-            return True
-        except Exception:
-            return False
-
-    def _download_image(self, img_url, save_path):
-        if os.path.exists(save_path):
-            logger.info(f"[下载] 图片已存在，跳过: {save_path}")
-            return True
-        
-        logger.info(f"[下载] 开始下载: {img_url}")
-        response = self._get_response(img_url)
-        if response is None:
-            self.failed_images.append((img_url, save_path))
-            return False
-        
-        # 过滤非图片/过小文件
-        content_type = response.headers.get("Content-Type", "")
-        file_size = len(response.content)
-        if not content_type.startswith("image/"):
-            logger.error(f"[下载] 非图片内容，丢弃: {img_url}")
-            self.failed_images.append((img_url, save_path))
-            return False
-        if file_size < MIN_IMAGE_SIZE:  # 40KB过滤
-            logger.error(f"[下载] 文件过小({file_size}字节)，丢弃: {img_url}")
-            self.failed_images.append((img_url, save_path))
-            return False
-        
-        # 原子化写入（跨平台目录兼容）
-        save_dir = os.path.dirname(save_path)
-        os.makedirs(save_dir, exist_ok=True)
-        temp_path = f"{save_path}.tmp"
-        try:
-            with open(temp_path, "wb") as f:
-                f.write(response.content)
-        except Exception as e:
-            logger.error(f"[下载] 写入失败: {e}")
-            self.failed_images.append((img_url, save_path))
-            return False
-        
-        # 图片验证
-        if self.verify:
-            if not self._validate_image(temp_path):
-                logger.error(f"[下载] 图片损坏，丢弃: {img_url}")
-                os.remove(temp_path)
-                self.failed_images.append((img_url, save_path))
-                return False
-        
-        # 重命名完成下载
-        try:
-            os.rename(temp_path, save_path)
-            logger.info(f"[下载] 成功保存: {save_path}")
-            return True
-        except Exception as e:
-            logger.error(f"[下载] 重命名失败: {e}")
-            os.remove(temp_path)
-            self.failed_images.append((img_url, save_path))
-            return False
-
-    def _download_album(self, album_info, album_index, total_album):
-        """下载单个专辑"""
-        album_title, album_url = album_info
-        if album_url in self.processed_album_urls:
-            logger.info(f"[专辑 {album_index}/{total_album}] 已处理，跳过: {album_title}")
-            return True
-        self.processed_album_urls.add(album_url)
-        
-        logger.info(f"\n[专辑 {album_index}/{total_album}] 开始处理: {album_title}")
-        # 清洗专辑名，跨平台路径兼容
-        safe_title = re.sub(r'[<>"/\\|?*:]', "_", album_title)[:50] if album_title else f"专辑_{album_index}"
-        album_dir = os.path.join(self.save_path, safe_title)
-        os.makedirs(album_dir, exist_ok=True)
-        
-        # 解析图片并下载
-        images = self._parse_album_images(album_url)
-        if not images:
-            logger.error(f"[专辑 {album_index}/{total_album}] 无图片，加入失败列表")
-            self.failed_albums.append(album_info)
-            return False
-        
-        # 单专辑内并发下载图片（低并发防反爬）
-        image_failures = 0
-        with ThreadPoolExecutor(max_workers=8) as executor:
-            futures = []
-            for img_index, img_url in enumerate(images):
-                img_name = f"{img_index+1:03d}.jpg"
-                img_path = os.path.join(album_dir, img_name)
-                futures.append(executor.submit(self._download_image, img_url, img_path))
-            
-            for future in as_completed(futures):
-                if not future.result():
-                    image_failures += 1
-        
-        logger.info(f"[专辑 {album_index}/{total_album}] 处理完成: 成功{len(images)-image_failures}张 | 失败{image_failures}张")
-        time.sleep(self.album_sleep)  # 专辑间延迟，反爬
-        return True
-
-    def _retry_failed(self):
-        """重试失败的图片和专辑"""
-        total_failed = len(self.failed_albums) + len(self.failed_images)
-        if total_failed == 0:
-            return
-        logger.info(f"\n[重试] 开始处理失败项: 专辑{len(self.failed_albums)}个 | 图片{len(self.failed_images)}张")
-        # 重试专辑
-        for idx, album in enumerate(self.failed_albums, 1):
-            self._download_album(album, idx, len(self.failed_albums))
-        # 重试图片
-        success = 0
-        for img_url, save_path in self.failed_images:
-            if self._download_image(img_url, save_path):
-                success += 1
-        logger.info(f"[重试] 完成: 图片成功{success}/{len(self.failed_images)}张")
-
-    def run(self):
-        """主运行逻辑：顺序爬取+下载"""
-        start_total_time = time.time()
-        logger.info("="*50)
-        logger.info(f"📱 运行平台：{'手机Termux' if IS_MOBILE else 'Windows电脑'}")
-        logger.info("[主程序] 美图色色爬虫 - 双平台通用版")
-        logger.info(f"[主程序] 保存路径: {self.save_path}")
-        logger.info(f"[主程序] 图片验证: {self.verify} | 列表页延迟: {self.page_sleep}s")
-        logger.info(f"[主程序] 过滤规则: 小于40KB文件自动丢弃")
-        logger.info("="*50)
-        os.makedirs(self.save_path, exist_ok=True)
-
-        # 初始化爬取参数
-        current_url = "https://xn--drdgbhrb-xx6n10qjm3s.tljkd-01.sbs/t/13/"
-        page = 1
-        processed_pages = set()
-        total_album_count = 0  # 累计总专辑数
-
-        # 核心：循环爬取列表页 → 逐个处理本页专辑 → 爬取下一页
-        while current_url and current_url not in processed_pages:
-            processed_pages.add(current_url)
-            logger.info(f"\n[列表页] 开始爬取第 {page} 页: {current_url}")
-            # 解析本页所有专辑
-            page_albums, next_page = self._parse_albums(current_url)
-            if not page_albums:
-                logger.warning(f"[列表页] 第{page}页无专辑，跳至下一页")
-                current_url = next_page
-                page += 1
-                time.sleep(self.page_sleep)
-                continue
-            
-            # 顺序处理本页每个专辑：获取一个，下载一个
-            total_album_count += len(page_albums)
-            for idx, album in enumerate(page_albums, 1):
-                self._download_album(album, total_album_count - len(page_albums) + idx, total_album_count)
-            
-            # 跳至下一页
-            if next_page and next_page not in processed_pages:
-                logger.info(f"[列表页] 第{page}页处理完成，跳至下一页")
-                current_url = next_page
-                page += 1
-                time.sleep(self.page_sleep)
-            else:
-                logger.info(f"[列表页] 已爬取所有页面（共{page}页）")
-                current_url = None
-
-        # 重试失败项
-        self._retry_failed()
-
-        # 最终统计
-        total_time = time.time() - start_total_time
-        logger.info("\n" + "="*50)
-        logger.info("[主程序] 爬取完成！")
-        logger.info(f"[主程序] 总耗时: {total_time/60:.1f}分钟 | 处理专辑: {total_album_count}个")
-        logger.info(f"[主程序] 失败项: 专辑{len(self.failed_albums)}个 | 图片{len(self.failed_images)}张")
-        logger.info(f"[主程序] 图片保存路径: {self.save_path}")
-        if IS_MOBILE:
-            logger.info("📱 手机查找：内部存储 → Download → 美图色色")
-        else:
-            logger.info("💻 Windows查找：此电脑 → C盘 → 爬取结果 → 美图色色")
-        logger.info("="*50)
-
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="美图色色爬虫-双平台通用版（手机Termux+Windows）")
-    parser.add_argument("--page-sleep", type=float, default=5, help="列表页翻页延迟(秒)，默认5")
-    parser.add_argument("--album-sleep", type=float, default=3, help="专辑间下载延迟(秒)，默认3")
-    parser.add_argument("--no-verify", action="store_true", help="关闭图片验证，加快下载速度")
-    parser.add_argument("--test", action="store_true", help="测试模式：使用默认路径，无需输入")
-    parser.add_argument("--save-dir", type=str, default="", help="自定义保存路径（如/sdcard/Download/xxx 或 C:/xxx）")
-    args = parser.parse_args()
-
-    # 配置保存路径
-    if args.save_dir:
-        save_path = args.save_dir
-    else:
-        save_path = DEFAULT_SAVE_DIR_MOBILE if IS_MOBILE else DEFAULT_SAVE_DIR_WIN
-    # 图片验证开关
-    verify = not args.no_verify
-
-    # 启动爬虫
-    spider = MeituSpider(
-        save_path=save_path,
-        verify=verify,
-        page_sleep=args.page_sleep,
-        album_sleep=args.album_sleep
-    )
-    spider.run()
+# -*- coding: utf-8 -*-
+""" 美图色色爬虫 双平台通用版（手机Termux+Windows电脑）| 顺序解析+全局下载池 | 列表页预取 | 40KB/分辨率预筛 | 可选打包输出 | 依赖库按需导入 | 可选时间核算 | 后台线程写日志 | 多镜像自动切换 """
+from __future__ import annotations
+
+import os
+import re
+import time
+import random
+import sys
+import argparse
+import logging
+from io import BytesIO
+from crawler_common import (
+    SeenUrlIndex, SharedImagePool, MemoryBudget, ArchiveStore, DirSnapshot, mount_http2, wait_for_downstream,
+    screen_image_response, parse_resolution, lazy_import, metered_chunks, transfer_blocked,
+    TimeAccount, install_time_account, account_http, timed, timed_get, install_async_logging, log_event,
+    ListingPrefetcher, LISTING_LOOKAHEAD, MirrorSet, MIRROR_PROBE_TIMEOUT,
+)
+
+# 重量级依赖第一次使用时才导入（--help 等模式在手机上秒开）
+requests = lazy_import("requests")
+urllib3 = lazy_import("urllib3")
+bs4 = lazy_import("bs4")
+Image = lazy_import("PIL.Image")
+
+# -------- 日志设置（双平台兼容：终端+文件） --------
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler("美图色色_crawler.log", encoding="utf-8"),
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# -------- 跨平台核心配置 --------
+IS_MOBILE = os.path.exists("/sdcard/Download")  # 自动识别手机/Windows
+# 跨平台默认保存路径
+DEFAULT_SAVE_DIR_MOBILE = "/sdcard/Download/美图色色"
+DEFAULT_SAVE_DIR_WIN = r"C:\爬取结果\美图色色"
+SITE_NAME = "美图色色"  # 多站点同时运行（crawl_all.py）时的统计名称
+MIN_IMAGE_SIZE = 40 * 1024  # 40KB过滤
+MIN_RESOLUTION = None  # 分辨率下限 (宽, 高)，如 (800, 600)；None 为不限制
+IMAGE_WORKERS = 8  # 全局图片下载线程数（所有专辑共享）
+MEMORY_BUDGET_MB = 64 if IS_MOBILE else 256  # 在途图片数据内存上限，手机端调低防止被系统杀进程
+# 镜像域名（--mirror 追加），请求发往其中最快的可用镜像
+MIRRORS = ["https://xn--drdgbhrb-xx6n10qjm3s.tljkd-01.sbs"]
+# 记录URL用的固定域名：已完成索引等统一按此记录，与 MIRRORS 分开配置，站点换域名时不要修改，否则已下载的专辑会重新下载
+CANONICAL_BASE = "https://xn--drdgbhrb-xx6n10qjm3s.tljkd-01.sbs"
+LISTING_PATH = "/t/13/"  # 爬取的列表页路径，也用于镜像健康探测
+
+class MeituSpider:
+    def __init__(self, save_path, verify=False, page_sleep=5, album_sleep=3, http2=False, memory_mb=MEMORY_BUDGET_MB, pack=False, min_resolution=MIN_RESOLUTION, time_report=False, prefetch=True, mirrors=None):
+        self.save_path = save_path
+        self.verify = verify
+        self.page_sleep = page_sleep
+        # 列表页预取：处理本页专辑时后台请求下一页；关闭时处理完本页才请求下一页
+        self.listing_lookahead = LISTING_LOOKAHEAD if prefetch else 0
+        self.album_sleep = album_sleep
+        self.session = self._init_session(http2)
+        self.user_agents = [
+            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.212 Safari/537.36",
+            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/89.0.4389.114 Safari/537.36"
+        ]
+        # 镜像切换：后台探测各镜像的延迟和成功率，请求发往最快的可用镜像；探测不走重试，失效域名很快被识别
+        self.probe_session = requests.Session()
+        self.mirrors = MirrorSet(mirrors or MIRRORS, CANONICAL_BASE, probe=self._probe_mirror, probe_path=LISTING_PATH)
+        self.base_url = self.mirrors.canonical_base  # 记录URL时使用的固定域名
+        self.failed_images = []
+        self.failed_albums = []
+        self.image_pool = None  # 全局图片下载池，run() 中创建
+        self.memory_budget = MemoryBudget(memory_mb * 1024 * 1024)  # 所有下载线程共享的内存预算
+        # 打包模式：每个专辑一个 tar 分片，避免 /sdcard 上大量小文件的创建/判重开销
+        self.archives = ArchiveStore(save_path) if pack else None
+        # 专辑目录快照：每个目录只 scandir 一次，判断图片是否已存在时查内存，/sdcard 上不再逐张 stat
+        self.dir_snapshot = DirSnapshot()
+        self.dir_snapshot.follow_renames(save_path)  # 被 transcode.py 转为 WebP 改名的图片也算已存在
+        self.min_resolution = min_resolution
+        # 时间核算：各线程时间按延迟/重试/连接/首字节/传输/解析/校验/写盘归类，结束时输出
+        self.time_account = TimeAccount() if time_report else None
+        self.filtered_images = 0  # 响应头/开头几KB预筛掉的图片数
+        self.processed_album_urls = SeenUrlIndex()  # 记录本次运行已处理专辑，避免重复
+        # 已完整下载的专辑，跨运行持久化，重启后直接跳过
+        self.completed_album_urls = SeenUrlIndex(os.path.join(save_path, ".completed_albums.idx"))
+
+    def _init_session(self, http2=False):
+        session = requests.Session()
+        retry = urllib3.util.retry.Retry(
+            total=3,
+            backoff_factor=1,
+            status_forcelist=[429, 500, 502, 503, 504]
+        )
+        adapter = requests.adapters.HTTPAdapter(max_retries=retry, pool_connections=100, pool_maxsize=100)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        # HTTP/2: 少量连接多路复用图片请求，服务器不支持时自动回退 HTTP/1.1
+        if http2:
+            mount_http2(session)
+        return session
+
+    def _get_random_user_agent(self):
+        return random.choice(self.user_agents)
+
+    def _probe_mirror(self, url):
+        """镜像健康探测：只取响应头，不读正文，不重试"""
+        headers = {"User-Agent": self._get_random_user_agent()}
+        with self.probe_session.get(url, headers=headers, timeout=MIRROR_PROBE_TIMEOUT, stream=True) as response:
+            return response.status_code < 400
+
+    def _get_response(self, url, retries=5, stream=False):
+        headers = {
+            "User-Agent": self._get_random_user_agent(),
+            "Referer": self.base_url,
+            "Accept-Language": "zh-CN,zh;q=0.9"
+        }
+        
+        for i in range(retries):
+            # 每次尝试都改写到当前最快的可用镜像（失败的镜像立即降权，重试自动换镜像）
+            mirror, target_url = self.mirrors.route(url)
+            headers["Referer"] = mirror or self.base_url
+            response = None
+            if stream:
+                # 流式响应在请求前等待：响应头到达后立即读正文，连接不会在响应中途闲置被服务器/代理超时断开
+                with timed("sleep"):
+                    time.sleep(random.uniform(2, 4))
+            start_time = time.time()
+            try:
+                response = timed_get(self.session, target_url, headers=headers, timeout=30, stream=stream)
+                response.raise_for_status()
+                request_time = time.time() - start_time
+                self.mirrors.record(mirror, True, request_time)
+                logger.info(f"[请求] {target_url} 成功，耗时 {request_time:.2f}秒")
+                
+                if not stream:
+                    delay = random.uniform(2, 4)
+                    with timed("sleep"):
+                        time.sleep(delay)
+                return response
+            except Exception as e:
+                if response is not None:
+                    response.close()  # 流式响应未读正文，及时归还连接
+                request_time = time.time() - start_time
+                # 404 是页面/图片本身不存在，不算镜像故障
+                not_found = isinstance(e, requests.exceptions.HTTPError) and e.response is not None and e.response.status_code == 404
+                if not not_found:
+                    self.mirrors.record(mirror, False)
+                best = self.mirrors.best()
+                if i < retries - 1 and mirror is not None and best != mirror and self.mirrors.healthy(best):
+                    # 换到另一个健康的镜像立即重试，不等待退避（所有镜像都不可用时照常退避）
+                    logger.warning(f"[请求] {target_url} 失败，{i+1}/{retries} 切换到镜像 {best} 重试: {e}")
+                elif i < retries - 1:
+                    delay = random.uniform(4, 8)
+                    logger.warning(f"[请求] {url} 失败，{i+1}/{retries} 重试，{delay:.2f}秒后重试: {e}")
+                    with timed("backoff"):
+                        time.sleep(delay)
+                else:
+                    logger.error(f"[请求] {url} 失败，{retries} 次重试后仍失败: {e}")
+                    return None
+
+    def _parse_albums(self, url):
+        """解析单页相册列表，返回本页所有专辑"""
+        response = self._get_response(url)
+        if not response:
+            logger.error(f"[解析] 请求失败，无法解析页面: {url}")
+            return [], None
+        
+        try:
+            with timed("parse"):
+                soup = bs4.BeautifulSoup(response.text, "html.parser")
+            albums = []
+            album_elements = soup.select(".videos-list-wrap .video-item-col")
+            logger.info(f"[解析] 本页找到 {len(album_elements)} 个相册元素")
+            
+            for i, album in enumerate(album_elements):
+                try:
+                    album_url = album.get("href")
+                    album_title = album.select_one(".video-desc-content").text.strip() if album.select_one(".video-desc-content") else f"未知专辑_{i+1}"
+                    # 跨平台过滤专辑名特殊字符
+                    album_title = re.sub(r'[\\/:*?"<>|+@#$%^&*(){}[]]', "_", album_title)
+                    if album_url and album_title not in ["/", ""]:
+                        # 镜像域名统一改写为主域名，换域名后已完成索引依然有效
+                        full_url = self.mirrors.canonical(f"{self.base_url}{album_url}" if not album_url.startswith("http") else album_url)
+                        albums.append((album_title, full_url))
+                        logger.debug(f"[解析] 解析到相册: {album_title} - {full_url}")
+                except Exception as e:
+                    logger.error(f"[解析] 解析相册元素失败: {e}")
+            
+            # 解析下一页
+            next_page = None
+            next_page_element = soup.select_one(".mo-paging .paging-item--next")
+            if next_page_element and next_page_element.get("href"):
+                next_page = f"{self.base_url}{next_page_element.get('href')}" if not next_page_element.get("href").startswith("http") else next_page_element.get("href")
+                next_page = self.mirrors.canonical(next_page)
+            soup.decompose()  # 及时释放解析树，避免与在途图片数据叠加占用内存
+            return albums, next_page
+        except Exception as e:
+            logger.error(f"[解析] 解析页面失败: {url}, 错误: {e}")
+            return [], None
+
+    def _fetch_listing_page(self, page, url):
+        """列表页预取线程中调用：请求并解析一页，返回 (本页专辑, 下一页URL)"""
+        logger.info(f"\n[列表页] 开始爬取第 {page} 页: {url}")
+        return self._parse_albums(url)
+
+    def _parse_album_images(self, album_url):
+        logger.info(f"[解析] 开始解析相册图片: {album_url}")
+        response = self._get_response(album_url)
+        if not response:
+            return []
+        
+        with timed("parse"):
+            soup = bs4.BeautifulSoup(response.text, "html.parser")
+            book_pages = soup.select_one("#book-pages")
+            screenshots = book_pages.get("data-screenshots", "") if book_pages else ""
+            soup.decompose()
+        if not book_pages:
+            logger.error(f"[解析] 未找到相册图片容器: {album_url}")
+            return []
+        
+        if not screenshots:
+            logger.error(f"[解析] 未找到相册图片URL: {album_url}")
+            return []
+        
+        images = []
+        for img_url in screenshots.split("#$"):
+            img_url = img_url.strip().lstrip('$')
+            if img_url and img_url.startswith("http"):
+                images.append(self.mirrors.canonical(img_url))
+        logger.info(f"[解析] 从相册提取到 {len(images)} 张图片")
+        return images
+
+    def _validate_image(self, image_path):
+        with timed("validate"):
+            try:
+                with Image.open(image_path) as img:
+                    img.verify()
+                return True
+            except Exception:
+                return False
+
+    def _download_image(self, img_url, save_path):
+        archive = None
+        if self.archives is not None:
+            archive, member = self.archives.locate(save_path)
+            if member in archive:
+                logger.info(f"[下载] 图片已在分片中，跳过: {archive.path} / {member}")
+                return True
+        elif self.dir_snapshot.exists(save_path):
+            logger.info(f"[下载] 图片已存在，跳过: {save_path}")
+            return True
+        
+        blocked = transfer_blocked()
+        if blocked:
+            logger.warning(f"[下载] 停止下载（{blocked}）: {img_url}")
+            self.failed_images.append((img_url, save_path))
+            return False
+        
+        logger.info(f"[下载] 开始下载: {img_url}")
+        # 流式请求：先拿到响应头，按 Content-Length 预留内存后再读取响应体
+        response = self._get_response(img_url, stream=True)
+        if response is None:
+            self.failed_images.append((img_url, save_path))
+            return False
+        
+        with response, self.memory_budget.reserve() as reservation:
+            # 非图片内容无需读取响应体
+            if not response.headers.get("Content-Type", "").startswith("image/"):
+                logger.error(f"[下载] 非图片内容，丢弃: {img_url}")
+                self.failed_images.append((img_url, save_path))
+                return False
+            # 预筛：Content-Length 不足 40KB 或开头几KB解析出的分辨率过低时，中止传输，不算失败
+            reason, chunks = screen_image_response(response, MIN_IMAGE_SIZE, self.min_resolution)
+            if reason:
+                logger.info(f"[下载] {reason}，跳过: {img_url}")
+                self.filtered_images += 1
+                return True
+            reservation.reserve_for(response)  # 预算耗尽时在此等待其他图片写盘
+            # 多站点同时运行时按共享带宽预算限速
+            with timed("transfer"):
+                content = b"".join(metered_chunks(SITE_NAME, chunks))
+            return self._save_image(img_url, save_path, content, archive)
+
+    def _save_image(self, img_url, save_path, content, archive=None):
+        """过滤过小文件后原子化写入并验证（打包模式下验证后追加到专辑分片）"""
+        file_size = len(content)
+        if file_size < MIN_IMAGE_SIZE:  # 40KB过滤
+            logger.error(f"[下载] 文件过小({file_size}字节)，丢弃: {img_url}")
+            self.failed_images.append((img_url, save_path))
+            return False
+        if archive is not None:
+            return self._save_to_archive(img_url, save_path, content, archive)
+        
+        # 原子化写入（跨平台目录兼容）
+        save_dir = os.path.dirname(save_path)
+        os.makedirs(save_dir, exist_ok=True)
+        temp_path = f"{save_path}.tmp"
+        try:
+            with timed("write"), open(temp_path, "wb") as f:
+                f.write(content)
+        except Exception as e:
+            logger.error(f"[下载] 写入失败: {e}")
+            self.failed_images.append((img_url, save_path))
+            return False
+        
+        # 图片验证
+        if self.verify:
+            if not self._validate_image(temp_path):
+                logger.error(f"[下载] 图片损坏，丢弃: {img_url}")
+                os.remove(temp_path)
+                self.failed_images.append((img_url, save_path))
+                return False
+        
+        # 重命名完成下载
+        try:
+            with timed("write"):
+                os.rename(temp_path, save_path)
+            self.dir_snapshot.add(save_path, file_size)
+            log_event(logger, "image_saved", f"[下载] 成功保存: {save_path}", url=img_url, path=save_path, bytes=file_size)
+            return True
+        except Exception as e:
+            logger.error(f"[下载] 重命名失败: {e}")
+            os.remove(temp_path)
+            self.failed_images.append((img_url, save_path))
+            return False
+
+    def _save_to_archive(self, img_url, save_path, content, archive):
+        """打包模式：内存中验证图片后追加到专辑分片"""
+        if self.verify:
+            try:
+                with timed("validate"), Image.open(BytesIO(content)) as img:
+                    img.verify()
+            except Exception:
+                logger.error(f"[下载] 图片损坏，丢弃: {img_url}")
+                self.failed_images.append((img_url, save_path))
+                return False
+        try:
+            with timed("write"):
+                archive.add(os.path.basename(save_path), content)
+        except OSError as e:
+            logger.error(f"[下载] 写入分片失败: {e}")
+            self.failed_images.append((img_url, save_path))
+            return False
+        log_event(logger, "image_saved", f"[下载] 成功保存: {archive.path} / {os.path.basename(save_path)}",
+                  url=img_url, path=archive.path, member=os.path.basename(save_path), bytes=len(content))
+        return True
+
+    def _download_album(self, album_info, album_index, total_album):
+        """下载单个专辑"""
+        album_title, album_url = album_info
+        if album_url in self.completed_album_urls:
+            logger.info(f"[专辑 {album_index}/{total_album}] 历史运行中已完成，跳过: {album_title}")
+            return True
+        if not self.processed_album_urls.add(album_url):
+            logger.info(f"[专辑 {album_index}/{total_album}] 已处理，跳过: {album_title}")
+            return True
+        
+        logger.info(f"\n[专辑 {album_index}/{total_album}] 开始处理: {album_title}")
+        # 清洗专辑名，跨平台路径兼容
+        safe_title = re.sub(r'[<>"/\\|?*:]', "_", album_title)[:50] if album_title else f"专辑_{album_index}"
+        album_dir = os.path.join(self.save_path, safe_title)
+        if self.archives is None:
+            os.makedirs(album_dir, exist_ok=True)
+        
+        # 解析图片并下载
+        images = self._parse_album_images(album_url)
+        if not images:
+            logger.error(f"[专辑 {album_index}/{total_album}] 无图片，加入失败列表")
+            self.failed_albums.append(album_info)
+            return False
+        
+        # 图片提交到全局下载池，本专辑线程不再等待，下载完成后由回调汇总
+        batch = self.image_pool.open_album(
+            f"专辑 {album_index}/{total_album}",
+            on_complete=lambda b: self._finish_album(b, album_url, album_index, total_album, safe_title),
+            error_result=False
+        )
+        for img_index, img_url in enumerate(images):
+            img_name = f"{img_index+1:03d}.jpg"
+            img_path = os.path.join(album_dir, img_name)
+            batch.submit(self._download_image, img_url, img_path)
+        batch.close()
+        
+        with timed("sleep"):
+            time.sleep(self.album_sleep)  # 专辑间延迟，反爬
+        return True
+
+    def _finish_album(self, batch, album_url, album_index, total_album, album_name):
+        """专辑的所有图片下载完成后由下载池回调"""
+        if self.archives is not None:
+            self.archives.close_album(album_name)
+        self.dir_snapshot.forget(os.path.join(self.save_path, album_name))
+        image_failures = batch.counts.get(False, 0)
+        logger.info(f"[专辑 {album_index}/{total_album}] 处理完成: 成功{batch.submitted-image_failures}张 | 失败{image_failures}张")
+        if image_failures == 0:
+            self.completed_album_urls.add(album_url)
+
+    def _retry_failed(self):
+        """重试失败的图片和专辑"""
+        total_failed = len(self.failed_albums) + len(self.failed_images)
+        if total_failed == 0:
+            return
+        logger.info(f"\n[重试] 开始处理失败项: 专辑{len(self.failed_albums)}个 | 图片{len(self.failed_images)}张")
+        # 重试专辑（遍历快照：重试中再次失败的项会追加到新列表，避免边遍历边追加导致死循环）
+        retry_albums, self.failed_albums = self.failed_albums, []
+        for idx, album in enumerate(retry_albums, 1):
+            self._download_album(album, idx, len(retry_albums))
+        self.image_pool.join()
+        # 重试图片
+        retry_images, self.failed_images = self.failed_images, []
+        success = 0
+        for img_url, save_path in retry_images:
+            if self._download_image(img_url, save_path):
+                success += 1
+        logger.info(f"[重试] 完成: 图片成功{success}/{len(retry_images)}张")
+
+    def run(self):
+        """主运行逻辑：顺序爬取+下载"""
+        start_total_time = time.time()
+        logger.info("="*50)
+        logger.info(f"📱 运行平台：{'手机Termux' if IS_MOBILE else 'Windows电脑'}")
+        logger.info("[主程序] 美图色色爬虫 - 双平台通用版")
+        logger.info(f"[主程序] 保存路径: {self.save_path}")
+        logger.info(f"[主程序] 图片验证: {self.verify} | 列表页延迟: {self.page_sleep}s")
+        logger.info(f"[主程序] 过滤规则: 小于40KB文件自动丢弃" + (f" | 分辨率低于{self.min_resolution[0]}x{self.min_resolution[1]}跳过" if self.min_resolution else ""))
+        logger.info("="*50)
+        os.makedirs(self.save_path, exist_ok=True)
+        if self.time_account is not None:
+            install_time_account(self.time_account)
+            account_http()
+        # 所有专辑共享一个图片下载池，空闲线程自动去帮还有任务的专辑
+        self.image_pool = SharedImagePool(max_workers=IMAGE_WORKERS, thread_name_prefix="ImageDownloader", max_open_albums=3)
+
+        # 初始化爬取参数
+        start_url = f"{self.base_url}{LISTING_PATH}"
+        page = 0
+        total_album_count = 0  # 累计总专辑数
+
+        # 核心：后台线程按翻页延迟预取列表页 → 主线程逐个处理本页专辑时，下一页已在请求/解析
+        listing = ListingPrefetcher(start_url, self._fetch_listing_page, page_delay=lambda: self.page_sleep,
+                                    lookahead=self.listing_lookahead)
+        for page, current_url, page_albums in listing:
+            if not page_albums:
+                logger.warning(f"[列表页] 第{page}页无专辑，跳至下一页")
+                continue
+            
+            # 顺序处理本页每个专辑：获取一个，下载一个
+            total_album_count += len(page_albums)
+            for idx, album in enumerate(page_albums, 1):
+                # 反压：下载队列积压或内存预算吃紧时，暂停解析新专辑
+                wait_for_downstream(self.image_pool, self.memory_budget)
+                self._download_album(album, total_album_count - len(page_albums) + idx, total_album_count)
+            logger.info(f"[列表页] 第{page}页处理完成")
+        logger.info(f"[列表页] 已爬取所有页面（共{page}页）")
+
+        # 等待下载池中剩余图片完成，再重试失败项
+        self.image_pool.join()
+        self._retry_failed()
+        self.image_pool.shutdown()
+        self.mirrors.close()
+        self.completed_album_urls.close()
+        if self.archives is not None:
+            self.archives.close()
+
+        # 最终统计
+        total_time = time.time() - start_total_time
+        logger.info("\n" + "="*50)
+        logger.info("[主程序] 爬取完成！")
+        logger.info(f"[主程序] 总耗时: {total_time/60:.1f}分钟 | 处理专辑: {total_album_count}个")
+        logger.info(f"[主程序] 失败项: 专辑{len(self.failed_albums)}个 | 图片{len(self.failed_images)}张 | 预筛跳过{self.filtered_images}张")
+        if len(self.mirrors.mirrors) > 1:
+            for line in self.mirrors.summary():
+                logger.info(f"[镜像] {line}")
+        logger.info(f"[主程序] 在途内存峰值: {self.memory_budget.peak/1024/1024:.1f}MB / 上限 {self.memory_budget.limit/1024/1024:.0f}MB")
+        logger.info(f"[主程序] 图片保存路径: {self.save_path}")
+        if self.time_account is not None:
+            install_time_account(None)
+            for line in self.time_account.report():
+                logger.info(f"[时间核算] {line}")
+        if IS_MOBILE:
+            logger.info("📱 手机查找：内部存储 → Download → 美图色色")
+        else:
+            logger.info("💻 Windows查找：此电脑 → C盘 → 爬取结果 → 美图色色")
+        logger.info("="*50)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="美图色色爬虫-双平台通用版（手机Termux+Windows）")
+    parser.add_argument("--page-sleep", type=float, default=5, help="列表页翻页延迟(秒，从上一页请求开始计时)，默认5")
+    parser.add_argument("--no-prefetch", action="store_true", help="关闭列表页预取：处理完本页所有专辑后才请求下一页")
+    parser.add_argument("--album-sleep", type=float, default=3, help="专辑间下载延迟(秒)，默认3")
+    parser.add_argument("--no-verify", action="store_true", help="关闭图片验证，加快下载速度")
+    parser.add_argument("--test", action="store_true", help="测试模式：使用默认路径，无需输入")
+    parser.add_argument("--http2", action="store_true", help="启用 HTTP/2 多路复用传输（需安装 httpx[http2]）")
+    parser.add_argument("--min-resolution", type=parse_resolution, help="分辨率下限，如 800x600（只读图片开头几KB判断，不达标不下载）")
+    parser.add_argument("--pack", action="store_true", help="打包输出：每个专辑保存为一个tar分片（用 extract_archives.py 解包）")
+    parser.add_argument("--memory-mb", type=int, default=MEMORY_BUDGET_MB, help=f"在途图片数据内存上限(MB)，0为不限制，默认{MEMORY_BUDGET_MB}")
+    parser.add_argument("--mirror", action="append", default=[], metavar="URL", help="追加镜像域名（可多次指定，如 https://新域名）：启动时和运行中探测各镜像，请求发往延迟最低的可用镜像")
+    parser.add_argument("--save-dir", type=str, default="", help="自定义保存路径（如/sdcard/Download/xxx 或 C:/xxx）")
+    parser.add_argument("--log-json", type=str, metavar="PATH", help="另外把日志以JSON行（含图片URL、路径、字节数等字段）写入该文件")
+    parser.add_argument("--time-report", action="store_true", help="核算时间花在延迟/重试/连接/首字节/传输/解析/校验/写盘上的比例，结束时输出最大的可避免开销")
+    args = parser.parse_args(argv)
+    # 日志的格式化和写文件/终端交给后台线程，下载线程不等待 /sdcard 和终端
+    install_async_logging(args.log_json)
+
+    # 配置保存路径
+    if args.save_dir:
+        save_path = args.save_dir
+    else:
+        save_path = DEFAULT_SAVE_DIR_MOBILE if IS_MOBILE else DEFAULT_SAVE_DIR_WIN
+    # 图片验证开关
+    verify = not args.no_verify
+
+    # 启动爬虫
+    spider = MeituSpider(
+        save_path=save_path,
+        verify=verify,
+        page_sleep=args.page_sleep,
+        album_sleep=args.album_sleep,
+        http2=args.http2,
+        memory_mb=args.memory_mb,
+        pack=args.pack,
+        min_resolution=args.min_resolution,
+        time_report=args.time_report,
+        prefetch=not args.no_prefetch,
+        mirrors=MIRRORS + args.mirror
+    )
+    spider.run()
+
+if __name__ == "__main__":
+    main()
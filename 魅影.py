@@ -1,295 +1,382 @@
-# -*- coding: utf-8 -*-
-""" 魅影图库爬虫 双平台通用版（手机Termux+Windows电脑）| 顺序下载 | 40KB过滤 | 魔法数字校验 """
-import requests
-from bs4 import BeautifulSoup
-import concurrent.futures
-from PIL import Image
-import io
-import os
-import re
-import sys
-import time
-import random
-import argparse
-import logging
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-
-# -------- 日志设置（双平台：终端+文件，中文兼容） --------
-log_file = "魅影图库_crawler.log"
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_file, encoding='utf-8'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
-logger = logging.getLogger(__name__)
-
-# 禁用第三方库日志
-for name in logging.root.manager.loggerDict:
-    if name not in ['__main__', 'crawler']:
-        logging.getLogger(name).setLevel(logging.CRITICAL)
-
-# -------- 跨平台核心配置 --------
-IS_MOBILE = os.path.exists("/sdcard/Download")  # 自动识别手机/Windows
-MIN_IMAGE_SIZE = 40 * 1024  # 40KB文件过滤
-# 跨平台默认保存路径
-DEFAULT_SAVE_DIR_MOBILE = "/sdcard/Download/魅影图库"
-DEFAULT_SAVE_DIR_WIN = r"C:\爬取结果\魅影图库"
-
-class GalleryCrawler:
-    def __init__(self, save_path, verify=False):
-        self.save_path = save_path
-        self.verify = verify
-        self.session = self._create_session()
-        # 初始化列表
-        self.completed_list = []
-        self.failed_list = []
-        self.processed_album_urls = set()  # 记录已处理专辑，避免重复
-        # 创建保存目录（跨平台兼容）
-        os.makedirs(self.save_path, exist_ok=True)
-        logger.info(f"📂 创建/检测保存目录: {self.save_path}")
-
-    def _create_session(self):
-        """创建带连接池和重试机制的session，跨平台兼容"""
-        session = requests.Session()
-        retry = Retry(
-            total=5,
-            backoff_factor=1,
-            status_forcelist=[429, 500, 502, 503, 504],
-            allowed_methods=["HEAD", "GET", "OPTIONS"]
-        )
-        adapter = HTTPAdapter(max_retries=retry, pool_connections=100, pool_maxsize=100)
-        session.mount("http://", adapter)
-        session.mount("https://", adapter)
-        # 设置headers，模拟浏览器+防盗链
-        session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Referer': 'https://xxtu.org/',
-            'Accept-Language': 'zh-CN,zh;q=0.9'
-        })
-        return session
-
-    def _sanitize_filename(self, filename):
-        """跨平台文件名清洗，过滤所有特殊字符"""
-        return re.sub(r'[\\/:*?"<>|+@#$%^&*(){}[]·~!￥]', ' ', filename)
-
-    def get_single_page_albums(self, page):
-        """获取单页相册链接和名称，用于顺序爬取"""
-        base_url = "https://xxtu.org/"
-        try:
-            # 构建分页URL
-            current_url = base_url if page == 1 else f"{base_url}?paged={page}"
-            logger.info(f"\n📄 正在获取第 {page} 页相册，URL: {current_url}")
-            # 随机延迟4-8秒，防反爬
-            delay = random.uniform(4, 8)
-            logger.info(f"⏱️  随机延迟 {delay:.1f} 秒...")
-            time.sleep(delay)
-
-            # 获取页面内容
-            start_time = time.time()
-            response = self.session.get(current_url, timeout=30)
-            response.raise_for_status()
-            end_time = time.time()
-
-            # 计算下载信息
-            content_length = len(response.content)
-            elapsed_time = end_time - start_time
-            if elapsed_time > 0:
-                speed = content_length / elapsed_time / 1024  # KB/s
-                logger.info(f"📥 页面下载完成，大小: {content_length/1024:.1f} KB，耗时: {elapsed_time:.2f} 秒，速度: {speed:.1f} KB/s")
-
-            # 解析页面
-            logger.info(f"🔍 正在解析页面...")
-            soup = BeautifulSoup(response.text, 'html.parser')
-            # 查找所有相册项
-            album_items = soup.find_all('article') or soup.find_all('div', class_='post')
-            if not album_items:
-                logger.info(f"第 {page} 页未找到相册项")
-                return [], None
-
-            logger.info(f"✅ 第 {page} 页找到 {len(album_items)} 个相册项")
-            # 提取相册信息
-            albums = []
-            for item in album_items:
-                a_tag = item.find('a')
-                if a_tag and 'href' in a_tag.attrs:
-                    album_url = a_tag['href']
-                    if album_url in self.processed_album_urls:
-                        continue
-                    # 查找相册名称，多标签兼容
-                    title_tag = item.find('h2', class_='entry-title') or item.find('h1', class_='entry-title') or item.find('h3', class_='entry-title')
-                    if title_tag:
-                        album_name = title_tag.text.strip()
-                        sanitized_name = self._sanitize_filename(album_name)
-                        albums.append((sanitized_name, album_name, album_url))
-                        self.processed_album_urls.add(album_url)
-                        logger.info(f"🎉 检索到新相册: {album_name}")
-
-            # 检查下一页
-            next_page = page + 1 if len(albums) > 0 else None
-            return albums, next_page
-
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 404:
-                logger.info(f"第 {page} 页返回404，已到达最后一页")
-                return [], None
-            else:
-                logger.error(f"HTTP请求失败: {e}，请按任意键重试...")
-                input()
-                return [], page
-        except requests.exceptions.RequestException as e:
-            logger.error(f"网络请求失败: {e}，请按任意键重试...")
-            input()
-            return [], page
-        except Exception as e:
-            logger.error(f"获取第 {page} 页相册失败: {e}")
-            import traceback
-            traceback.print_exc()
-            return [], None
-
-    def validate_image(self, image_path):
-        """验证图片是否损坏，先检查大小再校验完整性"""
-        # 先过滤小于40KB的文件
-        if os.path.getsize(image_path) < MIN_IMAGE_SIZE:
-            logger.error(f"图片 {image_path} 小于40KB，判定为无效")
-            return False
-        # 验证图片完整性
-        try:
-            with Image.open(image_path) as img:
-                img.verify()
-            return True
-        except Exception as e:
-            logger.error(f"图片 {image_path} 损坏: {e}")
-            return False
-
-    def download_image(self, image_url, save_path):
-        """下载单张图片，40KB过滤+魔法数字校验+原子化写入"""
-        retry_count = 0
-        max_retries = 5
-        img_name = os.path.basename(save_path)
-        # 跨平台清洗图片名
-        img_name = self._sanitize_filename(img_name)
-        save_path = os.path.join(os.path.dirname(save_path), img_name)
-
-        while retry_count < max_retries:
-            try:
-                # 随机延迟4-8秒
-                delay = random.uniform(4, 8)
-                logger.info(f"[{img_name}] ⏱️  随机延迟 {delay:.1f} 秒...")
-                time.sleep(delay)
-
-                # 发送请求
-                logger.info(f"[{img_name}] 🔗 正在连接: {image_url}")
-                response = self.session.get(image_url, timeout=60, stream=True)
-                response.raise_for_status()
-
-                # 验证响应内容是否为图片
-                content_type = response.headers.get('Content-Type', '')
-                if not content_type.startswith('image/'):
-                    logger.error(f"[{img_name}] ❌ 返回非图片内容: {content_type}")
-                    retry_count += 1
-                    continue
-
-                # 检查文件是否已存在
-                if os.path.exists(save_path):
-                    if self.validate_image(save_path):
-                        logger.info(f"[{img_name}] ✅ 已存在且完整，跳过")
-                        return True
-                    else:
-                        logger.info(f"[{img_name}] 🔄 已存在但损坏，重新下载")
-
-                # 原子化写入文件（跨平台目录兼容）
-                temp_path = save_path + '.tmp'
-                downloaded_size = 0
-                start_time = time.time()
-
-                with open(temp_path, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                            downloaded_size += len(chunk)
-                            # 简单进度显示
-                            elapsed_time = time.time() - start_time
-                            if elapsed_time > 0.5:
-                                speed = downloaded_size / elapsed_time / 1024
-                                logger.info(f"[{img_name}] 📊 下载中: {downloaded_size/1024:.1f} KB | 速度: {speed:.1f} KB/s", end='\r')
-
-                print()  # 换行结束进度条
-                # 过滤小于40KB的文件
-                if downloaded_size < MIN_IMAGE_SIZE:
-                    logger.error(f"[{img_name}] ❌ 文件过小({downloaded_size/1024:.1f} KB < 40KB)，丢弃")
-                    os.remove(temp_path)
-                    retry_count += 1
-                    continue
-
-                # 魔法数字验证（图片格式校验）
-                logger.info(f"[{img_name}] 🔍 验证图片完整性...")
-                with open(temp_path, 'rb') as f:
-                    magic_number = f.read(8)
-                valid_magic_numbers = {b'\xFF\xD8\xFF', b'\x89\x50\x4E\x47', b'\x47\x49\x46\x38', b'\x42\x4D'}
-                is_valid = any(magic_number.startswith(m) for m in valid_magic_numbers)
-                if not is_valid:
-                    logger.error(f"[{img_name}] ❌ 魔法数字无效，丢弃")
-                    os.remove(temp_path)
-                    retry_count += 1
-                    continue
-
-                # 最终验证并重命名
-                if self.validate_image(temp_path):
-                    os.rename(temp_path, save_path)
-                    logger.info(f"[{img_name}] ✅ 下载完成，保存至: {save_path}")
-                    return True
-                else:
-                    logger.error(f"[{img_name}] ❌ 下载后损坏，重试({retry_count+1}/{max_retries})")
-                    os.remove(temp_path)
-                    retry_count += 1
-            except requests.exceptions.RequestException as e:
-                retry_count += 1
-                logger.error(f"[{img_name}] ❌ 网络失败: {e}，重试({retry_count}/{max_retries})")
-                time.sleep(random.uniform(4, 8))
-            except Exception as e:
-                retry_count += 1
-                logger.error(f"[{img_name}] ❌ 下载失败: {e}，重试({retry_count}/{max_retries})")
-                time.sleep(random.uniform(4, 8))
-
-        logger.error(f"[{img_name}] ❌ 5次重试均失败，放弃下载")
-        return False
-
-    def download_album(self, album_info, album_index, total_album):
-        """下载单个相册，带进度标识，跨平台兼容"""
-        sanitized_name, original_name, album_url = album_info
-        logger.info(f"\n{'='*60}")
-        logger.info(f"🎊 [专辑 {album_index}/{total_album}] 开始处理: {original_name}")
-        logger.info(f"📚 相册链接: {album_url}")
-        logger.info(f"{'='*60}")
-
-        # 创建相册目录（跨平台）
-        album_dir = os.path.join(self.save_path, sanitized_name)
-        os.makedirs(album_dir, exist_ok=True)
-
-        try:
-            # 随机延迟4-8秒
-            delay = random.uniform(4, 8)
-            logger.info(f"⏱️  随机延迟 {delay:.1f} 秒...")
-            time.sleep(delay)
-
-            # 获取相册页面内容
-            response = self.session.get(album_url, timeout=30)
-            response.raise_for_status()
-
-            # 解析相册页面，获取所有图片链接
-            logger.info(f"🔍 提取图片链接...")
-            soup = BeautifulSoup(response.text, 'html.parser')
-            image_urls = []
-            for img in soup.find_all('img'):
-                if 'src' in img.attrs and img['src'].endswith(('.jpg', '.jpeg', '.png', '.gif')):
-                    image_urls.append(img['src'])
-
-            total_images = len(image_urls)
-            logger.info(f"📸 相册包含 {total_images} 张有效图片")
-            if total_images == 0:
-                logger.error(f"❌ 无有效图片，加入失败列表")
-                self.failed_list.append(original_name
+# -*- coding: utf-8 -*-
+""" 魅影图库爬虫 双平台通用版（手机Termux+Windows电脑）| 顺序下载 | 40KB过滤 | 分辨率预筛 | 魔法数字校验 | 依赖库按需导入 """
+from __future__ import annotations
+
+import concurrent.futures
+import io
+import os
+import re
+import sys
+import time
+import random
+import argparse
+import logging
+from crawler_common import (SeenUrlIndex, screen_image_response, parse_resolution, lazy_import, install_async_logging, ProgressSampler,
+                            load_transcode_renames)
+
+# 重量级依赖第一次使用时才导入（手机Termux上 --help 等模式不再等待数秒）
+requests = lazy_import("requests")
+urllib3 = lazy_import("urllib3")
+bs4 = lazy_import("bs4")
+Image = lazy_import("PIL.Image")
+
+# -------- 日志设置（双平台：终端+文件，中文兼容） --------
+log_file = "魅影图库_crawler.log"
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler(log_file, encoding='utf-8'),
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# 禁用第三方库日志（按顶层名称设置，库在之后才导入也同样生效，无需在导入时遍历所有日志器）
+QUIET_LOGGERS = ("urllib3", "requests", "charset_normalizer", "chardet", "PIL", "bs4")
+for name in QUIET_LOGGERS:
+    logging.getLogger(name).setLevel(logging.CRITICAL)
+# 日志的格式化和写文件/终端交给后台线程，下载线程不等待 /sdcard 和终端
+install_async_logging()
+# 下载进度采样：每张图片最多每秒一行，所有线程合计每秒最多几行
+progress_sampler = ProgressSampler()
+
+# -------- 跨平台核心配置 --------
+IS_MOBILE = os.path.exists("/sdcard/Download")  # 自动识别手机/Windows
+BASE_URL = "https://xxtu.org/"
+MIN_IMAGE_SIZE = 40 * 1024  # 40KB文件过滤
+MIN_RESOLUTION = None  # 分辨率下限，如 (800, 600)；只读图片开头几KB判断，不达标不下载
+# 跨平台默认保存路径
+DEFAULT_SAVE_DIR_MOBILE = "/sdcard/Download/魅影图库"
+DEFAULT_SAVE_DIR_WIN = r"C:\爬取结果\魅影图库"
+
+class GalleryCrawler:
+    def __init__(self, save_path, verify=False, min_resolution=MIN_RESOLUTION):
+        self.save_path = save_path
+        self.verify = verify
+        self.min_resolution = min_resolution
+        self.session = self._create_session()
+        # 初始化列表
+        self.completed_list = []
+        self.failed_list = []
+        self.processed_album_urls = SeenUrlIndex()  # 记录已处理专辑，避免重复
+        self.filtered_images = 0  # 响应头/开头几KB预筛掉的图片数（跳过，不算失败）
+        # transcode.py --format webp 改名过的图片：(相册目录名, 原文件名) -> 新文件名，判断已存在时跟随改名
+        self.transcoded = load_transcode_renames(save_path)
+        # 创建保存目录（跨平台兼容）
+        os.makedirs(self.save_path, exist_ok=True)
+        logger.info(f"📂 创建/检测保存目录: {self.save_path}")
+
+    def _create_session(self):
+        """创建带连接池和重试机制的session，跨平台兼容"""
+        session = requests.Session()
+        retry = urllib3.util.retry.Retry(
+            total=5,
+            backoff_factor=1,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["HEAD", "GET", "OPTIONS"]
+        )
+        adapter = requests.adapters.HTTPAdapter(max_retries=retry, pool_connections=100, pool_maxsize=100)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        # 设置headers，模拟浏览器+防盗链
+        session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+            'Referer': 'https://xxtu.org/',
+            'Accept-Language': 'zh-CN,zh;q=0.9'
+        })
+        return session
+
+    def _sanitize_filename(self, filename):
+        """跨平台文件名清洗，过滤所有特殊字符"""
+        return re.sub(r'[\\/:*?"<>|+@#$%^&*(){}[]·~!￥]', ' ', filename)
+
+    def get_single_page_albums(self, page):
+        """获取单页相册链接和名称，用于顺序爬取"""
+        base_url = BASE_URL
+        try:
+            # 构建分页URL
+            current_url = base_url if page == 1 else f"{base_url}?paged={page}"
+            logger.info(f"\n📄 正在获取第 {page} 页相册，URL: {current_url}")
+            # 随机延迟4-8秒，防反爬
+            delay = random.uniform(4, 8)
+            logger.info(f"⏱️  随机延迟 {delay:.1f} 秒...")
+            time.sleep(delay)
+
+            # 获取页面内容
+            start_time = time.time()
+            response = self.session.get(current_url, timeout=30)
+            response.raise_for_status()
+            end_time = time.time()
+
+            # 计算下载信息
+            content_length = len(response.content)
+            elapsed_time = end_time - start_time
+            if elapsed_time > 0:
+                speed = content_length / elapsed_time / 1024  # KB/s
+                logger.info(f"📥 页面下载完成，大小: {content_length/1024:.1f} KB，耗时: {elapsed_time:.2f} 秒，速度: {speed:.1f} KB/s")
+
+            # 解析页面
+            logger.info("🔍 正在解析页面...")
+            soup = bs4.BeautifulSoup(response.text, 'html.parser')
+            # 查找所有相册项
+            album_items = soup.find_all('article') or soup.find_all('div', class_='post')
+            if not album_items:
+                logger.info(f"第 {page} 页未找到相册项")
+                return [], None
+
+            logger.info(f"✅ 第 {page} 页找到 {len(album_items)} 个相册项")
+            # 提取相册信息
+            albums = []
+            for item in album_items:
+                a_tag = item.find('a')
+                if a_tag and 'href' in a_tag.attrs:
+                    album_url = a_tag['href']
+                    if album_url in self.processed_album_urls:
+                        continue
+                    # 查找相册名称，多标签兼容
+                    title_tag = item.find('h2', class_='entry-title') or item.find('h1', class_='entry-title') or item.find('h3', class_='entry-title')
+                    if title_tag:
+                        album_name = title_tag.text.strip()
+                        sanitized_name = self._sanitize_filename(album_name)
+                        albums.append((sanitized_name, album_name, album_url))
+                        self.processed_album_urls.add(album_url)
+                        logger.info(f"🎉 检索到新相册: {album_name}")
+
+            # 检查下一页
+            next_page = page + 1 if len(albums) > 0 else None
+            return albums, next_page
+
+        except requests.exceptions.HTTPError as e:
+            if e.response.status_code == 404:
+                logger.info(f"第 {page} 页返回404，已到达最后一页")
+                return [], None
+            else:
+                logger.error(f"HTTP请求失败: {e}，请按任意键重试...")
+                input()
+                return [], page
+        except requests.exceptions.RequestException as e:
+            logger.error(f"网络请求失败: {e}，请按任意键重试...")
+            input()
+            return [], page
+        except Exception as e:
+            logger.error(f"获取第 {page} 页相册失败: {e}")
+            import traceback
+            traceback.print_exc()
+            return [], None
+
+    def validate_image(self, image_path):
+        """验证图片是否损坏，先检查大小再校验完整性"""
+        # 先过滤小于40KB的文件
+        if os.path.getsize(image_path) < MIN_IMAGE_SIZE:
+            logger.error(f"图片 {image_path} 小于40KB，判定为无效")
+            return False
+        # 验证图片完整性
+        try:
+            with Image.open(image_path) as img:
+                img.verify()
+            return True
+        except Exception as e:
+            logger.error(f"图片 {image_path} 损坏: {e}")
+            return False
+
+    def download_image(self, image_url, save_path):
+        """下载单张图片，40KB过滤+魔法数字校验+原子化写入"""
+        retry_count = 0
+        max_retries = 5
+        img_name = os.path.basename(save_path)
+        # 跨平台清洗图片名
+        img_name = self._sanitize_filename(img_name)
+        save_path = os.path.join(os.path.dirname(save_path), img_name)
+
+        while retry_count < max_retries:
+            try:
+                # 随机延迟4-8秒
+                delay = random.uniform(4, 8)
+                logger.info(f"[{img_name}] ⏱️  随机延迟 {delay:.1f} 秒...")
+                time.sleep(delay)
+
+                # 发送请求
+                logger.info(f"[{img_name}] 🔗 正在连接: {image_url}")
+                response = self.session.get(image_url, timeout=60, stream=True)
+                response.raise_for_status()
+
+                # 验证响应内容是否为图片
+                content_type = response.headers.get('Content-Type', '')
+                if not content_type.startswith('image/'):
+                    logger.error(f"[{img_name}] ❌ 返回非图片内容: {content_type}")
+                    retry_count += 1
+                    continue
+
+                # 检查文件是否已存在（已被重新编码改名为 .webp 的按新文件名检查）
+                album_dir = os.path.dirname(save_path)
+                renamed = self.transcoded.get((os.path.basename(album_dir), img_name))
+                existing = os.path.join(album_dir, renamed) if renamed and not os.path.exists(save_path) else save_path
+                if os.path.exists(existing):
+                    if self.validate_image(existing):
+                        logger.info(f"[{img_name}] ✅ 已存在且完整，跳过")
+                        return True
+                    else:
+                        logger.info(f"[{img_name}] 🔄 已存在但损坏，重新下载")
+
+                # 预筛：先看Content-Length，再只读开头几KB解析宽高，不达标直接中止传输（重试也不会变大，不再重试，不算失败）
+                reject_reason, chunks = screen_image_response(response, MIN_IMAGE_SIZE, self.min_resolution)
+                if reject_reason:
+                    logger.info(f"[{img_name}] ⏭️ {reject_reason}，跳过")
+                    self.filtered_images += 1
+                    return True
+
+                # 原子化写入文件（跨平台目录兼容）
+                temp_path = save_path + '.tmp'
+                downloaded_size = 0
+                start_time = time.time()
+                progress_sampler.start()
+
+                with open(temp_path, 'wb') as f:
+                    for chunk in chunks:
+                        if chunk:
+                            f.write(chunk)
+                            downloaded_size += len(chunk)
+                            # 进度按采样频率输出（logger.info 不支持 end 参数，原先每个数据块都抛 TypeError 导致重试）
+                            if progress_sampler.due():
+                                speed = downloaded_size / max(time.time() - start_time, 1e-6) / 1024
+                                logger.info(f"[{img_name}] 📊 下载中: {downloaded_size/1024:.1f} KB | 速度: {speed:.1f} KB/s")
+
+                # 过滤小于40KB的文件
+                if downloaded_size < MIN_IMAGE_SIZE:
+                    logger.error(f"[{img_name}] ❌ 文件过小({downloaded_size/1024:.1f} KB < 40KB)，丢弃")
+                    os.remove(temp_path)
+                    retry_count += 1
+                    continue
+
+                # 魔法数字验证（图片格式校验）
+                logger.info(f"[{img_name}] 🔍 验证图片完整性...")
+                with open(temp_path, 'rb') as f:
+                    magic_number = f.read(8)
+                valid_magic_numbers = {b'\xFF\xD8\xFF', b'\x89\x50\x4E\x47', b'\x47\x49\x46\x38', b'\x42\x4D'}
+                is_valid = any(magic_number.startswith(m) for m in valid_magic_numbers)
+                if not is_valid:
+                    logger.error(f"[{img_name}] ❌ 魔法数字无效，丢弃")
+                    os.remove(temp_path)
+                    retry_count += 1
+                    continue
+
+                # 最终验证并重命名
+                if self.validate_image(temp_path):
+                    os.rename(temp_path, save_path)
+                    logger.info(f"[{img_name}] ✅ 下载完成，保存至: {save_path}")
+                    return True
+                else:
+                    logger.error(f"[{img_name}] ❌ 下载后损坏，重试({retry_count+1}/{max_retries})")
+                    os.remove(temp_path)
+                    retry_count += 1
+            except requests.exceptions.RequestException as e:
+                retry_count += 1
+                logger.error(f"[{img_name}] ❌ 网络失败: {e}，重试({retry_count}/{max_retries})")
+                time.sleep(random.uniform(4, 8))
+            except Exception as e:
+                retry_count += 1
+                logger.error(f"[{img_name}] ❌ 下载失败: {e}，重试({retry_count}/{max_retries})")
+                time.sleep(random.uniform(4, 8))
+
+        logger.error(f"[{img_name}] ❌ 5次重试均失败，放弃下载")
+        return False
+
+    def download_album(self, album_info, album_index, total_album):
+        """下载单个相册，带进度标识，跨平台兼容"""
+        sanitized_name, original_name, album_url = album_info
+        logger.info(f"\n{'='*60}")
+        logger.info(f"🎊 [专辑 {album_index}/{total_album}] 开始处理: {original_name}")
+        logger.info(f"📚 相册链接: {album_url}")
+        logger.info(f"{'='*60}")
+
+        # 创建相册目录（跨平台）
+        album_dir = os.path.join(self.save_path, sanitized_name)
+        os.makedirs(album_dir, exist_ok=True)
+
+        try:
+            # 随机延迟4-8秒
+            delay = random.uniform(4, 8)
+            logger.info(f"⏱️  随机延迟 {delay:.1f} 秒...")
+            time.sleep(delay)
+
+            # 获取相册页面内容
+            response = self.session.get(album_url, timeout=30)
+            response.raise_for_status()
+
+            # 解析相册页面，获取所有图片链接
+            logger.info("🔍 提取图片链接...")
+            soup = bs4.BeautifulSoup(response.text, 'html.parser')
+            image_urls = []
+            for img in soup.find_all('img'):
+                if 'src' in img.attrs and img['src'].endswith(('.jpg', '.jpeg', '.png', '.gif')):
+                    image_urls.append(img['src'])
+
+            total_images = len(image_urls)
+            logger.info(f"📸 相册包含 {total_images} 张有效图片")
+            if total_images == 0:
+                logger.error("❌ 无有效图片，加入失败列表")
+                self.failed_list.append(original_name)
+                return False
+
+            # 顺序下载相册中的图片：下载一张，再下载下一张
+            success_count = 0
+            fail_count = 0
+            for index, img_url in enumerate(image_urls, 1):
+                img_name = os.path.basename(img_url.split('?')[0])
+                logger.info(f"📥 [专辑 {album_index}/{total_album}] 图片 {index}/{total_images}")
+                if self.download_image(img_url, os.path.join(album_dir, img_name)):
+                    success_count += 1
+                else:
+                    fail_count += 1
+
+            logger.info(f"🎉 相册下载完成: {original_name}，成功 {success_count}/{total_images} 张，失败 {fail_count} 张")
+            if fail_count:
+                self.failed_list.append(original_name)
+                return False
+            self.completed_list.append(original_name)
+            return True
+        except requests.exceptions.RequestException as e:
+            logger.error(f"❌ 网络请求失败，处理相册 {original_name} 时出错: {e}")
+            self.failed_list.append(original_name)
+            return False
+        except Exception as e:
+            logger.error(f"❌ 处理相册 {original_name} 时出错: {e}")
+            self.failed_list.append(original_name)
+            return False
+
+    def run(self):
+        """主运行函数：逐页获取相册，获取一页下载一页"""
+        start_time = time.time()
+        logger.info(f"🚀 开始运行爬虫，开始时间: {time.strftime('%Y-%m-%d %H:%M:%S')}")
+        page = 1
+        while page:
+            albums, page = self.get_single_page_albums(page)
+            for album_index, album_info in enumerate(albums, 1):
+                self.download_album(album_info, album_index, len(albums))
+
+        total_time = time.time() - start_time
+        logger.info(f"\n{'='*60}")
+        logger.info(f"🏆 爬取完成！总耗时: {total_time/60:.2f} 分钟")
+        logger.info(f"📊 成功相册: {len(self.completed_list)} | 失败相册: {len(self.failed_list)} | 预筛跳过图片: {self.filtered_images} 张")
+        if self.failed_list:
+            logger.info(f"📋 失败列表: {self.failed_list}")
+        logger.info(f"📂 图片保存路径: {self.save_path}")
+        logger.info(f"{'='*60}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="魅影图库爬虫（双平台通用版）")
+    default_path = DEFAULT_SAVE_DIR_MOBILE if IS_MOBILE else DEFAULT_SAVE_DIR_WIN
+    parser.add_argument('--save-path', type=str, default=default_path, help="图片保存路径")
+    parser.add_argument('--min-resolution', type=parse_resolution, default=MIN_RESOLUTION,
+                        help="分辨率下限，如 800x600；只读图片开头几KB判断，不达标不下载")
+    args = parser.parse_args()
+
+    logger.info(f"📱 运行平台：{'手机Termux' if IS_MOBILE else 'Windows电脑'}")
+    crawler = GalleryCrawler(args.save_path, min_resolution=args.min_resolution)
+    crawler.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,688 +1,895 @@
-import requests
-from bs4 import BeautifulSoup
-import concurrent.futures
-from PIL import Image
-import io
-import os
-import time
-import random
-import argparse
-import logging
-import shutil
-import re
-import sys
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-
-# 设置日志格式
-log_file = "crawler.log"
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_file, encoding='utf-8')
-    ]
-)
-logger = logging.getLogger(__name__)
-
-# 禁用所有第三方库的日志
-for name in logging.root.manager.loggerDict:
-    if name not in ['__main__', 'crawler']:
-        logging.getLogger(name).setLevel(logging.CRITICAL)
-
-class GalleryCrawler:
-    def __init__(self, save_path, verify=False):
-        self.save_path = save_path
-        self.verify = verify
-        self.session = self._create_session()
-        
-        # 初始化列表
-        self.waiting_list = []
-        self.downloading_list = []
-        self.completed_list = []
-        self.failed_list = []
-        
-        # 创建保存目录
-        if not os.path.exists(self.save_path):
-            os.makedirs(self.save_path)
-    
-    def _create_session(self):
-        """创建带连接池和重试机制的session"""
-        session = requests.Session()
-        retry = Retry(
-            total=5,
-            backoff_factor=1,
-            status_forcelist=[429, 500, 502, 503, 504],
-            allowed_methods=["HEAD", "GET", "OPTIONS"]
-        )
-        adapter = HTTPAdapter(max_retries=retry, pool_connections=100, pool_maxsize=100)
-        session.mount("http://", adapter)
-        session.mount("https://", adapter)
-        # 设置headers模拟浏览器
-        session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        })
-        return session
-    
-    def _sanitize_filename(self, filename):
-        """清理文件名，将特殊字符替换为空格"""
-        return re.sub(r'[\\/:*?"<>|]', ' ', filename)
-    
-    def get_all_albums(self):
-        """获取所有相册链接和名称"""
-        base_url = "https://xxtu.org/"
-        albums = []
-        page = 1
-        max_pages = 100  # 设置较大的最大页数限制，确保获取所有相册
-        
-        logger.info("开始获取所有相册...")
-        print("🚀 开始获取所有相册...")
-        
-        while page <= max_pages:
-            try:
-                # 构建分页URL
-                if page == 1:
-                    current_url = base_url
-                else:
-                    current_url = f"{base_url}?paged={page}"
-                
-                logger.info(f"正在获取第 {page} 页相册，URL: {current_url}")
-                print(f"📄 正在获取第 {page} 页相册，URL: {current_url}")
-                # 随机延迟4-8秒
-                delay = random.uniform(4, 8)
-                print(f"⏱️  随机延迟 {delay:.1f} 秒...")
-                time.sleep(delay)
-                
-                # 获取页面内容
-                start_time = time.time()
-                response = self.session.get(current_url, timeout=30)
-                response.raise_for_status()
-                end_time = time.time()
-                
-                # 计算下载速度
-                content_length = len(response.content)
-                elapsed_time = end_time - start_time
-                if elapsed_time > 0:
-                    speed = content_length / elapsed_time / 1024  # KB/s
-                    print(f"📥 页面下载完成，大小: {content_length/1024:.1f} KB，耗时: {elapsed_time:.2f} 秒，速度: {speed:.1f} KB/s")
-                
-                # 解析页面
-                print(f"🔍 正在解析页面...")
-                soup = BeautifulSoup(response.text, 'html.parser')
-                
-                # 查找所有相册项 - 优化选择器，确保能找到所有相册项
-                album_items = soup.find_all('article')
-                if not album_items:
-                    # 尝试另一种可能的选择器
-                    print(f"🔍 未找到article标签，尝试使用div.post选择器...")
-                    album_items = soup.find_all('div', class_='post')
-                
-                if not album_items:
-                    logger.info(f"第 {page} 页未找到相册项，已获取全部相册")
-                    print(f"📄 第 {page} 页未找到相册项，已获取全部相册")
-                    break
-                
-                print(f"✅ 找到 {len(album_items)} 个相册项")
-                
-                # 提取相册信息
-                new_albums = 0
-                print(f"📸 正在提取相册信息...")
-                for item in album_items:
-                    # 查找相册链接
-                    a_tag = item.find('a')
-                    if a_tag and 'href' in a_tag.attrs:
-                        album_url = a_tag['href']
-                        # 查找相册名称
-                        title_tag = item.find('h2', class_='entry-title')
-                        if not title_tag:
-                            # 尝试其他可能的标题标签
-                            title_tag = item.find('h1', class_='entry-title')
-                            if not title_tag:
-                                title_tag = item.find('h3', class_='entry-title')
-                        
-                        if title_tag:
-                            album_name = title_tag.text.strip()
-                            # 清理相册名称，用于文件夹命名
-                            sanitized_name = self._sanitize_filename(album_name)
-                            
-                            # 检查是否已存在该相册
-                            album_exists = any(existing_album[2] == album_url for existing_album in albums)
-                            if not album_exists:
-                                albums.append((sanitized_name, album_name, album_url))
-                                new_albums += 1
-                                print(f"🎉 检索到相册: {album_name}")
-                
-                logger.info(f"第 {page} 页新增 {new_albums} 个相册，累计 {len(albums)} 个相册")
-                print(f"📊 第 {page} 页处理完成，新增 {new_albums} 个相册，累计 {len(albums)} 个相册")
-                
-                # 检查是否获取到新相册
-                if new_albums == 0:
-                    logger.info(f"第 {page} 页未新增任何相册，检查是否为最后一页")
-                    print(f"📄 第 {page} 页未新增任何相册，检查是否为最后一页")
-                    # 如果连续2页没有新增相册，或者页码超过5页，则停止
-                    if page > 5:  # 确保至少获取5页
-                        print(f"🎉 已获取到 {len(albums)} 个相册，结束相册获取")
-                        break
-                
-                # 继续获取下一页
-                page += 1
-                    
-            except requests.exceptions.HTTPError as e:
-                # 处理HTTP错误
-                if e.response.status_code == 404:
-                    # 404错误，说明页面不存在，是最后一页
-                    logger.info(f"第 {page} 页返回404错误，已到达最后一页")
-                    print(f"✅ 第 {page} 页返回404错误，已到达最后一页")
-                    break
-                else:
-                    # 其他HTTP错误，重试
-                    logger.error(f"HTTP请求失败: {e}")
-                    print(f"❌ HTTP请求失败: {e}")
-                    logger.info("按任意键重试，或按Ctrl+C退出...")
-                    input()
-                    continue
-            except requests.exceptions.RequestException as e:
-                # 其他网络请求错误，重试
-                logger.error(f"网络请求失败: {e}")
-                print(f"❌ 网络请求失败: {e}")
-                logger.info("按任意键重试，或按Ctrl+C退出...")
-                input()
-                continue
-            except Exception as e:
-                logger.error(f"获取第 {page} 页相册失败: {e}")
-                print(f"❌ 获取第 {page} 页相册失败: {e}")
-                # 打印完整的错误堆栈，便于调试
-                import traceback
-                traceback.print_exc()
-                break
-        
-        logger.info(f"共找到 {len(albums)} 个相册")
-        print(f"🎉 相册检索完成，共找到 {len(albums)} 个相册")
-        return albums
-    
-    def validate_image(self, image_path):
-        """验证图片是否损坏"""
-        # 检查文件大小
-        if os.path.getsize(image_path) == 0:
-            logger.error(f"图片 {image_path} 大小为0")
-            return False
-        
-        # 验证图片完整性
-        try:
-            with Image.open(image_path) as img:
-                img.verify()
-            return True
-        except Exception as e:
-            logger.error(f"图片 {image_path} 损坏: {e}")
-            return False
-    
-    def download_image(self, image_url, save_path):
-        """下载单张图片"""
-        retry_count = 0
-        max_retries = 5
-        
-        img_name = os.path.basename(save_path)
-        print(f"📥 开始下载图片: {img_name}")
-        
-        while retry_count < max_retries:
-            try:
-                # 随机延迟4-8秒
-                delay = random.uniform(4, 8)
-                print(f"⏱️  随机延迟 {delay:.1f} 秒...")
-                time.sleep(delay)
-                
-                # 发送请求
-                print(f"🔗 正在连接: {image_url}")
-                response = self.session.get(image_url, timeout=60, stream=True)
-                response.raise_for_status()
-                
-                # 验证响应状态码
-                if response.status_code != 200:
-                    error_msg = f"❌ 图片链接返回状态码: {response.status_code}"
-                    logger.error(f"图片链接 {image_url} 返回状态码: {response.status_code}")
-                    print(error_msg)
-                    retry_count += 1
-                    continue
-                
-                # 验证响应内容是否为图片
-                content_type = response.headers.get('Content-Type', '')
-                
-                if not content_type.startswith('image/'):
-                    error_msg = f"❌ 返回非图片内容: {content_type}"
-                    logger.error(f"图片链接 {image_url} 返回非图片内容: {content_type}")
-                    print(error_msg)
-                    retry_count += 1
-                    continue
-                
-                # 再次检查文件是否已存在（避免并发下载同一文件）
-                if os.path.exists(save_path):
-                    if self.validate_image(save_path):
-                        info_msg = f"✅ 图片已存在且完整，跳过下载"
-                        logger.info(f"图片 {image_url} 已存在且完整，跳过下载")
-                        print(info_msg)
-                        return True
-                    else:
-                        info_msg = f"🔄 图片已存在但损坏，重新下载"
-                        logger.info(f"图片 {image_url} 已存在但损坏，重新下载")
-                        print(info_msg)
-                
-                # 获取文件大小
-                content_length = response.headers.get('Content-Length')
-                total_size = int(content_length) if content_length else 0
-                if total_size > 0:
-                    print(f"📊 文件大小: {total_size/1024:.1f} KB")
-                
-                # 原子化写入文件
-                temp_path = save_path + '.tmp'
-                
-                # 下载并保存文件
-                print(f"💾 正在保存到: {save_path}")
-                start_time = time.time()
-                downloaded_size = 0
-                with open(temp_path, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                            downloaded_size += len(chunk)
-                            
-                            # 计算并显示下载进度和速度
-                            elapsed_time = time.time() - start_time
-                            if elapsed_time > 0.5:  # 每0.5秒更新一次进度
-                                speed = downloaded_size / elapsed_time / 1024  # KB/s
-                                if total_size > 0:
-                                    progress = downloaded_size / total_size * 100
-                                    print(f"📊 下载进度: {progress:.1f}% ({downloaded_size/1024:.1f} KB/{total_size/1024:.1f} KB)，速度: {speed:.1f} KB/s", end='\r')
-                                else:
-                                    print(f"📊 下载进度: {downloaded_size/1024:.1f} KB，速度: {speed:.1f} KB/s", end='\r')
-                
-                # 下载完成，计算总速度
-                end_time = time.time()
-                elapsed_time = end_time - start_time
-                total_downloaded = downloaded_size
-                if elapsed_time > 0:
-                    speed = total_downloaded / elapsed_time / 1024  # KB/s
-                    info_msg = f"📊 下载完成，耗时: {elapsed_time:.2f} 秒，速度: {speed:.1f} KB/s"
-                    print(f"\n{info_msg}")
-                    logger.info(f"[{img_name}] 下载完成，文件大小: {total_downloaded} 字节，耗时: {elapsed_time:.2f} 秒，速度: {speed:.1f} KB/s")
-                
-                # 检查文件大小是否为0
-                if total_downloaded == 0:
-                    error_msg = f"❌ 下载后文件大小为0"
-                    logger.error(f"图片 {image_url} 下载后文件大小为0")
-                    print(f"\n{error_msg}")
-                    os.remove(temp_path)
-                    retry_count += 1
-                    continue
-                
-                # 简单验证文件开头的魔法数字
-                print(f"🔍 正在验证图片完整性...")
-                with open(temp_path, 'rb') as f:
-                    magic_number = f.read(8)
-                
-                # 常见图片格式的魔法数字
-                valid_magic_numbers = {
-                    b'\xFF\xD8\xFF': ['jpg', 'jpeg'],
-                    b'\x89\x50\x4E\x47': ['png'],
-                    b'\x47\x49\x46\x38': ['gif'],
-                    b'\x42\x4D': ['bmp']
-                }
-                
-                is_valid = False
-                for magic, formats in valid_magic_numbers.items():
-                    if magic_number.startswith(magic):
-                        is_valid = True
-                        break
-                
-                if not is_valid:
-                    error_msg = f"❌ 图片魔法数字无效: {magic_number}"
-                    logger.error(f"图片 {image_url} 魔法数字无效: {magic_number}")
-                    print(error_msg)
-                    os.remove(temp_path)
-                    retry_count += 1
-                    continue
-                
-                # 验证图片完整性
-                if self.validate_image(temp_path):
-                    try:
-                        os.rename(temp_path, save_path)
-                        success_msg = f"✅ 图片下载完成: {img_name}"
-                        print(success_msg)
-                        return True
-                    except FileExistsError:
-                        # 如果文件在下载过程中被其他线程创建，再次验证
-                        os.remove(temp_path)
-                        if os.path.exists(save_path):
-                            if self.validate_image(save_path):
-                                info_msg = f"✅ 图片已被其他线程下载完成，跳过"
-                                logger.info(f"图片 {image_url} 已被其他线程下载完成，跳过")
-                                print(info_msg)
-                                return True
-                            else:
-                                error_msg = f"❌ 图片已存在但损坏，需要重新下载"
-                                logger.error(f"图片 {image_url} 已存在但损坏，需要重新下载")
-                                print(error_msg)
-                                retry_count += 1
-                                continue
-                else:
-                    error_msg = f"❌ 图片下载后损坏，正在重试... ({retry_count+1}/{max_retries})"
-                    logger.error(f"图片 {image_url} 下载后损坏，正在重试... ({retry_count+1}/{max_retries})")
-                    print(error_msg)
-                    os.remove(temp_path)
-                    retry_count += 1
-            except requests.exceptions.RequestException as e:
-                retry_count += 1
-                error_msg = f"❌ 网络请求失败: {e}，正在重试... ({retry_count}/{max_retries})"
-                logger.error(f"网络请求失败，下载图片 {image_url} 失败: {e}，正在重试... ({retry_count}/{max_retries})")
-                print(error_msg)
-                time.sleep(random.uniform(4, 8))
-            except Exception as e:
-                retry_count += 1
-                error_msg = f"❌ 下载失败: {e}，正在重试... ({retry_count}/{max_retries})"
-                logger.error(f"下载图片 {image_url} 失败: {e}，正在重试... ({retry_count}/{max_retries})")
-                print(error_msg)
-                # 打印完整的错误堆栈，以便调试
-                import traceback
-                traceback.print_exc()
-                time.sleep(random.uniform(4, 8))
-        
-        error_msg = f"❌ 图片下载失败: {img_name}"
-        print(error_msg)
-        return False
-    
-    def download_album(self, album_info):
-        """下载单个相册"""
-        sanitized_name, original_name, album_url = album_info
-        
-        # 打印相册开始信息
-        print(f"\n🎊 开始下载相册: {original_name}")
-        print(f"📚 相册链接: {album_url}")
-        logger.info(f"开始下载相册: {original_name}")
-        
-        # 将相册添加到正在下载列表
-        self.downloading_list.append(original_name)
-        
-        # 创建相册目录
-        album_dir = os.path.join(self.save_path, sanitized_name)
-        if not os.path.exists(album_dir):
-            print(f"📁 创建相册目录: {album_dir}")
-            os.makedirs(album_dir)
-        
-        try:
-            # 随机延迟4-8秒
-            delay = random.uniform(4, 8)
-            print(f"⏱️  随机延迟 {delay:.1f} 秒...")
-            time.sleep(delay)
-            
-            # 获取相册页面内容
-            print(f"🔗 获取相册页面内容...")
-            response = self.session.get(album_url, timeout=30)
-            response.raise_for_status()
-            
-            # 解析相册页面，获取所有图片链接
-            print(f"🔍 解析相册页面，提取图片链接...")
-            soup = BeautifulSoup(response.text, 'html.parser')
-            image_tags = soup.find_all('img')
-            image_urls = []
-            
-            for img in image_tags:
-                if 'src' in img.attrs:
-                    img_url = img['src']
-                    # 过滤掉不需要的图片（只保留jpg, jpeg, png, gif）
-                    if img_url.endswith(('.jpg', '.jpeg', '.png', '.gif')):
-                        image_urls.append(img_url)
-            
-            total_images = len(image_urls)
-            print(f"📸 相册包含 {total_images} 张图片")
-            logger.info(f"相册 {original_name} 包含 {total_images} 张图片")
-            
-            # 并发下载相册中的图片 - 限制图片级并发为3-5个
-            success_count = 0
-            skip_count = 0
-            fail_count = 0
-            
-            # 限制图片级并发数，避免并发过高
-            img_max_workers = random.randint(3, 5)
-            print(f"🚀 开始下载相册中的图片，使用 {img_max_workers} 个图片并发线程...")
-            with concurrent.futures.ThreadPoolExecutor(max_workers=img_max_workers) as executor:
-                futures = {}
-                for i, img_url in enumerate(image_urls):
-                    # 使用原文件名保存图片
-                    img_name = os.path.basename(img_url.split('?')[0])
-                    img_path = os.path.join(album_dir, img_name)
-                    
-                    # 如果图片已存在且验证通过，则跳过
-                    if os.path.exists(img_path):
-                        if self.validate_image(img_path):
-                            skip_msg = f"✅ 图片 {img_name} 已存在且完整，跳过下载"
-                            print(skip_msg)
-                            logger.info(f"[{original_name}] 图片 {img_name} 已存在且完整，跳过下载")
-                            skip_count += 1
-                            success_count += 1
-                            continue
-                        else:
-                            print(f"🔄 图片 {img_name} 已存在但损坏，重新下载")
-                            logger.info(f"[{original_name}] 图片 {img_name} 已存在但损坏，重新下载")
-                    
-                    future = executor.submit(self.download_image, img_url, img_path)
-                    futures[future] = (img_url, img_name)
-                
-                # 等待所有图片下载完成
-                total_futures = len(futures)
-                completed_futures = 0
-                
-                for future in concurrent.futures.as_completed(futures):
-                    completed_futures += 1
-                    img_url, img_name = futures[future]
-                    try:
-                        result = future.result()
-                        if result:
-                            success_count += 1
-                            print(f"📊 相册进度: {completed_futures}/{total_futures} 张，成功: {success_count}, 失败: {fail_count}, 跳过: {skip_count}")
-                        else:
-                            fail_count += 1
-                            print(f"📊 相册进度: {completed_futures}/{total_futures} 张，成功: {success_count}, 失败: {fail_count}, 跳过: {skip_count}")
-                    except Exception as e:
-                        fail_count += 1
-                        print(f"📊 相册进度: {completed_futures}/{total_futures} 张，成功: {success_count}, 失败: {fail_count}, 跳过: {skip_count}")
-                        logger.error(f"[{original_name}] 处理图片 {img_name} 时出错: {e}")
-            
-            # 下载完成总结
-            summary_msg = f"🎉 相册下载完成: {original_name}"
-            print(f"\n{summary_msg}")
-            print(f"📊 相册统计: 总图片数: {total_images}, 成功: {success_count}, 失败: {fail_count}, 跳过: {skip_count}")
-            print(f"📁 保存目录: {album_dir}")
-            
-            logger.info(f"相册 {original_name} 下载完成，成功 {success_count}/{total_images} 张图片")
-            
-            # 从正在下载列表移除，添加到已完成列表
-            self.downloading_list.remove(original_name)
-            self.completed_list.append(original_name)
-            
-            return True
-        except requests.exceptions.RequestException as e:
-            error_msg = f"❌ 网络请求失败，处理相册 {original_name} 时出错: {e}"
-            print(f"\n{error_msg}")
-            logger.error(error_msg)
-            # 从正在下载列表移除，添加到失败列表
-            if original_name in self.downloading_list:
-                self.downloading_list.remove(original_name)
-            self.failed_list.append(original_name)
-            return False
-        except Exception as e:
-            error_msg = f"❌ 处理相册 {original_name} 时出错: {e}"
-            print(f"\n{error_msg}")
-            logger.error(error_msg)
-            # 从正在下载列表移除，添加到失败列表
-            if original_name in self.downloading_list:
-                self.downloading_list.remove(original_name)
-            self.failed_list.append(original_name)
-            return False
-    
-    def run(self):
-        """主运行函数"""
-        start_time = time.time()
-        print("🚀 开始运行爬虫...")
-        print(f"📅 开始时间: {time.strftime('%Y-%m-%d %H:%M:%S')}")
-        
-        # 获取所有相册
-        print("\n🎯 阶段1: 获取所有相册")
-        albums = self.get_all_albums()
-        total_albums = len(albums)
-        print(f"🎉 共获取到 {total_albums} 个相册")
-        
-        # 将所有相册添加到待下载列表
-        self.waiting_list = [album[1] for album in albums]
-        print(f"📋 待下载列表已更新，共 {len(self.waiting_list)} 个相册")
-        
-        # 并发下载相册（3-5个并发）
-        max_workers = random.randint(3, 5)
-        print(f"\n🎯 阶段2: 开始下载相册")
-        print(f"⚡ 使用 {max_workers} 个并发线程")
-        print(f"📝 下载策略: 每个相册随机延迟4-8秒，每个图片随机延迟4-8秒")
-        
-        # 简单下载，不使用复杂的进度监控
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            print(f"\n📊 全局进度监控:")
-            print(f"开始下载...")
-            
-            # 执行下载
-            futures = {}
-            for i, album in enumerate(albums):
-                future = executor.submit(self.download_album, album)
-                futures[future] = album[1]
-            
-            # 实时监控进度
-            completed_albums = 0
-            for future in concurrent.futures.as_completed(futures):
-                completed_albums += 1
-                album_name = futures[future]
-                
-                # 计算当前进度
-                progress = completed_albums / total_albums * 100
-                elapsed_time = time.time() - start_time
-                albums_per_minute = completed_albums / (elapsed_time / 60) if elapsed_time > 0 else 0
-                
-                print(f"📊 全局进度: {progress:.1f}% ({completed_albums}/{total_albums} 个相册)，耗时: {elapsed_time:.2f} 秒，速度: {albums_per_minute:.1f} 个/分钟")
-                print(f"📋 当前状态: 待下载: {len(self.waiting_list)}, 正在下载: {len(self.downloading_list)}, 已完成: {len(self.completed_list)}, 失败: {len(self.failed_list)}")
-        
-        # 处理失败列表
-        if self.failed_list:
-            print(f"\n⚠️  下载完成！发现失败项")
-            print(f"📋 失败列表: {self.failed_list}")
-            print(f"📊 初步统计: 总相册数: {total_albums}, 成功: {len(self.completed_list)}, 失败: {len(self.failed_list)}")
-            
-            # 询问用户是否重试失败的相册
-            while True:
-                user_input = input("\n🔄 是否重试失败的相册？(y/n): ").strip().lower()
-                if user_input in ['y', 'n']:
-                    break
-                print("请输入 y 或 n")
-            
-            if user_input == 'y':
-                print("\n🔄 开始重试失败的相册...")
-                
-                # 准备重试的相册列表
-                retry_albums = []
-                for album in albums:
-                    if album[1] in self.failed_list:
-                        retry_albums.append(album)
-                
-                print(f"📋 准备重试 {len(retry_albums)} 个失败的相册")
-                
-                # 重置失败列表
-                self.failed_list = []
-                
-                # 重试下载
-                with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-                    futures = {}
-                    for album in retry_albums:
-                        future = executor.submit(self.download_album, album)
-                        futures[future] = album[1]
-                    
-                    # 实时监控重试进度
-                    completed_retry = 0
-                    total_retry = len(retry_albums)
-                    for future in concurrent.futures.as_completed(futures):
-                        completed_retry += 1
-                        album_name = futures[future]
-                        progress = completed_retry / total_retry * 100
-                        print(f"📊 重试进度: {progress:.1f}% ({completed_retry}/{total_retry} 个相册)")
-        
-        # 计算总耗时
-        total_time = time.time() - start_time
-        
-        # 打印最终结果
-        print(f"\n🏆 最终下载结果！")
-        print(f"📅 结束时间: {time.strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"⏱️  总耗时: {total_time:.2f} 秒 ({total_time/60:.2f} 分钟)")
-        print(f"📊 全局统计:")
-        print(f"   总相册数: {total_albums}")
-        print(f"   成功下载: {len(self.completed_list)}")
-        print(f"   下载失败: {len(self.failed_list)}")
-        print(f"   成功率: {len(self.completed_list)/total_albums*100:.1f}%")
-        
-        # 显示各个列表
-        print(f"\n📋 列表详情:")
-        print(f"   待下载列表: {self.waiting_list}")
-        print(f"   正在下载列表: {self.downloading_list}")
-        print(f"   已完成列表: {self.completed_list}")
-        print(f"   失败列表: {self.failed_list}")
-        
-        print(f"\n🎉 爬虫运行完成！")
-    
-    def verify_existing_files(self):
-        """验证并修复已存在的损坏文件"""
-        logger.info("开始验证已存在的文件...")
-        
-        # 遍历所有相册目录
-        for album_name in os.listdir(self.save_path):
-            album_dir = os.path.join(self.save_path, album_name)
-            if not os.path.isdir(album_dir):
-                continue
-            
-            logger.info(f"验证相册: {album_name}")
-            
-            # 遍历相册中的所有图片
-            for img_name in os.listdir(album_dir):
-                img_path = os.path.join(album_dir, img_name)
-                if not os.path.isfile(img_path):
-                    continue
-                
-                # 如果图片损坏，则删除
-                if not self.validate_image(img_path):
-                    logger.info(f"删除损坏的图片: {img_path}")
-                    os.remove(img_path)
-        
-        logger.info("文件验证完成！")
-
-def main():
-    # 解析命令行参数
-    parser = argparse.ArgumentParser(description="魅影图库爬虫")
-    parser.add_argument('--save-path', type=str, default="E:achong果影图库    xxtu.org", help="图片保存路径")
-    parser.add_argument('--verify', action='store_true', help="验证并修复已存在的损坏文件")
-    args = parser.parse_args()
-    
-    # 询问用户保存地址，若留空则使用默认
-    default_path = args.save_path
-    print(f"默认保存路径: {default_path}")
-    user_input = input("请输入自定义保存路径（留空使用默认）: ").strip()
-    
-    if user_input:
-        save_path = user_input
-        print(f"使用自定义保存路径: {save_path}")
-    else:
-        save_path = default_path
-        print(f"使用默认保存路径: {save_path}")
-    
-    # 初始化爬虫
-    crawler = GalleryCrawler(save_path, args.verify)
-    
-    # 如果启用了验证模式，则先验证已存在的文件
-    if args.verify:
-        crawler.verify_existing_files()
-    
-    # 开始爬取
-    crawler.run()
-
-if __name__ == "__main__":
+from __future__ import annotations
+
+import concurrent.futures
+import io
+import os
+import time
+import random
+import argparse
+import logging
+import shutil
+import re
+import sys
+import html
+import threading
+from xml.etree import ElementTree
+from crawler_common import (
+    SeenUrlIndex, SharedImagePool, DirSnapshot, FrontierCheckpoint, FrontierItem, CHECKPOINT_NAME,
+    lazy_import, download_to_file, transfer_blocked,
+    TimeAccount, install_time_account, account_http, timed, timed_get,
+    install_async_logging, console_print, console_input, ProgressSampler, log_event,
+)
+
+# 重量级依赖第一次使用时才导入（--help 等模式启动更快）
+requests = lazy_import("requests")
+urllib3 = lazy_import("urllib3")
+bs4 = lazy_import("bs4")
+Image = lazy_import("PIL.Image")
+
+SITE_NAME = "xxtu.org"  # 多站点同时运行（crawl_all.py）时的统计名称
+DEFAULT_SAVE_PATH = "E:achong果影图库    xxtu.org"
+MAX_PAGE_FAILURES = 5  # 不询问模式下，列表页连续失败多少次后结束相册获取
+BASE_URL = "https://xxtu.org/"
+REST_PER_PAGE = 100  # WordPress REST API 每页最多返回 100 篇文章
+# 相册发现方式：WordPress REST API（每页 100 个相册的精简 JSON）、RSS 订阅、HTML 列表页（每页 10 个相册）
+DISCOVERY_NAMES = {"rest": "WordPress REST API", "feed": "RSS 订阅", "html": "HTML 列表页"}
+DISCOVERY_SOURCES = {"rest": "wp-json", "feed": "feed", "html": "首页"}  # 翻页断点中各发现方式的来源名
+
+# 设置日志格式
+log_file = "crawler.log"
+QUIET_LOGGERS = ("urllib3", "requests", "charset_normalizer", "chardet", "PIL", "bs4", "httpx", "hpack", "h2")
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler(log_file, encoding='utf-8')
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# 禁用第三方库的日志（按顶层名称设置，库在之后才导入也同样生效，无需遍历已有日志器）
+for name in QUIET_LOGGERS:
+    logging.getLogger(name).setLevel(logging.CRITICAL)
+
+# 下载进度采样：每张图片最多每秒一行，所有线程合计每秒最多几行
+progress_sampler = ProgressSampler()
+
+class GalleryCrawler:
+    def __init__(self, save_path, verify=False, prompt=True, resume=True, discovery="auto"):
+        self.save_path = save_path
+        self.discovery = discovery  # 相册发现方式：auto / rest / feed / html
+        self.verify = verify
+        self.prompt = prompt  # False 时不等待键盘输入（后台或 crawl_all.py 运行）
+        self.session = self._create_session()
+        
+        # 初始化列表
+        self.waiting_list = []
+        self.downloading_list = []
+        self.completed_list = []
+        self.failed_list = []
+        self.list_lock = threading.Lock()  # 下载池回调线程与相册线程共同修改上述列表
+        
+        # 全局图片下载池，run() 中创建
+        self.image_pool = None
+        self.total_albums = 0
+        self.start_time = time.time()
+        
+        # 创建保存目录
+        if not os.path.exists(self.save_path):
+            os.makedirs(self.save_path)
+        
+        # 已完整下载的相册索引，跨运行持久化，重启后直接跳过
+        self.completed_albums = SeenUrlIndex(os.path.join(self.save_path, ".completed_albums.idx"))
+        # 相册目录快照：每个相册目录只 scandir 一次，判断图片是否已存在时查内存，不再逐张 stat
+        self.dir_snapshot = DirSnapshot()
+        self.dir_snapshot.follow_renames(self.save_path)  # 被 transcode.py 转为 WebP 改名的图片也算已存在
+        # 翻页断点：每页处理完记录下一页和未完成的相册（含图片列表），中断后从断点继续
+        self.checkpoint = FrontierCheckpoint(os.path.join(self.save_path, CHECKPOINT_NAME), resume=resume)
+    
+    def _create_session(self):
+        """创建带连接池和重试机制的session"""
+        session = requests.Session()
+        retry = urllib3.util.retry.Retry(
+            total=5,
+            backoff_factor=1,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["HEAD", "GET", "OPTIONS"]
+        )
+        adapter = requests.adapters.HTTPAdapter(max_retries=retry, pool_connections=100, pool_maxsize=100)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        # 设置headers模拟浏览器
+        session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+        })
+        return session
+    
+    def _sanitize_filename(self, filename):
+        """清理文件名，将特殊字符替换为空格"""
+        return re.sub(r'[\\/:*?"<>|]', ' ', filename)
+    
+    def _choose_discovery(self):
+        """确定相册发现方式：auto 时依次探测 WordPress REST API、RSS 订阅，都不可用时解析 HTML 列表页"""
+        if self.discovery != "auto":
+            return self.discovery
+        # 上次中断时使用的方式有断点，继续使用同一种方式（各方式的页码含义不同）
+        for backend, source in DISCOVERY_SOURCES.items():
+            if self.checkpoint.position(source) is not None:
+                console_print(f"🔌 相册发现方式: {DISCOVERY_NAMES[backend]}（沿用上次中断时的方式）")
+                return backend
+        probes = (
+            ("rest", f"{BASE_URL}wp-json/wp/v2/posts?per_page=1&_fields=link,title"),
+            ("feed", f"{BASE_URL}feed/"),
+        )
+        for backend, probe_url in probes:
+            try:
+                response = timed_get(self.session, probe_url, timeout=15)
+                response.raise_for_status()
+                if self._parse_listing(backend, response, 1)[0]:
+                    logger.info(f"相册发现方式: {backend} ({probe_url})")
+                    console_print(f"🔌 相册发现方式: {DISCOVERY_NAMES[backend]}")
+                    return backend
+            except Exception as e:
+                logger.info(f"{DISCOVERY_NAMES[backend]} 不可用: {e}")
+        console_print(f"🔌 相册发现方式: {DISCOVERY_NAMES['html']}")
+        return "html"
+    
+    def _listing_url(self, backend, page):
+        """第 page 页列表的URL"""
+        if backend == "rest":
+            # 只取链接和标题两个字段，每页 100 篇
+            return f"{BASE_URL}wp-json/wp/v2/posts?per_page={REST_PER_PAGE}&page={page}&_fields=link,title"
+        if backend == "feed":
+            return f"{BASE_URL}feed/?paged={page}"
+        return BASE_URL if page == 1 else f"{BASE_URL}?paged={page}"
+    
+    def _parse_listing(self, backend, response, page):
+        """解析一页列表，返回 ([(相册URL, 相册名称)], 是否最后一页)"""
+        if backend == "rest":
+            with timed("parse"):
+                posts = response.json()
+            if not isinstance(posts, list):
+                raise ValueError(f"REST API 返回的不是文章列表: {str(posts)[:200]}")
+            entries = [(post["link"], html.unescape(re.sub(r"<[^>]+>", "", post["title"]["rendered"])).strip())
+                       for post in posts if post.get("link")]
+            total_pages = response.headers.get("X-WP-TotalPages")
+            last_page = page >= int(total_pages) if total_pages else len(posts) < REST_PER_PAGE
+            return entries, last_page
+        
+        if backend == "feed":
+            with timed("parse"):
+                channel = ElementTree.fromstring(response.content).find("channel")
+            items = channel.findall("item") if channel is not None else []
+            entries = [((item.findtext("link") or "").strip(), (item.findtext("title") or "").strip()) for item in items]
+            return [(url, title) for url, title in entries if url and title], not items
+        
+        # 解析页面
+        console_print(f"🔍 正在解析页面...")
+        with timed("parse"):
+            soup = bs4.BeautifulSoup(response.text, 'html.parser')
+        
+        # 查找所有相册项 - 优化选择器，确保能找到所有相册项
+        album_items = soup.find_all('article')
+        if not album_items:
+            # 尝试另一种可能的选择器
+            console_print(f"🔍 未找到article标签，尝试使用div.post选择器...")
+            album_items = soup.find_all('div', class_='post')
+        
+        if not album_items:
+            return [], True
+        
+        console_print(f"✅ 找到 {len(album_items)} 个相册项")
+        entries = []
+        for item in album_items:
+            # 查找相册链接
+            a_tag = item.find('a')
+            if a_tag and 'href' in a_tag.attrs:
+                # 查找相册名称
+                title_tag = item.find('h2', class_='entry-title')
+                if not title_tag:
+                    # 尝试其他可能的标题标签
+                    title_tag = item.find('h1', class_='entry-title')
+                    if not title_tag:
+                        title_tag = item.find('h3', class_='entry-title')
+                if title_tag:
+                    entries.append((a_tag['href'], title_tag.text.strip()))
+        return entries, False
+    
+    def get_all_albums(self):
+        """获取所有相册链接和名称"""
+        albums = []
+        seen_album_urls = SeenUrlIndex()  # 本次运行内的相册去重，O(1) 判重
+        completed_skipped = 0
+        page = 1
+        max_pages = 100  # 设置较大的最大页数限制，确保获取所有相册
+        page_failures = 0  # 不询问模式下当前页连续失败次数
+        
+        logger.info("开始获取所有相册...")
+        console_print("🚀 开始获取所有相册...")
+        backend = self._choose_discovery()
+        source = DISCOVERY_SOURCES[backend]
+        
+        # 从上次中断处继续：未完成的相册直接加入列表，从记录的下一页开始翻页
+        position = self.checkpoint.position(source)
+        if position is not None:
+            for item in self.checkpoint.pending():
+                seen_album_urls.add(item.url)
+                albums.append((self._sanitize_filename(item.title), item.title, item.url))
+            next_url, pages_done = position
+            page = pages_done + 1 if next_url else max_pages + 1  # 列表已翻完时只下载未完成的相册
+            logger.info(f"从断点继续：已翻 {pages_done} 页，{len(albums)} 个相册未完成")
+            console_print(f"📌 从断点继续：已翻 {pages_done} 页，{len(albums)} 个相册未完成" + (f"，从第 {page} 页继续获取" if next_url else "，列表已翻完"))
+        
+        while page <= max_pages:
+            try:
+                # 构建分页URL
+                current_url = self._listing_url(backend, page)
+                
+                logger.info(f"正在获取第 {page} 页相册，URL: {current_url}")
+                console_print(f"📄 正在获取第 {page} 页相册，URL: {current_url}")
+                # 随机延迟4-8秒
+                delay = random.uniform(4, 8)
+                console_print(f"⏱️  随机延迟 {delay:.1f} 秒...")
+                with timed("sleep"):
+                    time.sleep(delay)
+                
+                # 获取页面内容
+                start_time = time.time()
+                response = timed_get(self.session, current_url, timeout=30)
+                response.raise_for_status()
+                end_time = time.time()
+                
+                # 计算下载速度
+                content_length = len(response.content)
+                elapsed_time = end_time - start_time
+                if elapsed_time > 0:
+                    speed = content_length / elapsed_time / 1024  # KB/s
+                    console_print(f"📥 页面下载完成，大小: {content_length/1024:.1f} KB，耗时: {elapsed_time:.2f} 秒，速度: {speed:.1f} KB/s")
+                
+                entries, last_page = self._parse_listing(backend, response, page)
+                if not entries:
+                    logger.info(f"第 {page} 页未找到相册项，已获取全部相册")
+                    console_print(f"📄 第 {page} 页未找到相册项，已获取全部相册")
+                    self.checkpoint.page_done(source, None, page)
+                    break
+                
+                # 提取相册信息
+                new_albums = 0
+                page_items = []  # 本页新发现的相册，写入断点
+                console_print(f"📸 正在提取相册信息...")
+                for album_url, album_name in entries:
+                    # 清理相册名称，用于文件夹命名
+                    sanitized_name = self._sanitize_filename(album_name)
+                    
+                    # 检查是否已存在该相册
+                    if seen_album_urls.add(album_url):
+                        new_albums += 1
+                        if album_url in self.completed_albums:
+                            # 之前的运行中已完整下载，不再加入下载队列
+                            completed_skipped += 1
+                            continue
+                        albums.append((sanitized_name, album_name, album_url))
+                        page_items.append(FrontierItem(album_url, album_name, source))
+                        console_print(f"🎉 检索到相册: {album_name}")
+                
+                logger.info(f"第 {page} 页新增 {new_albums} 个相册，累计 {len(albums)} 个相册")
+                console_print(f"📊 第 {page} 页处理完成，新增 {new_albums} 个相册，累计 {len(albums)} 个相册")
+                
+                # 检查是否获取到新相册
+                last_page = last_page or page >= max_pages
+                if new_albums == 0:
+                    logger.info(f"第 {page} 页未新增任何相册，检查是否为最后一页")
+                    console_print(f"📄 第 {page} 页未新增任何相册，检查是否为最后一页")
+                    # 如果连续2页没有新增相册，或者页码超过5页，则停止
+                    if page > 5:  # 确保至少获取5页
+                        console_print(f"🎉 已获取到 {len(albums)} 个相册，结束相册获取")
+                        last_page = True
+                
+                # 每页处理完立即写入断点（下一页和本页新发现的相册），中断后从下一页继续
+                self.checkpoint.page_done(source, None if last_page else self._listing_url(backend, page + 1), page, page_items)
+                if last_page:
+                    break
+                
+                # 继续获取下一页
+                page += 1
+                page_failures = 0
+                    
+            except requests.exceptions.HTTPError as e:
+                # 处理HTTP错误
+                status_code = e.response.status_code
+                if status_code == 404 or (backend == "rest" and status_code == 400):
+                    # 404错误（REST API 页码超出范围时返回400），说明页面不存在，是最后一页
+                    logger.info(f"第 {page} 页返回{status_code}错误，已到达最后一页")
+                    console_print(f"✅ 第 {page} 页返回{status_code}错误，已到达最后一页")
+                    self.checkpoint.page_done(source, None, page)
+                    break
+                else:
+                    # 其他HTTP错误，重试
+                    logger.error(f"HTTP请求失败: {e}")
+                    console_print(f"❌ HTTP请求失败: {e}")
+                    page_failures += 1
+                    if not self._wait_for_retry(page_failures):
+                        break
+                    continue
+            except requests.exceptions.RequestException as e:
+                # 其他网络请求错误，重试
+                logger.error(f"网络请求失败: {e}")
+                console_print(f"❌ 网络请求失败: {e}")
+                page_failures += 1
+                if not self._wait_for_retry(page_failures):
+                    break
+                continue
+            except Exception as e:
+                logger.error(f"获取第 {page} 页相册失败: {e}")
+                console_print(f"❌ 获取第 {page} 页相册失败: {e}")
+                # 打印完整的错误堆栈，便于调试
+                import traceback
+                traceback.print_exc()
+                break
+        
+        logger.info(f"共找到 {len(albums)} 个相册，跳过此前已完成的 {completed_skipped} 个相册")
+        console_print(f"🎉 相册检索完成，共找到 {len(albums)} 个相册，跳过此前已完成的 {completed_skipped} 个相册")
+        return albums
+    
+    def _wait_for_retry(self, failures):
+        """列表页请求失败后决定是否重试：询问模式下等待按键；不询问模式下连续失败过多则放弃"""
+        if self.prompt:
+            logger.info("按任意键重试，或按Ctrl+C退出...")
+            console_input()
+            return True
+        if failures >= MAX_PAGE_FAILURES:
+            logger.error(f"列表页连续失败 {failures} 次，结束相册获取")
+            console_print(f"❌ 列表页连续失败 {failures} 次，结束相册获取")
+            return False
+        return True
+    
+    def validate_image(self, image_path):
+        """验证图片是否损坏"""
+        with timed("validate"):
+            # 检查文件大小
+            if os.path.getsize(image_path) == 0:
+                logger.error(f"图片 {image_path} 大小为0")
+                return False
+            
+            # 验证图片完整性
+            try:
+                with Image.open(image_path) as img:
+                    img.verify()
+                return True
+            except Exception as e:
+                logger.error(f"图片 {image_path} 损坏: {e}")
+                return False
+    
+    def download_image(self, image_url, save_path):
+        """下载单张图片"""
+        retry_count = 0
+        max_retries = 5
+        
+        img_name = os.path.basename(save_path)
+        blocked = transfer_blocked()
+        if blocked:
+            logger.warning(f"停止下载图片 {image_url}: {blocked}")
+            console_print(f"⛔ 停止下载图片: {img_name}（{blocked}）")
+            return False
+        console_print(f"📥 开始下载图片: {img_name}")
+        
+        while retry_count < max_retries:
+            try:
+                # 随机延迟4-8秒
+                delay = random.uniform(4, 8)
+                console_print(f"⏱️  随机延迟 {delay:.1f} 秒...")
+                with timed("sleep"):
+                    time.sleep(delay)
+                
+                # 发送请求
+                console_print(f"🔗 正在连接: {image_url}")
+                response = timed_get(self.session, image_url, timeout=60, stream=True)
+                response.raise_for_status()
+                
+                # 验证响应状态码
+                if response.status_code != 200:
+                    error_msg = f"❌ 图片链接返回状态码: {response.status_code}"
+                    logger.error(f"图片链接 {image_url} 返回状态码: {response.status_code}")
+                    console_print(error_msg)
+                    retry_count += 1
+                    continue
+                
+                # 验证响应内容是否为图片
+                content_type = response.headers.get('Content-Type', '')
+                
+                if not content_type.startswith('image/'):
+                    error_msg = f"❌ 返回非图片内容: {content_type}"
+                    logger.error(f"图片链接 {image_url} 返回非图片内容: {content_type}")
+                    console_print(error_msg)
+                    retry_count += 1
+                    continue
+                
+                # 再次检查文件是否已存在（避免并发下载同一文件）
+                existing = self.dir_snapshot.locate(save_path)
+                if existing:
+                    if self.validate_image(existing):
+                        info_msg = f"✅ 图片已存在且完整，跳过下载"
+                        logger.info(f"图片 {image_url} 已存在且完整，跳过下载")
+                        console_print(info_msg)
+                        return True
+                    else:
+                        info_msg = f"🔄 图片已存在但损坏，重新下载"
+                        logger.info(f"图片 {image_url} 已存在但损坏，重新下载")
+                        console_print(info_msg)
+                
+                # 获取文件大小
+                content_length = response.headers.get('Content-Length')
+                total_size = int(content_length) if content_length else 0
+                if total_size > 0:
+                    console_print(f"📊 文件大小: {total_size/1024:.1f} KB")
+                
+                # 原子化写入文件
+                temp_path = save_path + '.tmp'
+                
+                # 下载并保存文件
+                console_print(f"💾 正在保存到: {save_path}")
+                start_time = time.time()
+                
+                def show_progress(downloaded_size):
+                    # 计算并显示下载进度和速度（每写盘一块回调一次，按采样频率输出）
+                    if progress_sampler.due():
+                        elapsed_time = time.time() - start_time
+                        speed = downloaded_size / elapsed_time / 1024  # KB/s
+                        if total_size > 0:
+                            progress = downloaded_size / total_size * 100
+                            console_print(f"📊 下载进度: {progress:.1f}% ({downloaded_size/1024:.1f} KB/{total_size/1024:.1f} KB)，速度: {speed:.1f} KB/s", end='\r')
+                        else:
+                            console_print(f"📊 下载进度: {downloaded_size/1024:.1f} KB，速度: {speed:.1f} KB/s", end='\r')
+                
+                progress_sampler.start()
+                # 响应体读入复用的大缓冲区后整块写盘（多站点同时运行时按共享带宽预算限速）
+                with timed("transfer"):
+                    result = download_to_file(response, temp_path, site=SITE_NAME, head_size=8, on_progress=show_progress)
+                
+                # 下载完成，计算总速度
+                end_time = time.time()
+                elapsed_time = end_time - start_time
+                total_downloaded = result.size
+                if elapsed_time > 0:
+                    speed = total_downloaded / elapsed_time / 1024  # KB/s
+                    info_msg = f"📊 下载完成，耗时: {elapsed_time:.2f} 秒，速度: {speed:.1f} KB/s"
+                    console_print(f"\n{info_msg}")
+                    log_event(logger, "image_downloaded",
+                              f"[{img_name}] 下载完成，文件大小: {total_downloaded} 字节，耗时: {elapsed_time:.2f} 秒，速度: {speed:.1f} KB/s",
+                              url=image_url, bytes=total_downloaded, seconds=round(elapsed_time, 3))
+                
+                # 检查文件大小是否为0
+                if total_downloaded == 0:
+                    error_msg = f"❌ 下载后文件大小为0"
+                    logger.error(f"图片 {image_url} 下载后文件大小为0")
+                    console_print(f"\n{error_msg}")
+                    os.remove(temp_path)
+                    retry_count += 1
+                    continue
+                
+                # 简单验证文件开头的魔法数字（写盘时已保留开头8字节，无需重新读文件）
+                console_print(f"🔍 正在验证图片完整性...")
+                magic_number = result.head
+                
+                # 常见图片格式的魔法数字
+                valid_magic_numbers = {
+                    b'\xFF\xD8\xFF': ['jpg', 'jpeg'],
+                    b'\x89\x50\x4E\x47': ['png'],
+                    b'\x47\x49\x46\x38': ['gif'],
+                    b'\x42\x4D': ['bmp']
+                }
+                
+                is_valid = False
+                for magic, formats in valid_magic_numbers.items():
+                    if magic_number.startswith(magic):
+                        is_valid = True
+                        break
+                
+                if not is_valid:
+                    error_msg = f"❌ 图片魔法数字无效: {magic_number}"
+                    logger.error(f"图片 {image_url} 魔法数字无效: {magic_number}")
+                    console_print(error_msg)
+                    os.remove(temp_path)
+                    retry_count += 1
+                    continue
+                
+                # 验证图片完整性
+                if self.validate_image(temp_path):
+                    try:
+                        with timed("write"):
+                            os.rename(temp_path, save_path)
+                        self.dir_snapshot.add(save_path, total_downloaded)
+                        success_msg = f"✅ 图片下载完成: {img_name}"
+                        console_print(success_msg)
+                        return True
+                    except FileExistsError:
+                        # 如果文件在下载过程中被其他线程创建，再次验证
+                        os.remove(temp_path)
+                        if os.path.exists(save_path):
+                            if self.validate_image(save_path):
+                                info_msg = f"✅ 图片已被其他线程下载完成，跳过"
+                                logger.info(f"图片 {image_url} 已被其他线程下载完成，跳过")
+                                console_print(info_msg)
+                                return True
+                            else:
+                                error_msg = f"❌ 图片已存在但损坏，需要重新下载"
+                                logger.error(f"图片 {image_url} 已存在但损坏，需要重新下载")
+                                console_print(error_msg)
+                                retry_count += 1
+                                continue
+                else:
+                    error_msg = f"❌ 图片下载后损坏，正在重试... ({retry_count+1}/{max_retries})"
+                    logger.error(f"图片 {image_url} 下载后损坏，正在重试... ({retry_count+1}/{max_retries})")
+                    console_print(error_msg)
+                    os.remove(temp_path)
+                    retry_count += 1
+            except requests.exceptions.RequestException as e:
+                retry_count += 1
+                error_msg = f"❌ 网络请求失败: {e}，正在重试... ({retry_count}/{max_retries})"
+                logger.error(f"网络请求失败，下载图片 {image_url} 失败: {e}，正在重试... ({retry_count}/{max_retries})")
+                console_print(error_msg)
+                with timed("backoff"):
+                    time.sleep(random.uniform(4, 8))
+            except Exception as e:
+                retry_count += 1
+                error_msg = f"❌ 下载失败: {e}，正在重试... ({retry_count}/{max_retries})"
+                logger.error(f"下载图片 {image_url} 失败: {e}，正在重试... ({retry_count}/{max_retries})")
+                console_print(error_msg)
+                # 打印完整的错误堆栈，以便调试
+                import traceback
+                traceback.print_exc()
+                with timed("backoff"):
+                    time.sleep(random.uniform(4, 8))
+        
+        error_msg = f"❌ 图片下载失败: {img_name}"
+        console_print(error_msg)
+        log_event(logger, "image_failed", f"图片 {image_url} 下载失败，已重试 {retry_count} 次",
+                  level=logging.ERROR, url=image_url, retries=retry_count)
+        return False
+    
+    def download_album(self, album_info):
+        """下载单个相册"""
+        sanitized_name, original_name, album_url = album_info
+        
+        # 打印相册开始信息
+        console_print(f"\n🎊 开始下载相册: {original_name}")
+        console_print(f"📚 相册链接: {album_url}")
+        logger.info(f"开始下载相册: {original_name}")
+        
+        # 将相册添加到正在下载列表
+        with self.list_lock:
+            self.downloading_list.append(original_name)
+        
+        # 创建相册目录
+        album_dir = os.path.join(self.save_path, sanitized_name)
+        if not os.path.exists(album_dir):
+            console_print(f"📁 创建相册目录: {album_dir}")
+            os.makedirs(album_dir)
+        
+        try:
+            # 上次中断时正在下载的相册：断点中已有图片列表，不再请求相册页面
+            image_urls = self.checkpoint.images(album_url)
+            if image_urls:
+                console_print(f"📌 从断点继续，使用已记录的 {len(image_urls)} 个图片链接")
+            else:
+                # 随机延迟4-8秒
+                delay = random.uniform(4, 8)
+                console_print(f"⏱️  随机延迟 {delay:.1f} 秒...")
+                with timed("sleep"):
+                    time.sleep(delay)
+                
+                # 获取相册页面内容
+                console_print(f"🔗 获取相册页面内容...")
+                response = timed_get(self.session, album_url, timeout=30)
+                response.raise_for_status()
+                
+                # 解析相册页面，获取所有图片链接
+                console_print(f"🔍 解析相册页面，提取图片链接...")
+                with timed("parse"):
+                    soup = bs4.BeautifulSoup(response.text, 'html.parser')
+                image_tags = soup.find_all('img')
+                image_urls = []
+                
+                for img in image_tags:
+                    if 'src' in img.attrs:
+                        img_url = img['src']
+                        # 过滤掉不需要的图片（只保留jpg, jpeg, png, gif）
+                        if img_url.endswith(('.jpg', '.jpeg', '.png', '.gif')):
+                            image_urls.append(img_url)
+                if image_urls:
+                    self.checkpoint.set_images(album_url, image_urls)
+            
+            total_images = len(image_urls)
+            console_print(f"📸 相册包含 {total_images} 张图片")
+            logger.info(f"相册 {original_name} 包含 {total_images} 张图片")
+            
+            # 已存在且完整的图片直接跳过，其余提交到全局下载池
+            skip_count = 0
+            console_print(f"🚀 将相册中的图片提交到全局下载池...")
+            batch = self.image_pool.open_album(
+                original_name,
+                on_complete=lambda b: self._finish_album(b, album_info, album_dir, total_images, skip_count),
+                error_result=False
+            )
+            try:
+                for i, img_url in enumerate(image_urls):
+                    # 使用原文件名保存图片
+                    img_name = os.path.basename(img_url.split('?')[0])
+                    img_path = os.path.join(album_dir, img_name)
+                    
+                    # 如果图片已存在且验证通过，则跳过
+                    existing = self.dir_snapshot.locate(img_path)
+                    if existing:
+                        if self.validate_image(existing):
+                            skip_msg = f"✅ 图片 {img_name} 已存在且完整，跳过下载"
+                            console_print(skip_msg)
+                            logger.info(f"[{original_name}] 图片 {img_name} 已存在且完整，跳过下载")
+                            skip_count += 1
+                            continue
+                        else:
+                            console_print(f"🔄 图片 {img_name} 已存在但损坏，重新下载")
+                            logger.info(f"[{original_name}] 图片 {img_name} 已存在但损坏，重新下载")
+                    
+                    batch.submit(self.download_image, img_url, img_path)
+            finally:
+                batch.close()
+            
+            return True
+        except requests.exceptions.RequestException as e:
+            error_msg = f"❌ 网络请求失败，处理相册 {original_name} 时出错: {e}"
+            console_print(f"\n{error_msg}")
+            logger.error(error_msg)
+            # 从正在下载列表移除，添加到失败列表
+            with self.list_lock:
+                if original_name in self.downloading_list:
+                    self.downloading_list.remove(original_name)
+                self.failed_list.append(original_name)
+            return False
+        except Exception as e:
+            error_msg = f"❌ 处理相册 {original_name} 时出错: {e}"
+            console_print(f"\n{error_msg}")
+            logger.error(error_msg)
+            # 从正在下载列表移除，添加到失败列表
+            with self.list_lock:
+                if original_name in self.downloading_list:
+                    self.downloading_list.remove(original_name)
+                self.failed_list.append(original_name)
+            return False
+    
+    def _finish_album(self, batch, album_info, album_dir, total_images, skip_count):
+        """相册的所有图片下载完成后由下载池回调，汇总统计"""
+        sanitized_name, original_name, album_url = album_info
+        fail_count = batch.counts.get(False, 0)
+        success_count = skip_count + batch.counts.get(True, 0)
+        self.dir_snapshot.forget(album_dir)
+        
+        # 下载完成总结
+        summary_msg = f"🎉 相册下载完成: {original_name}"
+        console_print(f"\n{summary_msg}")
+        console_print(f"📊 相册统计: 总图片数: {total_images}, 成功: {success_count}, 失败: {fail_count}, 跳过: {skip_count}")
+        console_print(f"📁 保存目录: {album_dir}")
+        
+        logger.info(f"相册 {original_name} 下载完成，成功 {success_count}/{total_images} 张图片")
+        
+        # 全部图片成功才记入持久化索引，有失败的相册下次运行继续补全
+        if fail_count == 0 and total_images > 0:
+            self.completed_albums.add(album_url)
+            self.checkpoint.done(album_url)
+        
+        with self.list_lock:
+            # 从正在下载列表移除，添加到已完成列表
+            if original_name in self.downloading_list:
+                self.downloading_list.remove(original_name)
+            self.completed_list.append(original_name)
+            finished_albums = len(self.completed_list) + len(self.failed_list)
+        
+        # 全局进度
+        if self.total_albums:
+            progress = finished_albums / self.total_albums * 100
+            elapsed_time = time.time() - self.start_time
+            albums_per_minute = finished_albums / (elapsed_time / 60) if elapsed_time > 0 else 0
+            console_print(f"📊 全局进度: {progress:.1f}% ({finished_albums}/{self.total_albums} 个相册)，耗时: {elapsed_time:.2f} 秒，速度: {albums_per_minute:.1f} 个/分钟")
+            console_print(f"📋 当前状态: 待下载: {len(self.waiting_list)}, 正在下载: {len(self.downloading_list)}, 已完成: {len(self.completed_list)}, 失败: {len(self.failed_list)}")
+    
+    def run(self):
+        """主运行函数"""
+        start_time = time.time()
+        self.start_time = start_time
+        console_print("🚀 开始运行爬虫...")
+        console_print(f"📅 开始时间: {time.strftime('%Y-%m-%d %H:%M:%S')}")
+        
+        # 获取所有相册
+        console_print("\n🎯 阶段1: 获取所有相册")
+        albums = self.get_all_albums()
+        total_albums = len(albums)
+        self.total_albums = total_albums
+        console_print(f"🎉 共获取到 {total_albums} 个相册")
+        
+        # 将所有相册添加到待下载列表
+        self.waiting_list = [album[1] for album in albums]
+        console_print(f"📋 待下载列表已更新，共 {len(self.waiting_list)} 个相册")
+        
+        # 并发解析相册（3-5个并发），图片统一交给全局下载池
+        max_workers = random.randint(3, 5)
+        # 全局下载池总线程数与原先 "相册并发 × 相册内3-5个图片并发" 相当
+        image_workers = max_workers * random.randint(3, 5)
+        self.image_pool = SharedImagePool(
+            max_workers=image_workers,
+            thread_name_prefix="ImageDownloader",
+            max_open_albums=max_workers * 2
+        )
+        console_print(f"\n🎯 阶段2: 开始下载相册")
+        console_print(f"⚡ 使用 {max_workers} 个相册解析线程，{image_workers} 个全局图片下载线程")
+        console_print(f"📝 下载策略: 每个相册随机延迟4-8秒，每个图片随机延迟4-8秒")
+        
+        # 简单下载，不使用复杂的进度监控
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            console_print(f"\n📊 全局进度监控:")
+            console_print(f"开始下载...")
+            
+            # 执行下载
+            futures = {}
+            for i, album in enumerate(albums):
+                future = executor.submit(self.download_album, album)
+                futures[future] = album[1]
+            
+            # 相册解析进度（下载进度由下载池回调打印）
+            parsed_albums = 0
+            for future in concurrent.futures.as_completed(futures):
+                parsed_albums += 1
+                console_print(f"📊 相册解析进度: {parsed_albums}/{total_albums} 个相册，剩余图片任务: {self.image_pool.queued_tasks}")
+        
+        # 等待下载池中剩余的图片完成
+        self.image_pool.join()
+        
+        # 处理失败列表
+        if self.failed_list:
+            console_print(f"\n⚠️  下载完成！发现失败项")
+            console_print(f"📋 失败列表: {self.failed_list}")
+            console_print(f"📊 初步统计: 总相册数: {total_albums}, 成功: {len(self.completed_list)}, 失败: {len(self.failed_list)}")
+            
+            # 询问用户是否重试失败的相册（不询问模式下自动重试一次）
+            user_input = 'y'
+            while self.prompt:
+                user_input = console_input("\n🔄 是否重试失败的相册？(y/n): ").strip().lower()
+                if user_input in ['y', 'n']:
+                    break
+                console_print("请输入 y 或 n")
+            
+            if user_input == 'y':
+                console_print("\n🔄 开始重试失败的相册...")
+                
+                # 准备重试的相册列表
+                retry_albums = []
+                for album in albums:
+                    if album[1] in self.failed_list:
+                        retry_albums.append(album)
+                
+                console_print(f"📋 准备重试 {len(retry_albums)} 个失败的相册")
+                
+                # 重置失败列表
+                self.failed_list = []
+                
+                # 重试下载
+                with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    futures = {}
+                    for album in retry_albums:
+                        future = executor.submit(self.download_album, album)
+                        futures[future] = album[1]
+                    
+                    # 实时监控重试进度
+                    completed_retry = 0
+                    total_retry = len(retry_albums)
+                    for future in concurrent.futures.as_completed(futures):
+                        completed_retry += 1
+                        album_name = futures[future]
+                        progress = completed_retry / total_retry * 100
+                        console_print(f"📊 重试进度: {progress:.1f}% ({completed_retry}/{total_retry} 个相册)")
+                self.image_pool.join()
+        
+        self.image_pool.shutdown()
+        
+        # 计算总耗时
+        total_time = time.time() - start_time
+        
+        # 打印最终结果
+        console_print(f"\n🏆 最终下载结果！")
+        console_print(f"📅 结束时间: {time.strftime('%Y-%m-%d %H:%M:%S')}")
+        console_print(f"⏱️  总耗时: {total_time:.2f} 秒 ({total_time/60:.2f} 分钟)")
+        console_print(f"📊 全局统计:")
+        console_print(f"   总相册数: {total_albums}")
+        console_print(f"   成功下载: {len(self.completed_list)}")
+        console_print(f"   下载失败: {len(self.failed_list)}")
+        console_print(f"   成功率: {(len(self.completed_list)/total_albums*100 if total_albums else 100.0):.1f}%")
+        
+        # 显示各个列表
+        console_print(f"\n📋 列表详情:")
+        console_print(f"   待下载列表: {self.waiting_list}")
+        console_print(f"   正在下载列表: {self.downloading_list}")
+        console_print(f"   已完成列表: {self.completed_list}")
+        console_print(f"   失败列表: {self.failed_list}")
+        
+        self.completed_albums.close()
+        # 列表已翻完时删除断点，下次运行从第一页发现新相册；列表中途失败时保留，下次从断点继续
+        if not self.checkpoint.finish():
+            console_print(f"📌 翻页断点已保存（{self.checkpoint.summary()}），下次运行从断点继续")
+        console_print(f"\n🎉 爬虫运行完成！")
+    
+    def verify_existing_files(self):
+        """验证并修复已存在的损坏文件"""
+        logger.info("开始验证已存在的文件...")
+        
+        # 遍历所有相册目录
+        for album_name in os.listdir(self.save_path):
+            album_dir = os.path.join(self.save_path, album_name)
+            if not os.path.isdir(album_dir):
+                continue
+            
+            logger.info(f"验证相册: {album_name}")
+            
+            # 遍历相册中的所有图片
+            for img_name in os.listdir(album_dir):
+                img_path = os.path.join(album_dir, img_name)
+                if not os.path.isfile(img_path):
+                    continue
+                
+                # 如果图片损坏，则删除
+                if not self.validate_image(img_path):
+                    logger.info(f"删除损坏的图片: {img_path}")
+                    os.remove(img_path)
+        
+        logger.info("文件验证完成！")
+
+def main(argv=None):
+    # 解析命令行参数
+    parser = argparse.ArgumentParser(description="魅影图库爬虫")
+    parser.add_argument('--save-path', type=str, default=DEFAULT_SAVE_PATH, help="图片保存路径")
+    parser.add_argument('--verify', action='store_true', help="验证并修复已存在的损坏文件")
+    parser.add_argument('--no-prompt', action='store_true', help="不等待键盘输入：直接使用 --save-path，失败的相册自动重试一次（后台或 crawl_all.py 运行）")
+    parser.add_argument('--discovery', choices=["auto", "rest", "feed", "html"], default="auto", help="相册发现方式：auto 依次尝试 WordPress REST API、RSS 订阅，都不可用时解析 HTML 列表页")
+    parser.add_argument('--no-resume', action='store_true', help="忽略上次中断时保存的翻页断点，从第一页重新获取相册")
+    parser.add_argument('--log-json', type=str, metavar='PATH', help="另外把日志以 JSON 行（含图片 URL、字节数、耗时等字段）写入该文件")
+    parser.add_argument('--time-report', action='store_true', help="核算各线程时间花在延迟、重试、连接、首字节、传输、解析、校验、写盘上的比例，结束时输出并给出最大的可避免开销")
+    args = parser.parse_args(argv)
+    # 日志和终端输出由后台线程写出
+    install_async_logging(args.log_json)
+    
+    # 询问用户保存地址，若留空则使用默认
+    default_path = args.save_path
+    console_print(f"默认保存路径: {default_path}")
+    user_input = "" if args.no_prompt else console_input("请输入自定义保存路径（留空使用默认）: ").strip()
+    
+    if user_input:
+        save_path = user_input
+        console_print(f"使用自定义保存路径: {save_path}")
+    else:
+        save_path = default_path
+        console_print(f"使用默认保存路径: {save_path}")
+    
+    # 初始化爬虫
+    crawler = GalleryCrawler(save_path, args.verify, prompt=not args.no_prompt, resume=not args.no_resume, discovery=args.discovery)
+    
+    # 如果启用了验证模式，则先验证已存在的文件
+    if args.verify:
+        crawler.verify_existing_files()
+    
+    # 时间核算：延迟、连接、传输等各类耗时分别计时
+    account = None
+    if args.time_report:
+        account = TimeAccount()
+        install_time_account(account)
+        account_http()
+    
+    # 开始爬取
+    try:
+        crawler.run()
+    finally:
+        if account is not None:
+            install_time_account(None)
+            console_print()
+            for line in account.report():
+                console_print(line)
+                logger.info(line)
+
+if __name__ == "__main__":
     main()
\ No newline at end of file